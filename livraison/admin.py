@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     ModeEnvoi, Livraison, Route, LivraisonRoute,
-    PhotoLivraison, DisponibiliteLivreur, ImportExcel, Vehicule
+    PhotoLivraison, DisponibiliteLivreur, ImportExcel, Vehicule, GeocodeCache
 )
 
 @admin.register(ModeEnvoi)
@@ -21,6 +21,13 @@ class RouteAdmin(admin.ModelAdmin):
     list_display = ['nom', 'date', 'periode', 'heure_depart', 'status']
     list_filter = ['status', 'periode', 'date']
     filter_horizontal = ['livreurs']
+    readonly_fields = Route.CHAMPS_COMPTEURS
+
+    def save_model(self, request, obj, form, change):
+        # Compteurs tenus par les signals depuis l'ouverture du formulaire: relus avant d'écrire
+        if change:
+            obj.refresh_from_db(fields=Route.CHAMPS_COMPTEURS)
+        super().save_model(request, obj, form, change)
 
 @admin.register(DisponibiliteLivreur)
 class DisponibiliteLivreurAdmin(admin.ModelAdmin):
@@ -29,11 +36,18 @@ class DisponibiliteLivreurAdmin(admin.ModelAdmin):
 
 @admin.register(ImportExcel)
 class ImportExcelAdmin(admin.ModelAdmin):
-    list_display = ['date_import', 'importe_par', 'nb_lignes_importees', 'nb_erreurs']
-    readonly_fields = ['date_import', 'nb_lignes_total', 'nb_lignes_importees', 'nb_erreurs']
+    list_display = ['date_import', 'importe_par', 'date_livraison', 'statut', 'nb_lignes_importees', 'nb_erreurs']
+    list_filter = ['statut']
+    readonly_fields = ['date_import', 'date_debut', 'date_fin', 'nb_lignes_total', 'nb_lignes_traitees', 'nb_lignes_importees', 'nb_erreurs']
 
 @admin.register(Vehicule)
 class VehiculeAdmin(admin.ModelAdmin):
     list_display = ('immatriculation', 'marque', 'modele', 'annee', 'statut')
     list_filter = ('statut', 'type_vehicule', 'carburant')
-    search_fields = ('immatriculation', 'marque', 'modele')
\ No newline at end of file
+    search_fields = ('immatriculation', 'marque', 'modele')
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ['cle', 'succes', 'date_creation', 'date_expiration']
+    list_filter = ['succes']
+    search_fields = ['cle']
@@ -0,0 +1,292 @@
+"""
+Outils de mesure des imports Excel: génération de classeurs synthétiques
+au format des exports de livraisons et banc d'essai par phase.
+
+Utilisé par les commandes generer_classeur_livraisons et benchmark_import.
+"""
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as heure
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import django
+import openpyxl
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from .geocoding import cache_memoire
+from .normalisation import COLONNES_EXCEL
+from .services import ExcelImportService
+
+
+# ==========================================
+# GÉNÉRATION DE CLASSEURS
+# ==========================================
+
+RUES = [
+    'rue Sainte-Catherine O', 'boul. René-Lévesque O', 'rue Sherbrooke E', 'av. du Parc',
+    'rue Saint-Denis', 'boul. Saint-Laurent', 'rue Notre-Dame O', 'av. McGill College',
+    'rue Peel', 'boul. de Maisonneuve E', 'rue Ontario E', 'av. Papineau',
+    'boul. Le Carrefour', 'boul. Taschereau', 'rue King E', 'boul. Saint-Martin O',
+]
+VILLES = ['', '', '', ', Montréal', ', Laval', ', Longueuil', ', Brossard']
+FSA = [
+    'H2X', 'H2Y', 'H2Z', 'H3A', 'H3B', 'H3C', 'H3G', 'H3H', 'H2L', 'H2J', 'H1V', 'H4C',
+    'H7N', 'H7T', 'H7V', 'J4K', 'J4Z', 'J4W', 'J4B',
+]
+EVENEMENTS = [
+    'Dîner d\'affaires', 'Pause café', 'Lunch d\'équipe', 'Cocktail', 'Déjeuner continental',
+    'Formation - thé et café', 'Repas chaud', 'Buffet froid', 'Réunion du CA', 'Sac de glace + boîtes à lunch',
+]
+MODES_ENVOI = [
+    'Plateau JLT', 'Coffret', 'Sac à lunch', 'Plat chaud individuel', 'Plateaux à partager', 'En vrac',
+]
+CONSEILLERS = ['Julie', 'Marc', 'Sophie', 'Karim', 'Isabelle']
+
+
+def code_postal_aleatoire(hasard):
+    """Code postal québécois dans un format tel que saisi à la main"""
+    lettres = 'ABCEGHJKLMNPRSTVWXYZ'
+    fsa = hasard.choice(FSA)
+    ldu = f"{hasard.randint(0, 9)}{hasard.choice(lettres)}{hasard.randint(0, 9)}"
+    return hasard.choice([f"{fsa} {ldu}", f"{fsa}{ldu}", f"{fsa.lower()}{ldu.lower()}", f"{fsa} {ldu} Canada"])
+
+
+def heure_aleatoire(hasard):
+    """Heure de livraison dans l'un des formats rencontrés dans les exports"""
+    h = hasard.choice([6, 7, 7, 8, 10, 11, 11, 12, 12, 13, 15, 17])
+    m = hasard.choice([0, 0, 15, 30, 45])
+    return hasard.choice([heure(h, m), f"{h:02d}:{m:02d}", f"{h:02d}h{m:02d}", f"{h}{m:02d}", f"{h}:{m:02d}"])
+
+
+def generer_lignes(nb_lignes, graine=42, numero_depart=900000):
+    """Itère les lignes (listes alignées sur COLONNES_EXCEL) d'un export synthétique"""
+    hasard = random.Random(graine)
+
+    for i in range(nb_lignes):
+        numero = numero_depart + i
+        app = str(hasard.randint(100, 2500)) if hasard.random() < 0.3 else None
+
+        yield [
+            f"{numero}.{hasard.randint(1, 3)}" if hasard.random() < 0.1 else numero,
+            hasard.choice(EVENEMENTS),
+            f"Client {hasard.randint(1, nb_lignes // 3 + 1)}",
+            f"Réception - {hasard.choice(CONSEILLERS)}" if hasard.random() < 0.5 else None,
+            f"{hasard.randint(1, 9999)} {hasard.choice(RUES)}{hasard.choice(VILLES)}",
+            app,
+            'Porte arrière' if hasard.random() < 0.05 else None,
+            code_postal_aleatoire(hasard),
+            heure_aleatoire(hasard),
+            hasard.choice([None, 4, 8, 12, 20, 35, 60, 150]),
+            hasard.choice(MODES_ENVOI),
+            hasard.choice(CONSEILLERS),
+            'Appeler à l\'arrivée' if hasard.random() < 0.2 else None,
+        ]
+
+
+def generer_classeur(destination, nb_lignes, graine=42, date_livraison=None):
+    """
+    Écrit un classeur au format attendu par ExcelImportService:
+    3 lignes de titre, l'en-tête, puis les livraisons. `destination`: chemin ou flux.
+    """
+    date_livraison = date_livraison or date.today()
+
+    classeur = openpyxl.Workbook(write_only=True)
+    feuille = classeur.create_sheet('Livraisons')
+    feuille.append(['Liste des livraisons'])
+    feuille.append([f"Date: {date_livraison.strftime('%Y-%m-%d')}"])
+    feuille.append([])
+    feuille.append(COLONNES_EXCEL)
+
+    for ligne in generer_lignes(nb_lignes, graine):
+        feuille.append(ligne)
+
+    classeur.save(destination)
+    return destination
+
+
+# ==========================================
+# FAUX FOURNISSEUR DE GÉOCODAGE
+# ==========================================
+
+class StubGeocodage(BaseHTTPRequestHandler):
+    """Répond comme Nominatim avec une position dans la région de Montréal"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        time.sleep(self.server.latence)
+
+        decalage = (hash(query) % 1000) / 10000
+        corps = json.dumps([{
+            'lat': str(45.50 + decalage),
+            'lon': str(-73.57 + decalage),
+            'place_id': abs(hash(query)),
+            'display_name': query,
+        }]).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stub_geocodage(latence=0.02, debit=100, workers=8):
+    """Démarre le faux fournisseur et y dirige le géocodage le temps du bloc"""
+    serveur = ThreadingHTTPServer(('127.0.0.1', 0), StubGeocodage)
+    serveur.latence = latence
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        try:
+            with override_settings(
+                GEOCODING_LIMITEUR_DOSSIER=dossier,
+                GEOCODING_FOURNISSEURS={'nominatim': {
+                    'url': f'http://127.0.0.1:{serveur.server_address[1]}/search',
+                    'debit': debit,
+                    'capacite': workers,
+                    'workers': workers,
+                }},
+            ):
+                yield serveur
+        finally:
+            serveur.shutdown()
+            serveur.server_close()
+
+
+# ==========================================
+# BANC D'ESSAI
+# ==========================================
+
+class CompteurRequetes:
+    """execute_wrapper qui compte les requêtes SQL par phase d'import"""
+
+    def __init__(self, service):
+        self.service = service
+        self.par_phase = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        phase = self.service.phase_courante or 'hors_phase'
+        self.par_phase[phase] = self.par_phase.get(phase, 0) + 1
+        return execute(sql, params, many, context)
+
+
+def metadonnees():
+    """Contexte du run, pour comparer les résultats entre versions"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, timeout=5, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'base_de_donnees': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+class BenchmarkImport:
+    """
+    Mesure un import complet par phase (lecture, normalisation, chargement,
+    géocodage, traitement, écriture) et compte les requêtes SQL de chacune.
+    Chaque mesure tourne dans une transaction annulée à la fin.
+    """
+
+    def __init__(self, date_livraison=None, latence=0.02, debit=100, workers=8, reimport=True, graine=42):
+        self.date_livraison = date_livraison or date(2099, 1, 1)
+        self.latence = latence
+        self.debit = debit
+        self.workers = workers
+        self.reimport = reimport
+        self.graine = graine
+
+    def mesurer_passe(self, contenu, nom_passe):
+        service = ExcelImportService(geocodage_differe=False)
+        compteur = CompteurRequetes(service)
+
+        debut = time.perf_counter()
+        with connection.execute_wrapper(compteur), contextlib.redirect_stdout(io.StringIO()):
+            resultat = service.importer(io.BytesIO(contenu), date_livraison=self.date_livraison)
+        total = time.perf_counter() - debut
+
+        if not resultat['success']:
+            raise RuntimeError(resultat.get('error', 'Import en échec'))
+
+        lignes = resultat['imported'] + resultat['updated'] + resultat['skipped']
+        return {
+            'passe': nom_passe,
+            'creees': resultat['imported'],
+            'mises_a_jour': resultat['updated'],
+            'inchangees': resultat['skipped'],
+            'erreurs': len(resultat['errors']),
+            'durees_s': {phase: round(duree, 4) for phase, duree in resultat['durees'].items()},
+            'total_s': round(total, 4),
+            'lignes_par_seconde': round(lignes / total, 1) if total else None,
+            'requetes_sql': dict(compteur.par_phase),
+            'requetes_sql_total': sum(compteur.par_phase.values()),
+            'cache_geocodage': resultat['geocoding_cache'],
+        }
+
+    def mesurer(self, nb_lignes):
+        """Mesures pour une taille de classeur (import initial puis réimport identique)"""
+        debut = time.perf_counter()
+        contenu = generer_classeur(io.BytesIO(), nb_lignes, self.graine, self.date_livraison).getvalue()
+        generation = time.perf_counter() - debut
+
+        passes = []
+        with stub_geocodage(self.latence, self.debit, self.workers), transaction.atomic():
+            cache_memoire.clear()
+            passes.append(self.mesurer_passe(contenu, 'import'))
+            if self.reimport:
+                passes.append(self.mesurer_passe(contenu, 'reimport_identique'))
+            transaction.set_rollback(True)
+        cache_memoire.clear()
+
+        return {
+            'lignes': nb_lignes,
+            'taille_fichier_octets': len(contenu),
+            'generation_s': round(generation, 4),
+            'passes': passes,
+        }
+
+    def executer(self, tailles):
+        return {
+            'metadonnees': metadonnees(),
+            'parametres': {
+                'latence_geocodage_s': self.latence,
+                'debit_geocodage': self.debit,
+                'workers_geocodage': self.workers,
+                'graine': self.graine,
+            },
+            'resultats': [self.mesurer(nb_lignes) for nb_lignes in tailles],
+        }
+
+
+def enregistrer_resultats(resultats, chemin):
+    os.makedirs(os.path.dirname(os.path.abspath(chemin)), exist_ok=True)
+    with open(chemin, 'w', encoding='utf-8') as fichier:
+        json.dump(resultats, fichier, ensure_ascii=False, indent=2)
+    return chemin
@@ -0,0 +1,257 @@
+"""
+Index des disponibilités des livreurs (DisponibiliteLivreur) sur une fenêtre de dates.
+
+Les périodes [date_debut, date_fin] sont rangées dans des arbres d'intervalles
+centrés, un global et un par livreur: "qui est là le jour D", "quelles
+disponibilités chevauchent [D1, D2]" et "quels livreurs sont libres pour cette
+route" se résolvent en O(log n + k) sans requête par livreur.
+
+L'index est gardé par processus. Les créations, modifications et suppressions
+(signals) le mettent à jour sur place; sa version (nombre de lignes, dernière
+date_maj) détecte les changements faits par un autre processus, qui provoquent
+un rechargement de la fenêtre.
+"""
+
+import threading
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+
+# Absences: priment sur une disponibilité couvrant la même date
+TYPES_ABSENCE = ('indisponible', 'conge', 'maladie')
+
+# Heures couvertes par chaque période (libellés de Livraison.PERIODE_CHOICES)
+HEURES_PERIODES = {
+    'matin': (time(5, 0), time(9, 0)),
+    'midi': (time(9, 30), time(12, 30)),
+    'apres_midi': (time(13, 0), time(20, 0)),
+}
+
+# Fenêtre chargée autour des dates demandées (jours)
+MARGE_AVANT = getattr(settings, 'DISPONIBILITES_MARGE_AVANT_JOURS', 7)
+MARGE_APRES = getattr(settings, 'DISPONIBILITES_MARGE_APRES_JOURS', 60)
+
+
+class Intervalle:
+    """Une ligne DisponibiliteLivreur; bornes en ordinaux de date, inclusives"""
+
+    __slots__ = ('id', 'livreur_id', 'debut', 'fin', 'type_dispo', 'heure_debut_shift', 'heure_fin_shift', 'notes')
+
+    def __init__(self, dispo):
+        self.id = dispo.id
+        self.livreur_id = dispo.livreur_id
+        self.debut = dispo.date_debut.toordinal()
+        self.fin = dispo.date_fin.toordinal()
+        self.type_dispo = dispo.type_dispo
+        self.heure_debut_shift = dispo.heure_debut_shift
+        self.heure_fin_shift = dispo.heure_fin_shift
+        self.notes = dispo.notes
+
+    def couvre_heures(self, debut, fin):
+        """Le shift (s'il est renseigné) recoupe-t-il [debut, fin] ?"""
+        if self.heure_debut_shift is not None and self.heure_debut_shift > fin:
+            return False
+        if self.heure_fin_shift is not None and self.heure_fin_shift < debut:
+            return False
+        return True
+
+
+class ArbreIntervalles:
+    """
+    Arbre d'intervalles centré, statique: reconstruit paresseusement après
+    ajout/retrait. Chaque nœud garde les intervalles contenant son centre,
+    triés par début et par fin décroissante.
+    """
+
+    def __init__(self, intervalles=()):
+        self.intervalles = {intervalle.id: intervalle for intervalle in intervalles}
+        self.racine = None
+        self.a_construire = True
+
+    def __len__(self):
+        return len(self.intervalles)
+
+    def ajouter(self, intervalle):
+        self.intervalles[intervalle.id] = intervalle
+        self.a_construire = True
+
+    def retirer(self, id_intervalle):
+        if self.intervalles.pop(id_intervalle, None) is not None:
+            self.a_construire = True
+
+    @classmethod
+    def construire_noeud(cls, intervalles):
+        if not intervalles:
+            return None
+        bornes = sorted(b for intervalle in intervalles for b in (intervalle.debut, intervalle.fin))
+        centre = bornes[len(bornes) // 2]
+        gauche = [i for i in intervalles if i.fin < centre]
+        droite = [i for i in intervalles if i.debut > centre]
+        ici = [i for i in intervalles if i.debut <= centre <= i.fin]
+        return (
+            centre,
+            sorted(ici, key=lambda i: i.debut),
+            sorted(ici, key=lambda i: -i.fin),
+            cls.construire_noeud(gauche),
+            cls.construire_noeud(droite),
+        )
+
+    def noeud(self):
+        if self.a_construire:
+            self.racine = self.construire_noeud(list(self.intervalles.values()))
+            self.a_construire = False
+        return self.racine
+
+    def chevauchant(self, debut, fin):
+        """Intervalles recoupant [debut, fin] (ordinaux), O(log n + k)"""
+        resultats = []
+        a_visiter = [self.noeud()]
+        while a_visiter:
+            noeud = a_visiter.pop()
+            if noeud is None:
+                continue
+            centre, par_debut, par_fin, gauche, droite = noeud
+            if fin < centre:
+                for intervalle in par_debut:
+                    if intervalle.debut > fin:
+                        break
+                    resultats.append(intervalle)
+                a_visiter.append(gauche)
+            elif debut > centre:
+                for intervalle in par_fin:
+                    if intervalle.fin < debut:
+                        break
+                    resultats.append(intervalle)
+                a_visiter.append(droite)
+            else:
+                resultats.extend(par_debut)
+                a_visiter.append(gauche)
+                a_visiter.append(droite)
+        return resultats
+
+    def couvrant(self, point):
+        return self.chevauchant(point, point)
+
+
+class IndexDisponibilites:
+    """Disponibilités d'une fenêtre [debut, fin]: arbre global et arbres par livreur"""
+
+    def __init__(self, debut, fin, dispos=(), version=None):
+        self.debut = debut
+        self.fin = fin
+        self.version = version
+        self.global_ = ArbreIntervalles()
+        self.par_livreur = {}
+        for dispo in dispos:
+            self.ajouter(dispo)
+
+    def couvre(self, debut, fin):
+        return self.debut <= debut and fin <= self.fin
+
+    def ajouter(self, dispo):
+        """Ajoute ou remplace une disponibilité (hors fenêtre: seulement retirée)"""
+        self.retirer(dispo.id)
+        if dispo.date_fin < self.debut or dispo.date_debut > self.fin:
+            return
+        intervalle = Intervalle(dispo)
+        self.global_.ajouter(intervalle)
+        self.par_livreur.setdefault(intervalle.livreur_id, ArbreIntervalles()).ajouter(intervalle)
+
+    def retirer(self, id_dispo):
+        intervalle = self.global_.intervalles.get(id_dispo)
+        if intervalle is None:
+            return
+        self.global_.retirer(id_dispo)
+        self.par_livreur[intervalle.livreur_id].retirer(id_dispo)
+
+    def arbre(self, livreur_id=None):
+        if livreur_id is None:
+            return self.global_
+        return self.par_livreur.get(livreur_id) or ArbreIntervalles()
+
+    def au(self, jour, livreur_id=None):
+        """Disponibilités couvrant `jour`, triées par début de shift (non renseigné d'abord, comme en SQL)"""
+        return sorted(
+            self.arbre(livreur_id).couvrant(jour.toordinal()),
+            key=lambda i: (i.heure_debut_shift is not None, i.heure_debut_shift or time.min, i.debut),
+        )
+
+    def entre(self, debut, fin, livreur_id=None):
+        """Disponibilités recoupant [debut, fin], triées par date de début"""
+        return sorted(
+            self.arbre(livreur_id).chevauchant(debut.toordinal(), fin.toordinal()),
+            key=lambda i: (i.debut, i.livreur_id),
+        )
+
+    def livreurs_libres(self, jour, periode=None, heure=None, exclure=()):
+        """
+        {livreur_id: Intervalle} des livreurs disponibles le `jour`, sans absence ce jour-là,
+        dont le shift recoupe `heure` (ou à défaut la période), hors `exclure`.
+        """
+        if heure is not None:
+            debut, fin = heure, heure
+        else:
+            debut, fin = HEURES_PERIODES.get(periode, (time.min, time.max))
+
+        absents = set(exclure)
+        libres = {}
+        for intervalle in self.au(jour):
+            if intervalle.type_dispo in TYPES_ABSENCE:
+                absents.add(intervalle.livreur_id)
+            elif intervalle.couvre_heures(debut, fin):
+                libres.setdefault(intervalle.livreur_id, intervalle)
+        return {livreur_id: intervalle for livreur_id, intervalle in libres.items() if livreur_id not in absents}
+
+
+def version_disponibilites():
+    from .models import DisponibiliteLivreur
+
+    bornes = DisponibiliteLivreur.objects.aggregate(nombre=Count('id'), maj=Max('date_maj'))
+    return bornes['nombre'], bornes['maj']
+
+
+def charger_index(debut, fin):
+    from .models import DisponibiliteLivreur
+
+    version = version_disponibilites()
+    dispos = DisponibiliteLivreur.objects.filter(date_debut__lte=fin, date_fin__gte=debut)
+    return IndexDisponibilites(debut, fin, dispos, version)
+
+
+_index = {'index': None}
+_index_lock = threading.RLock()
+
+
+def index_disponibilites(debut, fin=None):
+    """Index partagé par processus couvrant [debut, fin], rechargé si la table a changé ailleurs"""
+    fin = fin or debut
+    version = version_disponibilites()
+    with _index_lock:
+        index = _index['index']
+        if index is None or index.version != version or not index.couvre(debut, fin):
+            index = charger_index(debut - timedelta(days=MARGE_AVANT), fin + timedelta(days=MARGE_APRES))
+            _index['index'] = index
+        return index
+
+
+def actualiser(dispo, creee=False, supprimee=False):
+    """
+    Mise à jour sur place après création/modification/suppression. La version relue
+    est adoptée seulement si elle s'explique par ce seul changement; sinon rechargement.
+    """
+    with _index_lock:
+        index = _index['index']
+        if index is None or index.version is None:
+            return
+        nombre, maj = index.version
+        actuelle = version_disponibilites()
+        if supprimee:
+            index.retirer(dispo.id)
+            # La dernière date_maj peut reculer si la ligne supprimée était la plus récente
+            conforme = actuelle[0] == nombre - 1 and (actuelle[1] is None or maj is None or actuelle[1] <= maj)
+        else:
+            index.ajouter(dispo)
+            conforme = actuelle == (nombre + 1 if creee else nombre, dispo.date_maj)
+        index.version = actuelle if conforme else None
@@ -0,0 +1,301 @@
+"""
+Diffusion des changements de livraisons et de routes en Server-Sent Events.
+
+Chaque changement (statut d'une livraison ou d'une route, arrêt ajouté/retiré,
+ordre modifié) est écrit dans EvenementLivraison, dans la même transaction que
+le changement: l'id de la ligne est l'identifiant d'événement SSE. Un client
+reconnecté envoie Last-Event-ID et reçoit les événements manqués.
+
+Sous ASGI (restaurant_manager/asgi.py), une seule tâche par processus lit le
+journal toutes les INTERVALLE_S secondes et répartit les nouveaux événements
+entre les flux ouverts: le coût en base ne dépend plus du nombre d'écrans
+ouverts. Sous WSGI (runserver), chaque flux interroge le journal lui-même et se
+ferme après DUREE_FLUX_WSGI_S; EventSource se reconnecte avec Last-Event-ID.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# Lecture du journal (secondes)
+INTERVALLE_S = getattr(settings, 'EVENEMENTS_INTERVALLE_S', 1.0)
+
+# Commentaire envoyé sans événement, pour garder la connexion ouverte à travers les proxys
+BATTEMENT_S = getattr(settings, 'EVENEMENTS_BATTEMENT_S', 15)
+
+# Durée d'un flux avant fermeture (le navigateur se reconnecte seul)
+DUREE_FLUX_S = getattr(settings, 'EVENEMENTS_DUREE_FLUX_S', 300)
+DUREE_FLUX_WSGI_S = getattr(settings, 'EVENEMENTS_DUREE_FLUX_WSGI_S', 30)
+
+# Délai de reconnexion suggéré au navigateur (millisecondes)
+RECONNEXION_MS = 3000
+
+# Au-delà, le client reçoit "reset" et recharge tout plutôt que de rejouer le journal
+RATTRAPAGE_MAX = getattr(settings, 'EVENEMENTS_RATTRAPAGE_MAX', 500)
+
+# Conservation du journal, purgé toutes les PURGE_CHAQUE écritures
+RETENTION_JOURS = getattr(settings, 'EVENEMENTS_RETENTION_JOURS', 2)
+PURGE_CHAQUE = 1000
+
+
+# ==========================================
+# PUBLICATION
+# ==========================================
+
+def publier(type_evenement, date, route_id=None, **donnees):
+    """Écrit un événement dans le journal. Retourne l'EvenementLivraison créé."""
+    from .models import EvenementLivraison
+
+    evenement = EvenementLivraison.objects.create(
+        date=date, route_id=route_id, type=type_evenement, donnees=donnees
+    )
+    if evenement.id % PURGE_CHAQUE == 0:
+        EvenementLivraison.objects.filter(
+            horodatage__lt=timezone.now() - timedelta(days=RETENTION_JOURS)
+        ).delete()
+    return evenement
+
+
+def publier_livraison(livraison, route_id=None):
+    publier(
+        'livraison', livraison.date_livraison, route_id,
+        id=str(livraison.id), status=livraison.status, periode=livraison.periode,
+    )
+
+
+def publier_route(route, action=None):
+    donnees = {'status': route.status, 'periode': route.periode}
+    if action:
+        donnees['action'] = action
+    publier('route', route.date, route.id, **donnees)
+
+
+def publier_ordre(route):
+    publier('ordre', route.date, route.id, periode=route.periode)
+
+
+# ==========================================
+# LECTURE DU JOURNAL
+# ==========================================
+
+class FiltreEvenements:
+    """Événements d'une date et/ou d'une route (None: tous)"""
+
+    def __init__(self, date=None, route_id=None):
+        self.date = date
+        self.route_id = str(route_id) if route_id else None
+
+    def correspond(self, evenement):
+        return (
+            (self.date is None or evenement['date'] == self.date.isoformat())
+            and (self.route_id is None or evenement['route'] == self.route_id)
+        )
+
+    def appliquer(self, queryset):
+        if self.date is not None:
+            queryset = queryset.filter(date=self.date)
+        if self.route_id is not None:
+            queryset = queryset.filter(route_id=self.route_id)
+        return queryset
+
+
+def dernier_id():
+    from .models import EvenementLivraison
+
+    return EvenementLivraison.objects.aggregate(dernier=Max('id'))['dernier'] or 0
+
+
+def evenements_depuis(depuis, filtre=None, limite=None):
+    """Événements d'id > `depuis`, en dicts {id, type, date, route, donnees}"""
+    from .models import EvenementLivraison
+
+    queryset = EvenementLivraison.objects.filter(id__gt=depuis)
+    if filtre is not None:
+        queryset = filtre.appliquer(queryset)
+    queryset = queryset.order_by('id').values_list('id', 'type', 'date', 'route_id', 'donnees')
+    if limite is not None:
+        queryset = queryset[:limite]
+    return [
+        {
+            'id': id_evenement,
+            'type': type_evenement,
+            'date': date.isoformat(),
+            'route': str(route_id) if route_id else None,
+            'donnees': donnees,
+        }
+        for id_evenement, type_evenement, date, route_id, donnees in queryset
+    ]
+
+
+def rattrapage(depuis, filtre):
+    """
+    Événements manqués depuis Last-Event-ID: (événements, None), ou ([], id de reprise)
+    quand le journal ne permet pas de rejouer (purgé, trop long, base réinitialisée).
+    """
+    from .models import EvenementLivraison
+
+    bornes = EvenementLivraison.objects.aggregate(premier=Min('id'), dernier=Max('id'))
+    premier, dernier = bornes['premier'], bornes['dernier'] or 0
+    if depuis > dernier or (premier is not None and depuis < premier - 1):
+        return [], dernier
+
+    evenements = evenements_depuis(depuis, filtre, limite=RATTRAPAGE_MAX + 1)
+    if len(evenements) > RATTRAPAGE_MAX:
+        return [], dernier
+    return evenements, None
+
+
+def format_sse(evenement):
+    """Événement -> bloc text/event-stream (données JSON compactes)"""
+    donnees = {'route': evenement['route'], 'date': evenement['date'], **evenement['donnees']}
+    return (
+        f"id: {evenement['id']}\n"
+        f"event: {evenement['type']}\n"
+        f"data: {json.dumps(donnees, separators=(',', ':'))}\n\n"
+    )
+
+
+def format_controle(type_evenement, id_evenement):
+    """'pret' (flux ouvert) ou 'reset' (recharger l'état complet), avec l'id de reprise"""
+    return f"id: {id_evenement}\nevent: {type_evenement}\ndata: {{}}\n\n"
+
+
+# ==========================================
+# FLUX
+# ==========================================
+
+class Abonne:
+    def __init__(self, filtre, dernier):
+        self.filtre = filtre
+        self.dernier = dernier
+        self.file = asyncio.Queue()
+
+
+class Diffuseur:
+    """Lecture partagée du journal pour tous les flux d'une boucle asyncio"""
+
+    def __init__(self):
+        self.abonnes = set()
+        self.dernier = None
+        self.tache = None
+
+    async def demarrer(self):
+        # Position de lecture fixée avant tout rattrapage: aucun événement ne passe entre les deux
+        if self.dernier is None:
+            self.dernier = await sync_to_async(dernier_id)()
+
+    def abonner(self, filtre, dernier):
+        abonne = Abonne(filtre, dernier)
+        self.abonnes.add(abonne)
+        if self.tache is None or self.tache.done():
+            self.tache = asyncio.ensure_future(self.surveiller())
+        return abonne
+
+    def desabonner(self, abonne):
+        self.abonnes.discard(abonne)
+
+    async def surveiller(self):
+        while self.abonnes:
+            await asyncio.sleep(INTERVALLE_S)
+            try:
+                evenements = await sync_to_async(evenements_depuis)(self.dernier)
+            except Exception as e:
+                logger.error(f"Lecture du journal d'événements impossible: {e}")
+                continue
+            for evenement in evenements:
+                for abonne in list(self.abonnes):
+                    if abonne.filtre.correspond(evenement):
+                        abonne.file.put_nowait(evenement)
+            if evenements:
+                self.dernier = evenements[-1]['id']
+
+
+_diffuseurs = weakref.WeakKeyDictionary()
+
+
+def diffuseur():
+    """Diffuseur de la boucle asyncio courante (un par processus ASGI)"""
+    return _diffuseurs.setdefault(asyncio.get_running_loop(), Diffuseur())
+
+
+async def flux_asgi(filtre, depuis=None, duree=None):
+    """Flux SSE asynchrone: rattrapage depuis `depuis` puis événements du diffuseur"""
+    duree = DUREE_FLUX_S if duree is None else duree
+    yield f"retry: {RECONNEXION_MS}\n\n"
+
+    canal = diffuseur()
+    await canal.demarrer()
+    abonne = canal.abonner(filtre, canal.dernier)
+    try:
+        if depuis is None:
+            yield format_controle('pret', abonne.dernier)
+        else:
+            # Les événements déjà rejoués et reçus aussi du diffuseur sont ignorés (id <= abonne.dernier)
+            evenements, reprise = await sync_to_async(rattrapage)(depuis, filtre)
+            if reprise is not None:
+                abonne.dernier = reprise
+                yield format_controle('reset', reprise)
+            else:
+                abonne.dernier = depuis
+                for evenement in evenements:
+                    abonne.dernier = evenement['id']
+                    yield format_sse(evenement)
+
+        boucle = asyncio.get_running_loop()
+        fin = boucle.time() + duree
+        while (reste := fin - boucle.time()) > 0:
+            try:
+                evenement = await asyncio.wait_for(abonne.file.get(), min(BATTEMENT_S, reste))
+            except asyncio.TimeoutError:
+                yield ": battement\n\n"
+                continue
+            if evenement['id'] > abonne.dernier:
+                abonne.dernier = evenement['id']
+                yield format_sse(evenement)
+    finally:
+        canal.desabonner(abonne)
+
+
+def flux_wsgi(filtre, depuis=None, duree=None):
+    """Flux SSE synchrone (serveur WSGI): lit le journal lui-même et se ferme après `duree`"""
+    duree = DUREE_FLUX_WSGI_S if duree is None else duree
+    yield f"retry: {RECONNEXION_MS}\n\n"
+
+    if depuis is None:
+        dernier = dernier_id()
+        yield format_controle('pret', dernier)
+    else:
+        evenements, reprise = rattrapage(depuis, filtre)
+        if reprise is not None:
+            dernier = reprise
+            yield format_controle('reset', dernier)
+        else:
+            dernier = depuis
+            for evenement in evenements:
+                dernier = evenement['id']
+                yield format_sse(evenement)
+
+    fin = time.monotonic() + duree
+    battement = time.monotonic() + BATTEMENT_S
+    while time.monotonic() < fin:
+        time.sleep(min(INTERVALLE_S, max(fin - time.monotonic(), 0)))
+        evenements = evenements_depuis(dernier, filtre)
+        for evenement in evenements:
+            dernier = evenement['id']
+            yield format_sse(evenement)
+        if evenements:
+            battement = time.monotonic() + BATTEMENT_S
+        elif time.monotonic() >= battement:
+            battement = time.monotonic() + BATTEMENT_S
+            yield ": battement\n\n"
@@ -1,8 +1,264 @@
+import numpy as np
 import requests
 from decimal import Decimal
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import hashlib
+import os
+import tempfile
+import threading
 import time
 import re
 
+try:
+    import fcntl
+except ImportError:  # Windows: limiteur partagé entre threads seulement
+    fcntl = None
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# Durées de vie du cache (surchargeables dans settings.py)
+CACHE_TTL = timedelta(days=getattr(settings, 'GEOCODING_CACHE_TTL_JOURS', 90))
+CACHE_TTL_ECHEC = timedelta(hours=getattr(settings, 'GEOCODING_CACHE_TTL_ECHEC_HEURES', 24))
+CACHE_MEMOIRE_MAX = getattr(settings, 'GEOCODING_CACHE_MEMOIRE_MAX', 2048)
+
+# Champs Decimal à reconvertir après passage par JSON
+CHAMPS_DECIMAL = ('latitude', 'longitude')
+
+
+class CacheLRU:
+    """Cache mémoire borné (LRU) partagé par toutes les instances d'un processus"""
+    
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, cle):
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            resultat, expiration = entree
+            if expiration <= time.time():
+                del self._entrees[cle]
+                return None
+            self._entrees.move_to_end(cle)
+            return dict(resultat)
+    
+    def set(self, cle, resultat, ttl):
+        with self._lock:
+            self._entrees[cle] = (dict(resultat), time.time() + ttl.total_seconds())
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entrees.clear()
+
+
+cache_memoire = CacheLRU(CACHE_MEMOIRE_MAX)
+
+
+# Fournisseurs de géocodage (surchargeables via settings.GEOCODING_FOURNISSEURS)
+# debit: requêtes/seconde autorisées, capacite: rafale maximale, workers: requêtes simultanées
+FOURNISSEURS_PAR_DEFAUT = {
+    'nominatim': {
+        'url': 'https://nominatim.openstreetmap.org/search',
+        'debit': 1.0,  # Politique d'usage Nominatim: 1 requête/seconde
+        'capacite': 1,
+        'workers': 2,
+    },
+}
+
+
+def config_fournisseur(nom):
+    """Configuration d'un fournisseur, complétée par les valeurs par défaut"""
+    fournisseurs = getattr(settings, 'GEOCODING_FOURNISSEURS', {})
+    config = dict(FOURNISSEURS_PAR_DEFAUT.get(nom, FOURNISSEURS_PAR_DEFAUT['nominatim']))
+    config.update(fournisseurs.get(nom, {}))
+    return config
+
+
+class LimiteurDebit:
+    """
+    Seau à jetons partagé entre les threads et les processus d'une machine.
+    L'état (jetons, horodatage) vit dans un petit fichier verrouillé: chaque appel
+    réserve un jeton puis dort le temps nécessaire, hors verrou.
+    """
+    
+    def __init__(self, nom, debit, capacite=1, dossier=None):
+        self.debit = float(debit)
+        self.capacite = float(capacite)
+        self.chemin = os.path.join(dossier or tempfile.gettempdir(), f'geocodage_{nom}.jetons')
+        self._lock = threading.Lock()
+        self._etat = None  # Repli sans fcntl
+    
+    def _lire(self, fichier):
+        fichier.seek(0)
+        try:
+            jetons, horodatage = fichier.read().split()
+            return float(jetons), float(horodatage)
+        except ValueError:
+            return self.capacite, time.time()
+    
+    def _reserver(self, fichier=None):
+        """Retire un jeton (éventuellement à crédit) et retourne l'attente en secondes"""
+        maintenant = time.time()
+        jetons, horodatage = self._lire(fichier) if fichier else (self._etat or (self.capacite, maintenant))
+        
+        jetons = min(self.capacite, jetons + max(0.0, maintenant - horodatage) * self.debit)
+        jetons -= 1
+        
+        if fichier:
+            fichier.seek(0)
+            fichier.truncate()
+            fichier.write(f"{jetons} {maintenant}")
+            fichier.flush()
+        else:
+            self._etat = (jetons, maintenant)
+        
+        return max(0.0, -jetons / self.debit)
+    
+    def acquerir(self):
+        """Bloque jusqu'à ce qu'une requête soit autorisée"""
+        with self._lock:
+            if fcntl is None:
+                attente = self._reserver()
+            else:
+                with open(self.chemin, 'a+') as fichier:
+                    fcntl.flock(fichier, fcntl.LOCK_EX)
+                    try:
+                        attente = self._reserver(fichier)
+                    finally:
+                        fcntl.flock(fichier, fcntl.LOCK_UN)
+        if attente:
+            time.sleep(attente)
+        return attente
+
+
+# ==========================================
+# INDEX LOCAL DES CODES POSTAUX
+# ==========================================
+
+# Enregistrement: code (FSA "H3B" ou FSA+LDU "H3B2G2"), latitude, longitude
+DTYPE_CODES_POSTAUX = np.dtype([('code', 'S6'), ('latitude', '<f4'), ('longitude', '<f4')])
+CHEMIN_INDEX_CODES_POSTAUX = os.path.join(os.path.dirname(__file__), 'data', 'codes_postaux.bin')
+
+
+class IndexCodesPostaux:
+    """
+    Centroïdes des codes postaux canadiens, triés par code et mappés en mémoire.
+    Recherche dichotomique sur le code complet, puis repli sur la FSA (3 caractères).
+    """
+    
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.entrees = np.memmap(chemin, dtype=DTYPE_CODES_POSTAUX, mode='r')
+        self.codes = self.entrees['code']
+    
+    def __len__(self):
+        return len(self.entrees)
+    
+    @staticmethod
+    def normaliser(code_postal):
+        return re.sub(r'[^A-Z0-9]', '', (code_postal or '').upper())[:6]
+    
+    def _position(self, code):
+        cle = code.encode('ascii')
+        position = int(np.searchsorted(self.codes, cle))
+        if position < len(self.codes) and self.codes[position] == cle:
+            return position
+        return None
+    
+    def chercher(self, code_postal):
+        """Retourne un résultat de géocodage approximatif, ou None si le code est inconnu"""
+        code = self.normaliser(code_postal)
+        if len(code) < 3:
+            return None
+        
+        for cle, precision in ((code, 'ldu'), (code[:3], 'fsa')):
+            if len(cle) not in (3, 6):
+                continue
+            position = self._position(cle)
+            if position is not None:
+                entree = self.entrees[position]
+                return {
+                    'success': True,
+                    'latitude': Decimal(str(round(float(entree['latitude']), 6))),
+                    'longitude': Decimal(str(round(float(entree['longitude']), 6))),
+                    'place_id': '',
+                    'approximatif': True,
+                    'base_code_postal': True,
+                    'source': 'index_local',
+                    'precision': precision,
+                }
+        return None
+    
+    @staticmethod
+    def ecrire(chemin, centroides):
+        """
+        Écrit un index à partir de {code normalisé: (latitude, longitude)}.
+        Les centroïdes FSA absents sont calculés comme moyenne de leurs LDU.
+        """
+        par_fsa = {}
+        for code, (lat, lon) in centroides.items():
+            if len(code) == 6:
+                par_fsa.setdefault(code[:3], []).append((lat, lon))
+        
+        tous = dict(centroides)
+        for fsa, points in par_fsa.items():
+            if fsa not in tous:
+                tous[fsa] = (
+                    sum(p[0] for p in points) / len(points),
+                    sum(p[1] for p in points) / len(points),
+                )
+        
+        entrees = np.array(
+            [(code.encode('ascii'), lat, lon) for code, (lat, lon) in tous.items()],
+            dtype=DTYPE_CODES_POSTAUX
+        )
+        entrees.sort(order='code')
+        
+        os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+        chemin_temporaire = f"{chemin}.tmp"
+        entrees.tofile(chemin_temporaire)
+        os.replace(chemin_temporaire, chemin)
+        return len(entrees)
+
+
+_index_codes_postaux = {}
+
+
+def index_codes_postaux():
+    """Index partagé du processus (None si le fichier n'est pas installé)"""
+    chemin = getattr(settings, 'GEOCODING_INDEX_CODES_POSTAUX', CHEMIN_INDEX_CODES_POSTAUX)
+    if chemin not in _index_codes_postaux:
+        try:
+            _index_codes_postaux[chemin] = IndexCodesPostaux(chemin) if os.path.getsize(chemin) else None
+        except (OSError, ValueError):
+            _index_codes_postaux[chemin] = None
+    return _index_codes_postaux[chemin]
+
+
+_limiteurs = {}
+_limiteurs_lock = threading.Lock()
+
+
+def limiteur_pour(nom, config):
+    """Un seul limiteur par fournisseur et par processus"""
+    dossier = getattr(settings, 'GEOCODING_LIMITEUR_DOSSIER', None)
+    cle = (nom, config['debit'], config['capacite'], dossier)
+    with _limiteurs_lock:
+        if cle not in _limiteurs:
+            _limiteurs[cle] = LimiteurDebit(nom, config['debit'], config['capacite'], dossier)
+        return _limiteurs[cle]
+
+
 class GeocodingService:
     """Service de géocodage ultra-précis pour Québec"""
     
@@ -28,12 +284,112 @@ class GeocodingService:
         'LaSalle',
     ]
     
-    def __init__(self):
-        self.base_url = "https://nominatim.openstreetmap.org/search"
+    def __init__(self, fournisseur='nominatim'):
+        self.fournisseur = config_fournisseur(fournisseur)
+        self.base_url = self.fournisseur['url']
         self.headers = {
             'User-Agent': 'RestaurantManager/1.0'
         }
-        self.cache = {}
+        self.limiteur = limiteur_pour(fournisseur, self.fournisseur)
+        
+        # Session partagée par les threads du pool: connexions keep-alive réutilisées
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adaptateur = requests.adapters.HTTPAdapter(pool_maxsize=max(1, self.fournisseur['workers']))
+        self.session.mount('http://', adaptateur)
+        self.session.mount('https://', adaptateur)
+        
+        # Résultats pré-calculés par GeocodagePool (clé normalisée -> résultat)
+        self.resultats_lot = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'hits_memoire': 0,
+            'hits_base': 0,
+            'misses': 0,
+            'requetes_api': 0,
+        }
+    
+    # ==========================================
+    # CACHE (mémoire LRU -> base de données -> API)
+    # ==========================================
+    
+    @staticmethod
+    def normaliser_cle(cache_key):
+        """Clé insensible à la casse et aux espaces superflus"""
+        return re.sub(r'\s+', ' ', cache_key).strip().lower()
+    
+    @staticmethod
+    def _serialiser(resultat):
+        return {k: str(v) if isinstance(v, Decimal) else v for k, v in resultat.items()}
+    
+    @staticmethod
+    def _deserialiser(resultat):
+        resultat = dict(resultat)
+        for champ in CHAMPS_DECIMAL:
+            if resultat.get(champ) is not None:
+                resultat[champ] = Decimal(resultat[champ])
+        return resultat
+    
+    def lire_cache(self, cache_key):
+        """Cherche un résultat en mémoire puis en base; None si absent ou expiré"""
+        from .models import GeocodeCache
+        
+        cle = self.normaliser_cle(cache_key)
+        
+        resultat = cache_memoire.get(cle)
+        if resultat is not None:
+            self.stats['hits_memoire'] += 1
+            return self._deserialiser(resultat)
+        
+        entree = GeocodeCache.objects.filter(
+            cle_hash=hashlib.sha1(cle.encode('utf-8')).hexdigest(),
+            date_expiration__gt=timezone.now()
+        ).first()
+        
+        if entree is None:
+            self.stats['misses'] += 1
+            return None
+        
+        self.stats['hits_base'] += 1
+        cache_memoire.set(cle, entree.resultat, entree.date_expiration - timezone.now())
+        return self._deserialiser(entree.resultat)
+    
+    def ecrire_cache(self, cache_key, resultat):
+        """Mémorise un résultat (TTL court pour les échecs)"""
+        from .models import GeocodeCache
+        
+        cle = self.normaliser_cle(cache_key)
+        ttl = CACHE_TTL if resultat.get('success') else CACHE_TTL_ECHEC
+        donnees = self._serialiser(resultat)
+        
+        cache_memoire.set(cle, donnees, ttl)
+        GeocodeCache.objects.update_or_create(
+            cle_hash=hashlib.sha1(cle.encode('utf-8')).hexdigest(),
+            defaults={
+                'cle': cle,
+                'succes': bool(resultat.get('success')),
+                'resultat': donnees,
+                'date_creation': timezone.now(),
+                'date_expiration': timezone.now() + ttl,
+            }
+        )
+    
+    def statistiques_cache(self):
+        """Compteurs de hits/misses pour le résumé d'import"""
+        hits = self.stats['hits_memoire'] + self.stats['hits_base']
+        total = hits + self.stats['misses']
+        return {
+            **self.stats,
+            'taux_hits': round(hits * 100 / total, 1) if total else 0,
+        }
+    
+    @staticmethod
+    def purger_cache_expire():
+        """Supprime les entrées expirées de la base"""
+        from .models import GeocodeCache
+        
+        supprimees, _ = GeocodeCache.objects.filter(date_expiration__lte=timezone.now()).delete()
+        return supprimees
     
     def detecter_ville_depuis_code_postal(self, code_postal):
         """Détecte la ville probable depuis le code postal"""
@@ -146,11 +502,8 @@ class GeocodingService:
         
         return code
     
-    def geocoder_adresse(self, adresse_complete, ville=None, code_postal=None):
-        """
-        Géocode avec stratégie intelligente
-        Retourne latitude, longitude, place_id ET ville détectée
-        """
+    def preparer_requete(self, adresse_complete, ville=None, code_postal=None):
+        """Normalise l'adresse et choisit la ville; retourne les éléments de la requête"""
         # Extraire adresse précise ET ville depuis l'adresse
         adresse_precise, ville_detectee = self.extraire_adresse_precise(adresse_complete)
         code_postal_clean = self.formater_code_postal(code_postal) if code_postal else None
@@ -171,12 +524,73 @@ class GeocodingService:
         else:
             ville_finale = 'Montréal'
         
-        print(f"🔍 Géocodage: {adresse_precise} | {code_postal_clean} | {ville_finale}")
+        return {
+            'adresse_complete': adresse_complete,
+            'adresse_precise': adresse_precise,
+            'code_postal_clean': code_postal_clean,
+            'ville_finale': ville_finale,
+            'cache_key': f"{adresse_precise}|{code_postal_clean}|{ville_finale}",
+        }
+    
+    def position_approximative(self, code_postal, ville_finale):
+        """Centroïde du code postal depuis l'index local (aucun appel réseau)"""
+        index = index_codes_postaux()
+        resultat = index.chercher(code_postal) if index else None
+        if resultat:
+            resultat['ville_utilisee'] = ville_finale
+        return resultat
+    
+    def geocoder_adresse(self, adresse_complete, ville=None, code_postal=None, hors_ligne=False):
+        """
+        Géocode avec stratégie intelligente
+        Retourne latitude, longitude, place_id ET ville détectée
+        
+        hors_ligne=True: n'interroge pas l'API; si le cache ne connaît pas l'adresse,
+        retourne le centroïde du code postal (source 'index_local', à affiner plus tard).
+        En ligne, le centroïde sert aussi de repli quand l'API échoue (api_tentee=True).
+        """
+        requete = self.preparer_requete(adresse_complete, ville, code_postal)
+        cache_key = requete['cache_key']
+        
+        print(f"🔍 Géocodage: {requete['adresse_precise']} | {requete['code_postal_clean']} | {requete['ville_finale']}")
         
-        # Cache
-        cache_key = f"{adresse_precise}|{code_postal_clean}|{ville_finale}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        # Déjà résolu par le pool parallèle, sinon cache
+        resultat = self.resultats_lot.get(self.normaliser_cle(cache_key))
+        if resultat is not None:
+            resultat = dict(resultat)
+        else:
+            resultat = self.lire_cache(cache_key)
+        
+        if resultat is None and hors_ligne:
+            return self.position_approximative(requete['code_postal_clean'], requete['ville_finale']) or {
+                'success': False,
+                'error': 'Adresse absente du cache et de l\'index des codes postaux',
+                'adresse_originale': adresse_complete,
+                'ville_utilisee': requete['ville_finale']
+            }
+        
+        if resultat is None:
+            resultat, erreur_reseau = self.executer_strategies(requete)
+            self.memoriser(cache_key, resultat, erreur_reseau)
+        
+        # Repli: centroïde du code postal pour que la livraison apparaisse sur la carte
+        if not resultat['success']:
+            repli = self.position_approximative(requete['code_postal_clean'], requete['ville_finale'])
+            if repli:
+                repli['api_tentee'] = True
+                repli['error'] = resultat.get('error', 'Géocodage impossible')
+                return repli
+        return resultat
+    
+    def executer_strategies(self, requete):
+        """
+        Interroge l'API selon les 3 stratégies (aucun accès base: sûr dans un thread).
+        Retourne (résultat, erreur_reseau).
+        """
+        adresse_precise = requete['adresse_precise']
+        code_postal_clean = requete['code_postal_clean']
+        ville_finale = requete['ville_finale']
+        erreur_reseau = False
         
         # STRATÉGIE 1: Adresse + Code postal + Ville (OPTIMAL)
         if code_postal_clean and adresse_precise:
@@ -185,8 +599,8 @@ class GeocodingService:
             
             if result['success']:
                 result['ville_utilisee'] = ville_finale
-                self.cache[cache_key] = result
-                return result
+                return result, False
+            erreur_reseau = erreur_reseau or 'error' in result
         
         # STRATÉGIE 2: Adresse + Ville
         if adresse_precise:
@@ -196,8 +610,8 @@ class GeocodingService:
             if result['success']:
                 result['approximatif'] = True
                 result['ville_utilisee'] = ville_finale
-                self.cache[cache_key] = result
-                return result
+                return result, False
+            erreur_reseau = erreur_reseau or 'error' in result
         
         # STRATÉGIE 3: Code postal + Ville (dernier recours)
         if code_postal_clean:
@@ -208,18 +622,27 @@ class GeocodingService:
                 result['approximatif'] = True
                 result['base_code_postal'] = True
                 result['ville_utilisee'] = ville_finale
-                self.cache[cache_key] = result
-                return result
+                return result, False
+            erreur_reseau = erreur_reseau or 'error' in result
         
         return {
             'success': False,
             'error': 'Géocodage impossible',
-            'adresse_originale': adresse_complete,
+            'adresse_originale': requete['adresse_complete'],
             'ville_utilisee': ville_finale
-        }
+        }, erreur_reseau
+    
+    def memoriser(self, cache_key, resultat, erreur_reseau=False):
+        """Écrit le résultat dans le cache; pas de cache négatif sur panne réseau"""
+        if resultat['success'] or not erreur_reseau:
+            self.ecrire_cache(cache_key, resultat)
     
     def _geocoder_query(self, query):
         """Effectue la requête de géocodage"""
+        with self._stats_lock:
+            self.stats['requetes_api'] += 1
+        
+        self.limiteur.acquerir()  # Respecter le débit du fournisseur
         try:
             params = {
                 'q': query,
@@ -229,15 +652,12 @@ class GeocodingService:
                 'countrycodes': 'ca'
             }
             
-            response = requests.get(
+            response = self.session.get(
                 self.base_url,
                 params=params,
-                headers=self.headers,
                 timeout=10
             )
             
-            time.sleep(1)  # Respecter rate limit Nominatim
-            
             if response.status_code == 200:
                 data = response.json()
                 
@@ -256,8 +676,63 @@ class GeocodingService:
                             'display_name': result.get('display_name', ''),
                             'query_used': query
                         }
+            else:
+                return {'success': False, 'error': f"HTTP {response.status_code}"}
             
             return {'success': False}
             
         except Exception as e:
-            return {'success': False, 'error': str(e)}
\ No newline at end of file
+            return {'success': False, 'error': str(e)}
+
+
+class GeocodagePool:
+    """
+    Géocode un lot d'adresses en parallèle derrière le limiteur du fournisseur.
+    Le cache est lu et écrit dans le thread appelant; seuls les appels HTTP
+    partent dans les threads.
+    """
+    
+    def __init__(self, service=None, workers=None):
+        self.service = service or GeocodingService()
+        self.workers = workers or self.service.fournisseur['workers']
+    
+    def geocoder_lot(self, adresses):
+        """
+        `adresses`: itérable de (adresse_complete, code_postal).
+        Retourne {clé normalisée: résultat} et le garde dans service.resultats_lot.
+        """
+        service = self.service
+        resultats = {}
+        a_resoudre = {}
+        
+        for adresse_complete, code_postal in adresses:
+            requete = service.preparer_requete(adresse_complete, code_postal=code_postal)
+            cle = service.normaliser_cle(requete['cache_key'])
+            if cle in resultats or cle in a_resoudre:
+                continue
+            
+            resultat_cache = service.lire_cache(requete['cache_key'])
+            if resultat_cache is not None:
+                resultats[cle] = resultat_cache
+            else:
+                a_resoudre[cle] = requete
+        
+        if a_resoudre:
+            print(f"🌐 Géocodage parallèle: {len(a_resoudre)} adresse(s), {self.workers} worker(s)")
+            
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(service.executer_strategies, requete): (cle, requete)
+                    for cle, requete in a_resoudre.items()
+                }
+                for future in as_completed(futures):
+                    cle, requete = futures[future]
+                    try:
+                        resultat, erreur_reseau = future.result()
+                    except Exception as e:
+                        resultat, erreur_reseau = {'success': False, 'error': str(e)}, True
+                    service.memoriser(requete['cache_key'], resultat, erreur_reseau)
+                    resultats[cle] = resultat
+        
+        service.resultats_lot.update(resultats)
+        return resultats
@@ -0,0 +1,92 @@
+"""
+Encodage compact des positions GPS des livreurs.
+
+Les positions d'une route sont stockées par segments (SegmentGPS) d'au plus
+TAILLE_SEGMENT points: colonnes entières (millisecondes, microdegrés, mètres),
+encodées en différences successives puis compressées (zlib). Un lot de positions
+se traduit par la réécriture d'un seul petit segment, pas par une ligne par point.
+"""
+
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone as tz
+
+import numpy as np
+from django.conf import settings
+
+
+# Points par segment: au-delà, un nouveau segment est ouvert
+TAILLE_SEGMENT = getattr(settings, 'GPS_TAILLE_SEGMENT', 512)
+
+# Lot maximal accepté par requête
+TAILLE_LOT_MAX = getattr(settings, 'GPS_TAILLE_LOT_MAX', 500)
+
+ENTETE = struct.Struct('<4sBI')  # signature, version, nombre de points
+SIGNATURE = b'GPS1'
+VERSION = 1
+
+# Colonnes d'un segment décodé
+DTYPE_POINTS = np.dtype([('t', '<i8'), ('lat', '<i4'), ('lon', '<i4'), ('precision', '<u2')])
+
+EPOQUE = datetime(1970, 1, 1, tzinfo=tz.utc)
+
+
+def en_millisecondes(horodatage):
+    return int((horodatage - EPOQUE) / timedelta(milliseconds=1))
+
+
+def depuis_millisecondes(millisecondes):
+    return EPOQUE + timedelta(milliseconds=int(millisecondes))
+
+
+def points_depuis_pings(pings):
+    """
+    [(datetime aware, lat, lon, précision m|None)] -> tableau DTYPE_POINTS trié par temps
+    (t en ms depuis l'époque, positions en microdegrés, précision bornée à 65535 m).
+    """
+    points = np.zeros(len(pings), dtype=DTYPE_POINTS)
+    for i, (horodatage, latitude, longitude, precision) in enumerate(pings):
+        points[i] = (
+            en_millisecondes(horodatage),
+            round(latitude * 1e6),
+            round(longitude * 1e6),
+            min(int(precision or 0), 65535),
+        )
+    return np.sort(points, order='t', kind='stable')
+
+
+def encoder(points):
+    """Tableau DTYPE_POINTS -> octets (différences successives, zlib)"""
+    colonnes = [
+        np.diff(points['t'], prepend=0).astype('<i8'),
+        np.diff(points['lat'].astype(np.int64), prepend=0).astype('<i4'),
+        np.diff(points['lon'].astype(np.int64), prepend=0).astype('<i4'),
+        points['precision'].astype('<u2'),
+    ]
+    corps = b''.join(colonne.tobytes() for colonne in colonnes)
+    return ENTETE.pack(SIGNATURE, VERSION, len(points)) + zlib.compress(corps, 6)
+
+
+def decoder(donnees):
+    """Octets d'un segment -> tableau DTYPE_POINTS"""
+    signature, version, nombre = ENTETE.unpack_from(donnees)
+    if signature != SIGNATURE or version != VERSION:
+        raise ValueError('Segment GPS illisible')
+    corps = zlib.decompress(bytes(donnees[ENTETE.size:]))
+
+    points = np.zeros(nombre, dtype=DTYPE_POINTS)
+    decalage = 0
+    for nom, dtype in (('t', '<i8'), ('lat', '<i4'), ('lon', '<i4'), ('precision', '<u2')):
+        taille = np.dtype(dtype).itemsize * nombre
+        colonne = np.frombuffer(corps, dtype=dtype, count=nombre, offset=decalage)
+        points[nom] = colonne if nom == 'precision' else np.cumsum(colonne.astype(np.int64))
+        decalage += taille
+    return points
+
+
+def en_json(points):
+    """Points décodés -> [[horodatage ISO, lat, lon, précision], ...]"""
+    return [
+        [depuis_millisecondes(t).isoformat(timespec='seconds'), lat / 1e6, lon / 1e6, int(precision)]
+        for t, lat, lon, precision in points.tolist()
+    ]
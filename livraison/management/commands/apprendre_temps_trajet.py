@@ -0,0 +1,59 @@
+"""
+Met à jour les vitesses de trajet apprises à partir des routes terminées.
+
+À lancer chaque nuit: seules les routes postérieures à la dernière date apprise
+sont lues.
+
+Usage:
+    python manage.py apprendre_temps_trajet
+    python manage.py apprendre_temps_trajet --complet
+    python manage.py apprendre_temps_trajet --jusqu-au 2025-01-31
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.temps_trajet import apprendre, charger_modele
+
+
+class Command(BaseCommand):
+    help = 'Apprend les vitesses de trajet par zone et par heure à partir des livraisons effectuées'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--complet',
+            action='store_true',
+            help='Vider les tables et réapprendre tout l\'historique'
+        )
+        parser.add_argument(
+            '--jusqu-au',
+            help='Dernière date exclue (AAAA-MM-JJ, défaut: aujourd\'hui)'
+        )
+
+    def handle(self, *args, **options):
+        jusqu_au = None
+        if options['jusqu_au']:
+            try:
+                jusqu_au = datetime.strptime(options['jusqu_au'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Format de date invalide (attendu: AAAA-MM-JJ)')
+
+        resultat = apprendre(jusqu_au=jusqu_au, complet=options['complet'])
+        depuis = resultat['depuis'].strftime('%Y-%m-%d') if resultat['depuis'] else 'début'
+
+        if not resultat['routes']:
+            self.stdout.write(f"Aucune route terminée à apprendre ({depuis} → {resultat['jusqu_au']:%Y-%m-%d})")
+            return
+
+        modele = charger_modele()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resultat['routes']} route(s), {resultat['trajets']} trajet(s) intégrés "
+            f"dans {resultat['cases']} case(s) zone × heure ({depuis} → {resultat['jusqu_au']:%Y-%m-%d})"
+        ))
+        self.stdout.write(
+            f"🚚 Modèle: {modele.nb_trajets} trajet(s), {len(modele.cases)} case(s), "
+            f"vitesses par heure: " + ', '.join(
+                f"{heure:02d}h {vitesse:.0f} km/h" for heure, vitesse in sorted(modele.heures.items())
+            )
+        )
@@ -0,0 +1,89 @@
+"""
+Banc d'essai des imports Excel: génère des classeurs synthétiques, les importe
+contre un faux fournisseur de géocodage local et écrit les mesures en JSON.
+Les données importées sont annulées (transaction) à la fin de chaque mesure.
+
+Usage:
+    python manage.py benchmark_import
+    python manage.py benchmark_import --tailles 100,5000,50000 --sortie bench/import.json
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.benchmark import BenchmarkImport, enregistrer_resultats
+
+
+class Command(BaseCommand):
+    help = 'Mesure les phases de l\'import Excel (lecture, normalisation, géocodage, écriture) et écrit un rapport JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tailles',
+            default='100,1000,5000',
+            help='Nombres de lignes à mesurer, séparés par des virgules (défaut: 100,1000,5000)'
+        )
+        parser.add_argument(
+            '--sortie',
+            help='Fichier JSON de résultats (défaut: benchmark_import_<date>.json)'
+        )
+        parser.add_argument(
+            '--latence',
+            type=float,
+            default=20,
+            help='Latence simulée du géocodeur en millisecondes (défaut: 20)'
+        )
+        parser.add_argument(
+            '--debit',
+            type=float,
+            default=100,
+            help='Requêtes/seconde autorisées vers le faux géocodeur (défaut: 100)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Requêtes de géocodage simultanées (défaut: 8)'
+        )
+        parser.add_argument(
+            '--sans-reimport',
+            action='store_true',
+            help='Ne pas mesurer le réimport du même fichier'
+        )
+        parser.add_argument(
+            '--graine',
+            type=int,
+            default=42,
+            help='Graine aléatoire des classeurs générés'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tailles = [int(t) for t in options['tailles'].split(',') if t.strip()]
+        except ValueError:
+            raise CommandError('--tailles attend des entiers séparés par des virgules')
+        if not tailles or any(not 100 <= t <= 50000 for t in tailles):
+            raise CommandError('Chaque taille doit être entre 100 et 50000')
+
+        benchmark = BenchmarkImport(
+            latence=options['latence'] / 1000,
+            debit=options['debit'],
+            workers=options['workers'],
+            reimport=not options['sans_reimport'],
+            graine=options['graine'],
+        )
+
+        resultats = benchmark.executer(tailles)
+
+        for mesure in resultats['resultats']:
+            for passe in mesure['passes']:
+                phases = ' | '.join(f"{phase} {duree:.3f}s" for phase, duree in passe['durees_s'].items())
+                self.stdout.write(
+                    f"📊 {mesure['lignes']:>6} lignes [{passe['passe']}] "
+                    f"{passe['total_s']:.2f}s ({passe['lignes_par_seconde']} l/s, {passe['requetes_sql_total']} requêtes) - {phases}"
+                )
+
+        sortie = options['sortie'] or f"benchmark_import_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        enregistrer_resultats(resultats, sortie)
+        self.stdout.write(self.style.SUCCESS(f"✅ Résultats écrits dans {sortie}"))
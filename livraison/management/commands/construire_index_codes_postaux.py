@@ -0,0 +1,96 @@
+"""
+Construit l'index local des centroïdes de codes postaux (livraison/data/codes_postaux.bin).
+
+Sources acceptées:
+    - CSV avec en-tête code_postal,latitude,longitude
+    - Export GeoNames (CA_full.txt, séparé par tabulations)
+    - Les livraisons déjà géocodées de la base (--depuis-livraisons)
+
+Usage:
+    python manage.py construire_index_codes_postaux --source CA_full.txt
+    python manage.py construire_index_codes_postaux --depuis-livraisons
+"""
+
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.geocoding import CHEMIN_INDEX_CODES_POSTAUX, IndexCodesPostaux
+from livraison.models import Livraison
+
+
+class Command(BaseCommand):
+    help = 'Construit l\'index mappé en mémoire des centroïdes de codes postaux'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            action='append',
+            default=[],
+            help='Fichier CSV ou GeoNames à intégrer (option répétable)'
+        )
+        parser.add_argument(
+            '--depuis-livraisons',
+            action='store_true',
+            help='Ajoute les positions des livraisons géocodées avec succès'
+        )
+        parser.add_argument(
+            '--inclure-non-verifiees',
+            action='store_true',
+            help='Avec --depuis-livraisons: inclut aussi les livraisons ayant des coordonnées sans statut "success"'
+        )
+        parser.add_argument(
+            '--sortie',
+            default=CHEMIN_INDEX_CODES_POSTAUX,
+            help='Fichier index à écrire'
+        )
+
+    def lire_source(self, chemin):
+        """Itère (code, latitude, longitude) depuis un CSV ou un export GeoNames"""
+        with open(chemin, encoding='utf-8', newline='') as fichier:
+            premiere_ligne = fichier.readline()
+            fichier.seek(0)
+
+            if '\t' in premiere_ligne:
+                # GeoNames: pays, code, lieu, ..., latitude (col. 9), longitude (col. 10)
+                for colonnes in csv.reader(fichier, delimiter='\t'):
+                    if len(colonnes) > 10 and colonnes[0] == 'CA':
+                        yield colonnes[1], colonnes[9], colonnes[10]
+            else:
+                for ligne in csv.DictReader(fichier):
+                    yield ligne['code_postal'], ligne['latitude'], ligne['longitude']
+
+    def handle(self, *args, **options):
+        if not options['source'] and not options['depuis_livraisons']:
+            raise CommandError('Indiquer au moins une --source ou --depuis-livraisons')
+
+        points = {}  # code -> [(lat, lon)]
+
+        for chemin in options['source']:
+            try:
+                for code, lat, lon in self.lire_source(chemin):
+                    code = IndexCodesPostaux.normaliser(code)
+                    if len(code) in (3, 6):
+                        points.setdefault(code, []).append((float(lat), float(lon)))
+            except (OSError, KeyError, ValueError) as e:
+                raise CommandError(f'Lecture de {chemin} impossible: {e}')
+
+        if options['depuis_livraisons']:
+            livraisons = Livraison.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            if not options['inclure_non_verifiees']:
+                livraisons = livraisons.filter(geocode_status='success')
+
+            for code, lat, lon in livraisons.values_list('code_postal', 'latitude', 'longitude').iterator():
+                code = IndexCodesPostaux.normaliser(code)
+                if len(code) == 6:
+                    points.setdefault(code, []).append((float(lat), float(lon)))
+
+        centroides = {
+            code: (sum(p[0] for p in liste) / len(liste), sum(p[1] for p in liste) / len(liste))
+            for code, liste in points.items()
+        }
+        if not centroides:
+            raise CommandError('Aucun code postal valide trouvé')
+
+        total = IndexCodesPostaux.ecrire(options['sortie'], centroides)
+        self.stdout.write(self.style.SUCCESS(f"✅ Index écrit: {total} code(s) postal(aux) -> {options['sortie']}"))
@@ -0,0 +1,47 @@
+"""
+Convertit un extrait OpenStreetMap (.osm, XML) en graphe routier CSR pour les
+distances routières hors ligne.
+
+Usage:
+    python manage.py construire_reseau_routier --osm montreal.osm
+    python manage.py construire_reseau_routier --osm montreal.osm --sortie cache/reseau
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.reseau_routier import construire_reseau, dossier_reseau
+
+
+class Command(BaseCommand):
+    help = 'Construit le graphe routier (tableaux NumPy mappés en mémoire) à partir d\'un extrait OSM'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--osm',
+            required=True,
+            help='Extrait OpenStreetMap au format XML (.osm)'
+        )
+        parser.add_argument(
+            '--sortie',
+            help='Dossier du graphe (défaut: RESEAU_ROUTIER_DOSSIER ou cache/reseau)'
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['osm']):
+            raise CommandError(f"Fichier introuvable: {options['osm']}")
+
+        sortie = options['sortie'] or dossier_reseau() or os.path.join(settings.BASE_DIR, 'cache', 'reseau')
+
+        debut = time.perf_counter()
+        meta = construire_reseau(options['osm'], sortie)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {meta['nb_noeuds']} noeud(s), {meta['nb_aretes']} arête(s) en "
+            f"{time.perf_counter() - debut:.1f}s → {sortie}"
+        ))
+        if not dossier_reseau():
+            self.stdout.write(f"ℹ️  Définir RESEAU_ROUTIER_DOSSIER = '{sortie}' pour l'utiliser dans les matrices")
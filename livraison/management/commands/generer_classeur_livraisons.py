@@ -0,0 +1,55 @@
+"""
+Génère un classeur de livraisons synthétique au format des exports réels.
+
+Usage:
+    python manage.py generer_classeur_livraisons --lignes 5000
+    python manage.py generer_classeur_livraisons --lignes 50000 --sortie /tmp/gros.xlsx --graine 7
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.benchmark import generer_classeur
+
+
+class Command(BaseCommand):
+    help = 'Génère un classeur Excel synthétique importable par ExcelImportService'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lignes',
+            type=int,
+            default=1000,
+            help='Nombre de livraisons (100 à 50000, défaut: 1000)'
+        )
+        parser.add_argument(
+            '--sortie',
+            help='Fichier à écrire (défaut: livraisons_synthetiques_<lignes>.xlsx)'
+        )
+        parser.add_argument(
+            '--graine',
+            type=int,
+            default=42,
+            help='Graine aléatoire, pour des fichiers reproductibles'
+        )
+        parser.add_argument(
+            '--date',
+            help='Date de livraison inscrite dans l\'en-tête (AAAA-MM-JJ)'
+        )
+
+    def handle(self, *args, **options):
+        if not 100 <= options['lignes'] <= 50000:
+            raise CommandError('--lignes doit être entre 100 et 50000')
+
+        date_livraison = None
+        if options['date']:
+            try:
+                date_livraison = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Format de date invalide (attendu: AAAA-MM-JJ)')
+
+        sortie = options['sortie'] or f"livraisons_synthetiques_{options['lignes']}.xlsx"
+        generer_classeur(sortie, options['lignes'], options['graine'], date_livraison)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {options['lignes']} livraisons écrites dans {sortie}"))
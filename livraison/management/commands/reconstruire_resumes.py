@@ -0,0 +1,49 @@
+"""
+Recalcule les résumés journaliers des livraisons (ResumeLivraisonsJour) depuis Livraison.
+
+Les résumés sont tenus à jour en continu; la commande répare les écarts laissés par
+des écritures faites hors de l'application (shell, SQL, update() en lot).
+
+Usage:
+    python manage.py reconstruire_resumes
+    python manage.py reconstruire_resumes --date 2025-01-15
+    python manage.py reconstruire_resumes --du 2025-01-01 --au 2025-01-31
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.resumes import reconstruire
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les résumés journaliers des livraisons (tous, une date ou un intervalle)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Date à recalculer (AAAA-MM-JJ)')
+        parser.add_argument('--du', help='Première date de l\'intervalle (AAAA-MM-JJ)')
+        parser.add_argument('--au', help='Dernière date de l\'intervalle, incluse (AAAA-MM-JJ)')
+
+    @staticmethod
+    def lire_date(valeur):
+        try:
+            return datetime.strptime(valeur, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Format de date invalide: {valeur} (attendu: AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        dates = None
+        if options['date']:
+            dates = [self.lire_date(options['date'])]
+        elif options['du'] or options['au']:
+            if not (options['du'] and options['au']):
+                raise CommandError('--du et --au vont ensemble')
+            du, au = self.lire_date(options['du']), self.lire_date(options['au'])
+            if au < du:
+                raise CommandError('--au précède --du')
+            dates = [du + timedelta(days=n) for n in range((au - du).days + 1)]
+
+        lignes = reconstruire(dates)
+        portee = 'toutes les dates' if dates is None else f"{len(dates)} date(s)"
+        self.stdout.write(self.style.SUCCESS(f"✅ {lignes} résumé(s) date × période recalculé(s) ({portee})"))
@@ -0,0 +1,55 @@
+"""
+Relance le géocodage des livraisons en échec.
+
+Usage:
+    python manage.py regeocoder_livraisons
+    python manage.py regeocoder_livraisons --date 2025-01-15 --limite 100
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.services import RegeocodageService
+
+
+class Command(BaseCommand):
+    help = 'Relance le géocodage des livraisons dont geocode_status est "failed" ou "pending"'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Limiter aux livraisons de cette date (AAAA-MM-JJ)'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=None,
+            help='Nombre maximum de livraisons à traiter'
+        )
+        parser.add_argument(
+            '--max-tentatives',
+            type=int,
+            default=RegeocodageService.MAX_TENTATIVES,
+            help=f'Ignorer les livraisons déjà tentées ce nombre de fois (défaut: {RegeocodageService.MAX_TENTATIVES})'
+        )
+
+    def handle(self, *args, **options):
+        date_livraison = None
+        if options['date']:
+            try:
+                date_livraison = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Format de date invalide (attendu: AAAA-MM-JJ)')
+
+        service = RegeocodageService(max_tentatives=options['max_tentatives'])
+        resultat = service.relancer(date_livraison=date_livraison, limite=options['limite'])
+
+        if not resultat['traitees']:
+            self.stdout.write('Aucune livraison à regéocoder')
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resultat['reussies']}/{resultat['traitees']} livraison(s) géocodée(s), "
+            f"{resultat['echouees']} toujours en échec"
+        ))
@@ -0,0 +1,53 @@
+"""
+Vérifie les compteurs d'avancement des routes (nb_livraisons, nb_livrees, nb_en_cours)
+et corrige ceux qui ne correspondent plus aux arrêts.
+
+Les compteurs sont tenus à jour en continu; des écarts ne peuvent venir que
+d'écritures faites hors de l'application (shell, SQL, update() en lot).
+
+Usage:
+    python manage.py reparer_compteurs_routes
+    python manage.py reparer_compteurs_routes --date 2025-01-15
+    python manage.py reparer_compteurs_routes --verifier
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.models import Route
+from livraison.progression import reparer
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les compteurs d\'avancement des routes et corrige les écarts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Routes de cette date seulement (AAAA-MM-JJ)')
+        parser.add_argument(
+            '--verifier',
+            action='store_true',
+            help='Lister les écarts sans les corriger'
+        )
+
+    def handle(self, *args, **options):
+        routes = Route.objects.all()
+        if options['date']:
+            try:
+                routes = routes.filter(date=datetime.strptime(options['date'], '%Y-%m-%d').date())
+            except ValueError:
+                raise CommandError('Format de date invalide (attendu: AAAA-MM-JJ)')
+
+        ecarts = reparer(routes, appliquer=not options['verifier'])
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("✅ Compteurs des routes cohérents"))
+            return
+
+        for route, differences in ecarts:
+            detail = ', '.join(f"{champ} {stocke} → {reel}" for champ, (stocke, reel) in differences.items())
+            self.stdout.write(f"⚠️  {route.nom} ({route.date:%Y-%m-%d}): {detail}")
+
+        if options['verifier']:
+            self.stdout.write(self.style.WARNING(f"{len(ecarts)} route(s) en écart, non corrigée(s) (--verifier)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(ecarts)} route(s) corrigée(s)"))
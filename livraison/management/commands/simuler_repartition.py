@@ -0,0 +1,98 @@
+"""
+Simule la répartition d'une journée sous plusieurs hypothèses d'effectif et
+écrit distance totale, arrêts en retard et durée des routes par scénario.
+
+Usage:
+    python manage.py simuler_repartition --date 2025-01-15 --periode matin --livreurs 4,5,6
+    python manage.py simuler_repartition --synthetique 150 --livreurs 6,8,10 --departs 06:30,07:00 --services 5,8
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from livraison.benchmark import enregistrer_resultats
+from livraison.optimisation import DUREE_MAX_DISPATCH_S, TEMPS_SERVICE_MIN
+from livraison.simulation import (
+    SimulationRepartition, journee_historique, journee_synthetique, scenarios_croises,
+)
+
+
+def entiers(valeur, option):
+    try:
+        return [int(v) for v in valeur.split(',') if v.strip()]
+    except ValueError:
+        raise CommandError(f'{option} attend des entiers séparés par des virgules')
+
+
+class Command(BaseCommand):
+    help = 'Rejoue une journée de livraisons avec différents effectifs et compare les résultats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Journée historique à rejouer (AAAA-MM-JJ)')
+        parser.add_argument('--periode', help='Limiter à une période (matin, midi, apres_midi)')
+        parser.add_argument('--synthetique', type=int, help='Nombre d\'arrêts d\'une journée synthétique')
+        parser.add_argument('--graine', type=int, default=42, help='Graine de la journée synthétique')
+        parser.add_argument('--livreurs', default='4,6,8', help='Nombres de livreurs (défaut: 4,6,8)')
+        parser.add_argument('--capacites', default='12', help='Arrêts maximum par route (défaut: 12)')
+        parser.add_argument('--departs', default='07:00', help='Heures de départ HH:MM (défaut: 07:00)')
+        parser.add_argument(
+            '--services',
+            default=str(TEMPS_SERVICE_MIN),
+            help=f'Temps de service par arrêt en minutes (défaut: {TEMPS_SERVICE_MIN})'
+        )
+        parser.add_argument(
+            '--duree-max',
+            type=float,
+            default=DUREE_MAX_DISPATCH_S,
+            help=f'Budget de recherche par scénario en secondes (défaut: {DUREE_MAX_DISPATCH_S})'
+        )
+        parser.add_argument('--workers', type=int, help='Processus parallèles (défaut: nombre de coeurs, max 8)')
+        parser.add_argument('--sortie', help='Fichier JSON de résultats (défaut: simulation_<date>.json)')
+
+    def handle(self, *args, **options):
+        if bool(options['date']) == bool(options['synthetique']):
+            raise CommandError('Indiquer soit --date, soit --synthetique')
+
+        try:
+            departs = [datetime.strptime(d.strip(), '%H:%M').time() for d in options['departs'].split(',') if d.strip()]
+        except ValueError:
+            raise CommandError('--departs attend des heures HH:MM séparées par des virgules')
+
+        if options['date']:
+            try:
+                date_livraison = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Format de date invalide (attendu: AAAA-MM-JJ)')
+            journee = journee_historique(date_livraison, options['periode'])
+        else:
+            journee = journee_synthetique(options['synthetique'], options['graine'])
+
+        if not len(journee):
+            raise CommandError('Aucune livraison géocodée pour cette journée')
+
+        scenarios = scenarios_croises(
+            entiers(options['livreurs'], '--livreurs'),
+            entiers(options['capacites'], '--capacites'),
+            departs,
+            entiers(options['services'], '--services'),
+        )
+        self.stdout.write(f"🚚 {journee.libelle}: {len(journee)} arrêt(s), {len(scenarios)} scénario(s)")
+
+        resultats = SimulationRepartition(journee, options['workers'], options['duree_max']).executer(scenarios)
+
+        for s in resultats['scenarios']:
+            self.stdout.write(
+                f"📊 {s['livreurs']:>2} livreurs × {s['capacite']} arrêts, départ {s['heure_depart']}, "
+                f"service {s['temps_service']} min → {s['routes_utilisees']} route(s), "
+                f"{s['distance_totale_km']} km, {s['arrets_en_retard']} en retard, "
+                f"{s['non_placees']} non placé(s), route max {s['duree_route_max_min']} min "
+                f"({s['temps_calcul_s']}s)"
+            )
+
+        sortie = options['sortie'] or f"simulation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        enregistrer_resultats(resultats, sortie)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(scenarios)} scénario(s) en {resultats['duree_totale_s']}s "
+            f"sur {resultats['parametres']['workers']} processus → {sortie}"
+        ))
@@ -0,0 +1,75 @@
+"""
+Worker local qui vide la file des imports Excel.
+
+Usage:
+    python manage.py traiter_imports            # tourne en continu
+    python manage.py traiter_imports --une-fois # traite la file puis s'arrête
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from livraison.geocoding import GeocodingService
+from livraison.services import ImportQueueService
+
+
+class Command(BaseCommand):
+    help = 'Traite en arrière-plan les imports Excel mis en file par la vue import_excel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--une-fois',
+            action='store_true',
+            help='Traite les imports en attente puis s\'arrête'
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=float,
+            default=2.0,
+            help='Secondes d\'attente entre deux vérifications de la file (défaut: 2)'
+        )
+        parser.add_argument(
+            '--delai-blocage',
+            type=int,
+            default=30,
+            help='Minutes sans progression après lesquelles un import "en cours" est considéré bloqué et remis en file'
+        )
+
+    def handle(self, *args, **options):
+        queue = ImportQueueService()
+
+        remis = queue.reprendre_bloques(options['delai_blocage'])
+        if remis:
+            self.stdout.write(self.style.WARNING(f"⚠️  {remis} import(s) bloqué(s) remis en file"))
+
+        purgees = GeocodingService.purger_cache_expire()
+        if purgees:
+            self.stdout.write(f"🗑️  {purgees} entrée(s) expirée(s) retirée(s) du cache de géocodage")
+
+        self.stdout.write(self.style.HTTP_INFO('📥 Worker des imports démarré'))
+
+        try:
+            while True:
+                import_excel = queue.prendre_prochain()
+
+                if import_excel is None:
+                    if options['une_fois']:
+                        break
+                    time.sleep(options['intervalle'])
+                    continue
+
+                self.stdout.write(f"▶️  Import #{import_excel.id} ({import_excel.fichier.name})")
+                resultat = queue.traiter(import_excel)
+
+                if resultat['success']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"✅ Import #{import_excel.id}: {resultat['imported']} créées, "
+                        f"{resultat['updated']} mises à jour, {resultat['skipped']} inchangées"
+                    ))
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f"❌ Import #{import_excel.id}: {resultat.get('error', 'Erreur inconnue')}"
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write('\nArrêt du worker')
@@ -0,0 +1,414 @@
+"""
+Matrices de distances / temps de trajet par date de livraison.
+
+Une matrice float32 (km) et sa matrice de durées (minutes) par date, sur disque
+et mappées en mémoire. Chaque livraison géocodée (et le dépôt) occupe une case;
+un ajout, un déplacement ou un retrait ne recalcule qu'une ligne et une colonne.
+Lecture d'une paire en O(1): MatriceDistances.distance(a, b).
+"""
+
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: verrou entre threads seulement
+    fcntl = None
+
+import numpy as np
+from django.conf import settings
+
+from .optimisation import RAYON_TERRE_KM, VITESSE_KMH
+
+
+def dossier_matrices():
+    return getattr(settings, 'MATRICES_DOSSIER', os.path.join(settings.BASE_DIR, 'cache', 'matrices'))
+
+
+# Capacité initiale (cases); doublée quand la date dépasse
+CAPACITE_INITIALE = 64
+
+# Dates gardées mappées en mémoire par processus (les plus anciennement utilisées sont fermées)
+MATRICES_MAX = getattr(settings, 'MATRICES_MAX', 8)
+
+CLE_DEPOT = 'depot'
+
+
+def distances_depuis(latitude, longitude, latitudes, longitudes):
+    """Haversine (km) d'un point vers un tableau de points (NaN propagé)"""
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class MatriceDistances:
+    """
+    Matrice d'une date. Fichiers dans MATRICES_DOSSIER (défaut: cache/matrices):
+    <date>.json (cases, capacité), <date>.coords (float64 cap×2, NaN = case libre),
+    <date>.dist (float32 cap×cap, km), <date>.duree (float32 cap×cap, minutes).
+    Les modifications se font sous verrou de fichier (partagé entre processus).
+    """
+
+    def __init__(self, date_livraison, dossier=None, vitesse_kmh=VITESSE_KMH):
+        self.date = date_livraison
+        self.dossier = dossier or dossier_matrices()
+        self.vitesse_kmh = vitesse_kmh
+        self.prefixe = os.path.join(self.dossier, date_livraison.strftime('%Y-%m-%d'))
+        self.source = None
+        self._lock = threading.Lock()
+        self._version = None
+        self.cases = {}
+        self.capacite = 0
+        self.charger()
+
+    # ==========================================
+    # FICHIERS
+    # ==========================================
+
+    def reseau(self):
+        from .reseau_routier import reseau_routier
+        return reseau_routier()
+    
+    def source_courante(self):
+        """'haversine' ou l'extrait routier utilisé: un changement invalide toutes les cases"""
+        reseau = self.reseau()
+        return f"reseau:{reseau.version}" if reseau is not None else 'haversine'
+    
+    def chemin(self, extension):
+        return f"{self.prefixe}.{extension}"
+
+    def existe(self):
+        return os.path.exists(self.chemin('json'))
+
+    def ouvrir_tableaux(self, mode='r+'):
+        forme = (self.capacite, self.capacite)
+        self.coords = np.memmap(self.chemin('coords'), dtype=np.float64, mode=mode, shape=(self.capacite, 2))
+        self.dist = np.memmap(self.chemin('dist'), dtype=np.float32, mode=mode, shape=forme)
+        self.duree = np.memmap(self.chemin('duree'), dtype=np.float32, mode=mode, shape=forme)
+
+    def charger(self):
+        """(Re)lit les métadonnées et remappe les tableaux si un autre processus les a modifiés"""
+        if not self.existe():
+            self.cases = {}
+            self.capacite = 0
+            self._version = None
+            return
+
+        version = os.stat(self.chemin('json')).st_mtime_ns
+        if version == self._version:
+            return
+
+        with open(self.chemin('json'), encoding='utf-8') as fichier:
+            meta = json.load(fichier)
+        self.cases = meta['cases']
+        self.capacite = meta['capacite']
+        self.source = meta.get('source', 'haversine')
+        if self.capacite:
+            self.ouvrir_tableaux()
+        self._version = version
+
+    def enregistrer_meta(self):
+        temporaire = self.chemin('json.tmp')
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump({'capacite': self.capacite, 'cases': self.cases, 'source': self.source}, fichier)
+        os.replace(temporaire, self.chemin('json'))
+        self._version = os.stat(self.chemin('json')).st_mtime_ns
+
+    def creer(self, capacite):
+        """Nouveaux fichiers de `capacite` cases, contenu existant recopié"""
+        anciens = (self.coords, self.dist, self.duree) if self.capacite else None
+        ancienne_capacite = self.capacite
+
+        os.makedirs(self.dossier, exist_ok=True)
+        tableaux = {}
+        for extension, dtype, forme in (
+            ('coords', np.float64, (capacite, 2)),
+            ('dist', np.float32, (capacite, capacite)),
+            ('duree', np.float32, (capacite, capacite)),
+        ):
+            tableau = np.memmap(self.chemin(f'{extension}.tmp'), dtype=dtype, mode='w+', shape=forme)
+            tableau[:] = np.nan
+            tableaux[extension] = tableau
+
+        if anciens:
+            tableaux['coords'][:ancienne_capacite] = anciens[0]
+            tableaux['dist'][:ancienne_capacite, :ancienne_capacite] = anciens[1]
+            tableaux['duree'][:ancienne_capacite, :ancienne_capacite] = anciens[2]
+
+        for extension, tableau in tableaux.items():
+            tableau.flush()
+            os.replace(self.chemin(f'{extension}.tmp'), self.chemin(extension))
+        tableaux.clear()
+
+        self.capacite = capacite
+        self.ouvrir_tableaux()
+
+    @contextlib.contextmanager
+    def verrouiller(self):
+        """Verrou exclusif sur la date (threads + processus), métadonnées relues à l'entrée"""
+        with self._lock:
+            os.makedirs(self.dossier, exist_ok=True)
+            with open(self.chemin('lock'), 'a') as fichier:
+                if fcntl:
+                    fcntl.flock(fichier, fcntl.LOCK_EX)
+                try:
+                    self.charger()
+                    yield self
+                finally:
+                    if fcntl:
+                        fcntl.flock(fichier, fcntl.LOCK_UN)
+
+    # ==========================================
+    # MISES À JOUR INCRÉMENTALES
+    # ==========================================
+
+    def case_libre(self):
+        occupees = set(self.cases.values())
+        for case in range(self.capacite):
+            if case not in occupees:
+                return case
+        self.creer(max(CAPACITE_INITIALE, self.capacite * 2))
+        return len(occupees)
+
+    def _placer(self, cle, latitude, longitude):
+        """Écrit la ligne et la colonne de `cle` (ajout ou déplacement). Sous verrou."""
+        case = self.cases.get(cle)
+        if case is None:
+            case = self.case_libre()
+            self.cases[cle] = case
+
+        self.coords[case] = (latitude, longitude)
+        ligne = distances_depuis(latitude, longitude, self.coords[:, 0], self.coords[:, 1]).astype(np.float32)
+        ligne[case] = 0.0
+        self.dist[case, :] = ligne
+        self.dist[:, case] = ligne
+        duree = ligne * np.float32(60.0 / self.vitesse_kmh)
+        self.duree[case, :] = duree
+        self.duree[:, case] = duree
+        
+        reseau = self.reseau()
+        if reseau is not None:
+            self._placer_reseau(reseau, case, latitude, longitude)
+    
+    def _placer_reseau(self, reseau, case, latitude, longitude):
+        """Distances et durées routières (asymétriques) de la case vers les autres et retour"""
+        autres = sorted(set(self.cases.values()) - {case})
+        if not autres:
+            return
+        points = self.coords[autres].tolist()
+        for tableau, poids in ((self.dist, 'longueurs'), (self.duree, 'durees')):
+            aller = reseau.un_vers_plusieurs((latitude, longitude), points, poids=poids)
+            retour = reseau.un_vers_plusieurs((latitude, longitude), points, inverse=True, poids=poids)
+            # Points sans chemin (hors de l'extrait): la valeur à vol d'oiseau est conservée
+            for sens, valeurs in ((0, aller), (1, retour)):
+                connus = np.isfinite(valeurs)
+                index = np.array(autres)[connus]
+                if sens == 0:
+                    tableau[case, index] = valeurs[connus]
+                else:
+                    tableau[index, case] = valeurs[connus]
+
+    def _retirer(self, cle):
+        case = self.cases.pop(cle, None)
+        if case is None:
+            return
+        self.coords[case] = np.nan
+        self.dist[case, :] = np.nan
+        self.dist[:, case] = np.nan
+        self.duree[case, :] = np.nan
+        self.duree[:, case] = np.nan
+
+    def _terminer(self):
+        if self.capacite:
+            self.coords.flush()
+            self.dist.flush()
+            self.duree.flush()
+        self.enregistrer_meta()
+
+    def fermer(self):
+        """Libère les mappages; la matrice est relue depuis le disque à la prochaine écriture"""
+        with self._lock:
+            if self.capacite:
+                del self.coords, self.dist, self.duree
+            self.cases = {}
+            self.capacite = 0
+            self._version = None
+
+    def placer(self, cle, latitude, longitude):
+        with self.verrouiller():
+            self.source = self.source or self.source_courante()
+            self._placer(str(cle), float(latitude), float(longitude))
+            self._terminer()
+
+    def retirer(self, cle):
+        with self.verrouiller():
+            self._retirer(str(cle))
+            self._terminer()
+
+    def actualiser(self, positions):
+        """Place, déplace ou retire (position None) les clés de `positions` {cle: (lat, lon)|None}"""
+        with self.verrouiller():
+            self.source = self.source or self.source_courante()
+            for cle, position in positions.items():
+                if position is None:
+                    self._retirer(str(cle))
+                else:
+                    self._placer(str(cle), float(position[0]), float(position[1]))
+            self._terminer()
+
+    def a_jour(self, cles):
+        """Vrai si les `cles` sont toutes présentes et calculées avec la source courante"""
+        with self._lock:
+            self.charger()
+            return self.existe() and self.source == self.source_courante() and all(cle in self for cle in cles)
+
+    def synchroniser(self, points):
+        """
+        Aligne la matrice sur `points` {cle: (lat, lon)}: ajoute les nouvelles clés,
+        recalcule celles dont la position a changé, retire les absentes.
+        Retourne {'ajoutees', 'deplacees', 'retirees'}.
+        """
+        bilan = {'ajoutees': 0, 'deplacees': 0, 'retirees': 0}
+        points = {str(cle): (float(lat), float(lon)) for cle, (lat, lon) in points.items()}
+
+        with self.verrouiller():
+            source = self.source_courante()
+            meme_source = self.source == source
+            self.source = source
+
+            for cle in [cle for cle in self.cases if cle not in points]:
+                self._retirer(cle)
+                bilan['retirees'] += 1
+
+            for cle, (latitude, longitude) in points.items():
+                case = self.cases.get(cle)
+                if case is not None and meme_source and np.allclose(
+                    self.coords[case], (latitude, longitude), rtol=0, atol=1e-7
+                ):
+                    continue
+                bilan['deplacees' if case is not None else 'ajoutees'] += 1
+                self._placer(cle, latitude, longitude)
+
+            if any(bilan.values()) or not meme_source or not self.existe():
+                self._terminer()
+        return bilan
+
+    # ==========================================
+    # LECTURE
+    # ==========================================
+
+    def __contains__(self, cle):
+        return str(cle) in self.cases
+
+    def __len__(self):
+        return len(self.cases)
+
+    def distance(self, a, b):
+        """Distance en km entre deux clés (id de livraison ou CLE_DEPOT)"""
+        return float(self.dist[self.cases[str(a)], self.cases[str(b)]])
+
+    def temps(self, a, b):
+        """Temps de trajet estimé en minutes entre deux clés"""
+        return float(self.duree[self.cases[str(a)], self.cases[str(b)]])
+
+    def sous_matrice(self, cles, durees=False):
+        """Matrice dense (float64) des `cles`, dans l'ordre donné"""
+        index = [self.cases[str(cle)] for cle in cles]
+        source = self.duree if durees else self.dist
+        return np.asarray(source[np.ix_(index, index)], dtype=np.float64)
+
+
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+
+def matrice_pour_date(date_livraison, dossier=None):
+    """
+    Instance partagée (par processus) de la matrice d'une date, sans synchronisation.
+    Au plus MATRICES_MAX dates restent mappées; la moins récemment utilisée est fermée.
+    """
+    cle = (date_livraison, dossier or dossier_matrices())
+    with _matrices_lock:
+        matrice = _matrices.pop(cle, None)
+        if matrice is None:
+            matrice = MatriceDistances(date_livraison, dossier)
+        _matrices[cle] = matrice
+        evincees = []
+        while len(_matrices) > MATRICES_MAX:
+            evincees.append(_matrices.pop(next(iter(_matrices))))
+    for evincee in evincees:
+        evincee.fermer()
+    return matrice
+
+
+def points_du_jour(date_livraison):
+    """{cle: (lat, lon)} des livraisons géocodées de la date, plus le dépôt s'il est configuré"""
+    from .models import Livraison
+
+    points = {
+        str(id_livraison): (lat, lon)
+        for id_livraison, lat, lon in Livraison.objects.filter(
+            date_livraison=date_livraison,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('id', 'latitude', 'longitude')
+    }
+    depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+    if depot:
+        points[CLE_DEPOT] = depot
+    return points
+
+
+def matrice_jour(date_livraison, dossier=None):
+    """Matrice de la date, mise à jour au besoin (seules les livraisons modifiées sont recalculées)"""
+    matrice = matrice_pour_date(date_livraison, dossier)
+    matrice.synchroniser(points_du_jour(date_livraison))
+    return matrice
+
+
+def actualiser_livraison(livraison, dossier=None):
+    """Après un géocodage manuel: recalcule la case de la livraison si la matrice de sa date existe"""
+    actualiser_livraisons([livraison], dossier)
+
+
+def actualiser_livraisons(livraisons, dossier=None):
+    """
+    Après une écriture en lot (import, regéocodage): recalcule les cases des livraisons
+    dans les matrices existantes de leurs dates, une écriture par date.
+    """
+    par_date = {}
+    for livraison in livraisons:
+        position = None
+        if livraison.latitude is not None and livraison.longitude is not None:
+            position = (livraison.latitude, livraison.longitude)
+        par_date.setdefault(livraison.date_livraison, {})[livraison.pk] = position
+
+    for date_livraison, positions in par_date.items():
+        matrice = matrice_pour_date(date_livraison, dossier)
+        if matrice.existe():
+            matrice.actualiser(positions)
+
+
+def retirer_livraison(id_livraison, date_livraison, dossier=None):
+    """Après une suppression: libère la case de la livraison si la matrice de sa date existe"""
+    matrice = matrice_pour_date(date_livraison, dossier)
+    if matrice.existe():
+        matrice.retirer(id_livraison)
+
+
+def sous_matrices(date_livraison, cles, dossier=None):
+    """
+    (distances km, durées minutes) des `cles` depuis la matrice de la date,
+    ou (None, None) si l'une d'elles n'y figure pas (livraison d'une autre date).
+    Les écritures tiennent la matrice à jour (actualiser_livraisons): elle n'est
+    resynchronisée depuis la base que si une clé manque ou que la source a changé.
+    """
+    matrice = matrice_pour_date(date_livraison, dossier)
+    if not matrice.a_jour(cles):
+        matrice = matrice_jour(date_livraison, dossier)
+    if not all(cle in matrice for cle in cles):
+        return None, None
+    return matrice.sous_matrice(cles), matrice.sous_matrice(cles, durees=True)
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0015_disponibilitelivreur_heure_fin_shift'),
+    ]
+
+    operations = [
+        # Les imports existants ont été exécutés de façon synchrone: ils sont terminés
+        migrations.AddField(
+            model_name='importexcel',
+            name='statut',
+            field=models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('terminee', 'Terminé'), ('echouee', 'Échoué')], default='terminee', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='importexcel',
+            name='statut',
+            field=models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('terminee', 'Terminé'), ('echouee', 'Échoué')], default='en_attente', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='date_livraison',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='date_debut',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='date_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='nb_lignes_traitees',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='nb_lignes_mises_a_jour',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='nb_lignes_inchangees',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importexcel',
+            name='geocoding_failed',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='importexcel',
+            index=models.Index(fields=['statut', 'date_import'], name='livraison_i_statut_87f609_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0016_importexcel_suivi_traitement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle_hash', models.CharField(max_length=40, unique=True)),
+                ('cle', models.TextField()),
+                ('succes', models.BooleanField(default=True)),
+                ('resultat', models.JSONField(blank=True, default=dict)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_expiration', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de géocodage',
+                'verbose_name_plural': 'Cache de géocodage',
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0017_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livraison',
+            name='empreinte_import',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
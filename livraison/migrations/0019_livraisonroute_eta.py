@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0018_livraison_empreinte_import'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livraisonroute',
+            name='arrivee_estimee',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='livraisonroute',
+            name='depart_estime',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='livraisonroute',
+            name='retard_estime_min',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
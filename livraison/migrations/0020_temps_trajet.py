@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0019_livraisonroute_eta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='heure_depart_reelle',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='VitesseTrajet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zone', models.CharField(max_length=12)),
+                ('heure', models.PositiveSmallIntegerField()),
+                ('nb_trajets', models.PositiveIntegerField(default=0)),
+                ('distance_km', models.FloatField(default=0)),
+                ('duree_min', models.FloatField(default=0)),
+                ('derniere_date', models.DateField()),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Vitesse de trajet',
+                'verbose_name_plural': 'Vitesses de trajet',
+                'unique_together': {('zone', 'heure')},
+            },
+        ),
+    ]
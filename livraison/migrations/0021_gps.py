@@ -0,0 +1,48 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('livraison', '0020_temps_trajet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentGPS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('debut', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('nb_points', models.PositiveIntegerField(default=0)),
+                ('donnees', models.BinaryField()),
+                ('livreur', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments_gps', to='livraison.route')),
+            ],
+            options={
+                'verbose_name': 'Segment GPS',
+                'verbose_name_plural': 'Segments GPS',
+                'ordering': ['debut'],
+                'indexes': [models.Index(fields=['route', 'date', 'debut'], name='livraison_s_route_i_7f2904_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PositionGPS',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='position_gps', serialize=False, to='livraison.route')),
+                ('horodatage', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('precision', models.PositiveIntegerField(blank=True, null=True)),
+                ('livreur', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Position GPS',
+                'verbose_name_plural': 'Positions GPS',
+            },
+        ),
+    ]
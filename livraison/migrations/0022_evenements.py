@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0021_gps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementLivraison',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('route_id', models.UUIDField(blank=True, null=True)),
+                ('type', models.CharField(choices=[('livraison', 'Livraison'), ('route', 'Route'), ('arret', 'Arrêt de route'), ('ordre', 'Ordre de route')], max_length=20)),
+                ('donnees', models.JSONField(default=dict)),
+                ('horodatage', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Événement de livraison',
+                'verbose_name_plural': 'Événements de livraison',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['date', 'id'], name='livraison_e_date_ac9898_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0022_evenements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilitelivreur',
+            name='date_maj',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def remplir(apps, schema_editor):
+    """Résumés des livraisons existantes (même agrégation que resumes.reconstruire)"""
+    Livraison = apps.get_model('livraison', 'Livraison')
+    ResumeLivraisonsJour = apps.get_model('livraison', 'ResumeLivraisonsJour')
+
+    agregats = {
+        'nb_total': Count('id'),
+        'nb_recuperations': Count('id', filter=Q(est_recuperation=True)),
+        'total_convives': Sum('nb_convives'),
+    }
+    for status in ('non_assignee', 'assignee', 'en_cours', 'livree', 'annulee'):
+        agregats[f'nb_{status}'] = Count('id', filter=Q(status=status))
+    for besoin in ('cafe', 'the', 'sac_glace', 'part_chaud'):
+        agregats[f'nb_besoin_{besoin}'] = Count('id', filter=Q(**{f'besoin_{besoin}': True}))
+
+    lignes = Livraison.objects.order_by().values('date_livraison', 'periode').annotate(**agregats)
+    ResumeLivraisonsJour.objects.bulk_create([
+        ResumeLivraisonsJour(
+            date=ligne.pop('date_livraison'), periode=ligne.pop('periode'),
+            **dict(ligne, total_convives=ligne['total_convives'] or 0),
+        )
+        for ligne in lignes
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0023_disponibilite_date_maj'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeLivraisonsJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('periode', models.CharField(choices=[('matin', 'Matin (5h-9h)'), ('midi', 'Midi (9h30-12h30)'), ('apres_midi', 'Après-midi (13h-20h)')], max_length=20)),
+                ('nb_total', models.PositiveIntegerField(default=0)),
+                ('nb_non_assignee', models.PositiveIntegerField(default=0)),
+                ('nb_assignee', models.PositiveIntegerField(default=0)),
+                ('nb_en_cours', models.PositiveIntegerField(default=0)),
+                ('nb_livree', models.PositiveIntegerField(default=0)),
+                ('nb_annulee', models.PositiveIntegerField(default=0)),
+                ('nb_recuperations', models.PositiveIntegerField(default=0)),
+                ('total_convives', models.PositiveIntegerField(default=0)),
+                ('nb_besoin_cafe', models.PositiveIntegerField(default=0)),
+                ('nb_besoin_the', models.PositiveIntegerField(default=0)),
+                ('nb_besoin_sac_glace', models.PositiveIntegerField(default=0)),
+                ('nb_besoin_part_chaud', models.PositiveIntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Résumé journalier des livraisons',
+                'verbose_name_plural': 'Résumés journaliers des livraisons',
+                'ordering': ['date', 'periode'],
+                'unique_together': {('date', 'periode')},
+            },
+        ),
+        migrations.RunPython(remplir, migrations.RunPython.noop),
+    ]
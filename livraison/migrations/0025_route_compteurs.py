@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def remplir(apps, schema_editor):
+    """Compteurs des routes existantes (même agrégation que progression.compteurs_reels)"""
+    Route = apps.get_model('livraison', 'Route')
+
+    routes = []
+    for ligne in Route.objects.order_by().values('id').annotate(
+        total=Count('livraisonroute'),
+        livrees=Count('livraisonroute', filter=Q(livraisonroute__livraison__status='livree')),
+        en_cours=Count('livraisonroute', filter=Q(livraisonroute__livraison__status='en_cours')),
+    ):
+        routes.append(Route(
+            id=ligne['id'], nb_livraisons=ligne['total'], nb_livrees=ligne['livrees'], nb_en_cours=ligne['en_cours'],
+        ))
+    Route.objects.bulk_update(routes, ['nb_livraisons', 'nb_livrees', 'nb_en_cours'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0024_resume_livraisons_jour'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='nb_livraisons',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='nb_livrees',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='nb_en_cours',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(remplir, migrations.RunPython.noop),
+    ]
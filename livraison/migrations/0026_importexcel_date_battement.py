@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livraison', '0025_route_compteurs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importexcel',
+            name='date_battement',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -90,6 +90,9 @@ class Livraison(models.Model):
     )
     geocode_attempts = models.IntegerField(default=0)
 
+    # Empreinte (sha1) de la ligne Excel normalisée du dernier import
+    empreinte_import = models.CharField(max_length=40, blank=True)
+
     nom_conseiller = models.CharField(max_length=100, blank=True)
 
     # Checklist liée
@@ -369,6 +372,7 @@ class Route(models.Model):
         super().save(*args, **kwargs)
     heure_retour_prevue = models.TimeField(null=True, blank=True)
     heure_retour_reelle = models.TimeField(null=True, blank=True)
+    heure_depart_reelle = models.DateTimeField(null=True, blank=True)
     vehicule = models.ForeignKey(Vehicule, on_delete=models.SET_NULL, null=True, blank=True, related_name='routes')
     
     livreurs = models.ManyToManyField(
@@ -383,6 +387,13 @@ class Route(models.Model):
     # Ordre des livraisons (JSONField pour flexibilité)
     ordre_livraisons = models.JSONField(default=list, blank=True)
     
+    # Avancement: arrêts, livrés, en cours (mis à jour par les signals, voir progression.py).
+    # Une instance chargée plus tôt les écraserait: sauver avec update_fields.
+    CHAMPS_COMPTEURS = ('nb_livraisons', 'nb_livrees', 'nb_en_cours')
+    nb_livraisons = models.PositiveIntegerField(default=0)
+    nb_livrees = models.PositiveIntegerField(default=0)
+    nb_en_cours = models.PositiveIntegerField(default=0)
+    
     # Metadata
     cree_par = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -399,37 +410,32 @@ class Route(models.Model):
     
     def livraisons_livrees(self):
         """Retourne le nombre de livraisons livrées sur cette route."""
-        return self.livraisonroute_set.filter(livraison__status='livree').count()
+        return self.nb_livrees
     
     def livraisons_en_cours(self):
         """Retourne le nombre de livraisons en cours sur cette route."""
-        return self.livraisonroute_set.filter(livraison__status='en_cours').count()
+        return self.nb_en_cours
     
     def livraisons_en_attente(self):
-        """Retourne le nombre de livraisons en attente sur cette route."""
-        return self.livraisonroute_set.filter(livraison__status='en_attente').count()
+        """Retourne le nombre de livraisons ni livrées ni en cours sur cette route."""
+        return self.nb_livraisons - self.nb_livrees - self.nb_en_cours
     
     def taux_completion(self):
         """Retourne le pourcentage de livraisons complétées."""
-        total = self.livraisonroute_set.count()
-        if total == 0:
+        if self.nb_livraisons == 0:
             return 0
-        livrees = self.livraisons_livrees()
-        return round((livrees / total) * 100, 1)
+        return round((self.nb_livrees / self.nb_livraisons) * 100, 1)
     
     def verifier_completion_auto(self):
         """Vérifie si toutes les livraisons sont livrées et termine la route automatiquement"""
         if self.status != 'en_cours':
             return False
         
-        # Vérifier que toutes les livraisons sont livrées
-        total_livraisons = self.livraisonroute_set.count()
-        livraisons_livrees = self.livraisonroute_set.filter(livraison__status='livree').count()
-        
-        if total_livraisons > 0 and total_livraisons == livraisons_livrees:
+        # Compteurs de la ligne: aucune requête sur les arrêts
+        if self.nb_livraisons > 0 and self.nb_livrees == self.nb_livraisons:
             self.status = 'terminee'
             self.heure_retour_reelle = timezone.now()
-            self.save()
+            self.save(update_fields=['status', 'heure_retour_reelle'])
             return True
     
     def __str__(self):
@@ -444,6 +450,11 @@ class LivraisonRoute(models.Model):
     ordre = models.PositiveIntegerField(default=0)  # IMPORTANT pour le tri
     date_ajout = models.DateTimeField(default=timezone.now)
     
+    # Projection des heures de passage (ProjectionETAService), recalculée après chaque modification
+    arrivee_estimee = models.TimeField(null=True, blank=True)
+    depart_estime = models.TimeField(null=True, blank=True)
+    retard_estime_min = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['ordre']  # Tri par ordre
         unique_together = ['route', 'livraison']
@@ -497,6 +508,7 @@ class DisponibiliteLivreur(models.Model):
     )
     
     notes = models.TextField(blank=True)
+    date_maj = models.DateTimeField(auto_now=True)  # Version de l'index des disponibilités
     
     class Meta:
         ordering = ['date_debut']
@@ -508,7 +520,14 @@ class DisponibiliteLivreur(models.Model):
 
 
 class ImportExcel(models.Model):
-    """Historique des imports Excel"""
+    """Historique des imports Excel (et file d'attente des imports en arrière-plan)"""
+    
+    STATUT_CHOICES = [
+        ('en_attente', 'En attente'),
+        ('en_cours', 'En cours'),
+        ('terminee', 'Terminé'),
+        ('echouee', 'Échoué'),
+    ]
     
     fichier = models.FileField(
         upload_to='imports/%Y/%m/',
@@ -517,17 +536,178 @@ class ImportExcel(models.Model):
     
     date_import = models.DateTimeField(default=timezone.now)
     importe_par = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    date_livraison = models.DateField(null=True, blank=True)
+    
+    # Suivi du traitement
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_attente')
+    date_debut = models.DateTimeField(null=True, blank=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+    # Dernier signe de vie du worker (écriture de progression): sert à détecter un import bloqué
+    date_battement = models.DateTimeField(null=True, blank=True)
     
     nb_lignes_total = models.IntegerField(default=0)
+    nb_lignes_traitees = models.IntegerField(default=0)
     nb_lignes_importees = models.IntegerField(default=0)
+    nb_lignes_mises_a_jour = models.IntegerField(default=0)
+    nb_lignes_inchangees = models.IntegerField(default=0)
     nb_erreurs = models.IntegerField(default=0)
     
     rapport_erreurs = models.JSONField(default=dict, blank=True)
+    geocoding_failed = models.JSONField(default=list, blank=True)
     
     class Meta:
         ordering = ['-date_import']
         verbose_name = 'Import Excel'
         verbose_name_plural = 'Imports Excel'
+        indexes = [
+            models.Index(fields=['statut', 'date_import']),
+        ]
+    
+    def progression(self):
+        """Pourcentage de lignes traitées"""
+        if self.statut == 'terminee':
+            return 100
+        if not self.nb_lignes_total:
+            return 0
+        return min(99, int(self.nb_lignes_traitees * 100 / self.nb_lignes_total))
+
+
+class GeocodeCache(models.Model):
+    """Cache persistant des résultats de géocodage, partagé entre imports et processus"""
+    
+    cle_hash = models.CharField(max_length=40, unique=True)  # sha1 de la clé normalisée
+    cle = models.TextField()  # adresse_precise|code_postal|ville
+    succes = models.BooleanField(default=True)
+    resultat = models.JSONField(default=dict, blank=True)
+    date_creation = models.DateTimeField(default=timezone.now)
+    date_expiration = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = 'Cache de géocodage'
+        verbose_name_plural = 'Cache de géocodage'
+    
+    def __str__(self):
+        return self.cle
+
+
+class SegmentGPS(models.Model):
+    """Positions GPS d'une route, par segments compressés (voir livraison/gps.py)"""
+    
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='segments_gps')
+    livreur = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    date = models.DateField()
+    debut = models.DateTimeField()
+    fin = models.DateTimeField()
+    nb_points = models.PositiveIntegerField(default=0)
+    donnees = models.BinaryField()
+    
+    class Meta:
+        ordering = ['debut']
+        indexes = [models.Index(fields=['route', 'date', 'debut'])]
+        verbose_name = 'Segment GPS'
+        verbose_name_plural = 'Segments GPS'
+    
+    def __str__(self):
+        return f"{self.route.nom} {self.debut:%H:%M:%S} ({self.nb_points} points)"
+
+
+class PositionGPS(models.Model):
+    """Dernière position connue d'une route (tableau de bord du responsable)"""
+    
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='position_gps')
+    livreur = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    horodatage = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    precision = models.PositiveIntegerField(null=True, blank=True)  # mètres
+    
+    class Meta:
+        verbose_name = 'Position GPS'
+        verbose_name_plural = 'Positions GPS'
+
+
+class EvenementLivraison(models.Model):
+    """
+    Journal des changements de livraisons et de routes diffusé en Server-Sent Events
+    (voir livraison/evenements.py). L'id sert d'identifiant d'événement (Last-Event-ID).
+    """
+
+    TYPE_CHOICES = [
+        ('livraison', 'Livraison'),
+        ('route', 'Route'),
+        ('arret', 'Arrêt de route'),
+        ('ordre', 'Ordre de route'),
+    ]
+
+    date = models.DateField()
+    route_id = models.UUIDField(null=True, blank=True)  # Pas de clé étrangère: survit à la suppression
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    donnees = models.JSONField(default=dict)
+    horodatage = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['date', 'id'])]
+        verbose_name = 'Événement de livraison'
+        verbose_name_plural = 'Événements de livraison'
+
+    def __str__(self):
+        return f"#{self.id} {self.type} {self.date}"
+
+
+class ResumeLivraisonsJour(models.Model):
+    """
+    Compteurs des livraisons d'une date et d'une période, lus par les tableaux de bord
+    (tenus à jour par livraison/resumes.py, reconstruits par reconstruire_resumes)
+    """
+
+    date = models.DateField()
+    periode = models.CharField(max_length=20, choices=Livraison.PERIODE_CHOICES)
+    nb_total = models.PositiveIntegerField(default=0)
+    nb_non_assignee = models.PositiveIntegerField(default=0)
+    nb_assignee = models.PositiveIntegerField(default=0)
+    nb_en_cours = models.PositiveIntegerField(default=0)
+    nb_livree = models.PositiveIntegerField(default=0)
+    nb_annulee = models.PositiveIntegerField(default=0)
+    nb_recuperations = models.PositiveIntegerField(default=0)
+    total_convives = models.PositiveIntegerField(default=0)
+    nb_besoin_cafe = models.PositiveIntegerField(default=0)
+    nb_besoin_the = models.PositiveIntegerField(default=0)
+    nb_besoin_sac_glace = models.PositiveIntegerField(default=0)
+    nb_besoin_part_chaud = models.PositiveIntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'periode']
+        unique_together = ['date', 'periode']
+        verbose_name = 'Résumé journalier des livraisons'
+        verbose_name_plural = 'Résumés journaliers des livraisons'
+
+    def __str__(self):
+        return f"{self.date} {self.periode}: {self.nb_livree}/{self.nb_total}"
+
+
+class VitesseTrajet(models.Model):
+    """
+    Vitesses observées entre arrêts livrés, par zone d'arrivée et heure de départ
+    (sommes cumulées par la commande apprendre_temps_trajet)
+    """
+    
+    zone = models.CharField(max_length=12)  # FSA "H3B" ou geohash sans code postal
+    heure = models.PositiveSmallIntegerField()  # 0-23, heure locale de départ du trajet
+    nb_trajets = models.PositiveIntegerField(default=0)
+    distance_km = models.FloatField(default=0)
+    duree_min = models.FloatField(default=0)
+    derniere_date = models.DateField()  # Dernière date de route intégrée
+    date_maj = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['zone', 'heure']
+        verbose_name = 'Vitesse de trajet'
+        verbose_name_plural = 'Vitesses de trajet'
+    
+    def __str__(self):
+        return f"{self.zone} {self.heure:02d}h"
 
 
 class Livreur(models.Model):
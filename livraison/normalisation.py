@@ -0,0 +1,301 @@
+"""
+Normalisation vectorisée des lignes d'import Excel.
+
+Applique colonne par colonne (pandas/NumPy) les mêmes règles que les méthodes
+ligne à ligne d'ExcelImportService: nettoyer_code_postal, parser_heure,
+determiner_periode, extraire_numero_base et calculer_besoins.
+"""
+
+import hashlib
+import re
+from datetime import date, datetime, time
+
+import numpy as np
+import pandas as pd
+
+
+# Colonnes lues dans le fichier Excel
+COLONNES_EXCEL = [
+    '# Commande',
+    'Nom de l\'événement',
+    'Nom du client commandé',
+    'Livraison et personne à contacter sur le site',
+    'Adresse',
+    'APP',
+    'Ligne 2',
+    'Code postal',
+    'Heure livraison',
+    'Nb convives',
+    'Mode d\'envoi',
+    'Nom du conseiller',
+    'Informations supplémentaires',
+]
+
+# Mêmes formats que parser_heure, essayés dans le même ordre: HH:MM, HHhMM, HHMM
+REGEX_HEURE = r'^(?:(\d{1,2}):(\d{2})|(\d{1,2})h(\d{2})|(\d{1,2})(\d{2}))'
+
+REGEX_CODE_POSTAL = r'^[A-Z]\d[A-Z] \d[A-Z]\d$'
+
+MOTS_CLES_BESOINS = {
+    'besoin_cafe': 'café|cafe',
+    'besoin_the': 'thé|the',
+    'besoin_part_chaud': 'chaud',
+    'besoin_sac_glace': 'glace|glacé',
+}
+
+# Champs normalisés entrant dans l'empreinte d'une ligne (ordre significatif)
+CHAMPS_EMPREINTE = [
+    'numero_brut', 'nom_evenement', 'client_nom', 'contact_sur_site', 'adresse_complete',
+    'code_postal', 'heure_souhaitee', 'nb_convives', 'mode_envoi_nom', 'nom_conseiller',
+    'informations_supplementaires',
+]
+SEPARATEUR_EMPREINTE = '\x1f'
+
+# Colonne optionnelle portant la date de chaque ligne (exports multi-dates).
+# Pas de « Date » seule: une colonne de date de commande serait prise pour la livraison.
+COLONNES_DATE = ['Date livraison', 'Date de livraison']
+
+MOIS = {
+    'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6,
+    'juillet': 7, 'août': 8, 'aout': 8, 'septembre': 9, 'octobre': 10, 'novembre': 11,
+    'décembre': 12, 'decembre': 12,
+}
+REGEX_DATE_ISO = re.compile(r'(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})')
+REGEX_DATE_JMA = re.compile(r'(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})')
+REGEX_DATE_TEXTE = re.compile(r'(\d{1,2})(?:er)?\s+(' + '|'.join(MOIS) + r')(?:\s+(\d{4}))?', re.IGNORECASE)
+
+# Décalage entre l'index pandas et le numéro de ligne Excel (3 lignes de titre + en-tête)
+DECALAGE_LIGNE_EXCEL = 5
+
+
+def empreinte_donnees(donnees):
+    """Empreinte d'une ligne normalisée (dict d'extraire_donnees_ligne)"""
+    heure = donnees['heure_souhaitee']
+    valeurs = [
+        heure.strftime('%H:%M') if champ == 'heure_souhaitee' and heure else str(donnees[champ] or '')
+        for champ in CHAMPS_EMPREINTE
+    ]
+    return hashlib.sha1(SEPARATEUR_EMPREINTE.join(valeurs).encode('utf-8')).hexdigest()
+
+
+def detecter_date(valeur, annee_defaut=None):
+    """
+    Date contenue dans une cellule ou un nom de feuille: objet date/datetime,
+    2025-01-15, 15/01/2025, 15.01.2025 ou « Lundi 15 janvier [2025] ».
+    Retourne None si aucune date n'est reconnue.
+    """
+    if valeur is None:
+        return None
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    if isinstance(valeur, date):
+        return valeur
+
+    texte = str(valeur).strip()
+    candidats = []
+    if resultat := REGEX_DATE_ISO.search(texte):
+        candidats.append((int(resultat[1]), int(resultat[2]), int(resultat[3])))
+    if resultat := REGEX_DATE_JMA.search(texte):
+        candidats.append((int(resultat[3]), int(resultat[2]), int(resultat[1])))
+    if resultat := REGEX_DATE_TEXTE.search(texte):
+        annee = int(resultat[3]) if resultat[3] else annee_defaut
+        if annee:
+            candidats.append((annee, MOIS[resultat[2].lower()], int(resultat[1])))
+
+    for annee, mois, jour in candidats:
+        try:
+            return date(annee, mois, jour)
+        except ValueError:
+            continue
+    return None
+
+
+class LotNormalise:
+    """Résultat de la normalisation: lignes valides typées + rapport de rejets par colonne"""
+
+    def __init__(self, tableau, erreurs, rejets):
+        self.tableau = tableau  # DataFrame typé, une ligne par livraison valide
+        self.erreurs = erreurs  # Lignes rejetées (format des erreurs d'import)
+        self.rejets = rejets    # {colonne: [{'ligne', 'valeur', 'raison'}]}
+
+    def __len__(self):
+        return len(self.tableau)
+
+    def lignes(self):
+        """[(index, donnees)] au format d'ExcelImportService.extraire_donnees_ligne"""
+        return list(zip(self.tableau.index, self.tableau.to_dict('records')))
+
+
+class NormalisationService:
+    """Transforme un DataFrame brut (colonnes Excel) en lot de livraisons normalisées"""
+
+    def __init__(self):
+        self.rejets = {}
+        self.erreurs = []
+
+    def rejeter(self, colonne, index, valeurs, raison):
+        """Ajoute au rapport les valeurs d'une colonne pour les lignes `index`"""
+        rapport = self.rejets.setdefault(colonne, [])
+        for position, valeur in zip(index, valeurs):
+            rapport.append({
+                'ligne': int(position) + DECALAGE_LIGNE_EXCEL,
+                'valeur': str(valeur),
+                'raison': raison,
+            })
+
+    # ==========================================
+    # TRANSFORMATIONS PAR COLONNE
+    # ==========================================
+
+    @staticmethod
+    def texte(serie):
+        """Équivalent vectorisé de get_safe_value: NaN/None -> '', sinon str nettoyée"""
+        vide = serie.isna()
+        brut = serie.astype(str)
+        return brut.str.strip().where(~vide & (brut != 'nan'), '')
+
+    @staticmethod
+    def joindre(gauche, droite):
+        """', '.join des parties non vides"""
+        return (gauche + ', ' + droite).where(droite != '', gauche).where(gauche != '', droite)
+
+    @staticmethod
+    def nettoyer_code_postal(codes):
+        codes = codes.str.upper().str.strip().str.replace('CANADA', '', regex=False).str.replace(' ', '', regex=False)
+        formatable = (codes.str.len() == 6) & codes.str.match(r'[^\W\d_]')
+        return codes.where(~formatable, codes.str[:3] + ' ' + codes.str[3:])
+
+    @staticmethod
+    def extraire_numero_base(numeros):
+        return numeros.str.split('.', n=1).str[0]
+
+    def parser_heure(self, heures_brutes, index):
+        """
+        Retourne (heures en time|None, minutes depuis minuit ou NaN, masque des lignes invalides).
+        Une heure hors bornes (ex. 25:00) rend la ligne invalide, comme time() le ferait.
+        """
+        textes = self.texte(heures_brutes)
+        groupes = textes.str.extract(REGEX_HEURE)
+
+        h = pd.to_numeric(groupes[0].fillna(groupes[2]).fillna(groupes[4]))
+        m = pd.to_numeric(groupes[1].fillna(groupes[3]).fillna(groupes[5]))
+
+        reconnue = h.notna()
+        invalide = reconnue & ((h > 23) | (m > 59))
+        valide = reconnue & ~invalide
+
+        non_reconnue = (textes != '') & ~reconnue
+        if non_reconnue.any():
+            self.rejeter('Heure livraison', index[non_reconnue], textes[non_reconnue], 'Format non reconnu, heure ignorée')
+        if invalide.any():
+            self.rejeter('Heure livraison', index[invalide], textes[invalide], 'Heure invalide, ligne rejetée')
+
+        minutes = (h * 60 + m).where(valide)
+
+        # Un objet time par valeur distincte
+        valeurs = np.full(len(textes), None, dtype=object)
+        if valide.any():
+            distinctes = {int(v): time(int(v) // 60, int(v) % 60) for v in np.unique(minutes[valide])}
+            valeurs[valide.to_numpy()] = minutes[valide].astype(int).map(distinctes).to_numpy()
+
+        return pd.Series(valeurs, index=textes.index, dtype=object), minutes, invalide
+
+    @staticmethod
+    def determiner_periode(minutes):
+        periode = np.select(
+            [minutes.isna(), (minutes >= 5 * 60) & (minutes < 9 * 60 + 30), (minutes >= 9 * 60 + 30) & (minutes < 13 * 60)],
+            ['matin', 'matin', 'midi'],
+            default='apres_midi'
+        )
+        return pd.Series(periode, index=minutes.index)
+
+    def nb_convives(self, valeurs, index):
+        nombres = pd.to_numeric(valeurs, errors='coerce')
+        non_numerique = valeurs.notna() & nombres.isna() & (self.texte(valeurs) != '')
+        if non_numerique.any():
+            self.rejeter('Nb convives', index[non_numerique], valeurs[non_numerique], 'Valeur non numérique, 0 utilisé')
+        return nombres.fillna(0).astype(int)
+
+    @staticmethod
+    def besoins(noms):
+        noms = noms.str.lower()
+        return {
+            champ: noms.str.contains(motif, regex=True)
+            for champ, motif in MOTS_CLES_BESOINS.items()
+        }
+
+    @staticmethod
+    def empreintes(tableau, minutes):
+        """empreinte_donnees sur toutes les lignes: concaténation par colonne puis sha1"""
+        heures = (minutes // 60).astype('Int64').astype(str).str.zfill(2) + ':' + (minutes % 60).astype('Int64').astype(str).str.zfill(2)
+        colonnes = {champ: tableau[champ].astype(str) for champ in CHAMPS_EMPREINTE}
+        colonnes['heure_souhaitee'] = heures.where(minutes.notna(), '')
+        colonnes['nb_convives'] = colonnes['nb_convives'].where(tableau['nb_convives'] != 0, '')
+
+        cles = colonnes[CHAMPS_EMPREINTE[0]]
+        for champ in CHAMPS_EMPREINTE[1:]:
+            cles = cles + SEPARATEUR_EMPREINTE + colonnes[champ]
+        return cles.map(lambda cle: hashlib.sha1(cle.encode('utf-8')).hexdigest())
+
+    # ==========================================
+    # LOT COMPLET
+    # ==========================================
+
+    def normaliser(self, brut):
+        """
+        `brut`: DataFrame indexé comme pandas.read_excel (0 = première ligne de données).
+        Retourne un LotNormalise.
+        """
+        self.rejets = {}
+        self.erreurs = []
+
+        brut = brut.reindex(columns=COLONNES_EXCEL)
+        index = brut.index
+        col = {nom: self.texte(brut[nom]) for nom in COLONNES_EXCEL if nom not in ('Heure livraison', 'Nb convives')}
+
+        numero_brut = col['# Commande']
+        adresse = col['Adresse']
+        app = col['APP']
+        ligne2 = col['Ligne 2']
+        nom_evenement = col['Nom de l\'événement']
+
+        heures, minutes, heure_invalide = self.parser_heure(brut['Heure livraison'], index)
+
+        code_postal = self.nettoyer_code_postal(col['Code postal'])
+        hors_format = (code_postal != '') & ~code_postal.str.match(REGEX_CODE_POSTAL)
+        if hors_format.any():
+            self.rejeter('Code postal', index[hors_format], code_postal[hors_format], 'Format non canadien, conservé tel quel')
+
+        tableau = pd.DataFrame({
+            'numero_brut': numero_brut,
+            'numero_base': self.extraire_numero_base(numero_brut),
+            'nom_evenement': nom_evenement,
+            'client_nom': col['Nom du client commandé'].where(col['Nom du client commandé'] != '', 'Client Inconnu'),
+            'contact_sur_site': col['Livraison et personne à contacter sur le site'],
+            'adresse_complete': self.joindre(self.joindre(adresse, ('App ' + app).where(app != '', '')), ligne2),
+            'app': app,
+            'ligne2': ligne2,
+            'code_postal': code_postal,
+            'heure_souhaitee': heures,
+            'periode': self.determiner_periode(minutes),
+            'nb_convives': self.nb_convives(brut['Nb convives'], index),
+            'mode_envoi_nom': col['Mode d\'envoi'],
+            'nom_conseiller': col['Nom du conseiller'],
+            'informations_supplementaires': col['Informations supplémentaires'],
+        }, index=index)
+
+        tableau['empreinte'] = self.empreintes(tableau, minutes)
+
+        besoins = pd.DataFrame(self.besoins(nom_evenement), index=index)
+        tableau['besoins'] = besoins.to_dict('records')
+
+        # Lignes sans numéro: ignorées comme avant, signalées si elles ressemblent à une livraison
+        sans_numero = tableau['numero_base'] == ''
+        a_signaler = sans_numero & ((adresse != '') | (col['Nom du client commandé'] != ''))
+        if a_signaler.any():
+            self.rejeter('# Commande', index[a_signaler], adresse[a_signaler], 'Numéro de commande manquant, ligne ignorée')
+
+        for position, valeur in zip(index[heure_invalide & ~sans_numero], brut['Heure livraison'][heure_invalide & ~sans_numero]):
+            self.erreurs.append(f"Ligne {int(position) + DECALAGE_LIGNE_EXCEL}: Heure invalide '{valeur}'")
+
+        return LotNormalise(tableau[~sans_numero & ~heure_invalide], self.erreurs, self.rejets)
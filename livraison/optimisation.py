@@ -0,0 +1,393 @@
+"""
+Optimisation de l'ordre des arrêts d'une route et répartition entre routes.
+
+Matrice de distances haversine (NumPy), fenêtres horaires souples autour de
+heure_souhaitee, construction gloutonne puis amélioration 2-opt / Or-opt.
+Sans accès à la base: OptimisationRouteService et RepartitionAutomatiqueService
+(services.py) chargent les livraisons et écrivent les routes.
+"""
+
+import copy
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+RAYON_TERRE_KM = 6371.0
+
+# Vitesse moyenne en ville et temps passé à chaque arrêt
+VITESSE_KMH = getattr(settings, 'ROUTAGE_VITESSE_KMH', 30)
+TEMPS_SERVICE_MIN = getattr(settings, 'ROUTAGE_TEMPS_SERVICE_MIN', 5)
+
+# Fenêtre d'un arrêt: de AVANCE_MAX minutes avant heure_souhaitee jusqu'à heure_souhaitee
+AVANCE_MAX_MIN = getattr(settings, 'ROUTAGE_AVANCE_MAX_MIN', 30)
+
+# Coût d'une minute de retard, en km de détour équivalents
+PENALITE_RETARD = getattr(settings, 'ROUTAGE_PENALITE_RETARD_KM_MIN', 1.0)
+
+# Budget de temps de l'amélioration locale
+DUREE_MAX_S = getattr(settings, 'ROUTAGE_DUREE_MAX_S', 0.5)
+
+# Segments déplacés par Or-opt
+LONGUEURS_OR_OPT = (1, 2, 3)
+
+
+def matrice_distances(latitudes, longitudes):
+    """Distances haversine (km) entre tous les points, calculées en une passe vectorisée"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def minutes(heure):
+    """time -> minutes depuis minuit (None conservé)"""
+    return None if heure is None else heure.hour * 60 + heure.minute
+
+
+class EvaluationRoute:
+    """Distance, retard cumulé et coût d'un ordre de passage"""
+
+    __slots__ = ('distance_km', 'retard_min', 'cout', 'arrivees')
+
+    def __init__(self, distance_km, retard_min, cout, arrivees):
+        self.distance_km = distance_km
+        self.retard_min = retard_min
+        self.cout = cout
+        self.arrivees = arrivees
+
+    def en_dict(self):
+        return {
+            'distance_km': round(self.distance_km, 2),
+            'retard_min': round(self.retard_min, 1),
+        }
+
+
+class OptimiseurRoute:
+    """
+    Ordonne les arrêts d'une route.
+
+    `latitudes`/`longitudes`: un point par arrêt. `heures`: heure_souhaitee (time|None).
+    `depart`: (lat, lon) du point de départ (dépôt) ou None pour un trajet ouvert.
+    `heure_depart`: time de départ; sans elle, le premier arrêt est servi à l'ouverture
+    de sa fenêtre. `distances`/`durees`: matrices précalculées (km, minutes) des arrêts,
+    dépôt en dernier, par exemple issues de matrices.sous_matrices.
+    """
+
+    def __init__(self, latitudes, longitudes, heures=None, depart=None, heure_depart=None,
+                 vitesse_kmh=VITESSE_KMH, temps_service=TEMPS_SERVICE_MIN,
+                 avance_max=AVANCE_MAX_MIN, penalite_retard=PENALITE_RETARD,
+                 distances=None, durees=None):
+        self.nb_arrets = len(latitudes)
+        self.avec_depart = depart is not None
+
+        if distances is None:
+            lats = list(latitudes) + ([depart[0]] if depart else [])
+            lons = list(longitudes) + ([depart[1]] if depart else [])
+            distances = matrice_distances(lats, lons)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.depot = self.nb_arrets if depart else None
+        # Distances routières orientées (matrices._placer_reseau): d[a][b] != d[b][a]
+        self.symetrique = bool(np.allclose(self.distances, self.distances.T))
+
+        # Listes Python: l'évaluation séquentielle y est plus rapide qu'en NumPy élément par élément
+        self.d = self.distances.tolist()
+        if durees is None:
+            durees = self.distances * (60.0 / vitesse_kmh)
+        self.t = np.asarray(durees, dtype=np.float64).tolist()
+
+        heures = heures or [None] * self.nb_arrets
+        self.fermetures = [minutes(h) for h in heures]
+        self.ouvertures = [None if f is None else f - avance_max for f in self.fermetures]
+        self.avec_fenetres = any(f is not None for f in self.fermetures)
+
+        self.heure_depart = minutes(heure_depart)
+        self.temps_service = temps_service
+        self.penalite_retard = penalite_retard
+
+    # ==========================================
+    # ÉVALUATION
+    # ==========================================
+
+    def evaluer(self, ordre):
+        """Parcourt l'ordre en propageant l'heure d'arrivée (attente si en avance)"""
+        d, t = self.d, self.t
+        distance = 0.0
+        retard = 0.0
+        arrivees = []
+
+        precedent = self.depot
+        heure = self.heure_depart
+
+        for arret in ordre:
+            ouverture = self.ouvertures[arret]
+            if precedent is not None:
+                distance += d[precedent][arret]
+                if heure is not None:
+                    heure += t[precedent][arret]
+
+            if heure is None:
+                # Trajet sans heure de départ: commence à l'ouverture du premier arrêt daté
+                heure = ouverture
+            elif ouverture is not None and heure < ouverture:
+                heure = ouverture
+
+            arrivees.append(heure)
+            fermeture = self.fermetures[arret]
+            if heure is not None:
+                if fermeture is not None and heure > fermeture:
+                    retard += heure - fermeture
+                heure += self.temps_service
+            precedent = arret
+
+        if self.depot is not None and ordre:
+            distance += d[ordre[-1]][self.depot]
+
+        return EvaluationRoute(distance, retard, distance + self.penalite_retard * retard, arrivees)
+
+    def cout(self, ordre):
+        return self.evaluer(ordre).cout
+
+    # ==========================================
+    # CONSTRUCTION
+    # ==========================================
+
+    def plus_proche_voisin(self):
+        """Glouton: à chaque pas, l'arrêt le moins coûteux à ajouter (distance + retard)"""
+        restants = set(range(self.nb_arrets))
+        ordre = []
+
+        if self.depot is None:
+            # Trajet ouvert: démarrer par l'arrêt le plus urgent, sinon le plus excentré
+            if self.avec_fenetres:
+                premier = min(restants, key=lambda a: (self.fermetures[a] is None, self.fermetures[a] or 0))
+            else:
+                premier = int(np.argmax(self.distances.sum(axis=1)))
+            ordre.append(premier)
+            restants.discard(premier)
+
+        while restants:
+            meilleur = min(restants, key=lambda a: self.cout(ordre + [a]))
+            ordre.append(meilleur)
+            restants.discard(meilleur)
+        return ordre
+
+    def par_heure(self):
+        """Ordre chronologique des heures souhaitées (arrêts sans heure en fin)"""
+        return sorted(range(self.nb_arrets), key=lambda a: (self.fermetures[a] is None, self.fermetures[a] or 0, a))
+
+    # ==========================================
+    # AMÉLIORATION LOCALE
+    # ==========================================
+
+    def deux_opt(self, ordre, cout, echeance):
+        """Inverse le segment [i, j] tant que le coût baisse (premier gain accepté)"""
+        n = len(ordre)
+        d = self.d
+        ameliore = True
+        while ameliore and time.perf_counter() < echeance:
+            ameliore = False
+            for i in range(n - 1):
+                for j in range(i + 1, n):
+                    if not self.avec_fenetres and self.symetrique:
+                        # Sans fenêtres, matrice symétrique: seules les deux arêtes aux bornes changent, delta en O(1)
+                        avant = ordre[i - 1] if i > 0 else self.depot
+                        apres = ordre[j + 1] if j + 1 < n else self.depot
+                        delta = 0.0
+                        if avant is not None:
+                            delta += d[avant][ordre[j]] - d[avant][ordre[i]]
+                        if apres is not None:
+                            delta += d[ordre[i]][apres] - d[ordre[j]][apres]
+                        if delta >= -1e-9:
+                            continue
+                        ordre[i:j + 1] = ordre[i:j + 1][::-1]
+                        cout += delta
+                        ameliore = True
+                        continue
+
+                    candidat = ordre[:i] + ordre[i:j + 1][::-1] + ordre[j + 1:]
+                    cout_candidat = self.cout(candidat)
+                    if cout_candidat < cout - 1e-9:
+                        ordre, cout = candidat, cout_candidat
+                        ameliore = True
+        return ordre, cout
+
+    def or_opt(self, ordre, cout, echeance):
+        """Déplace des segments de 1 à 3 arrêts vers une meilleure position"""
+        n = len(ordre)
+        ameliore = True
+        while ameliore and time.perf_counter() < echeance:
+            ameliore = False
+            for longueur in LONGUEURS_OR_OPT:
+                for i in range(n - longueur + 1):
+                    segment = ordre[i:i + longueur]
+                    reste = ordre[:i] + ordre[i + longueur:]
+                    for position in range(len(reste) + 1):
+                        if position == i:
+                            continue
+                        candidat = reste[:position] + segment + reste[position:]
+                        cout_candidat = self.cout(candidat)
+                        if cout_candidat < cout - 1e-9:
+                            ordre, cout = candidat, cout_candidat
+                            ameliore = True
+                            break
+                    if time.perf_counter() >= echeance:
+                        return ordre, cout
+        return ordre, cout
+
+    def resoudre(self, ordre_initial=None, duree_max=DUREE_MAX_S):
+        """
+        Meilleur ordre trouvé parmi les constructions (et l'ordre actuel), amélioré par
+        2-opt et Or-opt jusqu'à stabilité ou `duree_max` secondes.
+        Retourne (ordre, EvaluationRoute).
+        """
+        if self.nb_arrets < 2:
+            ordre = list(range(self.nb_arrets))
+            return ordre, self.evaluer(ordre)
+
+        echeance = time.perf_counter() + duree_max
+        candidats = [self.plus_proche_voisin(), self.par_heure()]
+        if ordre_initial:
+            candidats.append(list(ordre_initial))
+        ordre = min(candidats, key=self.cout)
+        cout = self.cout(ordre)
+
+        while time.perf_counter() < echeance:
+            ordre, cout_2opt = self.deux_opt(ordre, cout, echeance)
+            ordre, cout_oropt = self.or_opt(ordre, self.cout(ordre), echeance)
+            if cout_oropt >= cout - 1e-9:
+                break
+            cout = cout_oropt
+
+        return ordre, self.evaluer(ordre)
+
+
+# Coût fixe d'une route utilisée (km équivalents): évite d'ouvrir une route pour un seul arrêt voisin
+COUT_ROUTE = getattr(settings, 'DISPATCH_COUT_ROUTE_KM', 5.0)
+
+# Budget de temps de la répartition complète
+DUREE_MAX_DISPATCH_S = getattr(settings, 'DISPATCH_DUREE_MAX_S', 2.0)
+
+
+class VehiculeTournee:
+    """Une route candidate: capacité (nombre d'arrêts) et heure de début de shift"""
+
+    __slots__ = ('cle', 'capacite', 'heure_depart')
+
+    def __init__(self, cle, capacite, heure_depart=None):
+        self.cle = cle
+        self.capacite = capacite
+        self.heure_depart = heure_depart
+
+
+class RepartiteurTournees:
+    """
+    Répartit des arrêts entre plusieurs routes (VRP à fenêtres horaires souples).
+
+    Une seule matrice de distances pour tous les arrêts; chaque route est évaluée
+    comme un OptimiseurRoute partageant cette matrice, avec sa propre heure de départ.
+    Construction par insertion au moindre coût (arrêts les plus urgents d'abord),
+    puis déplacements entre routes et 2-opt / Or-opt dans chaque route.
+    """
+
+    def __init__(self, latitudes, longitudes, heures, vehicules, depart=None, cout_route=COUT_ROUTE,
+                 distances=None, durees=None, temps_service=TEMPS_SERVICE_MIN):
+        self.base = OptimiseurRoute(
+            latitudes, longitudes, heures, depart=depart, distances=distances, durees=durees,
+            temps_service=temps_service,
+        )
+        self.vehicules = list(vehicules)
+        self.cout_route = cout_route
+        self.vues = []
+        for vehicule in self.vehicules:
+            vue = copy.copy(self.base)
+            vue.heure_depart = minutes(vehicule.heure_depart)
+            self.vues.append(vue)
+
+    def cout_tournee(self, k, arrets):
+        if not arrets:
+            return 0.0
+        return self.vues[k].cout(arrets) + self.cout_route
+
+    def meilleure_insertion(self, arret, tournees, couts, exclue=None):
+        """(delta, k, position) de l'insertion la moins coûteuse, ou None si tout est plein"""
+        meilleure = None
+        for k, arrets in enumerate(tournees):
+            if k == exclue or len(arrets) >= self.vehicules[k].capacite:
+                continue
+            for position in range(len(arrets) + 1):
+                delta = self.cout_tournee(k, arrets[:position] + [arret] + arrets[position:]) - couts[k]
+                if meilleure is None or delta < meilleure[0]:
+                    meilleure = (delta, k, position)
+        return meilleure
+
+    def construire(self):
+        tournees = [[] for _ in self.vehicules]
+        couts = [0.0] * len(self.vehicules)
+        non_places = []
+
+        for arret in self.base.par_heure():
+            insertion = self.meilleure_insertion(arret, tournees, couts)
+            if insertion is None:
+                non_places.append(arret)
+                continue
+            _, k, position = insertion
+            tournees[k].insert(position, arret)
+            couts[k] = self.cout_tournee(k, tournees[k])
+
+        return tournees, couts, non_places
+
+    def deplacer_entre_tournees(self, tournees, couts, echeance):
+        """Relocalise un arrêt dans une autre route quand le coût total baisse"""
+        ameliore = False
+        for k in range(len(tournees)):
+            i = 0
+            while i < len(tournees[k]) and time.perf_counter() < echeance:
+                arret = tournees[k][i]
+                reste = tournees[k][:i] + tournees[k][i + 1:]
+                gain_retrait = couts[k] - self.cout_tournee(k, reste)
+
+                insertion = self.meilleure_insertion(arret, tournees, couts, exclue=k)
+                if insertion and insertion[0] < gain_retrait - 1e-9:
+                    _, cible, position = insertion
+                    tournees[k] = reste
+                    couts[k] = self.cout_tournee(k, reste)
+                    tournees[cible].insert(position, arret)
+                    couts[cible] = self.cout_tournee(cible, tournees[cible])
+                    ameliore = True
+                    continue
+                i += 1
+        return ameliore
+
+    def ameliorer_tournees(self, tournees, couts, echeance):
+        for k, arrets in enumerate(tournees):
+            if len(arrets) < 3:
+                continue
+            vue = self.vues[k]
+            arrets, _ = vue.deux_opt(list(arrets), vue.cout(arrets), echeance)
+            arrets, _ = vue.or_opt(arrets, vue.cout(arrets), echeance)
+            tournees[k] = arrets
+            couts[k] = self.cout_tournee(k, arrets)
+
+    def resoudre(self, duree_max=DUREE_MAX_DISPATCH_S):
+        """
+        Retourne (tournees, non_places): une liste d'arrêts ordonnés par véhicule
+        (vide si la route n'est pas utilisée) et les arrêts sans place.
+        """
+        echeance = time.perf_counter() + duree_max
+        tournees, couts, non_places = self.construire()
+
+        self.ameliorer_tournees(tournees, couts, echeance)
+        while time.perf_counter() < echeance:
+            if not self.deplacer_entre_tournees(tournees, couts, echeance):
+                break
+            self.ameliorer_tournees(tournees, couts, echeance)
+
+        return tournees, non_places
+
+    def evaluer(self, k, arrets):
+        return self.vues[k].evaluer(arrets)
@@ -0,0 +1,128 @@
+"""
+Compteurs d'avancement des routes (Route.nb_livraisons, nb_livrees, nb_en_cours).
+
+Ils sont ajustés en une requête UPDATE avec expressions F à chaque ajout ou retrait
+d'arrêt et à chaque changement de statut d'une livraison (signals): deux écritures
+simultanées ne se perdent pas, et taux_completion / verifier_completion_auto lisent
+la ligne de la route au lieu de compter ses arrêts. Route.save() ne réécrit jamais
+ces colonnes. La commande reparer_compteurs_routes recalcule et corrige les écarts.
+"""
+
+import logging
+
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+
+logger = logging.getLogger(__name__)
+
+
+# Statut de livraison -> compteur de route
+CHAMPS_STATUS = {
+    'livree': 'nb_livrees',
+    'en_cours': 'nb_en_cours',
+}
+
+CHAMPS_COMPTEURS = ('nb_livraisons', 'nb_livrees', 'nb_en_cours')
+
+
+def ajuster(routes, deltas):
+    """
+    Ajoute `deltas` ({compteur: delta}) aux routes du queryset, en une requête.
+    Un décrément est borné à zéro: un compteur déjà décalé (voir reparer) ne fait pas
+    échouer le changement de statut ou le retrait d'arrêt qui l'a déclenché.
+    """
+    modifications = {}
+    negatifs = Q()
+    for champ, delta in deltas.items():
+        if delta > 0:
+            modifications[champ] = F(champ) + delta
+        elif delta < 0:
+            modifications[champ] = Greatest(F(champ) + delta, 0)
+            negatifs |= Q(**{f'{champ}__lt': -delta})
+    if not modifications:
+        return
+    if negatifs:
+        for ligne in routes.filter(negatifs).values('id', *CHAMPS_COMPTEURS):
+            logger.warning("Compteurs de la route %s décalés %s (deltas %s): bornés à zéro, lancer reparer_compteurs_routes", ligne.pop('id'), ligne, deltas)
+    routes.update(**modifications)
+
+
+def deltas_status(status, signe=1):
+    champ = CHAMPS_STATUS.get(status)
+    return {champ: signe} if champ else {}
+
+
+def status_livraison(lien):
+    """Statut de la livraison d'un arrêt, sans requête si elle est déjà chargée"""
+    from .models import Livraison, LivraisonRoute
+
+    if LivraisonRoute.livraison.is_cached(lien):
+        return lien.livraison.status
+    return Livraison.objects.filter(id=lien.livraison_id).values_list('status', flat=True).first()
+
+
+def arret_ajoute(lien):
+    from .models import Route
+
+    deltas = {'nb_livraisons': 1, **deltas_status(status_livraison(lien))}
+    ajuster(Route.objects.filter(id=lien.route_id), deltas)
+
+
+def arret_retire(lien):
+    from .models import Route
+
+    deltas = {'nb_livraisons': -1, **deltas_status(status_livraison(lien), -1)}
+    ajuster(Route.objects.filter(id=lien.route_id), deltas)
+
+
+def status_change(livraison, ancien, nouveau):
+    """Reporte le changement de statut d'une livraison sur les routes qui la contiennent"""
+    from .models import LivraisonRoute, Route
+
+    if ancien == nouveau:
+        return
+    deltas = deltas_status(ancien, -1)
+    for champ, delta in deltas_status(nouveau).items():
+        deltas[champ] = deltas.get(champ, 0) + delta
+    routes = Route.objects.filter(id__in=LivraisonRoute.objects.filter(livraison=livraison).values('route_id'))
+    ajuster(routes, deltas)
+
+
+def compteurs_reels(routes):
+    """{route_id: {compteur: valeur}} recalculés depuis LivraisonRoute, en une agrégation"""
+    agregats = {'nb_livraisons': Count('livraisonroute')}
+    for status, champ in CHAMPS_STATUS.items():
+        agregats[champ] = Count('livraisonroute', filter=Q(livraisonroute__livraison__status=status))
+    return {
+        ligne.pop('id'): ligne
+        for ligne in routes.order_by().values('id').annotate(**agregats)
+    }
+
+
+def reparer(routes=None, appliquer=True):
+    """
+    Compare les compteurs stockés aux valeurs réelles et corrige les routes en écart.
+    Retourne [(route, {compteur: (stocké, réel)})] des routes corrigées (ou à corriger).
+    """
+    from .models import Route
+
+    routes = Route.objects.all() if routes is None else routes
+    reels = compteurs_reels(routes)
+    ecarts = []
+    for route in routes.only('id', 'nom', 'date', *CHAMPS_COMPTEURS):
+        attendus = reels.get(route.id, dict.fromkeys(CHAMPS_COMPTEURS, 0))
+        differences = {
+            champ: (getattr(route, champ), attendus[champ])
+            for champ in CHAMPS_COMPTEURS if getattr(route, champ) != attendus[champ]
+        }
+        if differences:
+            ecarts.append((route, differences))
+
+    if appliquer:
+        for route, differences in ecarts:
+            # Écart relatif plutôt que valeur absolue: une écriture concurrente n'est pas écrasée
+            ajuster(Route.objects.filter(id=route.id), {
+                champ: reel - stocke for champ, (stocke, reel) in differences.items()
+            })
+    return ecarts
@@ -0,0 +1,149 @@
+"""
+Regroupement géographique des livraisons d'une date/période en routes candidates.
+
+k-means (coordonnées projetées en km) ou k-médoïdes à capacité (distances
+haversine, taille maximale par groupe), en NumPy. Sans accès à la base:
+RegroupementService (services.py) charge les livraisons et les livreurs.
+"""
+
+import math
+
+import numpy as np
+from django.conf import settings
+
+from .optimisation import matrice_distances
+
+
+# Km par degré de latitude; pour la longitude, multiplié par cos(latitude)
+KM_PAR_DEGRE = 111.2
+
+# Marge de taille des groupes à capacité: jusqu'à 20 % au-dessus de la moyenne
+MARGE_CAPACITE = getattr(settings, 'REGROUPEMENT_MARGE_CAPACITE', 0.2)
+
+ITERATIONS_MAX = 50
+
+
+def projeter(latitudes, longitudes):
+    """Projection équirectangulaire locale (km): distances euclidiennes ≈ haversine à l'échelle d'une ville"""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    cos_lat = math.cos(math.radians(float(latitudes.mean()))) if len(latitudes) else 1.0
+    return np.column_stack((longitudes * KM_PAR_DEGRE * cos_lat, latitudes * KM_PAR_DEGRE))
+
+
+def initialiser_kmeans_pp(points, k, hasard):
+    """Centres k-means++: chaque nouveau centre tiré proportionnellement à d² au centre le plus proche"""
+    centres = [points[hasard.integers(len(points))]]
+    d2 = ((points - centres[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        indice = hasard.choice(len(points), p=d2 / total) if total > 0 else hasard.integers(len(points))
+        centres.append(points[indice])
+        d2 = np.minimum(d2, ((points - points[indice]) ** 2).sum(axis=1))
+    return np.array(centres)
+
+
+def kmeans(points, k, graine=0, iterations=ITERATIONS_MAX):
+    """k-means (Lloyd) vectorisé. Retourne (étiquettes, centres)."""
+    points = np.asarray(points, dtype=np.float64)
+    k = max(1, min(k, len(points)))
+    hasard = np.random.default_rng(graine)
+    centres = initialiser_kmeans_pp(points, k, hasard)
+
+    etiquettes = np.full(len(points), -1)
+    for _ in range(iterations):
+        distances = ((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+        nouvelles = distances.argmin(axis=1)
+        if np.array_equal(nouvelles, etiquettes):
+            break
+        etiquettes = nouvelles
+        for groupe in range(k):
+            membres = points[etiquettes == groupe]
+            # Groupe vidé: repartir du point le plus mal servi
+            centres[groupe] = membres.mean(axis=0) if len(membres) else points[distances.min(axis=1).argmax()]
+
+    return etiquettes, centres
+
+
+def affecter_avec_capacite(distances, medoides, capacite):
+    """
+    Affecte chaque point à un médoïde sans dépasser `capacite` points par groupe.
+    Les points au plus fort regret (écart entre 1er et 2e choix) passent d'abord.
+    """
+    vers_medoides = distances[:, medoides]
+    tries = np.sort(vers_medoides, axis=1)
+    regret = tries[:, 1] - tries[:, 0] if len(medoides) > 1 else np.zeros(len(distances))
+
+    etiquettes = np.full(len(distances), -1)
+    tailles = np.zeros(len(medoides), dtype=int)
+    for point in np.argsort(-regret, kind='stable'):
+        for groupe in np.argsort(vers_medoides[point], kind='stable'):
+            if tailles[groupe] < capacite:
+                etiquettes[point] = groupe
+                tailles[groupe] += 1
+                break
+    return etiquettes
+
+
+def kmedoides_capacite(distances, k, capacite=None, graine=0, iterations=ITERATIONS_MAX):
+    """
+    k-médoïdes à capacité sur une matrice de distances (km).
+    `capacite`: points max par groupe (défaut: moyenne + MARGE_CAPACITE).
+    Retourne (étiquettes, indices des médoïdes).
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = len(distances)
+    k = max(1, min(k, n))
+    if capacite is None:
+        capacite = math.ceil(n / k * (1 + MARGE_CAPACITE))
+    capacite = max(capacite, math.ceil(n / k))
+
+    # Départ: médoïdes k-means++ sur les distances
+    hasard = np.random.default_rng(graine)
+    medoides = [int(hasard.integers(n))]
+    d2 = distances[medoides[0]] ** 2
+    for _ in range(1, k):
+        total = d2.sum()
+        suivant = int(hasard.choice(n, p=d2 / total)) if total > 0 else int(hasard.integers(n))
+        medoides.append(suivant)
+        d2 = np.minimum(d2, distances[suivant] ** 2)
+    medoides = np.array(medoides)
+
+    etiquettes = affecter_avec_capacite(distances, medoides, capacite)
+    for _ in range(iterations):
+        # Nouveau médoïde: le membre qui minimise la somme des distances du groupe
+        nouveaux = medoides.copy()
+        for groupe in range(k):
+            membres = np.flatnonzero(etiquettes == groupe)
+            if len(membres):
+                nouveaux[groupe] = membres[distances[np.ix_(membres, membres)].sum(axis=1).argmin()]
+        if np.array_equal(nouveaux, medoides):
+            break
+        medoides = nouveaux
+        etiquettes = affecter_avec_capacite(distances, medoides, capacite)
+
+    return etiquettes, medoides
+
+
+def decrire_groupes(etiquettes, latitudes, longitudes, convives):
+    """Centroïde, dispersion (distance moyenne et max au centroïde, km) et convives par groupe"""
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    convives = np.asarray(convives, dtype=np.int64)
+
+    groupes = []
+    for groupe in np.unique(etiquettes):
+        membres = etiquettes == groupe
+        centre = (float(latitudes[membres].mean()), float(longitudes[membres].mean()))
+        ecarts = matrice_distances(
+            np.append(latitudes[membres], centre[0]), np.append(longitudes[membres], centre[1])
+        )[-1, :-1]
+        groupes.append({
+            'groupe': int(groupe),
+            'centroide': {'latitude': round(centre[0], 6), 'longitude': round(centre[1], 6)},
+            'dispersion_km': round(float(ecarts.mean()), 2),
+            'rayon_km': round(float(ecarts.max()), 2),
+            'nb_livraisons': int(membres.sum()),
+            'nb_convives': int(convives[membres].sum()),
+        })
+    return groupes
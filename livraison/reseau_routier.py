@@ -0,0 +1,318 @@
+"""
+Distances routières hors ligne à partir d'un extrait OpenStreetMap.
+
+Un extrait .osm (XML, ex. export Overpass de la grande région de Montréal) est
+converti une fois par la commande construire_reseau_routier en graphe CSR
+(tableaux NumPy .npy, ouverts en mémoire mappée): noeuds (lat, lon), arêtes
+sortantes et entrantes avec longueur (km) et durée (minutes) selon le type de
+voie. Plus courts chemins point à point (A*) et un vers plusieurs (Dijkstra,
+arrêt dès que toutes les cibles sont atteintes), sans accès réseau.
+
+Activé pour les matrices de distances quand RESEAU_ROUTIER_DOSSIER est défini.
+"""
+
+import heapq
+import json
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+from .optimisation import RAYON_TERRE_KM
+
+
+# Vitesses (km/h) par type de voie OSM; les autres types (piétons, vélos...) sont ignorés
+VITESSES_VOIES = {
+    'motorway': 70, 'motorway_link': 45,
+    'trunk': 60, 'trunk_link': 40,
+    'primary': 45, 'primary_link': 35,
+    'secondary': 40, 'secondary_link': 30,
+    'tertiary': 35, 'tertiary_link': 30,
+    'unclassified': 30, 'residential': 25,
+    'living_street': 10, 'service': 15,
+}
+VITESSE_MAX_KMH = max(VITESSES_VOIES.values())
+
+# Taille des cases de l'index des noeuds (degrés)
+PAS_GRILLE = 0.01
+
+FICHIERS = (
+    'noeuds', 'indptr', 'voisins', 'longueurs', 'durees',
+    'indptr_inverse', 'voisins_inverse', 'longueurs_inverse', 'durees_inverse',
+)
+
+
+def dossier_reseau():
+    return getattr(settings, 'RESEAU_ROUTIER_DOSSIER', None)
+
+
+# ==========================================
+# CONSTRUCTION
+# ==========================================
+
+def sens_circulation(tags):
+    """1: sens du tracé seulement, -1: sens inverse seulement, 0: double sens"""
+    oneway = tags.get('oneway', '')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('junction') in ('roundabout', 'circular') or tags.get('highway') == 'motorway':
+        return 1
+    return 0
+
+
+def lire_osm(chemin):
+    """
+    Lit un extrait .osm (XML) en flux.
+    Retourne ({id osm: (lat, lon)}, [(ids des noeuds, vitesse km/h, sens)]).
+    """
+    positions = {}
+    voies = []
+    for _, element in ET.iterparse(chemin, events=('end',)):
+        if element.tag == 'node':
+            positions[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+            vitesse = VITESSES_VOIES.get(tags.get('highway'))
+            if vitesse and tags.get('access') not in ('no', 'private'):
+                maxspeed = tags.get('maxspeed', '').split(' ')[0]
+                if maxspeed.isdigit():
+                    vitesse = min(vitesse, int(maxspeed))
+                voies.append(([int(nd.get('ref')) for nd in element.iter('nd')], vitesse, sens_circulation(tags)))
+            element.clear()
+    return positions, voies
+
+
+def csr(sources, cibles, nb_noeuds, *valeurs):
+    """Tableaux CSR (indptr, voisins, valeurs...) triés par source"""
+    ordre = np.argsort(sources, kind='stable')
+    indptr = np.zeros(nb_noeuds + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=nb_noeuds), out=indptr[1:])
+    return (indptr, cibles[ordre].astype(np.int32)) + tuple(v[ordre].astype(np.float32) for v in valeurs)
+
+
+def construire_reseau(chemin_osm, dossier):
+    """Convertit un extrait .osm en graphe CSR dans `dossier`. Retourne les métadonnées."""
+    positions, voies = lire_osm(chemin_osm)
+
+    # Noeuds renumérotés: seuls ceux des voies retenues
+    index = {}
+    sources, cibles, vitesses = [], [], []
+    for refs, vitesse, sens in voies:
+        refs = [ref for ref in refs if ref in positions]
+        for a, b in zip(refs, refs[1:]):
+            ia = index.setdefault(a, len(index))
+            ib = index.setdefault(b, len(index))
+            if sens >= 0:
+                sources.append(ia)
+                cibles.append(ib)
+                vitesses.append(vitesse)
+            if sens <= 0:
+                sources.append(ib)
+                cibles.append(ia)
+                vitesses.append(vitesse)
+
+    noeuds = np.zeros((len(index), 2), dtype=np.float64)
+    for ref, rang in index.items():
+        noeuds[rang] = positions[ref]
+
+    sources = np.array(sources, dtype=np.int64)
+    cibles = np.array(cibles, dtype=np.int64)
+    longueurs = haversine(noeuds[sources], noeuds[cibles])
+    durees = longueurs * 60.0 / np.array(vitesses, dtype=np.float64)
+
+    tableaux = dict(zip(('indptr', 'voisins', 'longueurs', 'durees'), csr(sources, cibles, len(index), longueurs, durees)))
+    tableaux.update(zip(
+        ('indptr_inverse', 'voisins_inverse', 'longueurs_inverse', 'durees_inverse'),
+        csr(cibles, sources, len(index), longueurs, durees),
+    ))
+    tableaux['noeuds'] = noeuds
+
+    os.makedirs(dossier, exist_ok=True)
+    for nom, tableau in tableaux.items():
+        np.save(os.path.join(dossier, f'{nom}.npy'), tableau)
+
+    meta = {
+        'source': os.path.basename(chemin_osm),
+        'nb_noeuds': len(index),
+        'nb_aretes': len(sources),
+        'date': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(dossier, 'reseau.json'), 'w', encoding='utf-8') as fichier:
+        json.dump(meta, fichier)
+    return meta
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance (km) entre deux points, sans NumPy (boucles de recherche)"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(min(max(h, 0.0), 1.0)))
+
+
+def haversine(a, b):
+    """Distances (km) entre deux tableaux de points (lat, lon) alignés"""
+    lat1, lon1 = np.radians(a[:, 0]), np.radians(a[:, 1])
+    lat2, lon2 = np.radians(b[:, 0]), np.radians(b[:, 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+# ==========================================
+# REQUÊTES
+# ==========================================
+
+class ReseauRoutier:
+    """
+    Graphe routier mappé en mémoire. Les points quelconques sont rattachés au noeud
+    le plus proche (la distance de rattachement, à vol d'oiseau, est ajoutée au trajet).
+    `poids`: 'longueurs' (km) ou 'durees' (minutes).
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        with open(os.path.join(dossier, 'reseau.json'), encoding='utf-8') as fichier:
+            self.meta = json.load(fichier)
+        self.version = self.meta['date']
+        tableaux = {nom: np.load(os.path.join(dossier, f'{nom}.npy'), mmap_mode='r') for nom in FICHIERS}
+        self.noeuds = tableaux['noeuds']
+        self.nb_noeuds = len(self.noeuds)
+        self.sens = {
+            False: (tableaux['indptr'], tableaux['voisins'], tableaux['longueurs'], tableaux['durees']),
+            True: (tableaux['indptr_inverse'], tableaux['voisins_inverse'],
+                   tableaux['longueurs_inverse'], tableaux['durees_inverse']),
+        }
+        self.indexer()
+
+    def indexer(self):
+        """Index de grille: noeuds triés par case (PAS_GRILLE), bornes par recherche dichotomique"""
+        lignes = np.floor(self.noeuds[:, 0] / PAS_GRILLE).astype(np.int64)
+        colonnes = np.floor(self.noeuds[:, 1] / PAS_GRILLE).astype(np.int64)
+        codes = lignes * 100000 + colonnes
+        self.ordre_grille = np.argsort(codes, kind='stable')
+        self.codes_grille = codes[self.ordre_grille]
+
+    def plus_proche_noeud(self, latitude, longitude):
+        """(noeud, distance km) le plus proche, en élargissant la recherche autour de la case"""
+        ligne = math.floor(latitude / PAS_GRILLE)
+        colonne = math.floor(longitude / PAS_GRILLE)
+        for rayon in (1, 3, 10, None):
+            if rayon is None:
+                candidats = np.arange(self.nb_noeuds)
+            else:
+                morceaux = []
+                for dl in range(-rayon, rayon + 1):
+                    code = (ligne + dl) * 100000
+                    debut = np.searchsorted(self.codes_grille, code + colonne - rayon)
+                    fin = np.searchsorted(self.codes_grille, code + colonne + rayon, side='right')
+                    morceaux.append(self.ordre_grille[debut:fin])
+                candidats = np.concatenate(morceaux)
+            if len(candidats):
+                distances = haversine(np.array([[latitude, longitude]]), np.asarray(self.noeuds[candidats]))
+                meilleur = int(distances.argmin())
+                return int(candidats[meilleur]), float(distances[meilleur])
+        raise ValueError('Réseau routier vide')
+
+    def voisins(self, noeud, inverse=False, poids='longueurs'):
+        indptr, voisins, longueurs, durees = self.sens[inverse]
+        debut, fin = int(indptr[noeud]), int(indptr[noeud + 1])
+        valeurs = longueurs if poids == 'longueurs' else durees
+        return zip(voisins[debut:fin].tolist(), valeurs[debut:fin].tolist())
+
+    def dijkstra(self, source, cibles, inverse=False, poids='longueurs'):
+        """Coûts depuis `source` vers chaque cible (inf si inatteignable). `inverse`: vers la source."""
+        restantes = set(cibles)
+        couts = {source: 0.0}
+        fixes = set()
+        tas = [(0.0, source)]
+        while tas and restantes:
+            cout, noeud = heapq.heappop(tas)
+            if noeud in fixes:
+                continue
+            fixes.add(noeud)
+            restantes.discard(noeud)
+            for voisin, valeur in self.voisins(noeud, inverse, poids):
+                nouveau = cout + valeur
+                if nouveau < couts.get(voisin, math.inf):
+                    couts[voisin] = nouveau
+                    heapq.heappush(tas, (nouveau, voisin))
+        return [couts.get(cible, math.inf) if cible in fixes else math.inf for cible in cibles]
+
+    def a_etoile(self, source, cible, poids='longueurs'):
+        """Coût du plus court chemin source -> cible et liste des noeuds (A*, heuristique à vol d'oiseau)"""
+        lat_cible, lon_cible = float(self.noeuds[cible, 0]), float(self.noeuds[cible, 1])
+        # Heuristique admissible: distance à vol d'oiseau (à la vitesse maximale pour les durées)
+        facteur = 1.0 if poids == 'longueurs' else 60.0 / VITESSE_MAX_KMH
+
+        def estimation(noeud):
+            lat, lon = self.noeuds[noeud].tolist()
+            return facteur * haversine_km(lat, lon, lat_cible, lon_cible)
+
+        couts = {source: 0.0}
+        parents = {source: None}
+        fixes = set()
+        tas = [(estimation(source), 0.0, source)]
+        while tas:
+            _, cout, noeud = heapq.heappop(tas)
+            if noeud == cible:
+                chemin = []
+                while noeud is not None:
+                    chemin.append(noeud)
+                    noeud = parents[noeud]
+                return cout, chemin[::-1]
+            if noeud in fixes:
+                continue
+            fixes.add(noeud)
+            for voisin, valeur in self.voisins(noeud, poids=poids):
+                nouveau = cout + valeur
+                if nouveau < couts.get(voisin, math.inf):
+                    couts[voisin] = nouveau
+                    parents[voisin] = noeud
+                    heapq.heappush(tas, (nouveau + estimation(voisin), nouveau, voisin))
+        return math.inf, []
+
+    def rattacher(self, latitude, longitude, poids):
+        """Noeud le plus proche et coût du rattachement (km, ou minutes à 15 km/h)"""
+        noeud, km = self.plus_proche_noeud(float(latitude), float(longitude))
+        return noeud, km if poids == 'longueurs' else km * 60.0 / VITESSES_VOIES['service']
+
+    def trajet(self, depart, arrivee, poids='longueurs'):
+        """Coût routier d'un point (lat, lon) à un autre"""
+        source, acces = self.rattacher(*depart, poids)
+        cible, sortie = self.rattacher(*arrivee, poids)
+        cout, _ = self.a_etoile(source, cible, poids)
+        return cout + acces + sortie
+
+    def un_vers_plusieurs(self, origine, destinations, inverse=False, poids='longueurs'):
+        """
+        Coûts routiers de `origine` vers chaque destination (ou l'inverse avec `inverse`),
+        en un seul parcours de Dijkstra.
+        """
+        source, acces = self.rattacher(*origine, poids)
+        rattachements = [self.rattacher(lat, lon, poids) for lat, lon in destinations]
+        couts = self.dijkstra(source, [noeud for noeud, _ in rattachements], inverse, poids)
+        return np.array([acces + cout + sortie for cout, (_, sortie) in zip(couts, rattachements)])
+
+
+_reseaux = {}
+_reseaux_lock = threading.Lock()
+
+
+def reseau_routier(dossier=None):
+    """Réseau partagé (par processus), ou None si aucun réseau n'est configuré ou construit"""
+    dossier = dossier or dossier_reseau()
+    if not dossier or not os.path.exists(os.path.join(dossier, 'reseau.json')):
+        return None
+    with _reseaux_lock:
+        reseau = _reseaux.get(dossier)
+        if reseau is None:
+            reseau = _reseaux[dossier] = ReseauRoutier(dossier)
+    return reseau
@@ -0,0 +1,173 @@
+"""
+Résumé journalier des livraisons (ResumeLivraisonsJour), une ligne par date et période.
+
+Les tableaux de bord lisent ces compteurs au lieu de compter Livraison à chaque
+affichage. Ils sont tenus à jour en place (expressions F) par les signals de
+Livraison: création, changement de statut, de date, de convives ou de besoins,
+suppression. Les écritures en lot (import Excel, validation d'une répartition)
+n'envoient pas de signal: elles reconstruisent les dates touchées. La commande
+reconstruire_resumes recalcule tout depuis Livraison.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+
+# Statut de la livraison -> compteur
+CHAMPS_STATUS = {
+    'non_assignee': 'nb_non_assignee',
+    'assignee': 'nb_assignee',
+    'en_cours': 'nb_en_cours',
+    'livree': 'nb_livree',
+    'annulee': 'nb_annulee',
+}
+
+# Besoin (booléen de Livraison) -> compteur
+CHAMPS_BESOINS = {
+    'besoin_cafe': 'nb_besoin_cafe',
+    'besoin_the': 'nb_besoin_the',
+    'besoin_sac_glace': 'nb_besoin_sac_glace',
+    'besoin_part_chaud': 'nb_besoin_part_chaud',
+}
+
+COMPTEURS = ['nb_total', *CHAMPS_STATUS.values(), 'nb_recuperations', 'total_convives', *CHAMPS_BESOINS.values()]
+
+# Champs de Livraison dont dépend le résumé
+CHAMPS_LIVRAISON = ('date_livraison', 'periode', 'status', 'est_recuperation', 'nb_convives', *CHAMPS_BESOINS)
+
+
+# ==========================================
+# MISE À JOUR INCRÉMENTALE
+# ==========================================
+
+def contribution(livraison):
+    """
+    ((date, periode), {compteur: valeur}) d'une livraison, lu dans son __dict__ sans
+    requête; None si un champ n'est pas chargé (only/defer).
+    """
+    valeurs = livraison.__dict__
+    if any(champ not in valeurs for champ in CHAMPS_LIVRAISON):
+        return None
+    compteurs = {
+        'nb_total': 1,
+        'nb_recuperations': int(bool(valeurs['est_recuperation'])),
+        'total_convives': valeurs['nb_convives'] or 0,
+    }
+    if valeurs['status'] in CHAMPS_STATUS:
+        compteurs[CHAMPS_STATUS[valeurs['status']]] = 1
+    for besoin, champ in CHAMPS_BESOINS.items():
+        if valeurs[besoin]:
+            compteurs[champ] = 1
+    return (valeurs['date_livraison'], valeurs['periode']), compteurs
+
+
+def appliquer(cle, deltas):
+    """
+    Ajoute `deltas` aux compteurs de la ligne `cle` (créée au besoin), en une écriture atomique.
+    Les décréments sont bornés à zéro: un résumé décalé (voir reconstruire) ne fait pas
+    échouer l'enregistrement de la livraison qui l'a déclenché.
+    """
+    from .models import ResumeLivraisonsJour
+
+    deltas = {champ: delta for champ, delta in deltas.items() if delta}
+    if not deltas or cle[0] is None:
+        return
+    date, periode = cle
+    modifications = {}
+    negatifs = Q()
+    for champ, delta in deltas.items():
+        if delta > 0:
+            modifications[champ] = F(champ) + delta
+        else:
+            modifications[champ] = Greatest(F(champ) + delta, 0)
+            negatifs |= Q(**{f'{champ}__lt': -delta})
+    if negatifs and ResumeLivraisonsJour.objects.filter(negatifs, date=date, periode=periode).exists():
+        logger.warning("Résumé du %s (%s) décalé (deltas %s): borné à zéro, lancer reconstruire_resumes", date, periode, deltas)
+    modifications['date_maj'] = timezone.now()
+    if not ResumeLivraisonsJour.objects.filter(date=date, periode=periode).update(**modifications):
+        with transaction.atomic():
+            ResumeLivraisonsJour.objects.get_or_create(date=date, periode=periode)
+            ResumeLivraisonsJour.objects.filter(date=date, periode=periode).update(**modifications)
+
+
+def actualiser(avant, apres):
+    """Reporte le passage d'une contribution `avant` à `apres` (None: absente)"""
+    if avant is not None and apres is not None and avant[0] == apres[0]:
+        champs = set(avant[1]) | set(apres[1])
+        appliquer(apres[0], {champ: apres[1].get(champ, 0) - avant[1].get(champ, 0) for champ in champs})
+        return
+    if avant is not None:
+        appliquer(avant[0], {champ: -valeur for champ, valeur in avant[1].items()})
+    if apres is not None:
+        appliquer(apres[0], apres[1])
+
+
+# ==========================================
+# RECONSTRUCTION
+# ==========================================
+
+def reconstruire(dates=None):
+    """
+    Recalcule les lignes des `dates` (toutes si None) depuis Livraison, en une agrégation.
+    Retourne le nombre de lignes écrites.
+    """
+    from .models import Livraison, ResumeLivraisonsJour
+
+    livraisons = Livraison.objects.all()
+    resumes = ResumeLivraisonsJour.objects.all()
+    if dates is not None:
+        dates = set(dates)
+        livraisons = livraisons.filter(date_livraison__in=dates)
+        resumes = resumes.filter(date__in=dates)
+
+    agregats = {
+        'nb_total': Count('id'),
+        'nb_recuperations': Count('id', filter=Q(est_recuperation=True)),
+        'total_convives': Sum('nb_convives'),
+    }
+    for status, champ in CHAMPS_STATUS.items():
+        agregats[champ] = Count('id', filter=Q(status=status))
+    for besoin, champ in CHAMPS_BESOINS.items():
+        agregats[champ] = Count('id', filter=Q(**{besoin: True}))
+
+    lignes = [
+        ResumeLivraisonsJour(
+            date=ligne.pop('date_livraison'), periode=ligne.pop('periode'),
+            **dict(ligne, total_convives=ligne['total_convives'] or 0),
+        )
+        for ligne in livraisons.order_by().values('date_livraison', 'periode').annotate(**agregats)
+    ]
+    with transaction.atomic():
+        resumes.delete()
+        ResumeLivraisonsJour.objects.bulk_create(lignes)
+    return len(lignes)
+
+
+# ==========================================
+# LECTURE
+# ==========================================
+
+def resume_jour(date):
+    """
+    Compteurs d'une date: {compteur: total, 'par_periode': {periode: {compteur: valeur}}},
+    en une requête. Les périodes sans livraison valent zéro.
+    """
+    from .models import Livraison, ResumeLivraisonsJour
+
+    vide = dict.fromkeys(COMPTEURS, 0)
+    par_periode = {periode: dict(vide) for periode, _ in Livraison.PERIODE_CHOICES}
+    resume = dict(vide)
+    for ligne in ResumeLivraisonsJour.objects.filter(date=date).values('periode', *COMPTEURS):
+        periode = ligne.pop('periode')
+        par_periode[periode] = ligne
+        for champ, valeur in ligne.items():
+            resume[champ] += valeur
+    resume['par_periode'] = par_periode
+    return resume
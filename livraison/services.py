@@ -1,18 +1,164 @@
+import numpy as np
 import pandas as pd
-from datetime import datetime, time
+import openpyxl
+import io
+import math
+import threading
+import zipfile
+from openpyxl.utils.exceptions import InvalidFileException
+from datetime import datetime, time, timedelta
 from django.utils import timezone
 from decimal import Decimal
 import re
+import time as time_module
 
-from .models import Livraison, ModeEnvoi
-from .geocoding import GeocodingService
+from django.db import transaction
+from django.db.models import Count, Max, Prefetch, Q
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .models import (
+    Livraison, LivraisonRoute, ModeEnvoi, ImportExcel, PositionGPS, Route,
+    SegmentGPS, Vehicule,
+)
+from . import evenements, gps, resumes
+from .disponibilites import index_disponibilites
+from .geocoding import GeocodingService, GeocodagePool
+from .matrices import CLE_DEPOT, actualiser_livraisons, sous_matrices
+from .optimisation import (
+    AVANCE_MAX_MIN, TEMPS_SERVICE_MIN, VITESSE_KMH,
+    OptimiseurRoute, RepartiteurTournees, VehiculeTournee, matrice_distances,
+)
+from .regroupement import decrire_groupes, kmeans, kmedoides_capacite, projeter
+from .temps_trajet import modele_temps_trajet, zone_livraison
+from .normalisation import (
+    COLONNES_DATE, COLONNES_EXCEL, DECALAGE_LIGNE_EXCEL,
+    NormalisationService, detecter_date, empreinte_donnees,
+)
+
+
+# Nombre de lignes par transaction / requête IN lors des imports
+TAILLE_LOT = 200
+
+
+def par_lots(elements, taille):
+    """Découpe une liste en lots de `taille` éléments"""
+    elements = list(elements)
+    for i in range(0, len(elements), taille):
+        yield elements[i:i + taille]
+
+
+# Lignes de titre au-dessus de l'en-tête dans les exports de livraisons
+LIGNES_IGNOREES = 3
+
+
+class LigneExcel:
+    """Ligne légère: tuple de valeurs + index d'en-tête partagé (même .get qu'une Series pandas)"""
+    
+    __slots__ = ('valeurs', 'colonnes')
+    
+    def __init__(self, valeurs, colonnes):
+        self.valeurs = valeurs
+        self.colonnes = colonnes
+    
+    def get(self, colonne, defaut=None):
+        position = self.colonnes.get(colonne)
+        if position is None or position >= len(self.valeurs):
+            return defaut
+        return self.valeurs[position]
+
+
+def lire_lignes_excel(fichier_excel, lignes_ignorees=LIGNES_IGNOREES, nom_feuille=None, titres=None):
+    """
+    Itère (index, LigneExcel) en streaming via openpyxl read_only.
+    L'index suit la numérotation pandas: 0 = première ligne sous l'en-tête.
+    `nom_feuille`: feuille à lire (défaut: la première). `titres`: liste complétée
+    avec les valeurs des lignes de titre ignorées.
+    """
+    classeur = openpyxl.load_workbook(fichier_excel, read_only=True, data_only=True)
+    try:
+        feuille = classeur[nom_feuille] if nom_feuille else classeur.worksheets[0]
+        feuille.reset_dimensions()  # Ne pas se fier aux dimensions déclarées du fichier
+        
+        lignes = feuille.iter_rows(values_only=True)
+        for _ in range(lignes_ignorees):
+            valeurs = next(lignes, None) or ()
+            if titres is not None:
+                titres.extend(valeur for valeur in valeurs if valeur is not None)
+        entete = next(lignes, None)
+        if entete is None:
+            return
+        
+        colonnes = {}
+        for position, nom in enumerate(entete):
+            if nom is not None:
+                colonnes.setdefault(str(nom), position)
+        
+        for index, valeurs in enumerate(lignes):
+            if any(valeur is not None for valeur in valeurs):
+                yield index, LigneExcel(valeurs, colonnes)
+    finally:
+        classeur.close()
+
+
+def lire_tableau_excel(fichier_excel, colonnes=COLONNES_EXCEL, lignes_ignorees=LIGNES_IGNOREES, nom_feuille=None, titres=None):
+    """DataFrame des seules `colonnes`, construit depuis la lecture streaming"""
+    index = []
+    valeurs = []
+    for position, ligne in lire_lignes_excel(fichier_excel, lignes_ignorees, nom_feuille, titres):
+        index.append(position)
+        valeurs.append([ligne.get(colonne) for colonne in colonnes])
+    return pd.DataFrame(valeurs, index=index, columns=colonnes, dtype=object)
+
+
+def lire_feuille(contenu, nom_feuille, annee_defaut=None):
+    """
+    Lit une feuille d'un classeur (`contenu`: bytes) et détecte sa date dans son nom,
+    puis dans ses lignes de titre. Retourne (nom_feuille, date|None, DataFrame).
+    """
+    titres = []
+    tableau = lire_tableau_excel(io.BytesIO(contenu), COLONNES_EXCEL + COLONNES_DATE, nom_feuille=nom_feuille, titres=titres)
+    
+    date_feuille = detecter_date(nom_feuille, annee_defaut)
+    for titre in titres:
+        if date_feuille:
+            break
+        date_feuille = detecter_date(titre, annee_defaut)
+    
+    return nom_feuille, date_feuille, tableau
+
+
+def lire_classeur_excel(contenu, annee_defaut=None):
+    """
+    Lit toutes les feuilles non vides d'un classeur: [(nom_feuille, date|None, DataFrame)].
+    Les feuilles sont lues l'une après l'autre (openpyxl read_only lit déjà en flux): pas
+    de fork d'un processus Django qui a d'autres threads (pool de géocodage, serveur).
+    """
+    classeur = openpyxl.load_workbook(io.BytesIO(contenu), read_only=True)
+    noms = classeur.sheetnames
+    classeur.close()
+    
+    feuilles = [lire_feuille(contenu, nom, annee_defaut) for nom in noms]
+    return [feuille for feuille in feuilles if len(feuille[2])]
 
 
 class ExcelImportService:
     """Service pour importer/mettre à jour les livraisons depuis Excel"""
     
-    def __init__(self):
+    def __init__(self, taille_lot=TAILLE_LOT, geocodage_differe=None, lecture_streaming=True):
         self.geocoding_service = GeocodingService()
+        self.taille_lot = taille_lot
+        self.lecture_streaming = lecture_streaming
+        self.rejets = {}
+        self.inchangees_empreinte = 0
+        self.durees = {}
+        self.phase_courante = None
+        # Différé: placement immédiat au centroïde du code postal, affinage par le worker
+        if geocodage_differe is None:
+            geocodage_differe = getattr(settings, 'GEOCODING_IMPORT_DIFFERE', True)
+        self.geocodage_differe = geocodage_differe
+        self.a_affiner = []
+        self.par_date = []
         self.erreurs = []
         self.success_count = 0
         self.updated_count = 0
@@ -109,24 +255,110 @@ class ExcelImportService:
             'raison': raison
         })
     
-    def mettre_a_jour_livraison(self, livraison, row, date_livraison):
-        """Met à jour une livraison existante avec les nouvelles données"""
-        champs_modifies = []
-        needs_geocoding = False
+    def lire_tableau(self, fichier_excel):
+        """
+        DataFrame brut des colonnes utilisées. En streaming par défaut; les formats
+        que openpyxl ne lit pas (.xls) repassent par pandas.read_excel.
+        """
+        if self.lecture_streaming:
+            try:
+                return lire_tableau_excel(fichier_excel)
+            except (InvalidFileException, zipfile.BadZipFile):
+                if hasattr(fichier_excel, 'seek'):
+                    fichier_excel.seek(0)
         
-        # ========== NOM ÉVÉNEMENT ==========
-        nom_evenement = self.get_safe_value(row, 'Nom de l\'événement')
-        if nom_evenement and livraison.nom_evenement != nom_evenement:
-            livraison.nom_evenement = nom_evenement
-            champs_modifies.append('nom_evenement')
+        df = pd.read_excel(fichier_excel, skiprows=LIGNES_IGNOREES)
+        return df.reindex(columns=COLONNES_EXCEL).astype(object)
+    
+    def lire_classeur(self, fichier_excel, annee_defaut=None):
+        """
+        Toutes les feuilles du classeur: [(nom_feuille, date|None, DataFrame brut)].
+        Même repli pandas que lire_tableau pour les formats non lus par openpyxl.
+        """
+        if hasattr(fichier_excel, 'read'):
+            contenu = fichier_excel.read()
+        else:
+            with open(fichier_excel, 'rb') as fichier:
+                contenu = fichier.read()
         
-        # ========== CONTACT SUR SITE ==========
-        contact_sur_site = self.get_safe_value(row, 'Livraison et personne à contacter sur le site')
-        if contact_sur_site != livraison.contact_sur_site:
-            livraison.contact_sur_site = contact_sur_site
-            champs_modifies.append('contact_sur_site')
+        if self.lecture_streaming:
+            try:
+                return lire_classeur_excel(contenu, annee_defaut)
+            except (InvalidFileException, zipfile.BadZipFile):
+                pass
         
-        # ========== ADRESSE ==========
+        feuilles = pd.read_excel(io.BytesIO(contenu), sheet_name=None, skiprows=LIGNES_IGNOREES)
+        return [
+            (nom, detecter_date(nom, annee_defaut), df.reindex(columns=COLONNES_EXCEL + COLONNES_DATE).astype(object))
+            for nom, df in feuilles.items() if len(df)
+        ]
+    
+    def dates_lignes(self, brut, nom_feuille=None):
+        """
+        (colonne, dates): date de chaque ligne lue dans la première colonne de date
+        présente (colonne None et dates None sinon).
+        Les valeurs non reconnues sont signalées dans le rapport de rejets.
+        """
+        dates = pd.Series(None, index=brut.index, dtype=object)
+        for colonne in COLONNES_DATE:
+            if colonne not in brut or not brut[colonne].notna().any():
+                continue
+            
+            valeurs = brut[colonne]
+            renseignees = valeurs.notna() & (valeurs.astype(str).str.strip() != '')
+            distinctes = {valeur: detecter_date(valeur) for valeur in valeurs[renseignees].unique()}
+            dates = valeurs.map(distinctes).where(renseignees, None)
+            
+            non_reconnues = renseignees & dates.isna()
+            for position, valeur in valeurs[non_reconnues].items():
+                rejet = {'ligne': int(position) + DECALAGE_LIGNE_EXCEL, 'valeur': str(valeur), 'raison': 'Date non reconnue, date de la feuille utilisée'}
+                if nom_feuille:
+                    rejet['feuille'] = nom_feuille
+                self.rejets.setdefault(colonne, []).append(rejet)
+            return colonne, dates
+        return None, dates
+    
+    def repartir_par_date(self, feuilles, date_defaut):
+        """
+        Regroupe les lignes du classeur par date de livraison: {date: [(nom_feuille, DataFrame)]}.
+        Priorité: colonne de date de la ligne, date de la feuille (classeurs à plusieurs
+        feuilles seulement), puis `date_defaut`. nom_feuille vaut None si une seule feuille.
+        Les lignes dont la date remplace celle de la feuille ou la date choisie sont
+        signalées dans le rapport de rejets de leur colonne de date.
+        """
+        plusieurs_feuilles = len(feuilles) > 1
+        groupes = {}
+        
+        for nom_feuille, date_feuille, brut in feuilles:
+            nom = nom_feuille if plusieurs_feuilles else None
+            date_base = (date_feuille if plusieurs_feuilles else None) or date_defaut
+            
+            colonne, dates = self.dates_lignes(brut, nom)
+            remplacees = dates.notna() & (dates != date_base)
+            if remplacees.any():
+                origine = 'de la feuille' if date_base != date_defaut else 'choisie'
+                print(f"⚠️  {remplacees.sum()} ligne(s) datée(s) par « {colonne} » au lieu de la date {origine} ({date_base})")
+                for position, date_ligne in dates[remplacees].items():
+                    rejet = {
+                        'ligne': int(position) + DECALAGE_LIGNE_EXCEL,
+                        'valeur': date_ligne.strftime('%Y-%m-%d'),
+                        'raison': f"Date de la ligne utilisée au lieu de la date {origine} ({date_base.strftime('%Y-%m-%d')})",
+                    }
+                    if nom:
+                        rejet['feuille'] = nom
+                    self.rejets.setdefault(colonne, []).append(rejet)
+            dates = dates.where(dates.notna(), date_base)
+            
+            for date_groupe in sorted(set(dates)):
+                groupes.setdefault(date_groupe, []).append((nom, brut[dates == date_groupe]))
+        
+        return groupes
+    
+    def extraire_donnees_ligne(self, row):
+        """Normalise une ligne Excel en dictionnaire de champs Livraison"""
+        numero_brut = self.get_safe_value(row, '# Commande')
+        
+        # Adresse
         adresse_base = self.get_safe_value(row, 'Adresse')
         app = self.get_safe_value(row, 'APP')
         ligne2 = self.get_safe_value(row, 'Ligne 2')
@@ -139,57 +371,153 @@ class ExcelImportService:
         if ligne2:
             parts.append(ligne2)
         
-        adresse_complete = ', '.join(parts) if parts else ''
-        code_postal_raw = self.get_safe_value(row, 'Code postal')
-        code_postal = self.nettoyer_code_postal(code_postal_raw)
+        # Heure
+        heure_souhaitee = self.parser_heure(row.get('Heure livraison', ''))
+        
+        # Nb convives
+        nb_convives = row.get('Nb convives', 0)
+        try:
+            nb_convives = int(nb_convives) if not pd.isna(nb_convives) else 0
+        except:
+            nb_convives = 0
+        
+        return {
+            'numero_brut': numero_brut,
+            'numero_base': self.extraire_numero_base(numero_brut),
+            'nom_evenement': self.get_safe_value(row, 'Nom de l\'événement'),
+            'client_nom': self.get_safe_value(row, 'Nom du client commandé') or 'Client Inconnu',
+            'contact_sur_site': self.get_safe_value(row, 'Livraison et personne à contacter sur le site'),
+            'adresse_complete': ', '.join(parts) if parts else '',
+            'app': app,
+            'ligne2': ligne2,
+            'code_postal': self.nettoyer_code_postal(self.get_safe_value(row, 'Code postal')),
+            'heure_souhaitee': heure_souhaitee,
+            'periode': self.determiner_periode(heure_souhaitee),
+            'nb_convives': nb_convives,
+            'mode_envoi_nom': self.get_safe_value(row, 'Mode d\'envoi'),
+            'nom_conseiller': self.get_safe_value(row, 'Nom du conseiller'),
+            'informations_supplementaires': self.get_safe_value(row, 'Informations supplémentaires'),
+        }
+    
+    def calculer_besoins(self, nom_evenement):
+        """Détecte les besoins automatiques depuis le nom de l'événement"""
+        nom_lower = nom_evenement.lower() if nom_evenement else ''
+        return {
+            'besoin_cafe': 'café' in nom_lower or 'cafe' in nom_lower,
+            'besoin_the': 'thé' in nom_lower or 'the' in nom_lower,
+            'besoin_part_chaud': 'part chaud' in nom_lower or 'chaud' in nom_lower,
+            'besoin_sac_glace': 'glace' in nom_lower or 'glacé' in nom_lower,
+        }
+    
+    # ==========================================
+    # CHARGEMENT EN MÉMOIRE (une requête par table)
+    # ==========================================
+    
+    def charger_livraisons_existantes(self, numeros, date_livraison):
+        """
+        Charge en une passe les livraisons portant ces numéros.
+        Retourne (livraisons du jour par numéro, numéros déjà pris ailleurs).
+        """
+        existantes = {}
+        numeros_pris = set()
+        
+        for lot in par_lots(sorted(numeros), self.taille_lot):
+            for livraison in Livraison.objects.filter(numero_livraison__in=lot):
+                if livraison.date_livraison == date_livraison and not livraison.est_recuperation:
+                    existantes[livraison.numero_livraison] = livraison
+                else:
+                    numeros_pris.add(livraison.numero_livraison)
+        
+        return existantes, numeros_pris
+    
+    def charger_modes_envoi(self, noms):
+        """Résout les modes d'envoi par nom, en créant les manquants en bloc"""
+        noms = set(n for n in noms if n)
+        if not noms:
+            return {}
+        
+        modes = {m.nom: m for m in ModeEnvoi.objects.filter(nom__in=noms)}
+        manquants = noms - set(modes)
+        
+        if manquants:
+            ModeEnvoi.objects.bulk_create(
+                [ModeEnvoi(nom=nom) for nom in manquants],
+                ignore_conflicts=True
+            )
+            modes.update({m.nom: m for m in ModeEnvoi.objects.filter(nom__in=manquants)})
+        
+        return modes
+    
+    def charger_checklists(self, numeros):
+        """Checklists par numéro de commande (la plus récente gagne)"""
+        from ventes.models import Checklist
+        
+        checklists = {}
+        for lot in par_lots(sorted(numeros), self.taille_lot):
+            for checklist in Checklist.objects.filter(numero_commande__in=lot).order_by('date_creation'):
+                checklists[checklist.numero_commande] = checklist
+        return checklists
+    
+    # ==========================================
+    # MISE À JOUR
+    # ==========================================
+    
+    def appliquer_modifications(self, livraison, donnees, modes_envoi):
+        """Applique une ligne normalisée sur une livraison, sans sauvegarder"""
+        champs_modifies = []
+        needs_geocoding = False
+        
+        # ========== NOM ÉVÉNEMENT ==========
+        nom_evenement = donnees['nom_evenement']
+        if nom_evenement and livraison.nom_evenement != nom_evenement:
+            livraison.nom_evenement = nom_evenement
+            champs_modifies.append('nom_evenement')
+        
+        # ========== CONTACT SUR SITE ==========
+        contact_sur_site = donnees['contact_sur_site']
+        if contact_sur_site != livraison.contact_sur_site:
+            livraison.contact_sur_site = contact_sur_site
+            champs_modifies.append('contact_sur_site')
+        
+        # ========== ADRESSE ==========
+        adresse_complete = donnees['adresse_complete']
+        code_postal = donnees['code_postal']
         
         # Vérifier si adresse a changé
         if self.adresse_a_change(livraison, adresse_complete, code_postal):
             livraison.adresse_complete = adresse_complete
-            livraison.app = app
-            livraison.ligne_adresse_2 = ligne2
+            livraison.app = donnees['app']
+            livraison.ligne_adresse_2 = donnees['ligne2']
             livraison.code_postal = code_postal
             champs_modifies.extend(['adresse_complete', 'app', 'ligne_adresse_2', 'code_postal'])
             needs_geocoding = True
         
         # ========== HEURE ==========
-        heure_str = row.get('Heure livraison', '')
-        heure_souhaitee = self.parser_heure(heure_str)
+        heure_souhaitee = donnees['heure_souhaitee']
         if heure_souhaitee != livraison.heure_souhaitee:
             livraison.heure_souhaitee = heure_souhaitee
-            periode = self.determiner_periode(heure_souhaitee)
-            livraison.periode = periode
+            livraison.periode = donnees['periode']
             champs_modifies.extend(['heure_souhaitee', 'periode'])
         
         # ========== MODE ENVOI ==========
-        mode_envoi_nom = self.get_safe_value(row, 'Mode d\'envoi')
-        if mode_envoi_nom:
-            mode_envoi, _ = ModeEnvoi.objects.get_or_create(nom=mode_envoi_nom)
-            if livraison.mode_envoi != mode_envoi:
-                livraison.mode_envoi = mode_envoi
-                champs_modifies.append('mode_envoi')
+        mode_envoi = modes_envoi.get(donnees['mode_envoi_nom'])
+        if mode_envoi and livraison.mode_envoi_id != mode_envoi.id:
+            livraison.mode_envoi = mode_envoi
+            champs_modifies.append('mode_envoi')
         
         # ========== NB CONVIVES ==========
-        nb_convives = row.get('Nb convives', 0)
-        try:
-            nb_convives = int(nb_convives) if not pd.isna(nb_convives) else 0
-        except:
-            nb_convives = 0
-        
-        if nb_convives != livraison.nb_convives:
-            livraison.nb_convives = nb_convives
+        if donnees['nb_convives'] != livraison.nb_convives:
+            livraison.nb_convives = donnees['nb_convives']
             champs_modifies.append('nb_convives')
         
         # ========== CONSEILLER ==========
-        nom_conseiller = self.get_safe_value(row, 'Nom du conseiller')
-        if nom_conseiller != livraison.nom_conseiller:
-            livraison.nom_conseiller = nom_conseiller
+        if donnees['nom_conseiller'] != livraison.nom_conseiller:
+            livraison.nom_conseiller = donnees['nom_conseiller']
             champs_modifies.append('nom_conseiller')
         
         # ========== INFOS SUPPLÉMENTAIRES ==========
-        informations_supplementaires = self.get_safe_value(row, 'Informations supplémentaires')
-        if informations_supplementaires != livraison.informations_supplementaires:
-            livraison.informations_supplementaires = informations_supplementaires
+        if donnees['informations_supplementaires'] != livraison.informations_supplementaires:
+            livraison.informations_supplementaires = donnees['informations_supplementaires']
             champs_modifies.append('informations_supplementaires')
         
         # ========== GÉOCODAGE SI NÉCESSAIRE ==========
@@ -213,8 +541,13 @@ class ExcelImportService:
                 geo_result = self.geocoding_service.geocoder_adresse(
                     adresse_complete,
                     ville=None,  # Auto-détection depuis adresse ou code postal
-                    code_postal=code_postal
+                    code_postal=code_postal,
+                    hors_ligne=self.geocodage_differe
+                )
+                livraison.geocode_status, livraison.geocode_attempts = self.etat_geocodage(
+                    livraison.numero_livraison, geo_result, livraison.geocode_attempts
                 )
+                champs_modifies.extend(['geocode_status', 'geocode_attempts'])
                 
                 if geo_result['success']:
                     livraison.latitude = geo_result['latitude']
@@ -232,7 +565,8 @@ class ExcelImportService:
                         note_geo += " (approximatif)"
                     livraison.notes_internes = (livraison.notes_internes or '') + note_geo
                     champs_modifies.append('notes_internes')
-                else:
+                
+                if livraison.geocode_status == 'failed':
                     raison_echec = geo_result.get('error', 'Erreur API Nominatim')
                     self.ajouter_geocoding_failed(
                         livraison.numero_livraison,
@@ -244,253 +578,361 @@ class ExcelImportService:
                     champs_modifies.append('notes_internes')
         
         # ========== BESOINS AUTOMATIQUES ==========
-        nom_lower = livraison.nom_evenement.lower() if livraison.nom_evenement else ''
-        besoin_cafe = 'café' in nom_lower or 'cafe' in nom_lower
-        besoin_the = 'thé' in nom_lower or 'the' in nom_lower
-        besoin_part_chaud = 'part chaud' in nom_lower or 'chaud' in nom_lower
-        besoin_sac_glace = 'glace' in nom_lower or 'glacé' in nom_lower
-        
-        if besoin_cafe != livraison.besoin_cafe:
-            livraison.besoin_cafe = besoin_cafe
-            champs_modifies.append('besoin_cafe')
-        if besoin_the != livraison.besoin_the:
-            livraison.besoin_the = besoin_the
-            champs_modifies.append('besoin_the')
-        if besoin_part_chaud != livraison.besoin_part_chaud:
-            livraison.besoin_part_chaud = besoin_part_chaud
-            champs_modifies.append('besoin_part_chaud')
-        if besoin_sac_glace != livraison.besoin_sac_glace:
-            livraison.besoin_sac_glace = besoin_sac_glace
-            champs_modifies.append('besoin_sac_glace')
-        
-        # Sauvegarder si des champs ont changé
-        if champs_modifies:
-            livraison.save()
+        if 'besoins' in donnees and livraison.nom_evenement == donnees['nom_evenement']:
+            besoins = donnees['besoins']
+        else:
+            besoins = self.calculer_besoins(livraison.nom_evenement)
+        
+        for champ, valeur in besoins.items():
+            if valeur != getattr(livraison, champ):
+                setattr(livraison, champ, valeur)
+                champs_modifies.append(champ)
+        
+        return champs_modifies
+    
+    def mettre_a_jour_livraison(self, livraison, row, date_livraison):
+        """Met à jour une livraison existante avec les nouvelles données"""
+        donnees = self.extraire_donnees_ligne(row)
+        empreinte = empreinte_donnees(donnees)
+        if livraison.empreinte_import == empreinte:
+            return []
+        
+        modes_envoi = self.charger_modes_envoi([donnees['mode_envoi_nom']])
+        champs_modifies = self.appliquer_modifications(livraison, donnees, modes_envoi)
+        livraison.empreinte_import = empreinte
+        
+        # Sauvegarder (au minimum la nouvelle empreinte)
+        livraison.save()
         
         return champs_modifies
     
-    def importer(self, fichier_excel, date_livraison=None):
-        """Importe ou met à jour les livraisons depuis un fichier Excel"""
+    # ==========================================
+    # CRÉATION
+    # ==========================================
+    
+    def construire_livraison(self, donnees, date_livraison, modes_envoi):
+        """Construit (sans sauvegarder) une nouvelle livraison géocodée"""
+        numero_base = donnees['numero_base']
+        numero_brut = donnees['numero_brut']
+        nom_evenement = donnees['nom_evenement']
+        adresse_complete = donnees['adresse_complete']
+        code_postal = donnees['code_postal']
+        contact_sur_site = donnees['contact_sur_site']
+        nom_conseiller = donnees['nom_conseiller']
+        
+        # Notes internes
+        notes_internes = f"Importé le {timezone.now().strftime('%d/%m/%Y à %H:%M')}"
+        if numero_brut != numero_base:
+            notes_internes += f"\nNuméro original: {numero_brut}"
+        if contact_sur_site:
+            notes_internes += f"\nContact sur site: {contact_sur_site}"
+        if nom_conseiller:
+            notes_internes += f"\nConseiller: {nom_conseiller}"
+        
+        # ========== GÉOCODAGE ==========
+        latitude = None
+        longitude = None
+        place_id = ''
+        ville = 'Montréal'  # Défaut
+        geocode_status, geocode_attempts = 'failed', 1
+        
+        if not adresse_complete:
+            self.ajouter_geocoding_failed(
+                numero_base,
+                nom_evenement,
+                'Aucune adresse',
+                'Adresse manquante dans le fichier Excel'
+            )
+            notes_internes += "\n❌ Géocodage impossible: adresse manquante"
+        elif not code_postal:
+            self.ajouter_geocoding_failed(
+                numero_base,
+                nom_evenement,
+                adresse_complete,
+                'Code postal manquant'
+            )
+            notes_internes += "\n❌ Géocodage impossible: code postal manquant"
+        else:
+            # ✨ Géocodage avec auto-détection de la ville
+            geo_result = self.geocoding_service.geocoder_adresse(
+                adresse_complete,
+                ville=None,  # Auto-détection
+                code_postal=code_postal,
+                hors_ligne=self.geocodage_differe
+            )
+            geocode_status, geocode_attempts = self.etat_geocodage(numero_base, geo_result, 0)
+            
+            if geo_result['success']:
+                latitude = geo_result['latitude']
+                longitude = geo_result['longitude']
+                place_id = str(geo_result.get('place_id', ''))
+                ville = geo_result.get('ville_utilisee', 'Montréal')  # ✨ Récupérer la ville
+                
+                if geo_result.get('source') == 'index_local':
+                    notes_internes += f"\n📍 Position provisoire au code postal ({ville})"
+                elif geo_result.get('approximatif'):
+                    notes_internes += f"\n⚠️ Géocodage approximatif ({ville})"
+                else:
+                    notes_internes += f"\n✅ Géocodé: {ville}"
+            
+            if geocode_status == 'failed':
+                raison_echec = geo_result.get('error', 'Erreur API Nominatim')
+                ville_tentee = geo_result.get('ville_utilisee', 'Montréal')
+                self.ajouter_geocoding_failed(
+                    numero_base,
+                    nom_evenement,
+                    f"{adresse_complete}, {code_postal}",
+                    raison_echec
+                )
+                notes_internes += f"\n❌ Géocodage échoué ({ville_tentee}): {raison_echec}"
+        
+        return Livraison(
+            numero_livraison=numero_base,
+            nom_evenement=nom_evenement,
+            client_nom=donnees['client_nom'],
+            contact_sur_site=contact_sur_site,
+            adresse_complete=adresse_complete,
+            app=donnees['app'],
+            ligne_adresse_2=donnees['ligne2'],
+            code_postal=code_postal,
+            ville=ville,  # ✨ UTILISER LA VILLE DÉTECTÉE
+            latitude=latitude,
+            longitude=longitude,
+            place_id=place_id,
+            geocode_status=geocode_status,
+            geocode_attempts=geocode_attempts,
+            empreinte_import=donnees.get('empreinte') or empreinte_donnees(donnees),
+            date_livraison=date_livraison,
+            heure_souhaitee=donnees['heure_souhaitee'],
+            periode=donnees['periode'],
+            mode_envoi=modes_envoi.get(donnees['mode_envoi_nom']),
+            nb_convives=donnees['nb_convives'],
+            nom_conseiller=nom_conseiller,
+            informations_supplementaires=donnees['informations_supplementaires'],
+            notes_internes=notes_internes,
+            status='non_assignee',
+            **(donnees['besoins'] if 'besoins' in donnees else self.calculer_besoins(nom_evenement))
+        )
+    
+    # ==========================================
+    # GÉOCODAGE PARALLÈLE / DIFFÉRÉ
+    # ==========================================
+    
+    def etat_geocodage(self, numero, geo_result, tentatives):
+        """
+        (geocode_status, geocode_attempts) après un géocodage.
+        Une position provisoire (index local) ou un géocodage différé reste 'pending'
+        et sera affinée; un échec de l'API compte comme une tentative.
+        """
+        provisoire = geo_result.get('source') == 'index_local'
+        
+        if geo_result['success'] and not provisoire:
+            return 'success', 0
+        
+        if geo_result.get('api_tentee') or not (geo_result['success'] or self.geocodage_differe):
+            return 'failed', tentatives + 1
+        
+        self.a_affiner.append(numero)
+        return 'pending', tentatives
+    
+    def prechauffer_geocodage(self, lignes, existantes):
+        """Résout en parallèle les adresses nouvelles ou modifiées avant la boucle principale"""
+        adresses = []
+        for _, donnees in lignes:
+            livraison = existantes.get(donnees['numero_base'])
+            if livraison and not self.adresse_a_change(livraison, donnees['adresse_complete'], donnees['code_postal']):
+                continue
+            if donnees['adresse_complete'] and donnees['code_postal']:
+                adresses.append((donnees['adresse_complete'], donnees['code_postal']))
+        
+        if adresses:
+            GeocodagePool(self.geocoding_service).geocoder_lot(adresses)
+    
+    # ==========================================
+    # ÉCRITURE EN LOTS
+    # ==========================================
+    
+    def ecrire_creations(self, a_creer):
+        """
+        bulk_create par lots transactionnels; retombe en ligne à ligne si un lot échoue.
+        Retourne les livraisons écrites.
+        """
+        ecrites = []
+        for lot in par_lots(a_creer, self.taille_lot):
+            try:
+                with transaction.atomic():
+                    Livraison.objects.bulk_create([livraison for _, livraison in lot])
+                self.success_count += len(lot)
+                ecrites.extend(livraison for _, livraison in lot)
+            except Exception:
+                for index, livraison in lot:
+                    try:
+                        with transaction.atomic():
+                            livraison.save(force_insert=True)
+                        self.success_count += 1
+                        ecrites.append(livraison)
+                    except Exception as e:
+                        self.erreurs.append(f"Ligne {index + DECALAGE_LIGNE_EXCEL}: {str(e)}")
+        return ecrites
+    
+    def ecrire_mises_a_jour(self, a_mettre_a_jour):
+        """bulk_update par lots transactionnels, groupés par champs modifiés"""
+        maintenant = timezone.now()
+        
+        for lot in par_lots(list(a_mettre_a_jour.values()), self.taille_lot):
+            # Un bulk_update par combinaison de champs: seules les différences sont écrites
+            groupes = {}
+            for livraison, champs_modifies in lot:
+                livraison.date_modification = maintenant
+                champs = frozenset(champs_modifies) | {'date_modification'}
+                groupes.setdefault(champs, []).append(livraison)
+            
+            with transaction.atomic():
+                for champs, livraisons in groupes.items():
+                    Livraison.objects.bulk_update(livraisons, sorted(champs))
+    
+    def lier_contrats(self, livraisons):
+        """Équivalent en lot du signal post_save hotel.lier_livraison_contrat"""
+        from hotel.models import Contrat
+        
+        par_numero = {l.numero_livraison: l for l in livraisons if l.pk}
+        contrats = []
+        
+        for lot in par_lots(sorted(par_numero), self.taille_lot):
+            for contrat in Contrat.objects.filter(numero_contrat__in=lot, livraison__isnull=True):
+                contrat.livraison = par_numero[contrat.numero_contrat]
+                contrats.append(contrat)
+        
+        if contrats:
+            with transaction.atomic():
+                Contrat.objects.bulk_update(contrats, ['livraison'], batch_size=self.taille_lot)
+    
+    def demarrer_phase(self, nom):
+        """Clôt la phase en cours (durée cumulée dans self.durees) et démarre `nom`"""
+        maintenant = time_module.perf_counter()
+        if self.phase_courante:
+            self.durees[self.phase_courante] = self.durees.get(self.phase_courante, 0) + maintenant - self._debut_phase
+        self.phase_courante = nom
+        self._debut_phase = maintenant
+    
+    def reinitialiser(self):
         self.erreurs = []
         self.success_count = 0
         self.updated_count = 0
         self.skip_count = 0
         self.geocoding_failed = []
+        self.a_affiner = []
+        self.rejets = {}
+        self.inchangees_empreinte = 0
+        self.geocoding_service = GeocodingService()
+        self.durees = {}
+        self.phase_courante = None
+        self.par_date = []
+    
+    def etat_compteurs(self):
+        """Instantané des compteurs, pour le rapport d'une date ou son annulation"""
+        return {
+            'imported': self.success_count,
+            'updated': self.updated_count,
+            'skipped': self.skip_count,
+            'unchanged_fingerprint': self.inchangees_empreinte,
+            'errors': len(self.erreurs),
+            'geocoding_failed': len(self.geocoding_failed),
+            'a_affiner': len(self.a_affiner),
+        }
+    
+    def restaurer_compteurs(self, etat):
+        """Annule l'effet d'une date dont la transaction a été annulée"""
+        self.success_count = etat['imported']
+        self.updated_count = etat['updated']
+        self.skip_count = etat['skipped']
+        self.inchangees_empreinte = etat['unchanged_fingerprint']
+        del self.erreurs[etat['errors']:]
+        del self.geocoding_failed[etat['geocoding_failed']:]
+        del self.a_affiner[etat['a_affiner']:]
+    
+    def importer(self, fichier_excel, date_livraison=None, progression=None):
+        """
+        Importe ou met à jour les livraisons depuis un fichier Excel.
+        Le classeur peut couvrir plusieurs dates: colonne « Date livraison » sur les lignes,
+        ou une date par feuille (nom ou titre). Le reste va à `date_livraison`.
+        Chaque date est écrite dans sa propre transaction et détaillée dans 'par_date'.
+        `progression(service, lignes_traitees, lignes_total)` est appelé après chaque ligne.
+        """
+        self.reinitialiser()
         
         if date_livraison is None:
             date_livraison = timezone.now().date()
         
         try:
-            df = pd.read_excel(fichier_excel, skiprows=3)
-            
             print("=" * 80)
             print("IMPORT DE LIVRAISONS")
             print("=" * 80)
             print(f"Date de livraison: {date_livraison}")
-            print(f"Nombre de lignes: {len(df)}")
-            print()
             
-            for index, row in df.iterrows():
+            # ========== 1. LECTURE (feuilles en parallèle) ==========
+            self.demarrer_phase('lecture')
+            feuilles = self.lire_classeur(fichier_excel, date_livraison.year)
+            groupes = self.repartir_par_date(feuilles, date_livraison)
+            total = sum(len(brut) for parties in groupes.values() for _, brut in parties)
+            
+            if len(feuilles) > 1 or len(groupes) > 1:
+                print(f"Classeur: {len(feuilles)} feuille(s), {len(groupes)} date(s) de livraison")
+            
+            # ========== 2. UNE TRANSACTION PAR DATE ==========
+            traitees = 0
+            for date_groupe in sorted(groupes):
+                parties = groupes[date_groupe]
+                etat = self.etat_compteurs()
+                rapport = {
+                    'date': date_groupe.strftime('%Y-%m-%d'),
+                    'feuilles': sorted({nom for nom, _ in parties if nom}),
+                    'lignes': sum(len(brut) for _, brut in parties),
+                    'success': True,
+                }
+                
                 try:
-                    # ========== NUMÉRO COMMANDE ==========
-                    numero_brut = self.get_safe_value(row, '# Commande')
-                    numero_base = self.extraire_numero_base(numero_brut)
-                    
-                    if not numero_base:
-                        continue
-                    
-                    # ========== VÉRIFIER SI LIVRAISON EXISTE ==========
-                    livraison_existante = Livraison.objects.filter(
-                        numero_livraison=numero_base,
-                        date_livraison=date_livraison,
-                        est_recuperation=False
-                    ).first()
-                    
-                    if livraison_existante:
-                        # ========== MISE À JOUR ==========
-                        champs_modifies = self.mettre_a_jour_livraison(
-                            livraison_existante,
-                            row,
-                            date_livraison
-                        )
-                        
-                        # Vérifier liaison avec checklist
-                        if not livraison_existante.checklist:
-                            livraison_existante.lier_checklist_automatiquement()
-                        
-                        if champs_modifies:
-                            self.updated_count += 1
-                            print(f"🔄 #{numero_base} mis à jour: {', '.join(champs_modifies[:3])}...")
-                        else:
-                            self.skip_count += 1
-                            print(f"⏭️  #{numero_base} - aucun changement")
-                        
-                        continue
-                    
-                    # ========== CRÉATION NOUVELLE LIVRAISON ==========
-                    nom_evenement = self.get_safe_value(row, 'Nom de l\'événement')
-                    
-                    # Client
-                    client_nom = self.get_safe_value(row, 'Nom du client commandé')
-                    if not client_nom:
-                        client_nom = 'Client Inconnu'
-                    
-                    contact_sur_site = self.get_safe_value(row, 'Livraison et personne à contacter sur le site')
-                    
-                    # Adresse
-                    adresse_base = self.get_safe_value(row, 'Adresse')
-                    app = self.get_safe_value(row, 'APP')
-                    ligne2 = self.get_safe_value(row, 'Ligne 2')
-                    
-                    parts = []
-                    if adresse_base:
-                        parts.append(adresse_base)
-                    if app:
-                        parts.append(f"App {app}")
-                    if ligne2:
-                        parts.append(ligne2)
-                    
-                    adresse_complete = ', '.join(parts) if parts else ''
-                    
-                    code_postal_raw = self.get_safe_value(row, 'Code postal')
-                    code_postal = self.nettoyer_code_postal(code_postal_raw)
-                    
-                    # Heure
-                    heure_str = row.get('Heure livraison', '')
-                    heure_souhaitee = self.parser_heure(heure_str)
-                    periode = self.determiner_periode(heure_souhaitee)
-                    
-                    # Nb convives
-                    nb_convives = row.get('Nb convives', 0)
-                    try:
-                        nb_convives = int(nb_convives) if not pd.isna(nb_convives) else 0
-                    except:
-                        nb_convives = 0
-                    
-                    # Mode envoi
-                    mode_envoi_nom = self.get_safe_value(row, 'Mode d\'envoi')
-                    mode_envoi = None
-                    if mode_envoi_nom:
-                        mode_envoi, _ = ModeEnvoi.objects.get_or_create(nom=mode_envoi_nom)
-                    
-                    nom_conseiller = self.get_safe_value(row, 'Nom du conseiller')
-                    informations_supplementaires = self.get_safe_value(row, 'Informations supplémentaires')
-                    
-                    # Notes internes
-                    notes_internes = f"Importé le {timezone.now().strftime('%d/%m/%Y à %H:%M')}"
-                    if numero_brut != numero_base:
-                        notes_internes += f"\nNuméro original: {numero_brut}"
-                    if contact_sur_site:
-                        notes_internes += f"\nContact sur site: {contact_sur_site}"
-                    if nom_conseiller:
-                        notes_internes += f"\nConseiller: {nom_conseiller}"
-                    
-                    # ========== GÉOCODAGE ==========
-                    latitude = None
-                    longitude = None
-                    place_id = ''
-                    ville = 'Montréal'  # Défaut
-                    
-                    if not adresse_complete:
-                        self.ajouter_geocoding_failed(
-                            numero_base,
-                            nom_evenement,
-                            'Aucune adresse',
-                            'Adresse manquante dans le fichier Excel'
-                        )
-                        notes_internes += "\n❌ Géocodage impossible: adresse manquante"
-                    elif not code_postal:
-                        self.ajouter_geocoding_failed(
-                            numero_base,
-                            nom_evenement,
-                            adresse_complete,
-                            'Code postal manquant'
-                        )
-                        notes_internes += "\n❌ Géocodage impossible: code postal manquant"
-                    else:
-                        # ✨ Géocodage avec auto-détection de la ville
-                        geo_result = self.geocoding_service.geocoder_adresse(
-                            adresse_complete,
-                            ville=None,  # Auto-détection
-                            code_postal=code_postal
-                        )
-                        
-                        if geo_result['success']:
-                            latitude = geo_result['latitude']
-                            longitude = geo_result['longitude']
-                            place_id = str(geo_result.get('place_id', ''))
-                            ville = geo_result.get('ville_utilisee', 'Montréal')  # ✨ Récupérer la ville
-                            
-                            if geo_result.get('approximatif'):
-                                notes_internes += f"\n⚠️ Géocodage approximatif ({ville})"
-                            else:
-                                notes_internes += f"\n✅ Géocodé: {ville}"
-                        else:
-                            raison_echec = geo_result.get('error', 'Erreur API Nominatim')
-                            ville_tentee = geo_result.get('ville_utilisee', 'Montréal')
-                            self.ajouter_geocoding_failed(
-                                numero_base,
-                                nom_evenement,
-                                f"{adresse_complete}, {code_postal}",
-                                raison_echec
-                            )
-                            notes_internes += f"\n❌ Géocodage échoué ({ville_tentee}): {raison_echec}"
-                    
-                    # Besoins automatiques
-                    nom_lower = nom_evenement.lower() if nom_evenement else ''
-                    besoin_cafe = 'café' in nom_lower or 'cafe' in nom_lower
-                    besoin_the = 'thé' in nom_lower or 'the' in nom_lower
-                    besoin_part_chaud = 'part chaud' in nom_lower or 'chaud' in nom_lower
-                    besoin_sac_glace = 'glace' in nom_lower or 'glacé' in nom_lower
-                    
-                    # ========== CRÉATION ==========
-                    nouvelle_livraison = Livraison.objects.create(
-                        numero_livraison=numero_base,
-                        nom_evenement=nom_evenement,
-                        client_nom=client_nom,
-                        contact_sur_site=contact_sur_site,
-                        adresse_complete=adresse_complete,
-                        app=app,
-                        ligne_adresse_2=ligne2,
-                        code_postal=code_postal,
-                        ville=ville,  # ✨ UTILISER LA VILLE DÉTECTÉE
-                        latitude=latitude,
-                        longitude=longitude,
-                        place_id=place_id,
-                        date_livraison=date_livraison,
-                        heure_souhaitee=heure_souhaitee,
-                        periode=periode,
-                        mode_envoi=mode_envoi,
-                        nb_convives=nb_convives,
-                        nom_conseiller=nom_conseiller,
-                        informations_supplementaires=informations_supplementaires,
-                        besoin_cafe=besoin_cafe,
-                        besoin_the=besoin_the,
-                        besoin_part_chaud=besoin_part_chaud,
-                        besoin_sac_glace=besoin_sac_glace,
-                        notes_internes=notes_internes,
-                        status='non_assignee'
-                    )
-                    
-                    # Lier automatiquement une checklist si elle existe
-                    nouvelle_livraison.lier_checklist_automatiquement()
-                    
-                    self.success_count += 1
-                    coord_info = f"({latitude}, {longitude})" if latitude else "(non géocodé)"
-                    ville_info = f"[{ville}]" if ville != 'Montréal' else ""
-                    checklist_info = " 🔗" if nouvelle_livraison.checklist else ""
-                    print(f"✅ #{numero_base}: {nom_evenement[:30] if nom_evenement else 'OK'} {ville_info} {coord_info}{checklist_info}")
-                    
+                    with transaction.atomic():
+                        for nom_feuille, brut in parties:
+                            suivi = None
+                            if progression:
+                                suivi = lambda service, n, _total, decalage=traitees: progression(service, decalage + n, total)
+                            self.traiter_tableau(brut, date_groupe, suivi, nom_feuille)
+                            traitees += len(brut)
                 except Exception as e:
-                    error_msg = f"Ligne {index + 5}: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    self.erreurs.append(error_msg)
+                    self.restaurer_compteurs(etat)
+                    message = f"{rapport['date']}: {str(e)} (date annulée)"
+                    print(f"❌ {message}")
+                    self.erreurs.append(message)
+                    rapport.update(success=False, error=str(e))
+                
+                apres = self.etat_compteurs()
+                for cle in ('imported', 'updated', 'skipped', 'errors', 'geocoding_failed'):
+                    rapport[cle] = apres[cle] - etat[cle]
+                self.par_date.append(rapport)
+            self.demarrer_phase(None)
+            
+            if progression:
+                progression(self, total, total)
+            
+            echecs = [rapport for rapport in self.par_date if not rapport['success']]
+            if echecs and len(echecs) == len(self.par_date):
+                raise RuntimeError(echecs[0]['error'])
             
             print()
             print("=" * 80)
+            if len(self.par_date) > 1:
+                for rapport in self.par_date:
+                    statut = '✅' if rapport['success'] else '❌'
+                    print(f"{statut} {rapport['date']}: {rapport['imported']} créées | {rapport['updated']} mises à jour | {rapport['skipped']} inchangées | {rapport['errors']} erreurs")
             print(f"RÉSULTAT: {self.success_count} créées | {self.updated_count} mises à jour | {self.skip_count} inchangées | {len(self.erreurs)} erreurs")
+            print(f"🔑 Empreintes: {self.inchangees_empreinte} ligne(s) identique(s) au dernier import, ignorées sans comparaison")
             if self.geocoding_failed:
                 print(f"⚠️  {len(self.geocoding_failed)} livraison(s) non géocodée(s)")
+            if self.a_affiner:
+                print(f"📍 {len(self.a_affiner)} livraison(s) à position provisoire, affinage en arrière-plan")
+            cache = self.geocoding_service.statistiques_cache()
+            print(f"🗺️  Cache géocodage: {cache['hits_memoire'] + cache['hits_base']} hits | {cache['misses']} misses ({cache['taux_hits']}%) | {cache['requetes_api']} requêtes API")
             print("=" * 80)
             
             return {
@@ -498,8 +940,13 @@ class ExcelImportService:
                 'imported': self.success_count,
                 'updated': self.updated_count,
                 'skipped': self.skip_count,
+                'unchanged_fingerprint': self.inchangees_empreinte,
                 'errors': self.erreurs,
-                'geocoding_failed': self.geocoding_failed
+                'geocoding_failed': self.geocoding_failed,
+                'geocoding_cache': self.geocoding_service.statistiques_cache(),
+                'rejets': self.rejets,
+                'par_date': self.par_date,
+                'durees': self.durees
             }
             
         except Exception as e:
@@ -512,6 +959,1173 @@ class ExcelImportService:
                 'imported': self.success_count,
                 'updated': self.updated_count,
                 'skipped': self.skip_count,
+                'unchanged_fingerprint': self.inchangees_empreinte,
                 'errors': self.erreurs,
-                'geocoding_failed': self.geocoding_failed
-            }
\ No newline at end of file
+                'geocoding_failed': self.geocoding_failed,
+                'geocoding_cache': self.geocoding_service.statistiques_cache(),
+                'rejets': self.rejets,
+                'par_date': self.par_date
+            }
+    
+    def traiter_tableau(self, brut, date_livraison, progression=None, nom_feuille=None):
+        """
+        Normalise et écrit les lignes d'une feuille (ou d'une partie) pour une date.
+        Les erreurs par ligne sont collectées; une exception annule la date entière.
+        """
+        prefixe = f"[{nom_feuille}] " if nom_feuille else ''
+        nb_erreurs = len(self.erreurs)
+        
+        # ========== NORMALISATION (par colonne) ==========
+        self.demarrer_phase('normalisation')
+        lot = NormalisationService().normaliser(brut)
+        lignes = lot.lignes()
+        for colonne, rejets in lot.rejets.items():
+            self.rejets.setdefault(colonne, []).extend(
+                dict(rejet, feuille=nom_feuille) if nom_feuille else rejet for rejet in rejets
+            )
+        
+        for error_msg in lot.erreurs:
+            print(f"❌ {error_msg}")
+        self.erreurs.extend(lot.erreurs)
+        
+        print(f"{prefixe}{date_livraison} - Nombre de lignes: {len(brut)} ({len(lignes)} livraisons valides)")
+        for colonne, rejets in lot.rejets.items():
+            print(f"⚠️  {colonne}: {len(rejets)} valeur(s) signalée(s)")
+        print()
+        
+        # ========== RÉSOLUTION EN MÉMOIRE ==========
+        self.demarrer_phase('chargement')
+        numeros = {donnees['numero_base'] for _, donnees in lignes}
+        existantes, numeros_pris = self.charger_livraisons_existantes(numeros, date_livraison)
+        modes_envoi = self.charger_modes_envoi(d['mode_envoi_nom'] for _, d in lignes)
+        checklists = self.charger_checklists(numeros)
+        if not self.geocodage_differe:
+            self.demarrer_phase('geocodage')
+            self.prechauffer_geocodage(lignes, existantes)
+        
+        self.demarrer_phase('traitement')
+        a_creer = []            # [(index, livraison)]
+        nouvelles = {}          # numero -> livraison à créer
+        a_mettre_a_jour = {}    # numero -> (livraison, champs)
+        
+        for position, (index, donnees) in enumerate(lignes, start=1):
+            if progression:
+                progression(self, position - 1, len(lignes))
+            
+            numero_base = donnees['numero_base']
+            try:
+                livraison = existantes.get(numero_base) or nouvelles.get(numero_base)
+                
+                if livraison:
+                    # ========== MISE À JOUR ==========
+                    empreinte = donnees.get('empreinte') or empreinte_donnees(donnees)
+                    
+                    if livraison.empreinte_import == empreinte:
+                        # Ligne identique au dernier import: rien à comparer ni à géocoder
+                        champs_modifies = []
+                        self.inchangees_empreinte += 1
+                    else:
+                        champs_modifies = self.appliquer_modifications(livraison, donnees, modes_envoi)
+                    
+                    # Vérifier liaison avec checklist
+                    champs_a_ecrire = list(champs_modifies)
+                    if livraison.empreinte_import != empreinte:
+                        livraison.empreinte_import = empreinte
+                        champs_a_ecrire.append('empreinte_import')
+                    if not livraison.checklist_id and numero_base in checklists:
+                        livraison.checklist = checklists[numero_base]
+                        champs_a_ecrire.append('checklist')
+                    
+                    if numero_base in existantes and champs_a_ecrire:
+                        _, deja = a_mettre_a_jour.get(numero_base, (livraison, []))
+                        a_mettre_a_jour[numero_base] = (livraison, deja + champs_a_ecrire)
+                    
+                    if champs_modifies:
+                        self.updated_count += 1
+                        print(f"🔄 #{numero_base} mis à jour: {', '.join(champs_modifies[:3])}...")
+                    else:
+                        self.skip_count += 1
+                        print(f"⏭️  #{numero_base} - aucun changement")
+                    continue
+                
+                if numero_base in numeros_pris:
+                    raise ValueError(f"Le numéro {numero_base} existe déjà pour une autre date")
+                
+                # ========== CRÉATION NOUVELLE LIVRAISON ==========
+                livraison = self.construire_livraison(donnees, date_livraison, modes_envoi)
+                
+                # Lier automatiquement une checklist si elle existe
+                livraison.checklist = checklists.get(numero_base)
+                
+                nouvelles[numero_base] = livraison
+                a_creer.append((index, livraison))
+                
+                coord_info = f"({livraison.latitude}, {livraison.longitude})" if livraison.latitude else "(non géocodé)"
+                ville_info = f"[{livraison.ville}]" if livraison.ville != 'Montréal' else ""
+                checklist_info = " 🔗" if livraison.checklist else ""
+                print(f"✅ #{numero_base}: {livraison.nom_evenement[:30] if livraison.nom_evenement else 'OK'} {ville_info} {coord_info}{checklist_info}")
+                
+            except Exception as e:
+                error_msg = f"Ligne {index + DECALAGE_LIGNE_EXCEL}: {str(e)}"
+                print(f"❌ {error_msg}")
+                self.erreurs.append(error_msg)
+        
+        # ========== ÉCRITURE EN LOTS ==========
+        self.demarrer_phase('ecriture')
+        creees = self.ecrire_creations(a_creer)
+        self.ecrire_mises_a_jour(a_mettre_a_jour)
+        self.lier_contrats(list(existantes.values()) + [l for _, l in a_creer])
+        if a_creer or a_mettre_a_jour:
+            # Écritures en lot, sans signal: résumé de la date recalculé
+            resumes.reconstruire([date_livraison])
+        
+        # Cases des livraisons ajoutées ou déplacées dans la matrice de distances, une fois la date validée
+        positionnees = [l for l in creees if l.latitude is not None] + [
+            l for l, champs in a_mettre_a_jour.values() if 'latitude' in champs
+        ]
+        if positionnees:
+            transaction.on_commit(lambda: actualiser_livraisons(positionnees))
+        
+        if prefixe:
+            self.erreurs[nb_erreurs:] = [prefixe + message for message in self.erreurs[nb_erreurs:]]
+        
+        return len(lignes)
+
+
+class ImportQueueService:
+    """
+    File d'attente des imports Excel, persistée dans ImportExcel.
+    La vue ne fait qu'enregistrer le fichier; un worker (manage.py traiter_imports)
+    vide la file pour que les workers web restent libres pendant le géocodage.
+    """
+    
+    # Intervalle minimal entre deux écritures de progression
+    INTERVALLE_PROGRESSION = 1.0
+    
+    def __init__(self):
+        self._derniere_ecriture = 0
+    
+    def mettre_en_file(self, fichier, date_livraison, utilisateur=None):
+        """Enregistre un import à traiter en arrière-plan"""
+        return ImportExcel.objects.create(
+            fichier=fichier,
+            date_livraison=date_livraison,
+            importe_par=utilisateur,
+            statut='en_attente'
+        )
+    
+    def prendre_prochain(self):
+        """Réserve atomiquement le plus ancien import en attente (sûr entre processus)"""
+        candidats = ImportExcel.objects.filter(statut='en_attente').order_by('date_import')
+        
+        for import_id in candidats.values_list('id', flat=True)[:10]:
+            maintenant = timezone.now()
+            reserve = ImportExcel.objects.filter(id=import_id, statut='en_attente').update(
+                statut='en_cours',
+                date_debut=maintenant,
+                date_battement=maintenant
+            )
+            if reserve:
+                return ImportExcel.objects.get(id=import_id)
+        return None
+    
+    def _enregistrer_progression(self, import_excel, service, traitees, total, forcer=False):
+        maintenant = time_module.monotonic()
+        if not forcer and maintenant - self._derniere_ecriture < self.INTERVALLE_PROGRESSION:
+            return
+        self._derniere_ecriture = maintenant
+        
+        import_excel.nb_lignes_total = total
+        import_excel.nb_lignes_traitees = traitees
+        import_excel.nb_lignes_importees = service.success_count
+        import_excel.nb_lignes_mises_a_jour = service.updated_count
+        import_excel.nb_lignes_inchangees = service.skip_count
+        import_excel.nb_erreurs = len(service.erreurs)
+        import_excel.rapport_erreurs = {
+            'erreurs': service.erreurs,
+            'rejets_par_colonne': service.rejets,
+            'cache_geocodage': service.geocoding_service.statistiques_cache(),
+            'par_date': service.par_date
+        }
+        import_excel.geocoding_failed = service.geocoding_failed
+        import_excel.date_battement = timezone.now()
+        import_excel.save(update_fields=[
+            'nb_lignes_total', 'nb_lignes_traitees', 'nb_lignes_importees',
+            'nb_lignes_mises_a_jour', 'nb_lignes_inchangees', 'nb_erreurs',
+            'rapport_erreurs', 'geocoding_failed', 'date_battement'
+        ])
+    
+    def traiter(self, import_excel):
+        """Exécute un import réservé et persiste son résultat"""
+        service = ExcelImportService()
+        self._derniere_ecriture = 0
+        
+        def progression(service, traitees, total):
+            self._enregistrer_progression(import_excel, service, traitees, total)
+        
+        try:
+            with import_excel.fichier.open('rb') as fichier:
+                resultat = service.importer(
+                    fichier,
+                    date_livraison=import_excel.date_livraison,
+                    progression=progression
+                )
+        except Exception as e:
+            resultat = {'success': False, 'error': str(e)}
+        
+        self._enregistrer_progression(
+            import_excel, service,
+            import_excel.nb_lignes_total, import_excel.nb_lignes_total,
+            forcer=True
+        )
+        
+        if resultat['success']:
+            import_excel.statut = 'terminee'
+        else:
+            import_excel.statut = 'echouee'
+            import_excel.rapport_erreurs = {
+                'erreurs': service.erreurs,
+                'rejets_par_colonne': service.rejets,
+                'cache_geocodage': service.geocoding_service.statistiques_cache(),
+                'par_date': service.par_date,
+                'message': resultat.get('error', 'Erreur inconnue')
+            }
+        import_excel.date_fin = timezone.now()
+        import_excel.save(update_fields=['statut', 'date_fin', 'rapport_erreurs'])
+        
+        # Les livraisons sont déjà sur la carte (position provisoire): affiner maintenant
+        if resultat['success'] and service.a_affiner:
+            self.affiner_geocodage(import_excel, service.a_affiner)
+        
+        return resultat
+    
+    def affiner_geocodage(self, import_excel, numeros):
+        """Géocodage précis des livraisons placées au code postal pendant l'import"""
+        print(f"🎯 Affinage du géocodage: {len(numeros)} livraison(s)")
+        resultat = RegeocodageService().relancer(numeros=numeros)
+        
+        deja_signales = {echec['numero'] for echec in import_excel.geocoding_failed}
+        import_excel.geocoding_failed = import_excel.geocoding_failed + [
+            echec for echec in resultat['echecs'] if echec['numero'] not in deja_signales
+        ]
+        import_excel.save(update_fields=['geocoding_failed'])
+        return resultat
+    
+    def reprendre_bloques(self, delai_minutes=30):
+        """
+        Remet en file les imports 'en_cours' sans signe de vie depuis `delai_minutes`
+        (worker interrompu). Un import long mais actif écrit sa progression chaque
+        seconde et n'est pas repris.
+        """
+        limite = timezone.now() - timedelta(minutes=delai_minutes)
+        return ImportExcel.objects.filter(statut='en_cours').filter(
+            Q(date_battement__lt=limite) | Q(date_battement__isnull=True, date_debut__lt=limite)
+        ).update(statut='en_attente', date_debut=None, date_battement=None)
+    
+    def vider_file(self, limite=None):
+        """Traite les imports en attente jusqu'à épuisement (ou `limite`)"""
+        traites = 0
+        while limite is None or traites < limite:
+            import_excel = self.prendre_prochain()
+            if import_excel is None:
+                break
+            self.traiter(import_excel)
+            traites += 1
+        return traites
+
+
+class RegeocodageService:
+    """
+    Relance le géocodage des livraisons en échec (geocode_status 'failed' ou 'pending')
+    à travers le pool parallèle, et persiste le résultat en lots.
+    """
+    
+    MAX_TENTATIVES = 5
+    
+    def __init__(self, max_tentatives=MAX_TENTATIVES, taille_lot=TAILLE_LOT):
+        self.max_tentatives = max_tentatives
+        self.taille_lot = taille_lot
+        self.geocoding_service = GeocodingService()
+    
+    def a_relancer(self, date_livraison=None, numeros=None):
+        livraisons = Livraison.objects.filter(
+            geocode_status__in=['pending', 'failed'],
+            geocode_attempts__lt=self.max_tentatives
+        ).exclude(adresse_complete='').exclude(code_postal='')
+        if date_livraison:
+            livraisons = livraisons.filter(date_livraison=date_livraison)
+        if numeros is not None:
+            livraisons = livraisons.filter(numero_livraison__in=list(numeros))
+        return livraisons.order_by('geocode_attempts', 'date_livraison')
+    
+    def relancer(self, date_livraison=None, limite=None, numeros=None):
+        """Retourne {'traitees', 'reussies', 'echouees', 'echecs'} (echecs au format geocoding_failed)"""
+        livraisons = self.a_relancer(date_livraison, numeros)
+        livraisons = list(livraisons[:limite] if limite else livraisons)
+        if not livraisons:
+            return {'traitees': 0, 'reussies': 0, 'echouees': 0, 'echecs': []}
+        
+        resultats = GeocodagePool(self.geocoding_service).geocoder_lot(
+            (l.adresse_complete, l.code_postal) for l in livraisons
+        )
+        
+        reussies = 0
+        echecs = []
+        for livraison in livraisons:
+            requete = self.geocoding_service.preparer_requete(livraison.adresse_complete, code_postal=livraison.code_postal)
+            resultat = resultats.get(self.geocoding_service.normaliser_cle(requete['cache_key']), {'success': False})
+            
+            if resultat['success']:
+                livraison.latitude = resultat['latitude']
+                livraison.longitude = resultat['longitude']
+                livraison.place_id = str(resultat.get('place_id', ''))
+                livraison.ville = resultat.get('ville_utilisee', livraison.ville)
+                livraison.geocode_status = 'success'
+                livraison.geocode_attempts = 0
+                reussies += 1
+            else:
+                livraison.geocode_status = 'failed'
+                livraison.geocode_attempts += 1
+                echecs.append({
+                    'numero': livraison.numero_livraison,
+                    'nom': livraison.nom_evenement or 'Sans nom',
+                    'adresse': f"{livraison.adresse_complete}, {livraison.code_postal}",
+                    'raison': resultat.get('error', 'Géocodage impossible')
+                })
+            livraison.date_modification = timezone.now()
+        
+        with transaction.atomic():
+            Livraison.objects.bulk_update(
+                livraisons,
+                ['latitude', 'longitude', 'place_id', 'ville', 'geocode_status', 'geocode_attempts', 'date_modification'],
+                batch_size=self.taille_lot
+            )
+            positionnees = [l for l in livraisons if l.geocode_status == 'success']
+            if positionnees:
+                transaction.on_commit(lambda: actualiser_livraisons(positionnees))
+        
+        return {'traitees': len(livraisons), 'reussies': reussies, 'echouees': len(echecs), 'echecs': echecs}
+
+
+def durees_apprises(distances, durees, livraisons, depot, heure_depart):
+    """Durées de trajet issues des vitesses apprises (zone d'arrivée, heure de départ) si disponibles"""
+    modele = modele_temps_trajet()
+    if distances is None or not modele.actif:
+        return durees
+    zones = [zone_livraison(livraison) for livraison in livraisons] + ([None] if depot else [])
+    return modele.matrice_durees(distances, zones, heure_depart)
+
+
+class OptimisationRouteService:
+    """
+    Calcule l'ordre de passage d'une route à partir des coordonnées des livraisons
+    et des heures souhaitées, puis l'écrit dans LivraisonRoute.ordre.
+    """
+    
+    def __init__(self, duree_max=None):
+        self.duree_max = duree_max
+        # Point de départ des routes (lat, lon); sans dépôt, le trajet est ouvert
+        self.depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+    
+    def optimiser(self, route, appliquer=True):
+        """
+        Retourne {'avant', 'apres', 'gain_km', 'livraisons', 'sans_coordonnees'}.
+        Les livraisons sans coordonnées restent en fin de route dans leur ordre actuel.
+        Avec `appliquer`, le nouvel ordre est écrit en une seule transaction.
+        """
+        liens = list(
+            LivraisonRoute.objects.filter(route=route).select_related('livraison').order_by('ordre')
+        )
+        placables = [lr for lr in liens if lr.livraison.latitude is not None and lr.livraison.longitude is not None]
+        sans_coordonnees = [lr for lr in liens if lr not in placables]
+        
+        # Distances du cache de la date (recalcul local si une livraison n'en fait pas partie)
+        cles = [str(lr.livraison_id) for lr in placables] + ([CLE_DEPOT] if self.depot else [])
+        distances, durees = sous_matrices(route.date, cles)
+        durees = durees_apprises(
+            distances, durees, [lr.livraison for lr in placables], self.depot, route.heure_depart
+        )
+        
+        optimiseur = OptimiseurRoute(
+            [float(lr.livraison.latitude) for lr in placables],
+            [float(lr.livraison.longitude) for lr in placables],
+            heures=[lr.livraison.heure_souhaitee for lr in placables],
+            depart=self.depot,
+            heure_depart=route.heure_depart,
+            distances=distances,
+            durees=durees,
+        )
+        
+        ordre_actuel = list(range(len(placables)))
+        avant = optimiseur.evaluer(ordre_actuel)
+        if self.duree_max is None:
+            ordre, apres = optimiseur.resoudre(ordre_actuel)
+        else:
+            ordre, apres = optimiseur.resoudre(ordre_actuel, self.duree_max)
+        
+        # Ne jamais dégrader l'ordre du répartiteur
+        if apres.cout >= avant.cout:
+            ordre, apres = ordre_actuel, avant
+        
+        nouvel_ordre = [placables[i] for i in ordre] + sans_coordonnees
+        
+        if appliquer:
+            a_ecrire = []
+            for position, lr in enumerate(nouvel_ordre):
+                if lr.ordre != position:
+                    lr.ordre = position
+                    a_ecrire.append(lr)
+            with transaction.atomic():
+                LivraisonRoute.objects.bulk_update(a_ecrire, ['ordre'], batch_size=TAILLE_LOT)
+                if a_ecrire:
+                    ProjectionETAService().projeter(route, depuis=min(lr.ordre for lr in a_ecrire))
+                    evenements.publier_ordre(route)
+        
+        return {
+            'avant': avant.en_dict(),
+            'apres': apres.en_dict(),
+            'gain_km': round(avant.distance_km - apres.distance_km, 2),
+            'livraisons': [
+                {'id': str(lr.livraison_id), 'numero': lr.livraison.numero_livraison, 'ordre': position}
+                for position, lr in enumerate(nouvel_ordre)
+            ],
+            'sans_coordonnees': [lr.livraison.numero_livraison for lr in sans_coordonnees],
+        }
+
+
+class ProjectionETAService:
+    """
+    Heures de passage estimées d'une route: trajet (matrice de temps de la date) +
+    temps de service à chaque arrêt, attente si en avance (fenêtre de ROUTAGE_AVANCE_MAX_MIN
+    avant heure_souhaitee), retard au-delà de heure_souhaitee.
+    
+    Les estimations sont stockées dans LivraisonRoute; après une modification, seuls les
+    arrêts à partir de la première position touchée sont recalculés, et le calcul s'arrête
+    dès que la suite de la route retrouve ses heures précédentes.
+    """
+    
+    CHAMPS = ['arrivee_estimee', 'depart_estime', 'retard_estime_min']
+    
+    def __init__(self):
+        self.depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+        self.temps_service = getattr(settings, 'ROUTAGE_TEMPS_SERVICE_MIN', TEMPS_SERVICE_MIN)
+        # Temps de service par mode d'envoi (nom du mode -> minutes), ex: {'Buffet chaud': 15}
+        self.temps_service_par_mode = getattr(settings, 'ROUTAGE_TEMPS_SERVICE_PAR_MODE', {})
+        self.avance_max = getattr(settings, 'ROUTAGE_AVANCE_MAX_MIN', AVANCE_MAX_MIN)
+    
+    @staticmethod
+    def vers_heure(valeur):
+        """Minutes depuis minuit -> time (à la seconde), bornée à la journée"""
+        if valeur is None:
+            return None
+        secondes = min(max(int(round(valeur * 60)), 0), 24 * 3600 - 1)
+        return time(secondes // 3600, secondes // 60 % 60, secondes % 60)
+    
+    @staticmethod
+    def en_minutes(heure):
+        if heure is None:
+            return None
+        return heure.hour * 60 + heure.minute + heure.second / 60
+    
+    @staticmethod
+    def en_json(lr):
+        """Champs ETA d'un arrêt pour les réponses JSON des routes"""
+        return {
+            'arrivee_estimee': lr.arrivee_estimee.strftime('%H:%M') if lr.arrivee_estimee else None,
+            'retard_min': lr.retard_estime_min,
+            'en_retard': lr.retard_estime_min > 0,
+        }
+    
+    def temps_service_arret(self, livraison):
+        mode = livraison.mode_envoi.nom if livraison.mode_envoi_id else None
+        return self.temps_service_par_mode.get(mode, self.temps_service)
+    
+    def matrice_temps(self, route, liens):
+        """
+        ({cle: index}, fonction (depuis, vers, minutes de départ) -> minutes de trajet)
+        entre les arrêts géocodés et le dépôt. Vitesses apprises (VitesseTrajet) si
+        disponibles, sinon durées de la matrice de la date.
+        """
+        places = [lr for lr in liens if lr.livraison.latitude is not None and lr.livraison.longitude is not None]
+        cles = [str(lr.livraison_id) for lr in places] + ([CLE_DEPOT] if self.depot else [])
+        if not cles:
+            return {}, None
+        
+        distances, durees = sous_matrices(route.date, cles)
+        if distances is None:
+            lats = [float(lr.livraison.latitude) for lr in places] + ([self.depot[0]] if self.depot else [])
+            lons = [float(lr.livraison.longitude) for lr in places] + ([self.depot[1]] if self.depot else [])
+            distances = matrice_distances(lats, lons)
+            durees = distances * (60.0 / VITESSE_KMH)
+        
+        index = {cle: rang for rang, cle in enumerate(cles)}
+        modele = modele_temps_trajet()
+        if modele.actif:
+            d = distances.tolist()
+            zones = [zone_livraison(lr.livraison) for lr in places] + ([None] if self.depot else [])
+            return index, lambda a, b, heure: modele.minutes(d[a][b], zones[b], heure)
+        t = durees.tolist()
+        return index, lambda a, b, heure: t[a][b]
+    
+    def completer(self, route, liens):
+        """Routes affichées avant la projection: calcul complet si un arrêt géocodé n'a pas d'estimation"""
+        if route.heure_depart and any(
+            lr.arrivee_estimee is None and lr.livraison.latitude is not None for lr in liens
+        ):
+            return self.projeter(route, liens=liens)
+        return liens
+    
+    def projeter(self, route, depuis=0, jusqu_a=None, liens=None):
+        """
+        Recalcule les arrêts à partir de la position `depuis` (index dans l'ordre de passage).
+        Au-delà de `jusqu_a` (dernière position dont le prédécesseur a changé), le calcul
+        s'arrête au premier arrêt dont les heures sont inchangées.
+        Retourne les LivraisonRoute de la route dans l'ordre, à jour.
+        """
+        if liens is None:
+            liens = list(
+                LivraisonRoute.objects.filter(route=route)
+                .select_related('livraison', 'livraison__mode_envoi')
+                .order_by('ordre')
+            )
+        if not liens:
+            return liens
+        
+        depuis = min(max(depuis, 0), len(liens))
+        # Reprise impossible sans l'heure de départ de l'arrêt précédent
+        if depuis and liens[depuis - 1].depart_estime is None:
+            depuis = 0
+        jusqu_a = len(liens) if jusqu_a is None else jusqu_a
+        
+        index, temps = self.matrice_temps(route, liens)
+        
+        # État au départ du recalcul: heure et dernier point géocodé
+        if depuis:
+            heure = self.en_minutes(liens[depuis - 1].depart_estime)
+            position = None
+            for lr in reversed(liens[:depuis]):
+                if str(lr.livraison_id) in index:
+                    position = index[str(lr.livraison_id)]
+                    break
+            else:
+                position = index.get(CLE_DEPOT)
+        else:
+            heure = self.en_minutes(route.heure_depart)
+            position = index.get(CLE_DEPOT)
+        
+        modifies = []
+        for rang in range(depuis, len(liens)):
+            lr = liens[rang]
+            livraison = lr.livraison
+            cible = index.get(str(livraison.id))
+            
+            if heure is not None and position is not None and cible is not None:
+                heure += temps(position, cible, heure)
+            if cible is not None:
+                position = cible
+            
+            fermeture = self.en_minutes(livraison.heure_souhaitee)
+            ouverture = None if fermeture is None else fermeture - self.avance_max
+            if heure is None:
+                # Sans heure de départ: la route commence à l'ouverture du premier arrêt daté
+                heure = ouverture
+            elif ouverture is not None and heure < ouverture:
+                heure = ouverture
+            
+            arrivee = self.vers_heure(heure)
+            retard = 0
+            if heure is not None and fermeture is not None and heure > fermeture:
+                retard = int(math.ceil(heure - fermeture - 1e-9))
+            if heure is not None:
+                heure += self.temps_service_arret(livraison)
+            depart = self.vers_heure(heure)
+            
+            valeurs = (arrivee, depart, retard)
+            if valeurs == (lr.arrivee_estimee, lr.depart_estime, lr.retard_estime_min):
+                if rang > jusqu_a:
+                    break
+                continue
+            lr.arrivee_estimee, lr.depart_estime, lr.retard_estime_min = valeurs
+            modifies.append(lr)
+        
+        if modifies:
+            LivraisonRoute.objects.bulk_update(modifies, self.CHAMPS, batch_size=TAILLE_LOT)
+        return liens
+
+
+class TableauRoutesService:
+    """
+    Tableau des routes d'une date/période (dashboard, résumé journalier): routes,
+    arrêts dans l'ordre, mode d'envoi et livreurs chargés en REQUETES requêtes quel
+    que soit le nombre de routes, sérialisés une seule fois.
+    """
+
+    REQUETES = 3  # routes, arrêts (+ livraison, mode d'envoi), livreurs
+
+    def __init__(self):
+        self.projection = ProjectionETAService()
+
+    @staticmethod
+    def liens_queryset():
+        return LivraisonRoute.objects.select_related('livraison', 'livraison__mode_envoi').order_by('ordre')
+
+    def routes(self, date=None, periode=None, ordre=None):
+        """Routes avec arrêts et livreurs préchargés. `ordre`: tri (défaut: celui du modèle)."""
+        routes = Route.objects.all()
+        if date:
+            routes = routes.filter(date=date)
+        if periode:
+            routes = routes.filter(periode=periode)
+        if ordre:
+            routes = routes.order_by(*ordre)
+        return list(routes.prefetch_related(
+            Prefetch('livraisonroute_set', queryset=self.liens_queryset()),
+            'livreurs',
+        ))
+
+    def liens(self, route):
+        """Arrêts d'une seule route, dans l'ordre, heures estimées complétées"""
+        return self.projection.completer(route, list(self.liens_queryset().filter(route=route)))
+
+    @staticmethod
+    def livraison_json(lr):
+        liv = lr.livraison
+        return {
+            'id': str(liv.id),
+            'numero': liv.numero_livraison,
+            'nom_evenement': liv.nom_evenement,
+            'client': liv.client_nom,
+            'adresse': liv.adresse_complete,
+            'heure': liv.heure_souhaitee.strftime('%H:%M') if liv.heure_souhaitee else '',
+            'mode_envoi': liv.mode_envoi.nom if liv.mode_envoi else '',
+            'nb_convives': liv.nb_convives,
+            'informations_supplementaires': liv.informations_supplementaires,
+            'cafe': liv.besoin_cafe,
+            'the': liv.besoin_the,
+            'glace': liv.besoin_sac_glace,
+            'chaud': liv.besoin_part_chaud,
+            'est_recuperation': liv.est_recuperation,
+            'ordre': lr.ordre,
+            **ProjectionETAService.en_json(lr),
+        }
+
+    def route_json(self, route):
+        # Projection calculée seulement pour les routes jamais projetées
+        liens = self.projection.completer(route, list(route.livraisonroute_set.all()))
+        livreurs = list(route.livreurs.all())
+        return {
+            'id': str(route.id),
+            'nom': route.nom,
+            'heure_depart': route.heure_depart.strftime('%H:%M') if route.heure_depart else '',
+            'livreurs': [l.get_full_name() for l in livreurs],
+            'livreurs_ids': [l.id for l in livreurs],
+            'commentaire': route.commentaire,
+            'status': route.status,
+            'retards': sum(1 for lr in liens if lr.retard_estime_min),
+            'livraisons': [self.livraison_json(lr) for lr in liens],
+        }
+
+    def serialiser(self, date=None, periode=None, ordre=None):
+        return [self.route_json(route) for route in self.routes(date, periode, ordre)]
+
+    def routes_par_livraison(self, routes):
+        """{livraison_id: route} à partir de routes déjà chargées par routes()"""
+        par_livraison = {}
+        for route in routes:
+            for lr in route.livraisonroute_set.all():
+                par_livraison.setdefault(lr.livraison_id, route)
+        return par_livraison
+
+
+_grilles = {}
+_grilles_lock = threading.Lock()
+
+
+class PlanningLivreursService:
+    """
+    Grille de planning de gestion_livreurs: routes d'une fenêtre de `nb_jours`
+    chargées en une passe (comptes d'arrêts annotés, livreurs préchargés),
+    groupées par date et période en mémoire.
+
+    Grille gardée par processus et par fenêtre; sa version est le dernier
+    événement du journal (EvenementLivraison) pour les dates de la fenêtre, qui
+    avance à chaque modification d'une route, de ses livreurs ou de ses arrêts.
+    """
+
+    NB_JOURS = getattr(settings, 'PLANNING_NB_JOURS', 14)
+    GRILLES_MAX = 16  # Fenêtres gardées en mémoire
+
+    def __init__(self, nb_jours=None):
+        self.nb_jours = nb_jours or self.NB_JOURS
+
+    def jours(self, debut):
+        return [debut + timedelta(days=i) for i in range(self.nb_jours)]
+
+    def version(self, debut, fin):
+        from .models import EvenementLivraison
+
+        return EvenementLivraison.objects.filter(
+            date__range=(debut, fin)
+        ).aggregate(version=Max('id'))['version']
+
+    @staticmethod
+    def route_json(route):
+        return {
+            'id': str(route.id),
+            'nom': route.nom,
+            'heure_depart': route.heure_depart.strftime('%H:%M') if route.heure_depart else '',
+            'status': route.status,
+            'status_display': route.get_status_display(),
+            'livreurs': [
+                {
+                    'id': l.id,
+                    'nom': l.get_full_name() or l.username,
+                    'initiales': f"{l.first_name[0] if l.first_name else ''}{l.last_name[0] if l.last_name else ''}".upper()
+                }
+                for l in route.livreurs.all()
+            ],
+            'nb_livraisons': route.nb_livraisons,
+            'nb_recuperations': route.nb_recuperations,
+            'vehicule': f"{route.vehicule.marque} {route.vehicule.modele}" if route.vehicule else None
+        }
+
+    def construire(self, debut):
+        """{'YYYY-MM-DD': {'matin': [...], 'midi': [...], 'apres_midi': [...]}} pour la fenêtre"""
+        jours = self.jours(debut)
+        grille = {
+            jour.strftime('%Y-%m-%d'): {periode: [] for periode, _ in Livraison.PERIODE_CHOICES}
+            for jour in jours
+        }
+        routes = Route.objects.filter(
+            date__range=(jours[0], jours[-1])
+        ).select_related(
+            'vehicule'
+        ).prefetch_related(
+            'livreurs'
+        ).annotate(
+            # nb_livraisons: compteur stocké sur la route
+            nb_recuperations=Count('livraisonroute', filter=Q(livraisonroute__livraison__est_recuperation=True)),
+        ).order_by('date', 'periode', 'heure_depart')
+
+        for route in routes:
+            grille[route.date.strftime('%Y-%m-%d')].setdefault(route.periode, []).append(self.route_json(route))
+        return grille
+
+    def grille(self, debut):
+        """Grille de la fenêtre commençant à `debut`, reconstruite seulement si une route a changé"""
+        cle = (debut, self.nb_jours)
+        version = self.version(debut, debut + timedelta(days=self.nb_jours - 1))
+        with _grilles_lock:
+            en_cache = _grilles.get(cle)
+            if en_cache is not None and en_cache[0] == version:
+                return en_cache[1]
+
+        grille = self.construire(debut)
+        with _grilles_lock:
+            _grilles.pop(cle, None)
+            _grilles[cle] = (version, grille)
+            while len(_grilles) > self.GRILLES_MAX:
+                _grilles.pop(next(iter(_grilles)))
+        return grille
+
+
+class RepartitionAutomatiqueService:
+    """
+    Propose des routes pour les livraisons non assignées d'une date et d'une période,
+    à partir des livreurs disponibles (DisponibiliteLivreur) et des véhicules libres.
+    La proposition n'est pas enregistrée: le répartiteur la revoit puis la valide en bloc.
+    """
+    
+    def __init__(self, duree_max=None):
+        self.duree_max = duree_max
+        self.depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+        # Capacité d'une route en livraisons: places du véhicule × facteur, ou défaut sans véhicule
+        self.livraisons_par_place = getattr(settings, 'DISPATCH_LIVRAISONS_PAR_PLACE', 1)
+        self.capacite_defaut = getattr(settings, 'DISPATCH_CAPACITE_DEFAUT', 10)
+    
+    def livraisons_a_repartir(self, date_livraison, periode):
+        return list(Livraison.objects.filter(
+            date_livraison=date_livraison,
+            periode=periode,
+            status='non_assignee'
+        ).order_by('heure_souhaitee', 'numero_livraison'))
+    
+    def livreurs_disponibles(self, date_livraison, periode):
+        """[(livreur, heure_debut_shift)] des livreurs disponibles et sans route sur la période"""
+        occupes = set(Route.objects.filter(
+            date=date_livraison, periode=periode
+        ).exclude(status='annulee').values_list('livreurs', flat=True))
+        
+        libres = index_disponibilites(date_livraison).livreurs_libres(date_livraison, periode, exclure=occupes)
+        utilisateurs = get_user_model().objects.in_bulk(list(libres))
+        return [
+            (utilisateurs[livreur_id], intervalle.heure_debut_shift)
+            for livreur_id, intervalle in libres.items() if livreur_id in utilisateurs
+        ]
+    
+    def livreurs_libres_route(self, route):
+        """Livreurs disponibles pour une route: shift couvrant son départ (ou sa période), sans autre route"""
+        occupes = set(Route.objects.filter(
+            date=route.date, periode=route.periode
+        ).exclude(status='annulee').exclude(id=route.id).values_list('livreurs', flat=True))
+        return index_disponibilites(route.date).livreurs_libres(
+            route.date, route.periode, heure=route.heure_depart, exclure=occupes
+        )
+    
+    def vehicules_libres(self, date_livraison, periode):
+        occupes = Route.objects.filter(
+            date=date_livraison, periode=periode, vehicule__isnull=False
+        ).exclude(status='annulee').values_list('vehicule_id', flat=True)
+        return list(Vehicule.objects.filter(statut='disponible').exclude(id__in=occupes).order_by('-nombre_places', 'immatriculation'))
+    
+    @staticmethod
+    def format_heure(valeur):
+        if valeur is None:
+            return ''
+        valeur = int(round(valeur))
+        return f"{valeur // 60 % 24:02d}:{valeur % 60:02d}"
+    
+    def proposer(self, date_livraison, periode):
+        """
+        Retourne {'routes', 'non_assignees', 'sans_coordonnees', 'livreurs_sans_route', 'distance_totale_km'}.
+        Chaque route: livreur, véhicule, heure de départ (début de shift) et livraisons ordonnées.
+        """
+        livraisons = self.livraisons_a_repartir(date_livraison, periode)
+        placables = [l for l in livraisons if l.latitude is not None and l.longitude is not None]
+        sans_coordonnees = [l.numero_livraison for l in livraisons if l.latitude is None or l.longitude is None]
+        
+        # Les shifts les plus tôt reçoivent les plus grands véhicules
+        livreurs = self.livreurs_disponibles(date_livraison, periode)
+        vehicules = self.vehicules_libres(date_livraison, periode)
+        equipes = []
+        for position, (livreur, debut_shift) in enumerate(livreurs):
+            vehicule = vehicules[position] if position < len(vehicules) else None
+            capacite = vehicule.nombre_places * self.livraisons_par_place if vehicule else self.capacite_defaut
+            equipes.append((livreur, vehicule, VehiculeTournee(livreur.id, capacite, debut_shift)))
+        
+        if not placables or not equipes:
+            return {
+                'routes': [],
+                'non_assignees': [l.numero_livraison for l in placables],
+                'sans_coordonnees': sans_coordonnees,
+                'livreurs_sans_route': [livreur.get_full_name() or livreur.username for livreur, _, _ in equipes],
+                'distance_totale_km': 0,
+            }
+        
+        distances, durees = sous_matrices(
+            date_livraison, [str(l.id) for l in placables] + ([CLE_DEPOT] if self.depot else [])
+        )
+        durees = durees_apprises(
+            distances, durees, placables, self.depot, min((t.heure_depart for _, _, t in equipes if t.heure_depart), default=None)
+        )
+        repartiteur = RepartiteurTournees(
+            [float(l.latitude) for l in placables],
+            [float(l.longitude) for l in placables],
+            [l.heure_souhaitee for l in placables],
+            [tournee for _, _, tournee in equipes],
+            depart=self.depot,
+            distances=distances,
+            durees=durees,
+        )
+        if self.duree_max is None:
+            tournees, non_places = repartiteur.resoudre()
+        else:
+            tournees, non_places = repartiteur.resoudre(self.duree_max)
+        
+        libelle_periode = dict(Livraison.PERIODE_CHOICES).get(periode, periode).split(' (')[0]
+        routes = []
+        livreurs_sans_route = []
+        distance_totale = 0.0
+        for k, (livreur, vehicule, tournee) in enumerate(equipes):
+            nom_livreur = livreur.get_full_name() or livreur.username
+            if not tournees[k]:
+                livreurs_sans_route.append(nom_livreur)
+                continue
+            
+            evaluation = repartiteur.evaluer(k, tournees[k])
+            distance_totale += evaluation.distance_km
+            routes.append({
+                'nom': f"{libelle_periode} - {nom_livreur}",
+                'livreurs': [livreur.id],
+                'livreur_nom': nom_livreur,
+                'vehicule_id': vehicule.id if vehicule else None,
+                'vehicule': str(vehicule) if vehicule else '',
+                'heure_depart': tournee.heure_depart.strftime('%H:%M') if tournee.heure_depart else '',
+                'capacite': tournee.capacite,
+                **evaluation.en_dict(),
+                'livraisons': [
+                    {
+                        'id': str(placables[i].id),
+                        'numero': placables[i].numero_livraison,
+                        'client': placables[i].client_nom,
+                        'adresse': placables[i].adresse_complete,
+                        'heure': placables[i].heure_souhaitee.strftime('%H:%M') if placables[i].heure_souhaitee else '',
+                        'arrivee_estimee': self.format_heure(arrivee),
+                    }
+                    for i, arrivee in zip(tournees[k], evaluation.arrivees)
+                ],
+            })
+        
+        return {
+            'routes': routes,
+            'non_assignees': [placables[i].numero_livraison for i in non_places],
+            'sans_coordonnees': sans_coordonnees,
+            'livreurs_sans_route': livreurs_sans_route,
+            'distance_totale_km': round(distance_totale, 2),
+        }
+    
+    def valider(self, date_livraison, periode, routes, utilisateur=None):
+        """
+        Crée en une transaction les routes proposées (éventuellement retouchées):
+        [{'nom', 'livreurs': [ids], 'vehicule_id', 'heure_depart', 'livraisons': [ids ou {'id'}]}].
+        Échoue sans rien écrire si une livraison a été assignée entre-temps.
+        """
+        ids_par_route = [
+            [str(l['id']) if isinstance(l, dict) else str(l) for l in route.get('livraisons', [])]
+            for route in routes
+        ]
+        tous_ids = [i for ids in ids_par_route for i in ids]
+        if len(set(tous_ids)) != len(tous_ids):
+            raise ValueError("Une livraison figure dans plusieurs routes")
+        
+        with transaction.atomic():
+            livraisons = {
+                str(l.id): l for l in Livraison.objects.select_for_update().filter(id__in=tous_ids)
+            }
+            indisponibles = [
+                livraisons[i].numero_livraison if i in livraisons else i
+                for i in tous_ids
+                if i not in livraisons
+                or livraisons[i].status != 'non_assignee'
+                or livraisons[i].date_livraison != date_livraison
+                or livraisons[i].periode != periode
+            ]
+            if indisponibles:
+                raise ValueError(f"Livraison(s) déjà assignée(s) ou hors période: {', '.join(indisponibles)}")
+            
+            nouvelles_routes = []
+            for route, ids in zip(routes, ids_par_route):
+                if not ids:
+                    continue
+                nouvelles_routes.append((Route(
+                    nom=route['nom'],
+                    date=date_livraison,
+                    periode=periode,
+                    heure_depart=Route.parse_heure(route['heure_depart']) if route.get('heure_depart') else None,
+                    vehicule_id=route.get('vehicule_id'),
+                    commentaire=route.get('commentaire', 'Créée par la répartition automatique'),
+                    cree_par=utilisateur,
+                    nb_livraisons=len(ids),  # Arrêts créés en lot, sans signal; aucun livré ni en cours
+                ), route.get('livreurs', []), ids))
+            
+            Route.objects.bulk_create([route for route, _, _ in nouvelles_routes])
+            champ_livreur = f"{Route.livreurs.field.m2m_reverse_field_name()}_id"
+            Route.livreurs.through.objects.bulk_create([
+                Route.livreurs.through(route_id=route.id, **{champ_livreur: livreur_id})
+                for route, livreurs, _ in nouvelles_routes for livreur_id in livreurs
+            ])
+            LivraisonRoute.objects.bulk_create([
+                LivraisonRoute(route=route, livraison=livraisons[i], ordre=position)
+                for route, _, ids in nouvelles_routes for position, i in enumerate(ids)
+            ], batch_size=TAILLE_LOT)
+            Livraison.objects.filter(id__in=tous_ids).update(status='assignee', date_modification=timezone.now())
+            resumes.reconstruire([date_livraison])
+            # bulk_create n'envoie pas de signal: un événement par route créée
+            for route, _, _ in nouvelles_routes:
+                evenements.publier_route(route, 'creation')
+        
+        return [route for route, _, _ in nouvelles_routes]
+
+
+class RegroupementService:
+    """
+    Groupes géographiques des livraisons non assignées d'une date/période, un groupe
+    par livreur disponible: routes candidates à colorer sur la carte.
+    """
+    
+    METHODES = ('kmedoides', 'kmeans')
+    
+    def __init__(self, methode='kmedoides', graine=0):
+        if methode not in self.METHODES:
+            raise ValueError(f"Méthode inconnue: {methode} ({', '.join(self.METHODES)})")
+        self.methode = methode
+        self.graine = graine
+    
+    def nombre_groupes(self, date_livraison, periode, nb_livraisons):
+        """Un groupe par livreur disponible; à défaut, selon la capacité par défaut d'une route"""
+        repartition = RepartitionAutomatiqueService()
+        nb_livreurs = len(repartition.livreurs_disponibles(date_livraison, periode))
+        if nb_livreurs:
+            return nb_livreurs
+        return max(1, -(-nb_livraisons // repartition.capacite_defaut))
+    
+    def regrouper(self, date_livraison, periode, k=None, livraisons=None):
+        """
+        Retourne {'groupes': [...], 'affectations': {id livraison: groupe}, 'methode', 'k'}.
+        `livraisons`: liste déjà chargée (défaut: non assignées de la date/période).
+        """
+        if livraisons is None:
+            livraisons = RepartitionAutomatiqueService().livraisons_a_repartir(date_livraison, periode)
+        placables = [l for l in livraisons if l.latitude is not None and l.longitude is not None]
+        if not placables:
+            return {'groupes': [], 'affectations': {}, 'methode': self.methode, 'k': 0}
+        
+        k = min(k or self.nombre_groupes(date_livraison, periode, len(placables)), len(placables))
+        latitudes = [float(l.latitude) for l in placables]
+        longitudes = [float(l.longitude) for l in placables]
+        
+        if self.methode == 'kmeans':
+            etiquettes, _ = kmeans(projeter(latitudes, longitudes), k, self.graine)
+        else:
+            distances, _ = sous_matrices(date_livraison, [str(l.id) for l in placables])
+            if distances is None:
+                distances = matrice_distances(latitudes, longitudes)
+            etiquettes, _ = kmedoides_capacite(distances, k, graine=self.graine)
+        
+        # Numérotation stable: groupes triés par heure souhaitée la plus tôt, puis position
+        premieres = {}
+        for livraison, etiquette in zip(placables, etiquettes):
+            cle = (livraison.heure_souhaitee or time.max, -float(livraison.latitude))
+            premieres[etiquette] = min(premieres.get(etiquette, cle), cle)
+        renumerotation = {ancienne: nouvelle for nouvelle, ancienne in enumerate(sorted(premieres, key=premieres.get))}
+        etiquettes = np.array([renumerotation[e] for e in etiquettes])
+        
+        groupes = decrire_groupes(etiquettes, latitudes, longitudes, [l.nb_convives for l in placables])
+        for groupe in groupes:
+            groupe['livraisons'] = [str(l.id) for l, e in zip(placables, etiquettes) if e == groupe['groupe']]
+        
+        return {
+            'groupes': groupes,
+            'affectations': {str(l.id): int(e) for l, e in zip(placables, etiquettes)},
+            'methode': self.methode,
+            'k': k,
+        }
+
+
+class SuiviGPSService:
+    """
+    Positions GPS des livreurs: lots ajoutés au segment ouvert de (route, livreur),
+    dernière position par route dans PositionGPS, relecture du trajet par segments.
+    """
+    
+    # Horodatages acceptés: pas plus de 5 minutes dans le futur (horloge du téléphone)
+    AVANCE_MAX = timedelta(minutes=5)
+    
+    @staticmethod
+    def lire_horodatage(valeur):
+        """ISO 8601 (heure locale si sans fuseau) ou époque en secondes / millisecondes"""
+        if isinstance(valeur, (int, float)):
+            return gps.depuis_millisecondes(valeur if valeur > 1e11 else valeur * 1000)
+        horodatage = datetime.fromisoformat(str(valeur).replace('Z', '+00:00'))
+        if timezone.is_naive(horodatage):
+            horodatage = timezone.make_aware(horodatage)
+        return horodatage
+    
+    def valider(self, pings):
+        """Pings bruts -> [(datetime, lat, lon, précision)], invalides ignorés"""
+        limite = timezone.now() + self.AVANCE_MAX
+        valides = []
+        for ping in pings:
+            try:
+                horodatage = self.lire_horodatage(ping['t'])
+                latitude, longitude = float(ping['lat']), float(ping['lon'])
+                precision = ping.get('precision')
+                precision = float(precision) if precision is not None else None
+            except (KeyError, TypeError, ValueError, OverflowError):
+                continue
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180 and horodatage <= limite:
+                valides.append((horodatage, latitude, longitude, precision))
+        return valides
+    
+    def enregistrer(self, route, livreur, pings):
+        """
+        Ajoute un lot de positions. Les points antérieurs au dernier point enregistré
+        pour ce livreur sont ignorés (renvois). Retourne {'recus', 'ignores'}.
+        """
+        valides = self.valider(pings)
+        if not valides:
+            return {'recus': 0, 'ignores': len(pings)}
+        
+        with transaction.atomic():
+            ouvert = SegmentGPS.objects.filter(route=route, livreur=livreur).order_by('-debut').first()
+            points = gps.points_depuis_pings(valides)
+            if ouvert is not None:
+                points = points[points['t'] > gps.en_millisecondes(ouvert.fin)]
+            if not len(points):
+                return {'recus': 0, 'ignores': len(pings)}
+            
+            # Un segment par jour: regroupement par date locale
+            dates = [timezone.localdate(gps.depuis_millisecondes(t)) for t in points['t'].tolist()]
+            nouveaux = []
+            debut = 0
+            while debut < len(points):
+                jour = dates[debut]
+                fin = debut
+                while fin < len(points) and dates[fin] == jour:
+                    fin += 1
+                groupe = points[debut:fin]
+                
+                if ouvert is not None and ouvert.date == jour and ouvert.nb_points < gps.TAILLE_SEGMENT:
+                    place = gps.TAILLE_SEGMENT - ouvert.nb_points
+                    contenu = np.concatenate([gps.decoder(ouvert.donnees), groupe[:place]])
+                    ouvert.donnees = gps.encoder(contenu)
+                    ouvert.nb_points = len(contenu)
+                    ouvert.fin = gps.depuis_millisecondes(contenu['t'][-1])
+                    ouvert.save(update_fields=['donnees', 'nb_points', 'fin'])
+                    groupe = groupe[place:]
+                
+                for i in range(0, len(groupe), gps.TAILLE_SEGMENT):
+                    morceau = groupe[i:i + gps.TAILLE_SEGMENT]
+                    nouveaux.append(SegmentGPS(
+                        route=route, livreur=livreur, date=jour,
+                        debut=gps.depuis_millisecondes(morceau['t'][0]),
+                        fin=gps.depuis_millisecondes(morceau['t'][-1]),
+                        nb_points=len(morceau), donnees=gps.encoder(morceau),
+                    ))
+                debut = fin
+            SegmentGPS.objects.bulk_create(nouveaux)
+            
+            t, lat, lon, precision = points[-1].tolist()
+            horodatage = gps.depuis_millisecondes(t)
+            mises_a_jour = PositionGPS.objects.filter(route=route, horodatage__lt=horodatage).update(
+                livreur=livreur, horodatage=horodatage, latitude=lat / 1e6, longitude=lon / 1e6, precision=precision
+            )
+            if not mises_a_jour:
+                PositionGPS.objects.get_or_create(route=route, defaults={
+                    'livreur': livreur, 'horodatage': horodatage,
+                    'latitude': lat / 1e6, 'longitude': lon / 1e6, 'precision': precision,
+                })
+        
+        return {'recus': len(points), 'ignores': len(pings) - len(points)}
+    
+    def positions_actives(self):
+        """Dernière position de chaque route en cours"""
+        positions = PositionGPS.objects.filter(route__status='en_cours').select_related('route', 'livreur')
+        return [
+            {
+                'route_id': str(position.route_id),
+                'route': position.route.nom,
+                'livreur': position.livreur.get_full_name() if position.livreur else '',
+                'horodatage': timezone.localtime(position.horodatage).isoformat(timespec='seconds'),
+                'latitude': position.latitude,
+                'longitude': position.longitude,
+                'precision': position.precision,
+            }
+            for position in positions
+        ]
+    
+    def trajet(self, route, depuis=None, livreur_id=None):
+        """Points de la route dans l'ordre chronologique (après `depuis` si donné)"""
+        segments = SegmentGPS.objects.filter(route=route)
+        if depuis is not None:
+            segments = segments.filter(fin__gt=depuis)
+        if livreur_id is not None:
+            segments = segments.filter(livreur_id=livreur_id)
+        
+        morceaux = [gps.decoder(donnees) for donnees in segments.order_by('debut').values_list('donnees', flat=True)]
+        if not morceaux:
+            return []
+        points = np.concatenate(morceaux)
+        if depuis is not None:
+            points = points[points['t'] > gps.en_millisecondes(depuis)]
+        return gps.en_json(np.sort(points, order='t', kind='stable'))
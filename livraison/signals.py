@@ -0,0 +1,147 @@
+"""
+Signals alimentant le journal d'événements (livraison/evenements.py)
+Fichier: livraison/signals.py
+
+Sont publiés: les changements de statut des livraisons, toute modification
+d'une route (statut, champs, livreurs) et les ajouts/retraits d'arrêts. Les
+écritures en lot (bulk_create/bulk_update) publient elles-mêmes si besoin.
+Les mêmes signals tiennent à jour les résumés journaliers (livraison/resumes.py),
+les compteurs d'avancement des routes (livraison/progression.py) et l'index des
+disponibilités (livraison/disponibilites.py).
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from livraison import disponibilites, evenements, progression, resumes
+from livraison.models import DisponibiliteLivreur, Livraison, LivraisonRoute, Route
+
+
+def date_route(lien):
+    """Date de la route d'un arrêt, sans requête si la route est déjà chargée"""
+    if LivraisonRoute.route.is_cached(lien):
+        return lien.route.date
+    return Route.objects.filter(id=lien.route_id).values_list('date', flat=True).first()
+
+
+# ============================================================================
+# SIGNAL: Statut de LIVRAISON, modification de ROUTE
+# ============================================================================
+@receiver(post_init, sender=Livraison)
+@receiver(post_init, sender=Route)
+def memoriser_status(sender, instance, **kwargs):
+    instance._status_initial = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Livraison)
+def publier_status_livraison(sender, instance, created, **kwargs):
+    if created or instance.status == instance._status_initial:
+        return
+    if instance._status_initial is None:
+        # Statut non chargé (only/defer): compteurs des routes recalculés
+        progression.reparer(Route.objects.filter(livraisonroute__livraison=instance))
+    else:
+        progression.status_change(instance, instance._status_initial, instance.status)
+    instance._status_initial = instance.status
+    route_id = instance.livraisonroute_set.values_list('route_id', flat=True).first()
+    evenements.publier_livraison(instance, route_id)
+
+
+@receiver(post_save, sender=Route)
+def publier_modification_route(sender, instance, created, **kwargs):
+    if created:
+        action = 'creation'
+    elif instance.status == instance._status_initial:
+        action = 'modification'
+    else:
+        action = None
+    instance._status_initial = instance.status
+    evenements.publier_route(instance, action)
+
+
+@receiver(m2m_changed, sender=Route.livreurs.through)
+def publier_livreurs_route(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    routes = [instance] if not reverse else Route.objects.filter(id__in=kwargs.get('pk_set') or [])
+    for route in routes:
+        evenements.publier_route(route, 'livreurs')
+
+
+# ============================================================================
+# SIGNAL: Résumé journalier des LIVRAISONS
+# ============================================================================
+@receiver(post_init, sender=Livraison)
+def memoriser_contribution(sender, instance, **kwargs):
+    instance._resume_initial = resumes.contribution(instance)
+
+
+@receiver(post_save, sender=Livraison)
+def actualiser_resume(sender, instance, created, **kwargs):
+    apres = resumes.contribution(instance)
+    if created:
+        resumes.actualiser(None, apres)
+    elif instance._resume_initial is None or apres is None:
+        # Chargée avec only()/defer(): état précédent inconnu, la date est recalculée
+        resumes.reconstruire([instance.date_livraison])
+    else:
+        resumes.actualiser(instance._resume_initial, apres)
+    instance._resume_initial = apres
+
+
+@receiver(post_delete, sender=Livraison)
+def retirer_resume(sender, instance, **kwargs):
+    if instance._resume_initial is None:
+        resumes.reconstruire([instance.date_livraison])
+    else:
+        resumes.actualiser(instance._resume_initial, None)
+
+
+@receiver(post_delete, sender=Route)
+def publier_suppression_route(sender, instance, **kwargs):
+    evenements.publier_route(instance, 'suppression')
+
+
+# ============================================================================
+# SIGNAL: Arrêts de ROUTE
+# ============================================================================
+@receiver(post_save, sender=LivraisonRoute)
+def publier_ajout_arret(sender, instance, created, **kwargs):
+    if not created:
+        return
+    date = date_route(instance)
+    if date:
+        evenements.publier('arret', date, instance.route_id, livraison=str(instance.livraison_id), action='ajout')
+
+
+@receiver(post_delete, sender=LivraisonRoute)
+def publier_retrait_arret(sender, instance, **kwargs):
+    date = date_route(instance)
+    if date:
+        evenements.publier('arret', date, instance.route_id, livraison=str(instance.livraison_id), action='retrait')
+
+
+# ============================================================================
+# SIGNAL: Compteurs d'avancement des ROUTES
+# ============================================================================
+@receiver(post_save, sender=LivraisonRoute)
+def compter_ajout_arret(sender, instance, created, **kwargs):
+    if created:
+        progression.arret_ajoute(instance)
+
+
+@receiver(post_delete, sender=LivraisonRoute)
+def compter_retrait_arret(sender, instance, **kwargs):
+    progression.arret_retire(instance)
+
+
+# ============================================================================
+# SIGNAL: DISPONIBILITÉS des livreurs (index en mémoire)
+# ============================================================================
+@receiver(post_save, sender=DisponibiliteLivreur)
+def actualiser_index_disponibilites(sender, instance, created, **kwargs):
+    disponibilites.actualiser(instance, creee=created)
+
+
+@receiver(post_delete, sender=DisponibiliteLivreur)
+def retirer_index_disponibilites(sender, instance, **kwargs):
+    disponibilites.actualiser(instance, supprimee=True)
@@ -0,0 +1,203 @@
+"""
+Simulation de répartition: rejoue une journée de livraisons (historique ou
+synthétique) dans RepartiteurTournees sous plusieurs hypothèses d'effectif
+(nombre de livreurs, capacité, heure de départ, temps de service) et mesure
+distance totale, arrêts en retard et durée des routes.
+
+Les scénarios sont indépendants et répartis sur plusieurs processus. Utilisé
+par la commande simuler_repartition, qui sert aussi de banc d'essai du routage.
+"""
+
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import time as heure
+
+import numpy as np
+from django.conf import settings
+
+from .benchmark import metadonnees
+from .optimisation import (
+    DUREE_MAX_DISPATCH_S, VITESSE_KMH, RepartiteurTournees, VehiculeTournee, matrice_distances, minutes,
+)
+
+
+class JourneeSimulee:
+    """Arrêts d'une journée: positions, heures souhaitées et matrices (km, dépôt en dernier)"""
+
+    def __init__(self, libelle, latitudes, longitudes, heures, zones=None, depot=None, distances=None):
+        self.libelle = libelle
+        self.latitudes = list(latitudes)
+        self.longitudes = list(longitudes)
+        self.heures = list(heures)
+        self.zones = list(zones) if zones is not None else [None] * len(self.latitudes)
+        self.depot = depot
+        if distances is None:
+            lats = self.latitudes + ([depot[0]] if depot else [])
+            lons = self.longitudes + ([depot[1]] if depot else [])
+            distances = matrice_distances(lats, lons)
+        self.distances = np.asarray(distances, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def durees(self, heure_depart):
+        """Durées de trajet (minutes): vitesses apprises si disponibles, sinon vitesse fixe"""
+        from .temps_trajet import modele_temps_trajet
+
+        modele = modele_temps_trajet()
+        if not modele.actif:
+            return self.distances * (60.0 / VITESSE_KMH)
+        zones = self.zones + ([None] if self.depot else [])
+        return modele.matrice_durees(self.distances, zones, heure_depart)
+
+
+def journee_historique(date_livraison, periode=None):
+    """Livraisons géocodées d'une date (et d'une période), distances de la matrice du jour"""
+    from .matrices import CLE_DEPOT, sous_matrices
+    from .models import Livraison
+    from .temps_trajet import zone_livraison
+
+    livraisons = Livraison.objects.filter(
+        date_livraison=date_livraison, latitude__isnull=False, longitude__isnull=False
+    ).exclude(status='annulee').order_by('heure_souhaitee', 'numero_livraison')
+    if periode:
+        livraisons = livraisons.filter(periode=periode)
+    livraisons = list(livraisons)
+
+    depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+    distances = None
+    if livraisons:
+        distances, _ = sous_matrices(
+            date_livraison, [str(l.id) for l in livraisons] + ([CLE_DEPOT] if depot else [])
+        )
+    return JourneeSimulee(
+        f"{date_livraison:%Y-%m-%d}" + (f" {periode}" if periode else ''),
+        [float(l.latitude) for l in livraisons],
+        [float(l.longitude) for l in livraisons],
+        [l.heure_souhaitee for l in livraisons],
+        zones=[zone_livraison(l) for l in livraisons],
+        depot=depot,
+        distances=distances,
+    )
+
+
+def journee_synthetique(nb_arrets, graine=42):
+    """Arrêts aléatoires dans la région de Montréal, heures souhaitées du matin"""
+    hasard = random.Random(graine)
+    heures = [heure(h, m) for h in (7, 8, 9, 10, 11) for m in (0, 15, 30, 45)]
+    return JourneeSimulee(
+        f"synthétique {nb_arrets} (graine {graine})",
+        [45.45 + hasard.random() * 0.15 for _ in range(nb_arrets)],
+        [-73.70 + hasard.random() * 0.25 for _ in range(nb_arrets)],
+        [hasard.choice(heures) if hasard.random() < 0.8 else None for _ in range(nb_arrets)],
+        depot=getattr(settings, 'ROUTAGE_DEPOT', None),
+    )
+
+
+def scenarios_croises(livreurs, capacites, departs, temps_service):
+    """Produit cartésien des hypothèses, en dicts prêts pour simuler_scenario"""
+    return [
+        {'livreurs': n, 'capacite': c, 'heure_depart': d, 'temps_service': s}
+        for n, c, d, s in itertools.product(livreurs, capacites, departs, temps_service)
+    ]
+
+
+def simuler_scenario(journee, scenario, durees, duree_max=DUREE_MAX_DISPATCH_S):
+    """Répartit la journée selon un scénario. Sans accès à la base (exécuté dans un processus fils)."""
+    debut = time.perf_counter()
+    temps_service = scenario['temps_service']
+    vehicules = [
+        VehiculeTournee(k, scenario['capacite'], scenario['heure_depart']) for k in range(scenario['livreurs'])
+    ]
+    repartiteur = RepartiteurTournees(
+        journee.latitudes, journee.longitudes, journee.heures, vehicules,
+        depart=journee.depot, distances=journee.distances, durees=durees, temps_service=temps_service,
+    )
+    tournees, non_places = repartiteur.resoudre(duree_max)
+
+    depart = minutes(scenario['heure_depart'])
+    depot = len(journee) if journee.depot else None
+    routes = []
+    for k, arrets in enumerate(tournees):
+        if not arrets:
+            continue
+        evaluation = repartiteur.evaluer(k, arrets)
+        fermetures = [minutes(journee.heures[a]) for a in arrets]
+        en_retard = sum(
+            1 for arrivee, fermeture in zip(evaluation.arrivees, fermetures)
+            if arrivee is not None and fermeture is not None and arrivee > fermeture + 1e-9
+        )
+        fin = evaluation.arrivees[-1]
+        duree = None
+        if fin is not None:
+            fin += temps_service + (durees[arrets[-1]][depot] if depot is not None else 0)
+            duree = fin - (depart if depart is not None else evaluation.arrivees[0])
+        routes.append({
+            'arrets': len(arrets),
+            'distance_km': round(evaluation.distance_km, 2),
+            'retards': en_retard,
+            'retard_min': round(evaluation.retard_min, 1),
+            'duree_min': round(duree, 1) if duree is not None else None,
+        })
+
+    durees_routes = [route['duree_min'] for route in routes if route['duree_min'] is not None]
+    return {
+        **scenario,
+        'heure_depart': scenario['heure_depart'].strftime('%H:%M'),
+        'routes_utilisees': len(routes),
+        'non_placees': len(non_places),
+        'distance_totale_km': round(sum(route['distance_km'] for route in routes), 2),
+        'arrets_en_retard': sum(route['retards'] for route in routes),
+        'retard_total_min': round(sum(route['retard_min'] for route in routes), 1),
+        'duree_route_max_min': max(durees_routes, default=None),
+        'duree_route_moyenne_min': round(sum(durees_routes) / len(durees_routes), 1) if durees_routes else None,
+        'temps_calcul_s': round(time.perf_counter() - debut, 3),
+        'routes': routes,
+    }
+
+
+class SimulationRepartition:
+    """
+    Exécute des scénarios sur une journée, en parallèle sur `workers` processus (fork).
+    `duree_max`: budget de recherche par scénario (secondes).
+    """
+
+    def __init__(self, journee, workers=None, duree_max=DUREE_MAX_DISPATCH_S):
+        self.journee = journee
+        self.workers = workers or min(os.cpu_count() or 1, 8)
+        self.duree_max = duree_max
+
+    def executer(self, scenarios):
+        # Durées calculées une fois par heure de départ, dans le processus parent (accès à la base)
+        durees = {}
+        for scenario in scenarios:
+            depart = scenario['heure_depart']
+            if depart not in durees:
+                durees[depart] = self.journee.durees(depart).tolist()
+        taches = [(scenario, durees[scenario['heure_depart']]) for scenario in scenarios]
+
+        debut = time.perf_counter()
+        workers = min(self.workers, len(taches))
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                resultats = list(pool.map(
+                    simuler_scenario,
+                    itertools.repeat(self.journee),
+                    [scenario for scenario, _ in taches],
+                    [d for _, d in taches],
+                    itertools.repeat(self.duree_max),
+                ))
+        else:
+            resultats = [simuler_scenario(self.journee, scenario, d, self.duree_max) for scenario, d in taches]
+
+        return {
+            'metadonnees': metadonnees(),
+            'journee': {'libelle': self.journee.libelle, 'arrets': len(self.journee), 'depot': self.journee.depot},
+            'parametres': {'workers': workers, 'duree_max_s': self.duree_max},
+            'duree_totale_s': round(time.perf_counter() - debut, 3),
+            'scenarios': resultats,
+        }
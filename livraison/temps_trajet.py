@@ -0,0 +1,254 @@
+"""
+Temps de trajet appris à partir des livraisons effectuées.
+
+Les arrêts livrés consécutifs des routes terminées (heure_livraison_reelle, et
+Route.heure_depart_reelle pour le trajet depuis le dépôt) donnent des vitesses
+observées, cumulées par zone d'arrivée (FSA du code postal, geohash à défaut)
+et par heure de départ dans VitesseTrajet. ModeleTempsTrajet en tire une table
+de vitesses lissée (zone × heure → heure → ROUTAGE_VITESSE_KMH) utilisée par la
+projection des heures de passage et l'optimisation à la place de la vitesse fixe.
+"""
+
+import re
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils import timezone
+
+from .matrices import distances_depuis
+from .optimisation import TEMPS_SERVICE_MIN, VITESSE_KMH
+
+
+# Trajets retenus: assez longs pour être mesurables, vitesses plausibles en ville
+DISTANCE_MIN_KM = getattr(settings, 'TEMPS_TRAJET_DISTANCE_MIN_KM', 0.3)
+DUREE_MIN_MIN = getattr(settings, 'TEMPS_TRAJET_DUREE_MIN_MIN', 1.0)
+VITESSE_MIN_KMH = getattr(settings, 'TEMPS_TRAJET_VITESSE_MIN_KMH', 3)
+VITESSE_MAX_KMH = getattr(settings, 'TEMPS_TRAJET_VITESSE_MAX_KMH', 100)
+
+# Lissage: chaque case reçoit PRIOR_MIN minutes fictives à la vitesse du niveau supérieur
+PRIOR_MIN = getattr(settings, 'TEMPS_TRAJET_PRIOR_MIN', 30)
+
+PRECISION_GEOHASH = 5  # ~5 km
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+MOTIF_FSA = re.compile(r'^[A-Z]\d[A-Z]')
+
+
+def geohash(latitude, longitude, precision=PRECISION_GEOHASH):
+    """Geohash standard (base 32) d'un point"""
+    intervalles = [[-90.0, 90.0], [-180.0, 180.0]]
+    valeur = (float(latitude), float(longitude))
+    bits = []
+    for rang in range(precision * 5):
+        axe = 1 - rang % 2  # longitude d'abord
+        bas, haut = intervalles[axe]
+        milieu = (bas + haut) / 2
+        if valeur[axe] >= milieu:
+            bits.append(1)
+            intervalles[axe][0] = milieu
+        else:
+            bits.append(0)
+            intervalles[axe][1] = milieu
+    return ''.join(
+        BASE32[int(''.join(map(str, bits[i:i + 5])), 2)] for i in range(0, len(bits), 5)
+    )
+
+
+def zone_livraison(livraison):
+    """FSA du code postal ("H3B"), sinon geohash de la position, sinon None"""
+    code = (livraison.code_postal or '').upper().replace(' ', '')
+    if MOTIF_FSA.match(code):
+        return code[:3]
+    if livraison.latitude is not None and livraison.longitude is not None:
+        return geohash(livraison.latitude, livraison.longitude)
+    return None
+
+
+def trajets_route(route, liens, depot=None, temps_service=TEMPS_SERVICE_MIN):
+    """
+    Trajets observés d'une route terminée: (zone d'arrivée, heure de départ, km, minutes).
+    Les arrêts sont pris dans l'ordre réel de livraison; le temps de service est retiré.
+    """
+    arrets = sorted(
+        (
+            lr.livraison for lr in liens
+            if lr.livraison.status == 'livree' and lr.livraison.heure_livraison_reelle
+            and lr.livraison.latitude is not None and lr.livraison.longitude is not None
+        ),
+        key=lambda livraison: livraison.heure_livraison_reelle,
+    )
+
+    precedent = None
+    if depot and route.heure_depart_reelle:
+        precedent = (depot[0], depot[1], route.heure_depart_reelle)
+
+    for livraison in arrets:
+        latitude, longitude = float(livraison.latitude), float(livraison.longitude)
+        if precedent is not None:
+            lat0, lon0, depart = precedent
+            km = float(distances_depuis(lat0, lon0, np.array([latitude]), np.array([longitude]))[0])
+            minutes = (livraison.heure_livraison_reelle - depart).total_seconds() / 60
+            if km >= DISTANCE_MIN_KM and minutes >= DUREE_MIN_MIN:
+                vitesse = km * 60 / minutes
+                if VITESSE_MIN_KMH <= vitesse <= VITESSE_MAX_KMH:
+                    yield zone_livraison(livraison), timezone.localtime(depart).hour, km, minutes
+        precedent = (
+            latitude, longitude, livraison.heure_livraison_reelle + timedelta(minutes=temps_service)
+        )
+
+
+class ModeleTempsTrajet:
+    """
+    Table de vitesses lissée. `sommes`: {(zone, heure): (nb_trajets, km, minutes)}.
+    Sans observation, toutes les vitesses valent `vitesse_defaut` (actif = False).
+    """
+
+    def __init__(self, sommes=None, vitesse_defaut=VITESSE_KMH, prior_min=PRIOR_MIN):
+        self.vitesse_defaut = vitesse_defaut
+        sommes = sommes or {}
+        self.actif = bool(sommes)
+        self.nb_trajets = sum(n for n, _, _ in sommes.values())
+
+        par_heure = {}
+        for (_, heure), (_, km, minutes) in sommes.items():
+            cumul = par_heure.setdefault(heure, [0.0, 0.0])
+            cumul[0] += km
+            cumul[1] += minutes
+
+        def lisser(km, minutes, vitesse_parent):
+            return (km + vitesse_parent * prior_min / 60) / ((minutes + prior_min) / 60)
+
+        self.heures = {heure: lisser(km, minutes, vitesse_defaut) for heure, (km, minutes) in par_heure.items()}
+        self.cases = {
+            (zone, heure): lisser(km, minutes, self.heures[heure])
+            for (zone, heure), (_, km, minutes) in sommes.items()
+        }
+
+    def vitesse(self, zone, heure):
+        """km/h estimés pour un trajet vers `zone` partant à `heure` (0-23)"""
+        vitesse = self.cases.get((zone, heure))
+        if vitesse is None:
+            vitesse = self.heures.get(heure, self.vitesse_defaut)
+        return vitesse
+
+    def minutes(self, distance_km, zone, minutes_depart):
+        """Durée d'un trajet partant à `minutes_depart` (minutes depuis minuit)"""
+        heure = int(minutes_depart // 60) % 24 if minutes_depart is not None else None
+        return distance_km * 60.0 / self.vitesse(zone, heure)
+
+    def matrice_durees(self, distances, zones, heure_depart=None):
+        """Durées (minutes) d'une matrice de distances: vitesse de la zone d'arrivée (colonne)"""
+        heure = heure_depart.hour if heure_depart is not None else None
+        vitesses = np.array([self.vitesse(zone, heure) for zone in zones], dtype=np.float64)
+        return np.asarray(distances, dtype=np.float64) * 60.0 / vitesses[None, :]
+
+
+def charger_modele():
+    from .models import VitesseTrajet
+
+    sommes = {
+        (zone, heure): (nb, km, minutes)
+        for zone, heure, nb, km, minutes in VitesseTrajet.objects.values_list(
+            'zone', 'heure', 'nb_trajets', 'distance_km', 'duree_min'
+        )
+    }
+    return ModeleTempsTrajet(sommes)
+
+
+_modele = {'version': None, 'modele': None}
+_modele_lock = threading.Lock()
+
+
+def modele_temps_trajet():
+    """Modèle partagé par processus, rechargé quand la table a été reconstruite"""
+    from .models import VitesseTrajet
+
+    version = VitesseTrajet.objects.aggregate(version=Max('date_maj'))['version']
+    with _modele_lock:
+        if _modele['modele'] is None or _modele['version'] != version:
+            _modele['modele'] = charger_modele()
+            _modele['version'] = version
+        return _modele['modele']
+
+
+def apprendre(jusqu_au=None, complet=False, depot=None, temps_service=TEMPS_SERVICE_MIN):
+    """
+    Intègre les routes terminées postérieures à la dernière date apprise et antérieures
+    à `jusqu_au` (défaut: aujourd'hui). `complet`: repart d'une table vide.
+    Retourne {'routes', 'trajets', 'cases', 'depuis', 'jusqu_au'}.
+    """
+    from .models import LivraisonRoute, Route, VitesseTrajet
+
+    jusqu_au = jusqu_au or timezone.localdate()
+    if depot is None:
+        depot = getattr(settings, 'ROUTAGE_DEPOT', None)
+
+    with transaction.atomic():
+        if complet:
+            VitesseTrajet.objects.all().delete()
+        depuis = VitesseTrajet.objects.aggregate(derniere=Max('derniere_date'))['derniere']
+
+        routes = Route.objects.filter(status='terminee', date__lt=jusqu_au)
+        if depuis:
+            routes = routes.filter(date__gt=depuis)
+        routes = routes.prefetch_related(Prefetch(
+            'livraisonroute_set', queryset=LivraisonRoute.objects.select_related('livraison')
+        ))
+
+        cumuls = {}
+        nb_routes = 0
+        derniere_date = None
+        for route in routes.iterator(chunk_size=200):
+            nb_routes += 1
+            derniere_date = max(derniere_date or route.date, route.date)
+            for zone, heure, km, minutes in trajets_route(
+                route, route.livraisonroute_set.all(), depot, temps_service
+            ):
+                if zone is None:
+                    continue
+                cumul = cumuls.setdefault((zone, heure), [0, 0.0, 0.0])
+                cumul[0] += 1
+                cumul[1] += km
+                cumul[2] += minutes
+
+        if cumuls:
+            existantes = {
+                (ligne.zone, ligne.heure): ligne
+                for ligne in VitesseTrajet.objects.filter(zone__in={zone for zone, _ in cumuls})
+            }
+            a_creer, a_modifier = [], []
+            for (zone, heure), (nb, km, minutes) in cumuls.items():
+                ligne = existantes.get((zone, heure))
+                if ligne is None:
+                    a_creer.append(VitesseTrajet(
+                        zone=zone, heure=heure, nb_trajets=nb, distance_km=km, duree_min=minutes,
+                        derniere_date=derniere_date, date_maj=timezone.now(),
+                    ))
+                else:
+                    ligne.nb_trajets += nb
+                    ligne.distance_km += km
+                    ligne.duree_min += minutes
+                    ligne.derniere_date = derniere_date
+                    ligne.date_maj = timezone.now()
+                    a_modifier.append(ligne)
+            VitesseTrajet.objects.bulk_create(a_creer)
+            VitesseTrajet.objects.bulk_update(
+                a_modifier, ['nb_trajets', 'distance_km', 'duree_min', 'derniere_date', 'date_maj']
+            )
+
+        # Filigrane avancé même sans trajet exploitable, pour ne pas relire ces routes
+        if derniere_date and not cumuls:
+            VitesseTrajet.objects.filter(derniere_date=depuis).update(derniere_date=derniere_date)
+
+    return {
+        'routes': nb_routes,
+        'trajets': sum(nb for nb, _, _ in cumuls.values()),
+        'cases': len(cumuls),
+        'depuis': depuis,
+        'jusqu_au': jusqu_au,
+    }
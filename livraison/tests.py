@@ -1,3 +1,1826 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as heure, timedelta
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .geocoding import (
+    CACHE_TTL, CACHE_TTL_ECHEC, GeocodagePool, GeocodingService, IndexCodesPostaux, LimiteurDebit, cache_memoire
+)
+from .benchmark import BenchmarkImport
+from . import disponibilites, evenements, gps, progression, resumes, services
+from .models import (
+    DisponibiliteLivreur, GeocodeCache, ImportExcel, Livraison, LivraisonRoute, Livreur, ModeEnvoi, ResumeLivraisonsJour, Route, SegmentGPS, Vehicule,
+    VitesseTrajet,
+)
+from .matrices import MatriceDistances, matrice_jour, matrice_pour_date, sous_matrices
+from .optimisation import OptimiseurRoute, matrice_distances
+from .normalisation import NormalisationService, empreinte_donnees
+from .regroupement import kmeans, kmedoides_capacite, projeter
+from .reseau_routier import ReseauRoutier, construire_reseau
+from .simulation import SimulationRepartition, journee_historique, journee_synthetique, scenarios_croises
+from .temps_trajet import apprendre, modele_temps_trajet
+from .services import (
+    ExcelImportService, ImportQueueService, PlanningLivreursService, ProjectionETAService, RegeocodageService, RepartitionAutomatiqueService,
+    TableauRoutesService, lire_lignes_excel,
+)
+
+
+class StubNominatim(BaseHTTPRequestHandler):
+    """Faux Nominatim: tout est à Montréal sauf 'introuvable' et le code postal H0H 0H0"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        serveur = self.server
+        with serveur.lock:
+            serveur.requetes.append(query)
+            serveur.connexions.add(self.client_address)
+            serveur.en_cours += 1
+            serveur.max_simultanees = max(serveur.max_simultanees, serveur.en_cours)
+
+        time.sleep(serveur.latence)
+
+        if 'introuvable' in query.lower() or 'H0H' in query:
+            corps = []
+        else:
+            corps = [{'lat': '45.5017', 'lon': '-73.5673', 'place_id': 42, 'display_name': query}]
+        donnees = json.dumps(corps).encode('utf-8')
+
+        with serveur.lock:
+            serveur.en_cours -= 1
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(donnees)))
+        self.end_headers()
+        self.wfile.write(donnees)
+
+    def log_message(self, *args):
+        pass
+
+
+class GeocodageStubTestCase(TestCase):
+    """Démarre un serveur HTTP local et y dirige le fournisseur 'nominatim'"""
+
+    debit = 50
+    workers = 4
+    latence = 0.05
+
+    def setUp(self):
+        self.serveur = ThreadingHTTPServer(('127.0.0.1', 0), StubNominatim)
+        self.serveur.lock = threading.Lock()
+        self.serveur.requetes = []
+        self.serveur.connexions = set()
+        self.serveur.en_cours = 0
+        self.serveur.max_simultanees = 0
+        self.serveur.latence = self.latence
+        threading.Thread(target=self.serveur.serve_forever, daemon=True).start()
+        self.addCleanup(self.serveur.server_close)
+        self.addCleanup(self.serveur.shutdown)
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+
+        reglages = override_settings(
+            GEOCODING_LIMITEUR_DOSSIER=dossier.name,
+            GEOCODING_FOURNISSEURS={'nominatim': {
+                'url': f'http://127.0.0.1:{self.serveur.server_address[1]}/search',
+                'debit': self.debit,
+                'capacite': 1,
+                'workers': self.workers,
+            }},
+        )
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        cache_memoire.clear()
+        self.addCleanup(cache_memoire.clear)
+
+
+class GeocodagePoolTests(GeocodageStubTestCase):
+
+    def test_lot_parallele_et_keep_alive(self):
+        adresses = [(f'{100 + i} rue Saint-Denis, Montréal', 'H2X 1K4') for i in range(12)]
+
+        resultats = GeocodagePool().geocoder_lot(adresses)
+
+        self.assertEqual(len(resultats), 12)
+        self.assertTrue(all(r['success'] for r in resultats.values()))
+        self.assertEqual(len(self.serveur.requetes), 12)
+        self.assertGreater(self.serveur.max_simultanees, 1)
+        # Connexions réutilisées: au plus une par worker
+        self.assertLessEqual(len(self.serveur.connexions), self.workers)
+
+    def test_lot_reutilise_le_cache(self):
+        adresses = [('200 rue Sherbrooke, Montréal', 'H2X 1X8')] * 3
+
+        GeocodagePool().geocoder_lot(adresses)
+        service = GeocodingService()
+        GeocodagePool(service).geocoder_lot(adresses)
+
+        self.assertEqual(len(self.serveur.requetes), 1)
+        self.assertEqual(service.stats['requetes_api'], 0)
+
+    def test_regeocodage_des_echecs(self):
+        ok = Livraison.objects.create(
+            numero_livraison='1001', client_nom='A', adresse_complete='10 rue Ontario, Montréal',
+            code_postal='H2X 1Y6', date_livraison=date(2025, 1, 15), periode='matin',
+            geocode_status='failed', geocode_attempts=1
+        )
+        ko = Livraison.objects.create(
+            numero_livraison='1002', client_nom='B', adresse_complete='1 rue introuvable',
+            code_postal='H0H 0H0', date_livraison=date(2025, 1, 15), periode='matin',
+            geocode_status='failed', geocode_attempts=1
+        )
+
+        resultat = RegeocodageService().relancer()
+
+        self.assertEqual((resultat['traitees'], resultat['reussies'], resultat['echouees']), (2, 1, 1))
+        self.assertEqual([e['numero'] for e in resultat['echecs']], ['1002'])
+        ok.refresh_from_db()
+        ko.refresh_from_db()
+        self.assertEqual((ok.geocode_status, ok.geocode_attempts), ('success', 0))
+        self.assertIsNotNone(ok.latitude)
+        self.assertEqual((ko.geocode_status, ko.geocode_attempts), ('failed', 2))
+
+
+class CacheGeocodageTests(GeocodageStubTestCase):
+
+    latence = 0
+
+    def test_entree_expiree_reinterrogee(self):
+        GeocodingService().geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        self.assertEqual(len(self.serveur.requetes), 1)
+        entree = GeocodeCache.objects.get()
+        self.assertTrue(entree.succes)
+        self.assertGreater(entree.date_expiration, timezone.now() + CACHE_TTL - timedelta(minutes=1))
+
+        # Encore valide: servie par la base, sans requête
+        cache_memoire.clear()
+        GeocodingService().geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        self.assertEqual(len(self.serveur.requetes), 1)
+
+        GeocodeCache.objects.update(date_expiration=timezone.now() - timedelta(seconds=1))
+        cache_memoire.clear()
+        service = GeocodingService()
+        self.assertTrue(service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')['success'])
+        self.assertEqual(len(self.serveur.requetes), 2)
+        self.assertEqual(service.stats['misses'], 1)
+
+    def test_cache_negatif_expire_plus_tot(self):
+        service = GeocodingService()
+        service.geocoder_adresse('1 rue introuvable', code_postal='H0H 0H0')
+        service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        echec, succes = GeocodeCache.objects.get(succes=False), GeocodeCache.objects.get(succes=True)
+        self.assertLess(echec.date_expiration, timezone.now() + CACHE_TTL_ECHEC + timedelta(minutes=1))
+        self.assertLess(echec.date_expiration, succes.date_expiration)
+
+        # Une fois le TTL des échecs écoulé, l'échec est réinterrogé; le succès reste en cache
+        requetes = len(self.serveur.requetes)
+        cache_memoire.clear()
+        plus_tard = timezone.now() + CACHE_TTL_ECHEC + timedelta(minutes=1)
+        with mock.patch('livraison.geocoding.timezone.now', return_value=plus_tard):
+            service = GeocodingService()
+            self.assertIsNone(service.lire_cache(service.preparer_requete('1 rue introuvable', code_postal='H0H 0H0')['cache_key']))
+            self.assertIsNotNone(service.lire_cache(service.preparer_requete('10 rue Ontario', code_postal='H2X 1Y4')['cache_key']))
+        self.assertEqual(len(self.serveur.requetes), requetes)
+
+    def test_erreur_reseau_non_memorisee(self):
+        service = GeocodingService()
+        with mock.patch.object(service, '_geocoder_query', return_value={'success': False, 'error': 'Read timed out'}):
+            resultat = service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        self.assertTrue(resultat.get('api_tentee'))
+        self.assertFalse(GeocodeCache.objects.exists())
+
+        # Réseau rétabli: l'adresse est interrogée au lieu d'un échec mis en cache
+        self.assertTrue(service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')['success'])
+        self.assertEqual(len(self.serveur.requetes), 1)
+
+    def test_statistiques_hits_et_misses(self):
+        service = GeocodingService()
+        for _ in range(3):
+            service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        cache_memoire.clear()
+        service.geocoder_adresse('10 rue Ontario', code_postal='H2X 1Y4')
+        service.geocoder_adresse('20 rue Sherbrooke', code_postal='H3B 2G2')
+
+        statistiques = service.statistiques_cache()
+        self.assertEqual(
+            (statistiques['hits_memoire'], statistiques['hits_base'], statistiques['misses'], statistiques['requetes_api']),
+            (2, 1, 2, 2)
+        )
+        self.assertEqual(statistiques['taux_hits'], 60.0)
+
+
+class LimiteurDebitTests(TestCase):
+
+    def test_debit_partage_entre_instances(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            # Deux instances sur le même fichier = deux processus
+            limiteurs = [LimiteurDebit('test', debit=20, capacite=1, dossier=dossier) for _ in range(2)]
+
+            debut = time.monotonic()
+            for i in range(10):
+                limiteurs[i % 2].acquerir()
+            duree = time.monotonic() - debut
+
+        # 1 jeton disponible puis 9 à 20/s
+        self.assertGreaterEqual(duree, 0.4)
+
+
+class IndexCodesPostauxTests(GeocodageStubTestCase):
+
+    def setUp(self):
+        super().setUp()
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        chemin = os.path.join(dossier.name, 'codes_postaux.bin')
+        IndexCodesPostaux.ecrire(chemin, {
+            'H2X1Y4': (45.5100, -73.5650),
+            'H2X1Y6': (45.5120, -73.5630),
+            'H0H0H0': (45.4500, -73.7000),
+        })
+        reglages = override_settings(GEOCODING_INDEX_CODES_POSTAUX=chemin)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.index = IndexCodesPostaux(chemin)
+
+    def test_recherche_ldu_puis_fsa(self):
+        self.assertEqual(self.index.chercher('h2x 1y4')['precision'], 'ldu')
+        fsa = self.index.chercher('H2X 9Z9')
+        self.assertEqual(fsa['precision'], 'fsa')
+        self.assertAlmostEqual(float(fsa['latitude']), 45.511, places=4)
+        self.assertIsNone(self.index.chercher('G1A 1A1'))
+
+    def test_hors_ligne_sans_appel_reseau(self):
+        resultat = GeocodingService().geocoder_adresse('1 rue Ontario', code_postal='H2X1Y4', hors_ligne=True)
+
+        self.assertTrue(resultat['approximatif'])
+        self.assertEqual(resultat['source'], 'index_local')
+        self.assertEqual(self.serveur.requetes, [])
+
+    def test_repli_quand_api_echoue(self):
+        resultat = GeocodingService().geocoder_adresse('1 rue introuvable', code_postal='H0H 0H0')
+
+        self.assertTrue(resultat['success'])
+        self.assertTrue(resultat['api_tentee'])
+        self.assertEqual(resultat['source'], 'index_local')
+
+
+class LectureExcelTests(TestCase):
+
+    COLONNES = [
+        '# Commande', 'Nom de l\'événement', 'Nom du client commandé', 'Adresse', 'APP',
+        'Ligne 2', 'Code postal', 'Heure livraison', 'Nb convives', 'Mode d\'envoi',
+        'Nom du conseiller', 'Informations supplémentaires',
+    ]
+
+    def classeur(self):
+        classeur = openpyxl.Workbook()
+        feuille = classeur.active
+        for titre in ('Liste des livraisons', 'Traiteur', None):
+            feuille.append([titre])
+        feuille.append(self.COLONNES)
+        feuille.append([1201, 'Dîner café', 'ACME', '10 rue Ontario', '3', None, 'h2x1y4', heure(11, 30), 12, 'Livraison', 'Julie', None])
+        feuille.append([])
+        feuille.append(['1202.1', 'Pause thé GLACÉ', None, '20 rue Sherbrooke', None, 'Porte B', 'H3B 2G2 Canada', '7h15', None, None, None, 'Quai'])
+        feuille.append([1203, None, 'Client', None, None, None, None, '1630', 'dix'])
+        feuille.append([1204, 'Repas chaud', 'B', '5 av. du Parc', None, None, 'ABC', 'midi', 4.0])
+        feuille.append([1205, None, 'C', '1 rue X', None, None, None, '25:00'])
+        feuille.append([None, None, None, '99 rue Sans Numéro'])
+
+        contenu = io.BytesIO()
+        classeur.save(contenu)
+        return contenu.getvalue()
+
+    maxDiff = None
+
+    def test_normalisation_identique_au_ligne_a_ligne(self):
+        contenu = self.classeur()
+        service = ExcelImportService()
+
+        attendu = []
+        for index, ligne in lire_lignes_excel(io.BytesIO(contenu)):
+            try:
+                donnees = service.extraire_donnees_ligne(ligne)
+            except ValueError:
+                continue
+            if donnees['numero_base']:
+                donnees['besoins'] = service.calculer_besoins(donnees['nom_evenement'])
+                donnees['empreinte'] = empreinte_donnees(donnees)
+                attendu.append((index, donnees))
+
+        lot = NormalisationService().normaliser(service.lire_tableau(io.BytesIO(contenu)))
+
+        self.assertEqual(lot.lignes(), attendu)
+        self.assertEqual([i for i, _ in lot.lignes()], [0, 2, 3, 4])
+        self.assertEqual(lot.lignes()[0][1]['heure_souhaitee'], heure(11, 30))
+        self.assertEqual(lot.lignes()[1][1]['code_postal'], 'H3B 2G2')
+        self.assertTrue(lot.lignes()[1][1]['besoins']['besoin_sac_glace'])
+
+    def test_rapport_de_rejets_par_colonne(self):
+        service = ExcelImportService()
+        lot = NormalisationService().normaliser(service.lire_tableau(io.BytesIO(self.classeur())))
+
+        self.assertEqual(lot.erreurs, ["Ligne 10: Heure invalide '25:00'"])
+        self.assertEqual(
+            {colonne: [r['ligne'] for r in rejets] for colonne, rejets in lot.rejets.items()},
+            {'Heure livraison': [9, 10], 'Nb convives': [8], 'Code postal': [9], '# Commande': [11]}
+        )
+
+    def test_lecture_pandas_equivalente(self):
+        contenu = self.classeur()
+        streaming = NormalisationService().normaliser(ExcelImportService().lire_tableau(io.BytesIO(contenu)))
+        pandas = NormalisationService().normaliser(
+            ExcelImportService(lecture_streaming=False).lire_tableau(io.BytesIO(contenu))
+        )
+
+        # pandas convertit les colonnes numériques trouées en float ("1201.0", "App 3.0")
+        differences = {'numero_brut', 'app', 'adresse_complete', 'empreinte'}
+        for (i, donnees), (j, reference) in zip(streaming.lignes(), pandas.lignes()):
+            self.assertEqual(i, j)
+            self.assertEqual(
+                {k: v for k, v in donnees.items() if k not in differences},
+                {k: v for k, v in reference.items() if k not in differences}
+            )
+        self.assertEqual(streaming.lignes()[0][1]['adresse_complete'], '10 rue Ontario, App 3')
+
+
+class ReimportEmpreinteTests(TestCase):
+
+    def fichier(self, heure_livraison='11:30'):
+        classeur = openpyxl.Workbook()
+        feuille = classeur.active
+        for _ in range(3):
+            feuille.append([None])
+        feuille.append(['# Commande', 'Nom du client commandé', 'Adresse', 'Code postal', 'Heure livraison', 'Nb convives'])
+        feuille.append([3001, 'ACME', '10 rue Ontario', 'H2X 1Y4', heure_livraison, 10])
+        feuille.append([3002, 'Beta', '20 rue Sherbrooke', 'H3B 2G2', '7h15', 25])
+
+        contenu = io.BytesIO()
+        classeur.save(contenu)
+        contenu.seek(0)
+        return contenu
+
+    def test_reimport_identique_ignore_par_empreinte(self):
+        ExcelImportService(geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 15))
+        empreintes = dict(Livraison.objects.values_list('numero_livraison', 'empreinte_import'))
+        self.assertTrue(all(empreintes.values()))
+
+        with mock.patch('livraison.services.GeocodingService.geocoder_adresse') as geocoder:
+            resultat = ExcelImportService(geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 15))
+
+        self.assertEqual((resultat['imported'], resultat['updated'], resultat['skipped']), (0, 0, 2))
+        self.assertEqual(resultat['unchanged_fingerprint'], 2)
+        geocoder.assert_not_called()
+
+    def test_ligne_modifiee_sans_regeocodage(self):
+        ExcelImportService(geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 15))
+        avant = Livraison.objects.get(numero_livraison='3001')
+
+        with mock.patch('livraison.services.GeocodingService.geocoder_adresse') as geocoder:
+            resultat = ExcelImportService(geocodage_differe=True).importer(
+                self.fichier(heure_livraison='14:00'), date_livraison=date(2025, 1, 15)
+            )
+
+        self.assertEqual((resultat['imported'], resultat['updated'], resultat['skipped']), (0, 1, 1))
+        geocoder.assert_not_called()
+        apres = Livraison.objects.get(numero_livraison='3001')
+        self.assertEqual((apres.heure_souhaitee, apres.periode), (heure(14, 0), 'apres_midi'))
+        self.assertNotEqual(apres.empreinte_import, avant.empreinte_import)
+
+
+class EcritureEnLotsTests(TestCase):
+
+    def fichier(self, heure_livraison='11:30'):
+        classeur = openpyxl.Workbook()
+        feuille = classeur.active
+        for _ in range(3):
+            feuille.append([None])
+        feuille.append(['# Commande', 'Nom du client commandé', 'Adresse', 'Code postal', 'Heure livraison'])
+        for position in range(5):
+            feuille.append([6001 + position, f'Client {position}', f'{10 + position} rue Ontario', 'H2X 1Y4', heure_livraison])
+
+        contenu = io.BytesIO()
+        classeur.save(contenu)
+        contenu.seek(0)
+        return contenu
+
+    def test_creations_et_mises_a_jour_par_lots(self):
+        with mock.patch.object(Livraison.objects, 'bulk_create', wraps=Livraison.objects.bulk_create) as bulk_create:
+            resultat = ExcelImportService(taille_lot=2, geocodage_differe=True).importer(
+                self.fichier(), date_livraison=date(2025, 1, 15)
+            )
+        self.assertEqual(resultat['imported'], 5)
+        self.assertEqual([len(appel.args[0]) for appel in bulk_create.call_args_list], [2, 2, 1])
+        self.assertEqual(Livraison.objects.filter(date_livraison=date(2025, 1, 15)).count(), 5)
+
+        with mock.patch.object(Livraison.objects, 'bulk_update', wraps=Livraison.objects.bulk_update) as bulk_update:
+            resultat = ExcelImportService(taille_lot=2, geocodage_differe=True).importer(
+                self.fichier(heure_livraison='14:00'), date_livraison=date(2025, 1, 15)
+            )
+        self.assertEqual(resultat['updated'], 5)
+        self.assertEqual([len(appel.args[0]) for appel in bulk_update.call_args_list], [2, 2, 1])
+        self.assertIn('heure_souhaitee', bulk_update.call_args_list[0].args[1])
+        self.assertEqual(
+            set(Livraison.objects.values_list('heure_souhaitee', flat=True)), {heure(14, 0)}
+        )
+
+    def test_repli_ligne_a_ligne_signale_la_ligne(self):
+        Livraison.objects.create(
+            numero_livraison='6002', client_nom='Existante', adresse_complete='Adresse',
+            date_livraison=date(2025, 1, 14), periode='matin'
+        )
+        service = ExcelImportService(taille_lot=10)
+        a_creer = [
+            (index, Livraison(
+                numero_livraison=numero, client_nom='Client', adresse_complete='Adresse',
+                date_livraison=date(2025, 1, 15), periode='matin'
+            ))
+            for index, numero in enumerate(['6001', '6002', '6003'])
+        ]
+
+        service.ecrire_creations(a_creer)
+
+        # Le lot échoue sur le doublon: les autres lignes sont écrites une à une
+        self.assertEqual(service.success_count, 2)
+        self.assertEqual(len(service.erreurs), 1)
+        self.assertTrue(service.erreurs[0].startswith('Ligne 6: '))
+        self.assertEqual(
+            set(Livraison.objects.filter(date_livraison=date(2025, 1, 15)).values_list('numero_livraison', flat=True)),
+            {'6001', '6003'}
+        )
+
+    def test_numero_pris_pour_une_autre_date(self):
+        ExcelImportService(geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 15))
+
+        resultat = ExcelImportService(geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 16))
+
+        self.assertEqual(resultat['imported'], 0)
+        self.assertIn('Ligne 5: Le numéro 6001 existe déjà pour une autre date', resultat['errors'])
+        self.assertEqual(len(resultat['errors']), 5)
+        self.assertFalse(Livraison.objects.filter(date_livraison=date(2025, 1, 16)).exists())
+
+    def test_liaison_des_contrats(self):
+        from hotel.models import Contrat
+
+        def contrat(numero, livraison=None):
+            return Contrat.objects.create(
+                numero_contrat=numero, nom_evenement='Gala', client_nom='Client', client_telephone='514',
+                adresse_complete='Adresse', date_evenement=date(2025, 1, 15),
+                heure_debut_prevue=heure(11, 0), heure_fin_prevue=heure(14, 0), livraison=livraison
+            )
+
+        autre = Livraison.objects.create(
+            numero_livraison='5999', client_nom='Autre', adresse_complete='Adresse',
+            date_livraison=date(2025, 1, 15), periode='matin'
+        )
+        libre, deja_lie = contrat('6001'), contrat('6002', livraison=autre)
+
+        ExcelImportService(taille_lot=2, geocodage_differe=True).importer(self.fichier(), date_livraison=date(2025, 1, 15))
+
+        libre.refresh_from_db()
+        deja_lie.refresh_from_db()
+        self.assertEqual(libre.livraison, Livraison.objects.get(numero_livraison='6001'))
+        self.assertEqual(deja_lie.livraison, autre)
+
+        # Contrat créé après l'import: lié au réimport, même sans changement de ligne
+        tardif = contrat('6005')
+        resultat = ExcelImportService(taille_lot=2, geocodage_differe=True).importer(
+            self.fichier(), date_livraison=date(2025, 1, 15)
+        )
+        self.assertEqual(resultat['skipped'], 5)
+        tardif.refresh_from_db()
+        self.assertEqual(tardif.livraison, Livraison.objects.get(numero_livraison='6005'))
+
+
+class ImportQueueTests(GeocodageStubTestCase):
+
+    latence = 0
+
+    def setUp(self):
+        super().setUp()
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(MEDIA_ROOT=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def mettre_en_file(self, contenu=None):
+        if contenu is None:
+            classeur = openpyxl.Workbook()
+            feuille = classeur.active
+            for _ in range(3):
+                feuille.append([None])
+            feuille.append(['# Commande', 'Nom du client commandé', 'Adresse', 'Code postal', 'Heure livraison'])
+            feuille.append([8001, 'ACME', '10 rue Ontario', 'H2X 1Y4', '11:30'])
+            feuille.append([8002, 'Beta', '20 rue Sherbrooke', 'H3B 2G2', '7h15'])
+            tampon = io.BytesIO()
+            classeur.save(tampon)
+            contenu = tampon.getvalue()
+        return ImportQueueService().mettre_en_file(ContentFile(contenu, name='livraisons.xlsx'), date(2025, 2, 3))
+
+    def test_reservation_conditionnelle(self):
+        premier = self.mettre_en_file()
+        second = self.mettre_en_file()
+        queue = ImportQueueService()
+
+        self.assertEqual(queue.prendre_prochain().id, premier.id)
+        self.assertEqual(queue.prendre_prochain().id, second.id)
+        self.assertIsNone(queue.prendre_prochain())
+
+        # Candidats lus avant qu'un autre worker ne réserve: l'UPDATE conditionnel ne touche aucune ligne
+        filtre = ImportExcel.objects.filter
+        debut = ImportExcel.objects.get(id=premier.id).date_debut
+
+        def candidats_perimes(*args, **kwargs):
+            if kwargs == {'statut': 'en_attente'}:
+                return ImportExcel.objects.all()
+            return filtre(*args, **kwargs)
+
+        with mock.patch.object(ImportExcel.objects, 'filter', side_effect=candidats_perimes):
+            self.assertIsNone(queue.prendre_prochain())
+        self.assertEqual(ImportExcel.objects.get(id=premier.id).date_debut, debut)
+
+    def test_transitions_et_vue_de_progression(self):
+        import_excel = self.mettre_en_file()
+        self.assertEqual(import_excel.statut, 'en_attente')
+        queue = ImportQueueService()
+        reserve = queue.prendre_prochain()
+        self.assertEqual(reserve.statut, 'en_cours')
+        self.assertIsNotNone(reserve.date_battement)
+
+        resultat = queue.traiter(reserve)
+        self.assertTrue(resultat['success'])
+        import_excel.refresh_from_db()
+        self.assertEqual((import_excel.statut, import_excel.nb_lignes_importees), ('terminee', 2))
+        self.assertIsNotNone(import_excel.date_fin)
+
+        echec = self.mettre_en_file(b'pas un classeur')
+        queue.traiter(queue.prendre_prochain())
+        echec.refresh_from_db()
+        self.assertEqual(echec.statut, 'echouee')
+        self.assertTrue(echec.rapport_erreurs['message'])
+
+        self.client.force_login(get_user_model().objects.create_user('resp7', password='x', role='resp_livraison'))
+        donnees = self.client.get(reverse('livraison:progression_import', args=[import_excel.id])).json()
+        self.assertEqual(
+            (donnees['statut'], donnees['termine'], donnees['progression'], donnees['livraisons_creees'], donnees['lignes_total']),
+            ('terminee', True, 100, 2, 2)
+        )
+        self.assertEqual(donnees['date_livraison'], '2025-02-03')
+        donnees = self.client.get(reverse('livraison:progression_import', args=[echec.id])).json()
+        self.assertEqual((donnees['success'], donnees['termine']), (False, True))
+        self.assertTrue(donnees['error'])
+
+    def test_reprise_selon_le_battement(self):
+        bloque, actif = self.mettre_en_file(), self.mettre_en_file()
+        queue = ImportQueueService()
+        queue.prendre_prochain()
+        queue.prendre_prochain()
+        il_y_a_une_heure = timezone.now() - timedelta(hours=1)
+        # Les deux ont démarré il y a une heure; seul le second a écrit sa progression récemment
+        ImportExcel.objects.update(date_debut=il_y_a_une_heure, date_battement=il_y_a_une_heure)
+        ImportExcel.objects.filter(id=actif.id).update(date_battement=timezone.now())
+
+        self.assertEqual(queue.reprendre_bloques(30), 1)
+        self.assertEqual(
+            dict(ImportExcel.objects.values_list('id', 'statut')),
+            {bloque.id: 'en_attente', actif.id: 'en_cours'}
+        )
+        self.assertEqual(queue.prendre_prochain().id, bloque.id)
+
+
+class BenchmarkImportTests(TestCase):
+
+    def test_mesure_par_phase_et_reimport(self):
+        resultats = BenchmarkImport(latence=0, debit=1000, workers=4).executer([100])
+
+        import_initial, reimport = resultats['resultats'][0]['passes']
+        self.assertEqual(import_initial['creees'], 100)
+        self.assertEqual(reimport['inchangees'], 100)
+        self.assertIn('geocodage', import_initial['durees_s'])
+        self.assertLess(reimport['requetes_sql_total'], import_initial['requetes_sql_total'])
+        # Transaction annulée: rien ne reste en base
+        self.assertFalse(Livraison.objects.exists())
+
+
+class ImportMultiDatesTests(TestCase):
+
+    def classeur(self):
+        classeur = openpyxl.Workbook()
+        classeur.remove(classeur.active)
+        entete = ['# Commande', 'Nom du client commandé', 'Adresse', 'Code postal', 'Heure livraison']
+
+        for nom, lignes in [
+            ('Lundi 13 janvier', [[4001, 'ACME', '10 rue Ontario', 'H2X 1Y4', '11:30']]),
+            ('Mardi 14 janvier', [[4002, 'Beta', '20 rue Sherbrooke', 'H3B 2G2', '7h15'],
+                                  [4003, 'Gamma', '30 rue Peel', 'H3C 1A1', '12:00']]),
+        ]:
+            feuille = classeur.create_sheet(nom)
+            feuille.append(['Liste des livraisons'])
+            feuille.append([None])
+            feuille.append([None])
+            feuille.append(entete)
+            for ligne in lignes:
+                feuille.append(ligne)
+
+        # Feuille sans date propre: une date par ligne
+        feuille = classeur.create_sheet('Semaine')
+        for _ in range(3):
+            feuille.append([None])
+        feuille.append(entete + ['Date livraison'])
+        feuille.append([4004, 'Delta', '40 rue King', 'J4K 1A1', '8:00', date(2025, 1, 14)])
+        feuille.append([4005, 'Epsilon', '50 av. du Parc', 'H2X 2B2', '15:00', '2025-01-15'])
+        feuille.append([4006, 'Zeta', '60 rue Ontario', 'H2X 1Y4', '9:00', 'bientôt'])
+
+        contenu = io.BytesIO()
+        classeur.save(contenu)
+        contenu.seek(0)
+        return contenu
+
+    def test_dates_par_feuille_et_par_ligne(self):
+        resultat = ExcelImportService(geocodage_differe=True).importer(self.classeur(), date_livraison=date(2025, 1, 20))
+
+        self.assertTrue(resultat['success'])
+        dates = dict(Livraison.objects.values_list('numero_livraison', 'date_livraison'))
+        self.assertEqual(dates, {
+            '4001': date(2025, 1, 13),
+            '4002': date(2025, 1, 14),
+            '4003': date(2025, 1, 14),
+            '4004': date(2025, 1, 14),
+            '4005': date(2025, 1, 15),
+            '4006': date(2025, 1, 20),  # Date illisible: date par défaut, signalée
+        })
+        self.assertEqual(
+            [(rapport['date'], rapport['imported'], rapport['feuilles']) for rapport in resultat['par_date']],
+            [
+                ('2025-01-13', 1, ['Lundi 13 janvier']),
+                ('2025-01-14', 3, ['Mardi 14 janvier', 'Semaine']),
+                ('2025-01-15', 1, ['Semaine']),
+                ('2025-01-20', 1, ['Semaine']),
+            ]
+        )
+        rejets = resultat['rejets']['Date livraison']
+        self.assertEqual(rejets[0]['valeur'], 'bientôt')
+        # Dates de ligne qui remplacent la date choisie: signalées
+        self.assertEqual(
+            [(rejet['ligne'], rejet['valeur'], rejet['feuille']) for rejet in rejets[1:]],
+            [(5, '2025-01-14', 'Semaine'), (6, '2025-01-15', 'Semaine')]
+        )
+        self.assertIn('date choisie (2025-01-20)', rejets[1]['raison'])
+        # Écriture en lot: résumé de chaque date recalculé
+        self.assertEqual(resumes.resume_jour(date(2025, 1, 14))['nb_total'], 3)
+
+    def test_colonne_date_generique_ignoree(self):
+        classeur = openpyxl.Workbook()
+        feuille = classeur.active
+        for _ in range(3):
+            feuille.append([None])
+        feuille.append(['# Commande', 'Nom du client commandé', 'Adresse', 'Code postal', 'Heure livraison', 'Date'])
+        feuille.append([4101, 'ACME', '10 rue Ontario', 'H2X 1Y4', '11:30', date(2024, 12, 2)])
+        contenu = io.BytesIO()
+        classeur.save(contenu)
+        contenu.seek(0)
+
+        resultat = ExcelImportService(geocodage_differe=True).importer(contenu, date_livraison=date(2025, 1, 20))
+
+        self.assertEqual(resultat['imported'], 1)
+        self.assertEqual(Livraison.objects.get().date_livraison, date(2025, 1, 20))
+        self.assertEqual(resultat['rejets'], {})
+
+    def test_une_date_en_echec_est_annulee_seule(self):
+        ecrire = ExcelImportService.ecrire_creations
+
+        def ecrire_sauf_le_14(service, a_creer):
+            ecrites = ecrire(service, a_creer)
+            if any(livraison.date_livraison == date(2025, 1, 14) for _, livraison in a_creer):
+                raise RuntimeError('écriture impossible')
+            return ecrites
+
+        with mock.patch.object(ExcelImportService, 'ecrire_creations', ecrire_sauf_le_14):
+            resultat = ExcelImportService(geocodage_differe=True).importer(self.classeur(), date_livraison=date(2025, 1, 20))
+
+        self.assertTrue(resultat['success'])
+        self.assertFalse(Livraison.objects.filter(date_livraison=date(2025, 1, 14)).exists())
+        self.assertEqual(Livraison.objects.count(), 3)
+        self.assertEqual(resultat['imported'], 3)
+        echec = next(rapport for rapport in resultat['par_date'] if rapport['date'] == '2025-01-14')
+        self.assertEqual((echec['success'], echec['imported']), (False, 0))
+
+
+class MatricesTemporairesMixin:
+    """Matrices de distances écrites dans un dossier temporaire"""
+
+    def setUp(self):
+        super().setUp()
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglage = override_settings(MATRICES_DOSSIER=dossier.name)
+        reglage.enable()
+        self.addCleanup(reglage.disable)
+        self.dossier_matrices = dossier.name
+
+
+def points_aleatoires(nombre, graine=1):
+    import random
+    hasard = random.Random(graine)
+    return (
+        [45.45 + hasard.random() * 0.15 for _ in range(nombre)],
+        [-73.65 + hasard.random() * 0.2 for _ in range(nombre)],
+    )
+
+
+class OptimiseurRouteTests(TestCase):
+
+    def test_route_de_40_arrets(self):
+        latitudes, longitudes = points_aleatoires(40)
+        optimiseur = OptimiseurRoute(latitudes, longitudes)
+        avant = optimiseur.evaluer(list(range(40)))
+
+        debut = time.perf_counter()
+        ordre, apres = optimiseur.resoudre(list(range(40)))
+        duree = time.perf_counter() - debut
+
+        self.assertEqual(sorted(ordre), list(range(40)))
+        self.assertLess(apres.distance_km, avant.distance_km / 2)
+        self.assertLess(duree, 1.0)
+
+    def test_deux_opt_matrice_orientee(self):
+        # Distances routières orientées: inverser un segment change le coût de toutes ses arêtes
+        hasard = np.random.default_rng(4)
+        for _ in range(20):
+            distances = hasard.uniform(1, 10, (9, 9))
+            np.fill_diagonal(distances, 0)
+            optimiseur = OptimiseurRoute([0] * 8, [0] * 8, depart=(0, 0), distances=distances)
+            self.assertFalse(optimiseur.symetrique)
+
+            initial = list(range(8))
+            ordre, cout = optimiseur.deux_opt(list(initial), optimiseur.cout(initial), time.perf_counter() + 5)
+            self.assertEqual(sorted(ordre), initial)
+            self.assertAlmostEqual(cout, optimiseur.cout(ordre))
+            self.assertLessEqual(cout, optimiseur.cout(initial))
+
+    def test_fenetres_horaires_respectees(self):
+        # L'arrêt du milieu, attendu à 9h, passe avant les deux extrémités attendues à 11h
+        latitudes, longitudes = [45.50, 45.60, 45.55], [-73.57, -73.63, -73.60]
+
+        ordre, _ = OptimiseurRoute(latitudes, longitudes).resoudre([0, 1, 2])
+        self.assertEqual(ordre[1], 2)
+
+        optimiseur = OptimiseurRoute(latitudes, longitudes, heures=[heure(11, 0), heure(11, 5), heure(9, 0)])
+        ordre, evaluation = optimiseur.resoudre([0, 1, 2])
+        self.assertEqual(ordre[0], 2)
+        self.assertEqual(evaluation.retard_min, 0)
+
+
+class OptimiserRouteVueTests(MatricesTemporairesMixin, TestCase):
+
+    def setUp(self):
+        self.utilisateur = get_user_model().objects.create_user('resp', password='x', role='resp_livraison')
+        self.client.force_login(self.utilisateur)
+        self.route = Route.objects.create(nom='Route A', date=date(2025, 1, 15), periode='matin')
+
+        latitudes, longitudes = points_aleatoires(12, graine=3)
+        for position, (lat, lon) in enumerate(zip(latitudes, longitudes)):
+            livraison = Livraison.objects.create(
+                numero_livraison=str(5000 + position), client_nom='Client', adresse_complete='Adresse',
+                date_livraison=date(2025, 1, 15), periode='matin',
+                latitude=round(lat, 6), longitude=round(lon, 6),
+            )
+            LivraisonRoute.objects.create(route=self.route, livraison=livraison, ordre=position)
+        LivraisonRoute.objects.create(
+            route=self.route, ordre=99,
+            livraison=Livraison.objects.create(
+                numero_livraison='5999', client_nom='Client', adresse_complete='Adresse',
+                date_livraison=date(2025, 1, 15), periode='matin',
+            ),
+        )
+
+    def test_optimiser_ecrit_l_ordre(self):
+        reponse = self.client.post(reverse('livraison:optimiser_route', args=[self.route.id]))
+        donnees = reponse.json()
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertLess(donnees['apres']['distance_km'], donnees['avant']['distance_km'])
+        self.assertEqual(donnees['sans_coordonnees'], ['5999'])
+
+        ordres = list(LivraisonRoute.objects.filter(route=self.route).order_by('ordre').values_list('livraison__numero_livraison', 'ordre'))
+        self.assertEqual([numero for numero, _ in ordres], [livraison['numero'] for livraison in donnees['livraisons']])
+        self.assertEqual([ordre for _, ordre in ordres], list(range(13)))
+        self.assertEqual(ordres[-1][0], '5999')
+
+    def test_apercu_sans_ecriture(self):
+        reponse = self.client.post(
+            reverse('livraison:optimiser_route', args=[self.route.id]),
+            data=json.dumps({'appliquer': False}), content_type='application/json'
+        )
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            list(LivraisonRoute.objects.filter(route=self.route).order_by('ordre').values_list('ordre', flat=True)),
+            list(range(12)) + [99]
+        )
+
+
+@override_settings(ROUTAGE_DEPOT=None, ROUTAGE_TEMPS_SERVICE_MIN=5, ROUTAGE_TEMPS_SERVICE_PAR_MODE={})
+class ProjectionETATests(MatricesTemporairesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Utilisateur = get_user_model()
+        self.client.force_login(Utilisateur.objects.create_user('resp', password='x', role='resp_livraison'))
+        self.route = Route.objects.create(
+            nom='Route ETA', date=date(2025, 1, 15), periode='matin', heure_depart=heure(8, 0)
+        )
+        # Arrêts à ~1,1 km les uns des autres vers le nord (≈ 2,2 min à 30 km/h)
+        self.livraisons = []
+        for position, souhaitee in enumerate([heure(8, 0), heure(8, 30), heure(8, 5), heure(9, 0)]):
+            livraison = Livraison.objects.create(
+                numero_livraison=str(8000 + position), client_nom='Client', adresse_complete='Adresse',
+                date_livraison=self.route.date, periode='matin', heure_souhaitee=souhaitee,
+                latitude=45.50 + 0.01 * position, longitude=-73.57, status='assignee',
+            )
+            LivraisonRoute.objects.create(route=self.route, livraison=livraison, ordre=position)
+            self.livraisons.append(livraison)
+
+    def etas(self):
+        return {
+            lr.livraison.numero_livraison: lr
+            for lr in LivraisonRoute.objects.filter(route=self.route).select_related('livraison')
+        }
+
+    def test_projection_et_retards(self):
+        reponse = self.client.get(reverse('livraison:routes_json'), {'date': '2025-01-15'}).json()
+        route = reponse['routes'][0]
+        arrets = {l['numero']: l for l in route['livraisons']}
+
+        self.assertEqual(arrets['8000']['arrivee_estimee'], '08:00')
+        # 8:05 de service, ~2 min de trajet, puis attente jusqu'à l'ouverture (8:30 - 30 min)
+        self.assertEqual(arrets['8001']['arrivee_estimee'], '08:07')
+        self.assertFalse(arrets['8001']['en_retard'])
+        # Arrivée ~8:14 pour 8:05 souhaitée
+        self.assertTrue(arrets['8002']['en_retard'])
+        self.assertGreaterEqual(arrets['8002']['retard_min'], 8)
+        self.assertEqual(route['retards'], 1)
+
+    def test_reordonner_ne_recalcule_que_la_suite(self):
+        ProjectionETAService().projeter(self.route)
+        retard_avant = self.etas()['8002'].retard_estime_min
+        # Valeur témoin sur le premier arrêt: elle doit survivre au recalcul partiel
+        LivraisonRoute.objects.filter(livraison=self.livraisons[0]).update(retard_estime_min=99)
+
+        ordre = [self.livraisons[i].id for i in (0, 2, 1, 3)]
+        reponse = self.client.post(
+            reverse('livraison:reordonner_route', args=[self.route.id]),
+            data=json.dumps({'ordre': [str(i) for i in ordre]}), content_type='application/json'
+        ).json()
+
+        self.assertEqual([l['id'] for l in reponse['livraisons']], [str(i) for i in ordre])
+        etas = self.etas()
+        self.assertEqual(etas['8000'].retard_estime_min, 99)
+        # Servi en deuxième: ~8:09 au lieu de ~8:14
+        self.assertLess(etas['8002'].retard_estime_min, retard_avant)
+        self.assertEqual(reponse['livraisons'][1]['retard_min'], etas['8002'].retard_estime_min)
+
+        # Résultat identique à une projection complète (hors arrêt témoin)
+        LivraisonRoute.objects.filter(livraison=self.livraisons[0]).update(retard_estime_min=0)
+        partielles = {n: (lr.arrivee_estimee, lr.depart_estime) for n, lr in etas.items()}
+        LivraisonRoute.objects.filter(route=self.route).update(arrivee_estimee=None, depart_estime=None)
+        ProjectionETAService().projeter(self.route)
+        completes = {n: (lr.arrivee_estimee, lr.depart_estime) for n, lr in self.etas().items()}
+        self.assertEqual(partielles, completes)
+
+
+@override_settings(ROUTAGE_DEPOT=None, ROUTAGE_TEMPS_SERVICE_MIN=5, ROUTAGE_TEMPS_SERVICE_PAR_MODE={})
+class TempsTrajetTests(MatricesTemporairesMixin, TestCase):
+
+    def creer_route_terminee(self, jour, debut=heure(9, 0)):
+        """Route livrée vers le nord: ~1,1 km et 6 min 40 de trajet entre arrêts (~10 km/h)"""
+        route = Route.objects.create(nom=f'Route {jour}', date=jour, periode='matin', status='terminee')
+        depart = timezone.make_aware(datetime.combine(jour, debut))
+        for position in range(4):
+            livraison = Livraison.objects.create(
+                numero_livraison=f"{jour:%d}{position}", client_nom='Client', adresse_complete='Adresse',
+                date_livraison=jour, periode='matin', code_postal='H2X 1Y4', status='livree',
+                latitude=45.50 + 0.01 * position, longitude=-73.57,
+                heure_livraison_reelle=depart + timedelta(minutes=(5 + 6.67) * position),
+            )
+            LivraisonRoute.objects.create(route=route, livraison=livraison, ordre=position)
+        return route
+
+    def test_apprentissage_incremental(self):
+        self.creer_route_terminee(date(2025, 1, 10))
+        resultat = apprendre(jusqu_au=date(2025, 1, 20))
+        self.assertEqual((resultat['routes'], resultat['trajets']), (1, 3))
+
+        ligne = VitesseTrajet.objects.get()
+        self.assertEqual((ligne.zone, ligne.heure), ('H2X', 9))
+        self.assertAlmostEqual(ligne.distance_km * 60 / ligne.duree_min, 10, delta=0.2)
+
+        # Nuit suivante: seules les nouvelles routes sont lues
+        self.assertEqual(apprendre(jusqu_au=date(2025, 1, 20))['routes'], 0)
+        self.creer_route_terminee(date(2025, 1, 12))
+        self.assertEqual(apprendre(jusqu_au=date(2025, 1, 20))['routes'], 1)
+        self.assertEqual(VitesseTrajet.objects.get().nb_trajets, 6)
+
+        # Case lissée vers la vitesse de l'heure, heure inconnue: vitesse par défaut
+        modele = modele_temps_trajet()
+        self.assertLess(modele.vitesse('H2X', 9), 15)
+        self.assertEqual(modele.vitesse('H2X', 14), modele.vitesse_defaut)
+
+    def test_projection_avec_vitesses_apprises(self):
+        self.creer_route_terminee(date(2025, 1, 10))
+        apprendre(jusqu_au=date(2025, 1, 20))
+
+        route = Route.objects.create(nom='Demain', date=date(2025, 1, 21), periode='matin', heure_depart=heure(9, 0))
+        for position in range(2):
+            livraison = Livraison.objects.create(
+                numero_livraison=f"99{position}", client_nom='Client', adresse_complete='Adresse',
+                date_livraison=route.date, periode='matin', code_postal='H2X1Y4',
+                latitude=45.50 + 0.02 * position, longitude=-73.57, status='assignee',
+            )
+            LivraisonRoute.objects.create(route=route, livraison=livraison, ordre=position)
+
+        liens = ProjectionETAService().projeter(route)
+        # 2,2 km à la vitesse apprise (lissée) au lieu de 30 km/h (4 min 24)
+        trajet = datetime.combine(route.date, liens[1].arrivee_estimee) - datetime.combine(route.date, liens[0].depart_estime)
+        self.assertGreater(trajet, timedelta(minutes=6))
+
+
+class RepartitionAutomatiqueTests(MatricesTemporairesMixin, TestCase):
+
+    def setUp(self):
+        Utilisateur = get_user_model()
+        self.responsable = Utilisateur.objects.create_user('resp', password='x', role='resp_livraison')
+        self.client.force_login(self.responsable)
+        self.jour = date(2025, 1, 15)
+
+        self.livreurs = []
+        for nom, debut in [('ana', heure(6, 0)), ('bob', heure(6, 30)), ('cleo', heure(6, 0))]:
+            livreur = Utilisateur.objects.create_user(nom, password='x', role='livreur')
+            DisponibiliteLivreur.objects.create(
+                livreur=livreur, date_debut=self.jour, date_fin=self.jour,
+                type_dispo='disponible', heure_debut_shift=debut
+            )
+            self.livreurs.append(livreur)
+        DisponibiliteLivreur.objects.create(
+            livreur=self.livreurs[2], date_debut=self.jour, date_fin=self.jour, type_dispo='conge'
+        )
+
+        for immatriculation, places in [('AAA111', 4), ('BBB222', 3)]:
+            Vehicule.objects.create(
+                marque='Ford', modele='Transit', annee=2020, immatriculation=immatriculation,
+                couleur='Blanc', nombre_places=places
+            )
+
+        # Deux groupes d'adresses: centre-ville et Laval
+        points = [(45.500, -73.570), (45.502, -73.572), (45.504, -73.568), (45.506, -73.566),
+                  (45.570, -73.750), (45.572, -73.752), (45.574, -73.748)]
+        for position, (lat, lon) in enumerate(points):
+            Livraison.objects.create(
+                numero_livraison=str(6000 + position), client_nom='Client', adresse_complete='Adresse',
+                date_livraison=self.jour, periode='matin', heure_souhaitee=heure(8, 0),
+                latitude=lat, longitude=lon,
+            )
+
+    def proposer(self):
+        reponse = self.client.post(
+            reverse('livraison:repartition_auto_apercu'),
+            data=json.dumps({'date': '2025-01-15', 'periode': 'matin'}), content_type='application/json'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_proposition_respecte_capacites_et_disponibilites(self):
+        proposition = self.proposer()
+
+        self.assertEqual(proposition['non_assignees'], [])
+        self.assertEqual(len(proposition['routes']), 2)
+        self.assertNotIn(self.livreurs[2].id, [route['livreurs'][0] for route in proposition['routes']])
+        for route in proposition['routes']:
+            self.assertLessEqual(len(route['livraisons']), route['capacite'])
+            # Une route par groupe d'adresses
+            self.assertEqual(len({livraison['numero'] < '6004' for livraison in route['livraisons']}), 1)
+        self.assertFalse(Route.objects.exists())
+
+    def test_validation_en_bloc(self):
+        proposition = self.proposer()
+
+        reponse = self.client.post(
+            reverse('livraison:repartition_auto_valider'),
+            data=json.dumps({'date': '2025-01-15', 'periode': 'matin', 'routes': proposition['routes']}),
+            content_type='application/json'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(Route.objects.count(), 2)
+        self.assertFalse(Livraison.objects.exclude(status='assignee').exists())
+
+        route = Route.objects.get(nom=proposition['routes'][0]['nom'])
+        self.assertEqual(list(route.livreurs.values_list('id', flat=True)), proposition['routes'][0]['livreurs'])
+        self.assertEqual(
+            list(LivraisonRoute.objects.filter(route=route).order_by('ordre').values_list('livraison__numero_livraison', flat=True)),
+            [livraison['numero'] for livraison in proposition['routes'][0]['livraisons']]
+        )
+        self.assertEqual(route.nb_livraisons, len(proposition['routes'][0]['livraisons']))
+        self.assertEqual(resumes.resume_jour(date(2025, 1, 15))['nb_assignee'], Livraison.objects.count())
+
+        # Deuxième validation de la même proposition: refusée, rien d'écrit
+        reponse = self.client.post(
+            reverse('livraison:repartition_auto_valider'),
+            data=json.dumps({'date': '2025-01-15', 'periode': 'matin', 'routes': proposition['routes']}),
+            content_type='application/json'
+        )
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(Route.objects.count(), 2)
+
+
+class ReseauRoutierTests(MatricesTemporairesMixin, TestCase):
+    """Extrait livraison/fixtures/reseau_test.osm: deux rives, un seul pont au nord (lat 45.52)"""
+
+    def setUp(self):
+        super().setUp()
+        self.dossier_reseau = os.path.join(self.dossier_matrices, 'reseau')
+        construire_reseau(
+            os.path.join(os.path.dirname(__file__), 'fixtures', 'reseau_test.osm'), self.dossier_reseau
+        )
+        self.reseau = ReseauRoutier(self.dossier_reseau)
+
+    def test_plus_courts_chemins(self):
+        ouest, est = (45.50, -73.58), (45.50, -73.56)
+        # La passerelle piétonne est ignorée: détour par le pont (2 × 2,2 km + 1,6 km)
+        self.assertAlmostEqual(self.reseau.trajet(ouest, est), 6.0, delta=0.1)
+
+        source, _ = self.reseau.plus_proche_noeud(*ouest)
+        cibles = [self.reseau.plus_proche_noeud(lat, lon)[0] for lat, lon in [(45.52, -73.54), (45.51, -73.60)]]
+        dijkstra = self.reseau.dijkstra(source, cibles)
+        a_etoile = [self.reseau.a_etoile(source, cible)[0] for cible in cibles]
+        np.testing.assert_allclose(dijkstra, a_etoile, rtol=1e-6)
+
+        # Rue à sens unique vers l'est: le retour fait le tour du quadrillage
+        a, b = (45.50, -73.56), (45.50, -73.54)
+        self.assertLess(self.reseau.trajet(a, b), self.reseau.trajet(b, a))
+        np.testing.assert_allclose(
+            self.reseau.un_vers_plusieurs(b, [a], inverse=True), [self.reseau.trajet(a, b)], rtol=1e-6
+        )
+
+    def test_matrice_routiere(self):
+        jour = date(2025, 1, 15)
+        for position, (lat, lon) in enumerate([(45.50, -73.58), (45.50, -73.56)]):
+            Livraison.objects.create(
+                numero_livraison=str(9100 + position), client_nom='Client', adresse_complete='Adresse',
+                date_livraison=jour, periode='matin', latitude=lat, longitude=lon,
+            )
+        a, b = Livraison.objects.order_by('numero_livraison')
+
+        matrice = matrice_jour(jour)
+        self.assertLess(matrice.distance(a.id, b.id), 2)
+        with override_settings(RESEAU_ROUTIER_DOSSIER=self.dossier_reseau):
+            # Changement de source: toutes les cases sont recalculées
+            self.assertEqual(matrice.synchroniser({a.id: (45.50, -73.58), b.id: (45.50, -73.56)})['deplacees'], 2)
+            self.assertAlmostEqual(matrice.distance(a.id, b.id), 6.0, delta=0.1)
+            self.assertGreater(matrice.temps(a.id, b.id), 10)
+
+
+class RegroupementTests(MatricesTemporairesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        Utilisateur = get_user_model()
+        self.client.force_login(Utilisateur.objects.create_user('resp', password='x', role='resp_livraison'))
+        self.jour = date(2025, 1, 15)
+        for nom in ('ana', 'bob', 'cleo'):
+            DisponibiliteLivreur.objects.create(
+                livreur=Utilisateur.objects.create_user(nom, password='x', role='livreur'),
+                date_debut=self.jour, date_fin=self.jour, type_dispo='disponible'
+            )
+
+        # Trois quartiers de 4 adresses, plus une livraison sans coordonnées
+        centres = [(45.50, -73.57), (45.57, -73.75), (45.52, -73.45)]
+        for q, (lat, lon) in enumerate(centres):
+            for i in range(4):
+                Livraison.objects.create(
+                    numero_livraison=f"{7000 + q * 10 + i}", client_nom='Client', adresse_complete='Adresse',
+                    date_livraison=self.jour, periode='matin', nb_convives=10 + i,
+                    latitude=lat + 0.002 * i, longitude=lon - 0.002 * i,
+                )
+        Livraison.objects.create(
+            numero_livraison='7999', client_nom='Client', adresse_complete='Adresse',
+            date_livraison=self.jour, periode='matin'
+        )
+
+    def test_kmedoides_respecte_la_capacite(self):
+        lats, lons = points_aleatoires(60, graine=4)
+        distances = matrice_distances(lats, lons)
+        etiquettes, medoides = kmedoides_capacite(distances, 4, capacite=16)
+
+        self.assertEqual(len(medoides), 4)
+        self.assertLessEqual(np.bincount(etiquettes).max(), 16)
+        self.assertTrue((etiquettes >= 0).all())
+
+        etiquettes, centres = kmeans(projeter(lats, lons), 4)
+        self.assertEqual(len(np.unique(etiquettes)), 4)
+
+    def test_groupes_par_livreur_dans_livraisons_json(self):
+        for methode in ('kmedoides', 'kmeans'):
+            reponse = self.client.get(reverse('livraison:livraisons_json'), {
+                'date': '2025-01-15', 'periode': 'matin', 'groupes': '1', 'methode': methode,
+            }).json()
+
+            self.assertEqual(len(reponse['groupes']), 3)
+            for groupe in reponse['groupes']:
+                self.assertEqual(groupe['nb_livraisons'], 4)
+                self.assertEqual(groupe['nb_convives'], 10 + 11 + 12 + 13)
+                self.assertLess(groupe['rayon_km'], 1)
+            par_quartier = {}
+            for livraison in reponse['livraisons']:
+                if livraison['numero'] == '7999':
+                    self.assertIsNone(livraison['groupe'])
+                else:
+                    par_quartier.setdefault(livraison['numero'][:3], set()).add(livraison['groupe'])
+            self.assertEqual(sorted(len(groupes) for groupes in par_quartier.values()), [1, 1, 1])
+
+        sans_option = self.client.get(reverse('livraison:livraisons_json'), {'date': '2025-01-15'}).json()
+        self.assertNotIn('groupes', sans_option)
+
+
+@override_settings(ROUTAGE_DEPOT=(45.50, -73.57))
+class SimulationRepartitionTests(MatricesTemporairesMixin, TestCase):
+
+    def test_scenarios_d_effectif(self):
+        journee = journee_synthetique(30, graine=3)
+        scenarios = scenarios_croises([2, 4], [10], [heure(7, 0)], [5, 10])
+        resultats = SimulationRepartition(journee, workers=2, duree_max=0.2).executer(scenarios)
+
+        par_cle = {(s['livreurs'], s['temps_service']): s for s in resultats['scenarios']}
+        self.assertEqual(len(par_cle), 4)
+        # 2 livreurs × 10 arrêts ne couvrent pas 30 arrêts
+        self.assertEqual(par_cle[(2, 5)]['non_placees'], 10)
+        self.assertEqual(par_cle[(4, 5)]['non_placees'], 0)
+        for scenario in resultats['scenarios']:
+            self.assertEqual(sum(r['arrets'] for r in scenario['routes']) + scenario['non_placees'], 30)
+            self.assertGreater(scenario['duree_route_max_min'], 0)
+        self.assertEqual(resultats['parametres']['workers'], 2)
+
+    def test_journee_historique(self):
+        jour = date(2025, 1, 15)
+        for lat, lon in zip(*points_aleatoires(5, graine=2)):
+            Livraison.objects.create(
+                numero_livraison=f"{lat:.5f}", client_nom='Client', adresse_complete='Adresse',
+                date_livraison=jour, periode='matin', latitude=lat, longitude=lon, heure_souhaitee=heure(9, 0),
+            )
+        journee = journee_historique(jour, 'matin')
+        self.assertEqual(len(journee), 5)
+        self.assertEqual(journee.distances.shape, (6, 6))
+
+        resultat = SimulationRepartition(journee, workers=1, duree_max=0.1).executer(
+            scenarios_croises([1], [10], [heure(8, 30)], [5])
+        )['scenarios'][0]
+        self.assertEqual(resultat['routes_utilisees'], 1)
+        self.assertEqual(resultat['non_placees'], 0)
+
+
+class SuiviGPSTests(TestCase):
+
+    def setUp(self):
+        Utilisateur = get_user_model()
+        self.livreur = Utilisateur.objects.create_user('ana', password='x', role='livreur')
+        self.client.force_login(self.livreur)
+        self.route = Route.objects.create(nom='Route GPS', date=date(2025, 1, 15), periode='matin', status='en_cours')
+        self.route.livreurs.add(self.livreur)
+        self.debut = timezone.make_aware(datetime(2025, 1, 15, 8, 0))
+
+    def pings(self, nombre, decalage=0):
+        return [
+            {
+                't': (self.debut + timedelta(seconds=5 * (decalage + i))).isoformat(),
+                'lat': 45.5 + 0.0001 * (decalage + i), 'lon': -73.57, 'precision': 8,
+            }
+            for i in range(nombre)
+        ]
+
+    def envoyer(self, pings):
+        return self.client.post(
+            reverse('livraison:envoyer_positions_gps', args=[self.route.id]),
+            data=json.dumps({'pings': pings}), content_type='application/json'
+        )
+
+    def test_codec_compact_et_exact(self):
+        points = gps.points_depuis_pings([
+            (self.debut + timedelta(seconds=3 * i), 45.5 + 1e-5 * i, -73.57 - 2e-5 * i, 5) for i in range(500)
+        ])
+        donnees = gps.encoder(points)
+        self.assertLess(len(donnees), 500 * 4)
+        np.testing.assert_array_equal(gps.decoder(donnees), points)
+
+    def test_lots_segments_et_relecture(self):
+        with mock.patch.object(gps, 'TAILLE_SEGMENT', 64):
+            for lot in range(5):
+                reponse = self.envoyer(self.pings(30, decalage=30 * lot)).json()
+                self.assertEqual(reponse['recus'], 30)
+            # Renvoi d'un lot déjà reçu (réseau instable): ignoré
+            self.assertEqual(self.envoyer(self.pings(30, decalage=120)).json()['ignores'], 30)
+
+        self.assertEqual(sum(SegmentGPS.objects.values_list('nb_points', flat=True)), 150)
+        self.assertEqual(SegmentGPS.objects.count(), 3)
+
+        trajet = self.client.get(reverse('livraison:trajet_gps_route', args=[self.route.id])).json()
+        self.assertEqual(trajet['nb_points'], 150)
+        self.assertAlmostEqual(trajet['points'][-1][1], 45.5 + 0.0001 * 149, places=6)
+
+        depuis = (self.debut + timedelta(seconds=5 * 139)).isoformat()
+        suite = self.client.get(reverse('livraison:trajet_gps_route', args=[self.route.id]), {'depuis': depuis}).json()
+        self.assertEqual(suite['nb_points'], 10)
+
+        positions = self.client.get(reverse('livraison:positions_routes')).json()['positions']
+        self.assertEqual(len(positions), 1)
+        self.assertAlmostEqual(positions[0]['latitude'], 45.5 + 0.0001 * 149, places=6)
+
+    def test_refus_hors_route_en_cours(self):
+        self.route.status = 'terminee'
+        self.route.save()
+        self.assertEqual(self.envoyer(self.pings(3)).status_code, 400)
+
+
+class TableauRoutesTests(TestCase):
+
+    def setUp(self):
+        Utilisateur = get_user_model()
+        self.client.force_login(Utilisateur.objects.create_user('resp2', password='x', role='resp_livraison'))
+        self.livreurs = [
+            Utilisateur.objects.create_user(f'liv{i}', password='x', role='livreur', first_name=f'Livreur{i}')
+            for i in range(2)
+        ]
+        self.mode = ModeEnvoi.objects.create(nom='Camion')
+        self.jour = date(2025, 1, 15)
+        self.numero = 3000
+
+    def creer_routes(self, nombre, arrets=4):
+        for r in range(nombre):
+            route = Route.objects.create(nom=f'Route {r}', date=self.jour, periode='matin')
+            route.livreurs.add(*self.livreurs)
+            for position in range(arrets):
+                self.numero += 1
+                livraison = Livraison.objects.create(
+                    numero_livraison=str(self.numero), client_nom='Client', adresse_complete='Adresse',
+                    date_livraison=self.jour, periode='matin', mode_envoi=self.mode, status='assignee',
+                )
+                LivraisonRoute.objects.create(route=route, livraison=livraison, ordre=position)
+
+    def requetes(self, nom, parametres):
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.client.get(reverse(nom), parametres).status_code, 200)
+        return len(requetes)
+
+    def test_nombre_de_requetes_fixe(self):
+        self.creer_routes(2)
+        with self.assertNumQueries(TableauRoutesService.REQUETES):
+            routes = TableauRoutesService().serialiser(self.jour, 'matin')
+        self.assertEqual([len(r['livraisons']) for r in routes], [4, 4])
+        self.assertEqual(routes[0]['livraisons'][0]['mode_envoi'], 'Camion')
+        self.assertEqual(len(routes[0]['livreurs_ids']), 2)
+
+        parametres = {'date': '2025-01-15', 'periode': 'matin'}
+        petite_journee = self.requetes('livraison:routes_json', parametres)
+        petit_resume = self.requetes('livraison:resume_journalier', {'date': '2025-01-15'})
+
+        self.creer_routes(10, arrets=6)
+        self.assertEqual(self.requetes('livraison:routes_json', parametres), petite_journee)
+        self.assertEqual(self.requetes('livraison:resume_journalier', {'date': '2025-01-15'}), petit_resume)
+
+    def test_resume_affiche_route_et_livreurs(self):
+        self.creer_routes(1, arrets=1)
+        reponse = self.client.get(reverse('livraison:resume_journalier'), {'date': '2025-01-15'})
+        self.assertContains(reponse, 'Route 0')
+        self.assertContains(reponse, 'Livreur1')
+        self.assertEqual(reponse.context['stats']['assignee'], 1)
+
+
+class PlanningLivreursTests(TestCase):
+
+    def setUp(self):
+        services._grilles.clear()
+        self.livreur = get_user_model().objects.create_user('noe', password='x', role='livreur', first_name='Noé')
+        self.debut = date(2025, 1, 13)
+        self.route = Route.objects.create(nom='Lundi matin', date=self.debut, periode='matin', heure_depart=heure(7, 0))
+        self.route.livreurs.add(self.livreur)
+        for numero, recuperation in (('4001', False), ('4002', False), ('4003', True)):
+            livraison = Livraison.objects.create(
+                numero_livraison=numero, client_nom='Client', adresse_complete='Adresse',
+                date_livraison=self.debut, periode='matin', est_recuperation=recuperation,
+            )
+            LivraisonRoute.objects.create(route=self.route, livraison=livraison)
+        Route.objects.create(nom='Jeudi midi', date=self.debut + timedelta(days=3), periode='midi')
+        Route.objects.create(nom='Hors fenêtre', date=self.debut + timedelta(days=20), periode='matin')
+
+    def test_grille_fenetre_et_invalidation(self):
+        planning = PlanningLivreursService()
+        with self.assertNumQueries(3):  # version, routes annotées, livreurs
+            grille = planning.grille(self.debut)
+
+        self.assertEqual(len(grille), 14)
+        lundi = grille['2025-01-13']['matin'][0]
+        self.assertEqual((lundi['nb_livraisons'], lundi['nb_recuperations']), (3, 1))
+        self.assertEqual(lundi['livreurs'][0]['initiales'], 'N')
+        self.assertEqual(grille['2025-01-16']['midi'][0]['nom'], 'Jeudi midi')
+        self.assertNotIn('Hors fenêtre', json.dumps(grille))
+
+        # Rien n'a changé: seule la version est relue
+        with self.assertNumQueries(1):
+            self.assertIs(planning.grille(self.debut), grille)
+
+        self.route.nom = 'Lundi matin (modifiée)'
+        self.route.save(update_fields=['nom'])
+        self.assertEqual(planning.grille(self.debut)['2025-01-13']['matin'][0]['nom'], 'Lundi matin (modifiée)')
+
+        LivraisonRoute.objects.filter(route=self.route).first().delete()
+        self.assertEqual(planning.grille(self.debut)['2025-01-13']['matin'][0]['nb_livraisons'], 2)
+
+        # Route d'une autre fenêtre: la grille reste en cache
+        Route.objects.filter(nom='Hors fenêtre').get().delete()
+        with self.assertNumQueries(1):
+            planning.grille(self.debut)
+
+    def test_page_gestion_livreurs(self):
+        self.client.force_login(get_user_model().objects.create_user('resp3', password='x', role='resp_livraison'))
+        reponse = self.client.get(reverse('livraison:gestion_livreurs'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.context['jours_planning']), PlanningLivreursService.NB_JOURS)
+
+
+class DisponibilitesIndexTests(TestCase):
+
+    def setUp(self):
+        disponibilites._index['index'] = None
+        Utilisateur = get_user_model()
+        self.ada = Utilisateur.objects.create_user('ada', password='x', role='livreur', first_name='Ada')
+        self.bob = Utilisateur.objects.create_user('bob', password='x', role='livreur', first_name='Bob')
+        self.cyd = Utilisateur.objects.create_user('cyd', password='x', role='livreur', first_name='Cyd')
+        for utilisateur in (self.ada, self.bob, self.cyd):
+            Livreur.objects.create(user=utilisateur)
+        self.jour = date(2025, 3, 10)
+        semaine = dict(date_debut=self.jour, date_fin=self.jour + timedelta(days=6), type_dispo='disponible')
+        DisponibiliteLivreur.objects.create(livreur=self.ada, heure_debut_shift=heure(6, 0), **semaine)
+        DisponibiliteLivreur.objects.create(livreur=self.bob, heure_debut_shift=heure(14, 0), **semaine)
+        DisponibiliteLivreur.objects.create(livreur=self.cyd, **semaine)
+        DisponibiliteLivreur.objects.create(
+            livreur=self.cyd, date_debut=self.jour + timedelta(days=2), date_fin=self.jour + timedelta(days=3), type_dispo='conge',
+        )
+
+    def test_arbre_contre_recherche_lineaire(self):
+        intervalles = []
+        for numero in range(300):
+            dispo = DisponibiliteLivreur(
+                id=numero, livreur_id=numero % 7, type_dispo='disponible',
+                date_debut=self.jour + timedelta(days=(numero * 37) % 90),
+                date_fin=self.jour + timedelta(days=(numero * 37) % 90 + numero % 11),
+            )
+            intervalles.append(disponibilites.Intervalle(dispo))
+        arbre = disponibilites.ArbreIntervalles(intervalles)
+        for debut in range(self.jour.toordinal() - 3, self.jour.toordinal() + 100, 5):
+            fin = debut + 4
+            attendus = {i.id for i in intervalles if i.debut <= fin and i.fin >= debut}
+            self.assertEqual({i.id for i in arbre.chevauchant(debut, fin)}, attendus)
+
+    def test_requetes_point_intervalle_et_libres(self):
+        index = disponibilites.index_disponibilites(self.jour)
+        self.assertEqual(len(index.au(self.jour)), 3)
+        self.assertEqual([i.livreur_id for i in index.au(self.jour + timedelta(days=2), self.cyd.id)], [self.cyd.id] * 2)
+        self.assertEqual(len(index.entre(self.jour + timedelta(days=7), self.jour + timedelta(days=20))), 0)
+
+        # Matin: Bob commence à 14h; mercredi: Cyd est en congé
+        self.assertEqual(set(index.livreurs_libres(self.jour, 'matin')), {self.ada.id, self.cyd.id})
+        self.assertEqual(set(index.livreurs_libres(self.jour + timedelta(days=2), 'apres_midi')), {self.ada.id, self.bob.id})
+        self.assertEqual(set(index.livreurs_libres(self.jour, heure=heure(15, 0), exclure=[self.ada.id])), {self.bob.id, self.cyd.id})
+
+        # Répartition: un livreur déjà sur une route de la période n'est plus proposé
+        route = Route.objects.create(nom='Matin', date=self.jour, periode='matin', heure_depart=heure(7, 0))
+        route.livreurs.add(self.ada)
+        repartition = RepartitionAutomatiqueService()
+        self.assertEqual({livreur.id for livreur, _ in repartition.livreurs_disponibles(self.jour, 'matin')}, {self.cyd.id})
+        self.assertEqual(set(repartition.livreurs_libres_route(route)), {self.ada.id, self.cyd.id})
+
+    def test_mise_a_jour_incrementale(self):
+        index = disponibilites.index_disponibilites(self.jour)
+        conge = DisponibiliteLivreur.objects.create(
+            livreur=self.ada, date_debut=self.jour, date_fin=self.jour, type_dispo='maladie',
+        )
+        # Le signal a mis l'index à jour: seule la version est relue, sans rechargement
+        with self.assertNumQueries(1):
+            self.assertIs(disponibilites.index_disponibilites(self.jour), index)
+            self.assertNotIn(self.ada.id, index.livreurs_libres(self.jour))
+
+        conge.date_debut = conge.date_fin = self.jour + timedelta(days=1)
+        conge.save()
+        self.assertIn(self.ada.id, disponibilites.index_disponibilites(self.jour).livreurs_libres(self.jour))
+
+        conge.delete()
+        self.assertIs(disponibilites.index_disponibilites(self.jour), index)
+        self.assertIn(self.ada.id, index.livreurs_libres(self.jour + timedelta(days=1)))
+
+        # Changement hors ORM (autre processus): la version ne correspond plus, l'index est rechargé
+        DisponibiliteLivreur.objects.filter(livreur=self.bob).update(type_dispo='indisponible', date_maj=timezone.now())
+        self.assertNotIn(self.bob.id, disponibilites.index_disponibilites(self.jour).livreurs_libres(self.jour))
+
+    def test_vues(self):
+        self.client.force_login(get_user_model().objects.create_user('resp4', password='x', role='resp_livraison'))
+        disponibilites.index_disponibilites(self.jour)
+
+        # Une requête par table, quel que soit le nombre de livreurs (session, utilisateur, version, livreurs)
+        with self.assertNumQueries(4):
+            reponse = self.client.get(reverse('livraison:disponibilites_par_date'), {'date': '2025-03-12'})
+        dispos = {livreur['nom']: livreur['dispos'] for livreur in reponse.json()['disponibilites']}
+        self.assertEqual([d['type_dispo'] for d in dispos['Cyd']], ['disponible', 'conge'])
+        self.assertEqual(dispos['Ada'][0]['heure_debut_shift'], '06:00')
+
+        reponse = self.client.get(reverse('livraison:livreurs_json'), {'date': '2025-03-10', 'periode': 'matin'})
+        self.assertEqual({livreur['id'] for livreur in reponse.json()['livreurs']}, {self.ada.id, self.cyd.id})
+
+        reponse = self.client.get(reverse('livraison:disponibilites_json'), {
+            'date_debut': '2025-03-12', 'date_fin': '2025-03-13', 'livreur_id': self.cyd.id,
+        })
+        self.assertEqual([d['type_display'] for d in reponse.json()['disponibilites']], ['Disponible', 'Congé'])
+
+
+class ResumeLivraisonsTests(TestCase):
+
+    def setUp(self):
+        self.jour = date(2025, 4, 2)
+
+    def creer(self, numero, **champs):
+        return Livraison.objects.create(**{
+            'numero_livraison': numero, 'client_nom': 'Client', 'adresse_complete': 'Adresse',
+            'date_livraison': self.jour, 'periode': 'matin', **champs,
+        })
+
+    def compteurs(self):
+        return {
+            (r.date, r.periode): {champ: getattr(r, champ) for champ in resumes.COMPTEURS if getattr(r, champ)}
+            for r in ResumeLivraisonsJour.objects.all()
+        }
+
+    def test_mise_a_jour_incrementale_egale_reconstruction(self):
+        a = self.creer('5001', nb_convives=12, besoin_cafe=True)
+        b = self.creer('5002', nb_convives=8, est_recuperation=True)
+        c = self.creer('5003', periode='midi', besoin_the=True)
+
+        resume = resumes.resume_jour(self.jour)
+        self.assertEqual((resume['nb_total'], resume['nb_non_assignee'], resume['total_convives']), (3, 3, 20))
+        self.assertEqual(resume['par_periode']['matin']['nb_recuperations'], 1)
+        self.assertEqual(resume['par_periode']['apres_midi']['nb_total'], 0)
+
+        a.status = 'livree'
+        a.save()
+        b = Livraison.objects.get(id=b.id)
+        b.date_livraison = self.jour + timedelta(days=1)
+        b.save()
+        c.delete()
+        # Chargée partiellement: la date est recalculée plutôt que devinée
+        d = self.creer('5004')
+        d = Livraison.objects.only('id', 'status', 'date_livraison').get(id=d.id)
+        d.status = 'en_cours'
+        d.save(update_fields=['status'])
+
+        resume = resumes.resume_jour(self.jour)
+        self.assertEqual((resume['nb_total'], resume['nb_livree'], resume['nb_en_cours'], resume['nb_besoin_the']), (2, 1, 1, 0))
+        self.assertEqual(resumes.resume_jour(self.jour + timedelta(days=1))['nb_recuperations'], 1)
+
+        incremental = self.compteurs()
+        resumes.reconstruire()
+        self.assertEqual(self.compteurs(), incremental)
+
+    def test_ecritures_en_lot_et_commande(self):
+        self.creer('5101')
+        self.creer('5102')
+        Livraison.objects.filter(date_livraison=self.jour).update(status='annulee')
+        self.assertEqual(resumes.resume_jour(self.jour)['nb_annulee'], 0)
+
+        sortie = io.StringIO()
+        call_command('reconstruire_resumes', date='2025-04-02', stdout=sortie)
+        self.assertIn('1 résumé(s)', sortie.getvalue())
+        with self.assertNumQueries(1):
+            self.assertEqual(resumes.resume_jour(self.jour)['nb_annulee'], 2)
+
+    def test_decrement_borne_a_zero(self):
+        livraison = self.creer('5301', nb_convives=10)
+        ResumeLivraisonsJour.objects.update(nb_total=0, nb_non_assignee=0, total_convives=4)
+
+        livraison.status = 'assignee'
+        with self.assertLogs('livraison.resumes', 'WARNING'):
+            livraison.save()
+        with self.assertLogs('livraison.resumes', 'WARNING'):
+            livraison.delete()
+
+        resume = resumes.resume_jour(self.jour)
+        self.assertEqual((resume['nb_total'], resume['nb_non_assignee'], resume['nb_assignee'], resume['total_convives']), (0, 0, 0, 0))
+
+    def test_tableau_de_bord(self):
+        self.creer('5201', status='livree')
+        self.creer('5202', periode='apres_midi')
+        self.client.force_login(get_user_model().objects.create_user('resp5', password='x', role='resp_livraison'))
+        reponse = self.client.get(reverse('livraison:dashboard_responsable'), {'date': '2025-04-02'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual((reponse.context['stats']['total'], reponse.context['stats']['livrees']), (2, 1))
+        self.assertEqual(reponse.context['par_periode']['apres_midi']['nb_total'], 1)
+
+
+class CompteursRouteTests(TestCase):
+
+    def setUp(self):
+        self.route = Route.objects.create(nom='Route A', date=date(2025, 5, 6), periode='matin', status='en_cours')
+        self.livraisons = [
+            Livraison.objects.create(
+                numero_livraison=f"70{n}", client_nom='Client', adresse_complete='Adresse',
+                date_livraison=date(2025, 5, 6), periode='matin', status='assignee',
+            )
+            for n in range(3)
+        ]
+        for ordre, livraison in enumerate(self.livraisons):
+            LivraisonRoute.objects.create(route=self.route, livraison=livraison, ordre=ordre)
+
+    def test_compteurs_suivent_arrets_et_statuts(self):
+        perimee = Route.objects.get(id=self.route.id)
+        self.assertEqual((perimee.nb_livraisons, perimee.nb_livrees, perimee.nb_en_cours), (3, 0, 0))
+
+        premiere, deuxieme, troisieme = self.livraisons
+        premiere.status = 'livree'
+        premiere.save()
+        deuxieme.status = 'en_cours'
+        deuxieme.save()
+        troisieme.delete()  # Arrêt supprimé en cascade
+
+        route = Route.objects.get(id=self.route.id)
+        with self.assertNumQueries(0):
+            self.assertEqual((route.nb_livraisons, route.livraisons_livrees(), route.livraisons_en_cours()), (2, 1, 1))
+            self.assertEqual(route.taux_completion(), 50.0)
+            self.assertFalse(route.verifier_completion_auto())
+
+        # Une instance chargée avant ces changements, sauvée avec update_fields, ne réécrit pas les compteurs
+        perimee.commentaire = 'Modifiée'
+        perimee.save(update_fields=['commentaire'])
+        route.refresh_from_db()
+        self.assertEqual((route.commentaire, route.nb_livraisons, route.nb_livrees), ('Modifiée', 2, 1))
+
+    def test_sauvegarde_complete_inchangee(self):
+        # save() sans update_fields garde le comportement Django: compteurs écrits, ligne recréée au besoin
+        route = Route.objects.get(id=self.route.id)
+        route.nb_livraisons = 5
+        route.save()
+        self.assertEqual(Route.objects.get(id=route.id).nb_livraisons, 5)
+
+        Route.objects.filter(id=route.id).delete()
+        route.save()
+        self.assertTrue(Route.objects.filter(id=route.id).exists())
+
+    def test_vue_de_modification_preserve_les_compteurs(self):
+        self.client.force_login(get_user_model().objects.create_user('resp8', password='x', role='resp_livraison'))
+        with mock.patch('livraison.views.Route.objects.get', return_value=Route.objects.get(id=self.route.id)):
+            self.livraisons[0].status = 'livree'
+            self.livraisons[0].save()
+            reponse = self.client.put(
+                reverse('livraison:modifier_route', args=[self.route.id]),
+                json.dumps({'nom': 'Route B'}), content_type='application/json'
+            )
+        self.assertEqual(reponse.status_code, 200)
+        self.route.refresh_from_db()
+        self.assertEqual((self.route.nom, self.route.nb_livrees), ('Route B', 1))
+
+    def test_dernier_arret_livre_termine_la_route(self):
+        self.client.force_login(get_user_model().objects.create_user('liv6', password='x', role='livreur'))
+        for livraison in self.livraisons:
+            reponse = self.client.post(reverse('livraison:marquer_livree', args=[livraison.id]))
+            self.assertEqual(reponse.status_code, 200)
+        self.route.refresh_from_db()
+        self.assertEqual((self.route.status, self.route.nb_livrees), ('terminee', 3))
+
+    def test_decrement_borne_a_zero(self):
+        # Compteurs décalés à zéro: le retrait d'arrêt et le changement de statut passent quand même
+        self.livraisons[0].status = 'en_cours'
+        self.livraisons[0].save()
+        Route.objects.filter(id=self.route.id).update(nb_livraisons=0, nb_en_cours=0)
+
+        self.livraisons[0].status = 'livree'
+        with self.assertLogs('livraison.progression', 'WARNING'):
+            self.livraisons[0].save()
+        with self.assertLogs('livraison.progression', 'WARNING'):
+            LivraisonRoute.objects.filter(livraison=self.livraisons[1]).delete()
+
+        self.route.refresh_from_db()
+        self.assertEqual((self.route.nb_livraisons, self.route.nb_livrees, self.route.nb_en_cours), (0, 1, 0))
+        self.assertEqual(Livraison.objects.get(id=self.livraisons[0].id).status, 'livree')
+
+    def test_reparation(self):
+        Route.objects.filter(id=self.route.id).update(nb_livraisons=9, nb_en_cours=4)
+        ecarts = progression.reparer(appliquer=False)
+        self.assertEqual(ecarts[0][1], {'nb_livraisons': (9, 3), 'nb_en_cours': (4, 0)})
+
+        sortie = io.StringIO()
+        call_command('reparer_compteurs_routes', stdout=sortie)
+        self.assertIn('1 route(s) corrigée(s)', sortie.getvalue())
+        self.route.refresh_from_db()
+        self.assertEqual((self.route.nb_livraisons, self.route.nb_en_cours), (3, 0))
+        self.assertEqual(progression.reparer(), [])
+
+
+class EvenementsTests(TestCase):
+
+    def setUp(self):
+        Utilisateur = get_user_model()
+        self.livreur = Utilisateur.objects.create_user('leo', password='x', role='livreur')
+        self.client.force_login(self.livreur)
+        self.jour = date(2025, 1, 15)
+        self.route = Route.objects.create(nom='Route SSE', date=self.jour, periode='matin', status='en_cours')
+        self.route.livreurs.add(self.livreur)
+        self.livraison = Livraison.objects.create(
+            numero_livraison='2001', client_nom='A', adresse_complete='10 rue Ontario, Montréal',
+            date_livraison=self.jour, periode='matin', status='en_cours'
+        )
+        LivraisonRoute.objects.create(route=self.route, livraison=self.livraison, ordre=0)
+        self.depart = evenements.dernier_id()
+
+    def lire_flux(self, **entetes):
+        with mock.patch.object(evenements, 'DUREE_FLUX_WSGI_S', 0):
+            reponse = self.client.get(reverse('livraison:flux_evenements'), {'date': '2025-01-15'}, **entetes)
+            self.assertEqual(reponse['Content-Type'], 'text/event-stream')
+            return b''.join(reponse.streaming_content).decode()
+
+    def test_marquer_livree_publie_livraison_et_route(self):
+        self.client.post(reverse('livraison:marquer_livree', args=[self.livraison.id]))
+
+        publies = evenements.evenements_depuis(self.depart)
+        self.assertEqual([e['type'] for e in publies], ['livraison', 'route'])
+        self.assertEqual(publies[0]['donnees']['status'], 'livree')
+        self.assertEqual(publies[0]['route'], str(self.route.id))
+        self.assertEqual(publies[1]['donnees']['status'], 'terminee')
+
+        # Sauvegarde sans changement de statut: rien de publié
+        Livraison.objects.get(id=self.livraison.id).save()
+        self.assertEqual(len(evenements.evenements_depuis(self.depart)), 2)
+
+    def test_reprise_last_event_id(self):
+        autre_jour = Route.objects.create(nom='Autre', date=date(2025, 1, 16), periode='matin')
+        autre_jour.status = 'en_cours'
+        autre_jour.save()
+        Livraison.objects.filter(id=self.livraison.id).update(status='livree')
+        self.assertEqual(self.client.post(reverse('livraison:terminer_route', args=[self.route.id])).status_code, 200)
+
+        flux = self.lire_flux(HTTP_LAST_EVENT_ID=str(self.depart))
+        self.assertNotIn(str(autre_jour.id), flux)
+        self.assertIn('event: route\n', flux)
+        self.assertIn('"status":"terminee"', flux)
+
+        # Rien de manqué depuis le dernier id: seulement la directive de reconnexion
+        flux = self.lire_flux(HTTP_LAST_EVENT_ID=str(evenements.dernier_id()))
+        self.assertNotIn('event:', flux)
+
+        # Id inconnu du journal: le client doit tout recharger
+        self.assertIn('event: reset\n', self.lire_flux(HTTP_LAST_EVENT_ID=str(evenements.dernier_id() + 50)))
+
+    def test_flux_asgi_diffuse_les_nouveaux_evenements(self):
+        filtre = evenements.FiltreEvenements(date=self.jour)
+
+        async def lire():
+            flux = evenements.flux_asgi(filtre, duree=5)
+            blocs = [await flux.__anext__(), await flux.__anext__()]
+            await sync_to_async(evenements.publier_ordre)(self.route)
+            await sync_to_async(evenements.publier)('ordre', date(2025, 1, 16))
+            blocs.append(await flux.__anext__())
+            await flux.aclose()
+            return blocs
+
+        with mock.patch.object(evenements, 'INTERVALLE_S', 0.01):
+            retry, pret, ordre = async_to_sync(lire)()
+        self.assertTrue(retry.startswith('retry:'))
+        self.assertEqual(pret, f"id: {self.depart}\nevent: pret\ndata: {{}}\n\n")
+        self.assertIn('event: ordre\n', ordre)
+        self.assertIn(str(self.route.id), ordre)
+
+
+class MatriceDistancesTests(MatricesTemporairesMixin, TestCase):
+
+    def creer_livraisons(self, nombre, debut=0):
+        latitudes, longitudes = points_aleatoires(nombre, graine=debut + 7)
+        return [
+            Livraison.objects.create(
+                numero_livraison=str(7000 + debut + position), client_nom='Client', adresse_complete='Adresse',
+                date_livraison=date(2025, 1, 15), periode='matin',
+                latitude=round(lat, 6), longitude=round(lon, 6),
+            )
+            for position, (lat, lon) in enumerate(zip(latitudes, longitudes))
+        ]
+
+    def verifier(self, matrice, livraisons):
+        attendu = matrice_distances([float(l.latitude) for l in livraisons], [float(l.longitude) for l in livraisons])
+        np.testing.assert_allclose(matrice.sous_matrice([l.id for l in livraisons]), attendu, rtol=1e-5, atol=1e-4)
+
+    def test_synchronisation_incrementale(self):
+        livraisons = self.creer_livraisons(10)
+        matrice = matrice_jour(date(2025, 1, 15))
+        self.verifier(matrice, livraisons)
+        self.assertAlmostEqual(
+            matrice.distance(livraisons[0].id, livraisons[1].id),
+            matrice_distances([float(livraisons[0].latitude), float(livraisons[1].latitude)],
+                              [float(livraisons[0].longitude), float(livraisons[1].longitude)])[0, 1],
+            places=3
+        )
+
+        # Déplacement + suppression + ajout: seules ces cases bougent
+        Livraison.objects.filter(id=livraisons[3].id).update(latitude=45.7, longitude=-73.4)
+        livraisons[3].refresh_from_db()
+        livraisons[5].delete()
+        nouvelle = self.creer_livraisons(1, debut=50)[0]
+
+        bilan = matrice.synchroniser({
+            l.id: (l.latitude, l.longitude) for l in Livraison.objects.filter(date_livraison=date(2025, 1, 15))
+        })
+        self.assertEqual(bilan, {'ajoutees': 1, 'deplacees': 1, 'retirees': 1})
+
+        restantes = [l for i, l in enumerate(livraisons) if i != 5] + [nouvelle]
+        self.verifier(matrice, restantes)
+        self.assertEqual(len(matrice), 10)
+
+        # Une autre instance (autre processus) relit les fichiers sans recalcul
+        relue = MatriceDistances(date(2025, 1, 15), self.dossier_matrices)
+        self.verifier(relue, restantes)
+        self.assertEqual(relue.dist.dtype, np.float32)
+
+    def test_cache_des_matrices_borne(self):
+        livraisons = self.creer_livraisons(5)
+        jours = [date(2025, 1, 15) + timedelta(days=i) for i in range(3)]
+
+        with mock.patch('livraison.matrices.MATRICES_MAX', 2), mock.patch.dict('livraison.matrices._matrices', clear=True):
+            premiere = matrice_jour(jours[0])
+            self.assertEqual(len(premiere), 5)
+            matrice_pour_date(jours[1])
+            matrice_pour_date(jours[0])  # Utilisée récemment: gardée
+            matrice_pour_date(jours[2])
+
+            from .matrices import _matrices
+            self.assertEqual([cle[0] for cle in _matrices], [jours[0], jours[2]])
+            evincee = matrice_pour_date(jours[1])
+            self.assertEqual([cle[0] for cle in _matrices], [jours[2], jours[1]])
+            self.assertEqual((premiere.capacite, len(premiere)), (0, 0))
+            self.assertFalse(hasattr(premiere, 'dist'))
+
+            # Rouverte depuis le disque, sans recalcul
+            relue = matrice_jour(jours[0])
+            self.assertIsNot(relue, premiere)
+            self.verifier(relue, livraisons)
+            self.assertEqual(len(evincee), 0)
+
+    def test_regeocodage_actualise_la_matrice(self):
+        livraisons = self.creer_livraisons(6)
+        matrice_jour(date(2025, 1, 15))
+        Livraison.objects.filter(id=livraisons[2].id).update(geocode_status='failed', geocode_attempts=1, code_postal='H2X 1Y4')
+
+        geocodage = GeocodingService()
+        cle = geocodage.normaliser_cle(geocodage.preparer_requete('Adresse', code_postal='H2X 1Y4')['cache_key'])
+        with mock.patch('livraison.services.GeocodagePool') as pool, self.captureOnCommitCallbacks(execute=True):
+            pool.return_value.geocoder_lot.return_value = {
+                cle: {'success': True, 'latitude': 45.7, 'longitude': -73.4, 'place_id': 1}
+            }
+            self.assertEqual(RegeocodageService().relancer()['reussies'], 1)
+        livraisons[2].refresh_from_db()
+
+        # Case recalculée à l'écriture: la lecture ne resynchronise pas
+        cles = [str(l.id) for l in livraisons]
+        with mock.patch.object(MatriceDistances, 'synchroniser', autospec=True, side_effect=MatriceDistances.synchroniser) as synchroniser:
+            distances, _ = sous_matrices(date(2025, 1, 15), cles)
+            synchroniser.assert_not_called()
+            attendu = matrice_distances([float(l.latitude) for l in livraisons], [float(l.longitude) for l in livraisons])
+            np.testing.assert_allclose(distances, attendu, rtol=1e-5, atol=1e-4)
+
+            # Clé absente (livraison créée hors des chemins suivis): resynchronisation
+            nouvelle = self.creer_livraisons(1, debut=50)[0]
+            distances, _ = sous_matrices(date(2025, 1, 15), cles + [str(nouvelle.id)])
+            self.assertEqual(synchroniser.call_count, 1)
+            self.assertEqual(distances.shape, (7, 7))
+
+    def test_agrandissement_conserve_les_valeurs(self):
+        livraisons = self.creer_livraisons(60)
+        matrice = matrice_jour(date(2025, 1, 15))
+        self.assertEqual(matrice.capacite, 64)
+
+        livraisons += self.creer_livraisons(20, debut=100)
+        matrice = matrice_jour(date(2025, 1, 15))
+        self.assertEqual(matrice.capacite, 128)
+        self.verifier(matrice, livraisons)
@@ -21,6 +21,7 @@ urlpatterns = [
     # ==========================================
     path('responsable/dashboard/', views.dashboard_responsable, name='dashboard_responsable'),
     path('responsable/import/', views.import_excel, name='import_excel'),
+    path('api/imports/<int:import_id>/progression/', views.progression_import, name='progression_import'),
     
     # Gestion des livreurs
     path('responsable/livreurs/', views.gestion_livreurs, name='gestion_livreurs'),
@@ -53,6 +54,13 @@ urlpatterns = [
     path('api/routes/ajouter-livraison/', views.ajouter_livraison_route, name='ajouter_livraison_route'),
     path('api/routes/retirer-livraison/', views.retirer_livraison_route, name='retirer_livraison_route'),
     path('api/routes/<uuid:route_id>/reordonner/', views.reordonner_livraisons_route, name='reordonner_route'),
+    path('api/routes/<uuid:route_id>/optimiser/', views.optimiser_route, name='optimiser_route'),
+    path('api/routes/repartition-auto/apercu/', views.repartition_auto_apercu, name='repartition_auto_apercu'),
+    path('api/routes/repartition-auto/valider/', views.repartition_auto_valider, name='repartition_auto_valider'),
+    path('api/routes/<uuid:route_id>/gps/', views.envoyer_positions_gps, name='envoyer_positions_gps'),
+    path('api/routes/<uuid:route_id>/trajet-gps/', views.trajet_gps_route, name='trajet_gps_route'),
+    path('api/routes/positions/', views.positions_routes, name='positions_routes'),
+    path('api/evenements/', views.flux_evenements, name='flux_evenements'),
     path('api/routes/<uuid:route_id>/modifier/', views.modifier_route, name='modifier_route'),
     path('api/routes/supprimer/<uuid:route_id>/', views.supprimer_route, name='supprimer_route'),
     path('api/route/<uuid:route_id>/livraisons/coords/', views.route_livraisons_coords, name='route_livraisons_coords'),
@@ -1,9 +1,20 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from .models import Livraison, ImportExcel
-from .services import ExcelImportService
+from .services import (
+    ImportQueueService, OptimisationRouteService, ProjectionETAService,
+    PlanningLivreursService, RegroupementService, RepartitionAutomatiqueService, SuiviGPSService,
+    TableauRoutesService,
+)
+from . import evenements, resumes
+from .disponibilites import index_disponibilites
+from .gps import TAILLE_LOT_MAX
+from .matrices import actualiser_livraison, retirer_livraison
+from collections import Counter
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.conf import settings
@@ -17,28 +28,23 @@ def dashboard_responsable(request):
     date_selectionnee = request.GET.get('date', datetime.now().strftime('%Y-%m-%d'))
     date_obj = datetime.strptime(date_selectionnee, '%Y-%m-%d').date()
     
-    # Statistiques du jour
-    livraisons_jour = Livraison.objects.filter(date_livraison=date_obj)
+    # Statistiques du jour: résumé matérialisé, une requête
+    resume = resumes.resume_jour(date_obj)
     
     stats = {
-        'total': livraisons_jour.count(),
-        'non_assignees': livraisons_jour.filter(status='non_assignee').count(),
-        'assignees': livraisons_jour.filter(status='assignee').count(),
-        'en_cours': livraisons_jour.filter(status='en_cours').count(),
-        'livrees': livraisons_jour.filter(status='livree').count(),
+        'total': resume['nb_total'],
+        'non_assignees': resume['nb_non_assignee'],
+        'assignees': resume['nb_assignee'],
+        'en_cours': resume['nb_en_cours'],
+        'livrees': resume['nb_livree'],
+        'recuperations': resume['nb_recuperations'],
+        'convives': resume['total_convives'],
     }
     
-    # Livraisons par période
-    livraisons_matin = livraisons_jour.filter(periode='matin')
-    livraisons_midi = livraisons_jour.filter(periode='midi')
-    livraisons_apres_midi = livraisons_jour.filter(periode='apres_midi')
-    
     context = {
         'date_selectionnee': date_selectionnee,
         'stats': stats,
-        'livraisons_matin': livraisons_matin,
-        'livraisons_midi': livraisons_midi,
-        'livraisons_apres_midi': livraisons_apres_midi,
+        'par_periode': resume['par_periode'],
     }
     
     return render(request, 'livraison/responsable/dashboard.html', context)
@@ -52,8 +58,11 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.utils import timezone
+from django.urls import reverse
+from django.shortcuts import get_object_or_404
 from datetime import datetime, date
 import json
+import uuid
 
 
 @login_required
@@ -131,50 +140,25 @@ def import_excel(request):
             # return redirect('livraison:import_excel')
         
         try:
-            print("Création du service...")
-            service = ExcelImportService()
+            # L'import (géocodage compris) est exécuté par le worker: manage.py traiter_imports
+            import_excel = ImportQueueService().mettre_en_file(fichier, date_livraison, request.user)
+            print(f"Import #{import_excel.id} mis en file pour le {date_livraison}")
             
-            print(f"Début de l'import pour le {date_livraison}...")
-            resultat = service.importer(fichier, date_livraison=date_livraison)
-            print(f"Résultat: {resultat}")
+            if is_ajax:
+                return JsonResponse({
+                    'success': True,
+                    'import_id': import_excel.id,
+                    'statut': import_excel.statut,
+                    'progression_url': reverse('livraison:progression_import', args=[import_excel.id]),
+                    'date_livraison': date_livraison.strftime('%Y-%m-%d')
+                }, status=202)
             
-            if resultat['success']:
-                if is_ajax:
-                    return JsonResponse({
-                        'success': True,
-                        'livraisons_creees': resultat['imported'],
-                        'livraisons_mises_a_jour': resultat['updated'],
-                        'livraisons_inchangees': resultat['skipped'],
-                        'total': resultat['imported'] + resultat['updated'] + resultat['skipped'],
-                        'erreurs': len(resultat['errors']),
-                        'geocoding_failed': resultat['geocoding_failed'],
-                        'date_livraison': date_livraison.strftime('%Y-%m-%d')
-                    })
-                
-                # Message de succès
-                message = f"✅ Import réussi pour le {date_livraison.strftime('%d/%m/%Y')} : "
-                message += f"{resultat['imported']} créées, "
-                message += f"{resultat['updated']} mises à jour, "
-                message += f"{resultat['skipped']} inchangées"
-                
-                if resultat['geocoding_failed']:
-                    message += f" | ⚠️ {len(resultat['geocoding_failed'])} non géocodées"
-                
-                messages.success(request, message)
-                return redirect('livraison:dashboard_responsable')
-            else:
-                # Erreur
-                error_msg = resultat.get('error', 'Erreur inconnue')
-                print(f"ERREUR lors de l'import: {error_msg}")
-                
-                if is_ajax:
-                    return JsonResponse({
-                        'success': False,
-                        'error': error_msg
-                    }, status=500)
-                
-                messages.error(request, f"Erreur lors de l'import : {error_msg}")
-                return redirect('livraison:import_excel')
+            messages.success(
+                request,
+                f"📥 Import mis en file pour le {date_livraison.strftime('%d/%m/%Y')}. "
+                f"Le suivi est disponible dans l'historique des imports."
+            )
+            return redirect('livraison:import_excel')
         
         except Exception as e:
             print(f"EXCEPTION: {e}")
@@ -201,6 +185,36 @@ def import_excel(request):
     
     return render(request, 'livraison/responsable/import_excel.html', context)
 
+@login_required
+def progression_import(request, import_id):
+    """API JSON de suivi d'un import en arrière-plan (interrogée par la page d'import)"""
+    import_excel = get_object_or_404(ImportExcel, id=import_id)
+    
+    rapport = import_excel.rapport_erreurs or {}
+    
+    return JsonResponse({
+        'success': import_excel.statut != 'echouee',
+        'import_id': import_excel.id,
+        'statut': import_excel.statut,
+        'statut_display': import_excel.get_statut_display(),
+        'termine': import_excel.statut in ('terminee', 'echouee'),
+        'progression': import_excel.progression(),
+        'lignes_total': import_excel.nb_lignes_total,
+        'lignes_traitees': import_excel.nb_lignes_traitees,
+        'livraisons_creees': import_excel.nb_lignes_importees,
+        'livraisons_mises_a_jour': import_excel.nb_lignes_mises_a_jour,
+        'livraisons_inchangees': import_excel.nb_lignes_inchangees,
+        'total': import_excel.nb_lignes_importees + import_excel.nb_lignes_mises_a_jour + import_excel.nb_lignes_inchangees,
+        'erreurs': import_excel.nb_erreurs,
+        'liste_erreurs': rapport.get('erreurs', []),
+        'rejets_par_colonne': rapport.get('rejets_par_colonne', {}),
+        'error': rapport.get('message', ''),
+        'geocoding_failed': import_excel.geocoding_failed,
+        'cache_geocodage': rapport.get('cache_geocodage', {}),
+        'par_date': rapport.get('par_date', []),
+        'date_livraison': import_excel.date_livraison.strftime('%Y-%m-%d') if import_excel.date_livraison else None,
+    })
+
 @login_required
 def livraisons_json(request):
     """API JSON pour récupérer les livraisons (pour la carte)"""
@@ -223,6 +237,22 @@ def livraisons_json(request):
         # Combiner les deux
         livraisons = (recups | normales).distinct()
     
+    # Option ?groupes=1 (avec date et période): groupe géographique par livraison pour la carte
+    regroupement = None
+    if date and periode and request.GET.get('groupes') in ('1', 'true'):
+        livraisons = list(livraisons.select_related('mode_envoi'))
+        try:
+            regroupement = RegroupementService(
+                methode=request.GET.get('methode', 'kmedoides')
+            ).regrouper(
+                datetime.strptime(date, '%Y-%m-%d').date(),
+                periode,
+                k=int(request.GET['k']) if request.GET.get('k') else None,
+                livraisons=livraisons,
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    
     data = []
     for liv in livraisons:
         data.append({
@@ -244,7 +274,15 @@ def livraisons_json(request):
             'chaud': liv.besoin_part_chaud,
             'est_recuperation': liv.est_recuperation,  # 🔥 IMPORTANT
         })
+        if regroupement is not None:
+            data[-1]['groupe'] = regroupement['affectations'].get(str(liv.id))
     
+    if regroupement is not None:
+        return JsonResponse({
+            'livraisons': data,
+            'groupes': regroupement['groupes'],
+            'methode': regroupement['methode'],
+        })
     return JsonResponse({'livraisons': data})
 
 from django.http import JsonResponse
@@ -347,9 +385,15 @@ def ajouter_livraison_route(request):
         livraison.save()
         
         # 🔥 Retourner TOUTES les livraisons de la route dans l'ordre
-        livraisons_route = LivraisonRoute.objects.filter(
+        livraisons_route = list(LivraisonRoute.objects.filter(
             route=route
-        ).select_related('livraison').order_by('ordre')
+        ).select_related('livraison', 'livraison__mode_envoi').order_by('ordre'))
+        
+        # ⏱️ Heures estimées: seuls l'arrêt ajouté et les suivants sont recalculés
+        rang = next(i for i, lr in enumerate(livraisons_route) if lr.livraison_id == livraison.id)
+        livraisons_route = ProjectionETAService().projeter(
+            route, depuis=rang, jusqu_a=rang + 1, liens=livraisons_route
+        )
         
         livraisons_data = []
         for lr in livraisons_route:
@@ -366,6 +410,7 @@ def ajouter_livraison_route(request):
                 'glace': liv.besoin_sac_glace,
                 'chaud': liv.besoin_part_chaud,
                 'est_recuperation': liv.est_recuperation,
+                **ProjectionETAService.en_json(lr),
             })
         
         return JsonResponse({
@@ -387,6 +432,12 @@ def retirer_livraison_route(request):
         
         livraison = Livraison.objects.get(id=data['livraison_id'])
         
+        # Position de l'arrêt retiré, pour ne recalculer que la suite de sa route
+        positions = []
+        for lr in LivraisonRoute.objects.filter(livraison=livraison).select_related('route'):
+            rang = LivraisonRoute.objects.filter(route=lr.route, ordre__lt=lr.ordre).count()
+            positions.append((lr.route, rang))
+        
         # Supprimer l'association
         LivraisonRoute.objects.filter(livraison=livraison).delete()
         
@@ -394,6 +445,9 @@ def retirer_livraison_route(request):
         livraison.status = 'non_assignee'
         livraison.save()
         
+        for route, rang in positions:
+            ProjectionETAService().projeter(route, depuis=rang, jusqu_a=rang)
+        
         return JsonResponse({
             'success': True,
             'message': 'Livraison retirée de la route'
@@ -467,52 +521,8 @@ def routes_json(request):
     date = request.GET.get('date')
     periode = request.GET.get('periode')
     
-    routes = Route.objects.all()
-    
-    if date:
-        routes = routes.filter(date=date)
-    if periode:
-        routes = routes.filter(periode=periode)
-    
     # 🔥 Trier par date de création DESC (plus récent en premier)
-    routes = routes.order_by('-date_creation')
-    
-    data = []
-    for route in routes:
-        livraisons_route = LivraisonRoute.objects.filter(
-            route=route
-        ).select_related('livraison').order_by('ordre')
-        
-        livraisons_data = []
-        for lr in livraisons_route:
-            liv = lr.livraison
-            livraisons_data.append({
-                'id': str(liv.id),
-                'numero': liv.numero_livraison,
-                'nom_evenement': liv.nom_evenement,
-                'client': liv.client_nom,
-                'adresse': liv.adresse_complete,
-                'heure': liv.heure_souhaitee.strftime('%H:%M') if liv.heure_souhaitee else '',
-                'mode_envoi': liv.mode_envoi.nom if liv.mode_envoi else '',
-                'nb_convives': liv.nb_convives,
-                'informations_supplementaires': liv.informations_supplementaires,
-                'cafe': liv.besoin_cafe,
-                'the': liv.besoin_the,
-                'glace': liv.besoin_sac_glace,
-                'chaud': liv.besoin_part_chaud,
-                'est_recuperation': liv.est_recuperation,
-            })
-        
-        data.append({
-            'id': str(route.id),
-            'nom': route.nom,
-            'heure_depart': route.heure_depart.strftime('%H:%M') if route.heure_depart else '',
-            'livreurs': [l.get_full_name() for l in route.livreurs.all()],
-            'livreurs_ids': [l.id for l in route.livreurs.all()],
-            'commentaire': route.commentaire,
-            'status': route.status,
-            'livraisons': livraisons_data
-        })
+    data = TableauRoutesService().serialiser(date, periode, ordre=('-date_creation',))
     
     return JsonResponse({'routes': data})
 @login_required
@@ -524,6 +534,27 @@ def livreurs_json(request):
         is_active=True
     )
     
+    # Filtre optionnel: livreurs libres pour une route (?route=) ou une date/période (?date=&periode=&heure=)
+    try:
+        route_id = request.GET.get('route')
+        date_str = request.GET.get('date')
+        if route_id:
+            route = Route.objects.get(id=route_id)
+            libres = RepartitionAutomatiqueService().livreurs_libres_route(route)
+            livreurs = livreurs.filter(id__in=list(libres))
+        elif date_str:
+            date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+            heure_str = request.GET.get('heure')
+            libres = index_disponibilites(date_obj).livreurs_libres(
+                date_obj, request.GET.get('periode'),
+                heure=datetime.strptime(heure_str, '%H:%M').time() if heure_str else None,
+            )
+            livreurs = livreurs.filter(id__in=list(libres))
+    except Route.DoesNotExist:
+        return JsonResponse({'error': 'Route introuvable'}, status=404)
+    except (ValueError, ValidationError) as e:
+        return JsonResponse({'error': f"Paramètres invalides: {str(e)}"}, status=400)
+    
     data = [{
         'id': l.id,
         'nom': l.get_full_name(),
@@ -847,6 +878,10 @@ def reordonner_livraisons_route(request, route_id):
         ordre_livraisons = data.get('ordre', [])  # Liste d'IDs dans l'ordre
         
         route = Route.objects.get(id=route_id)
+        ancien_ordre = [
+            str(id_livraison) for id_livraison in
+            LivraisonRoute.objects.filter(route=route).order_by('ordre').values_list('livraison_id', flat=True)
+        ]
         
         # Mettre à jour l'ordre
         for index, livraison_id in enumerate(ordre_livraisons):
@@ -855,9 +890,23 @@ def reordonner_livraisons_route(request, route_id):
                 livraison_id=livraison_id
             ).update(ordre=index)
         
+        # ⏱️ Heures estimées: recalcul à partir du premier arrêt déplacé
+        tableau = TableauRoutesService()
+        liens = list(tableau.liens_queryset().filter(route=route))
+        changements = [
+            i for i, lr in enumerate(liens)
+            if i >= len(ancien_ordre) or ancien_ordre[i] != str(lr.livraison_id)
+        ]
+        if changements:
+            liens = ProjectionETAService().projeter(
+                route, depuis=changements[0], jusqu_a=changements[-1] + 1, liens=liens
+            )
+            evenements.publier_ordre(route)
+        
         return JsonResponse({
             'success': True,
-            'message': 'Ordre mis à jour'
+            'message': 'Ordre mis à jour',
+            'livraisons': [tableau.livraison_json(lr) for lr in liens],
         })
         
     except Route.DoesNotExist:
@@ -870,7 +919,214 @@ def reordonner_livraisons_route(request, route_id):
             'success': False,
             'error': str(e)
         }, status=400)
+
+@login_required
+@require_http_methods(["POST"])
+def optimiser_route(request, route_id):
+    """
+    Calcule le meilleur ordre de passage (distance + heures souhaitées) et l'applique.
+    Body JSON optionnel: {"appliquer": false} pour un simple aperçu.
+    """
+    try:
+        try:
+            data = json.loads(request.body or '{}')
+        except ValueError:
+            data = request.POST
+        appliquer = data.get('appliquer', True) not in (False, 'false', '0')
+        
+        route = Route.objects.get(id=route_id)
+        
+        if route.status in ('terminee', 'annulee'):
+            return JsonResponse({
+                'success': False,
+                'error': f"Route {route.get_status_display().lower()}, ordre non modifiable"
+            }, status=400)
+        
+        resultat = OptimisationRouteService().optimiser(route, appliquer=appliquer)
+        
+        return JsonResponse({
+            'success': True,
+            'message': f"Ordre optimisé: {resultat['avant']['distance_km']} km → {resultat['apres']['distance_km']} km",
+            **resultat
+        })
+        
+    except Route.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Route introuvable'
+        }, status=404)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+@login_required
+@require_http_methods(["POST"])
+def repartition_auto_apercu(request):
+    """
+    Propose des routes pour les livraisons non assignées d'une date/période
+    (livreurs disponibles, véhicules libres). Rien n'est enregistré.
+    Body JSON: {"date": "AAAA-MM-JJ", "periode": "matin"}
+    """
+    try:
+        data = json.loads(request.body)
+        date_obj = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        periode = data.get('periode', 'matin')
+        
+        proposition = RepartitionAutomatiqueService().proposer(date_obj, periode)
+        
+        return JsonResponse({
+            'success': True,
+            'date': date_obj.strftime('%Y-%m-%d'),
+            'periode': periode,
+            **proposition
+        })
+        
+    except (KeyError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'error': f"Paramètres invalides: {str(e)}"
+        }, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@login_required
+@require_http_methods(["POST"])
+def repartition_auto_valider(request):
+    """
+    Crée en bloc les routes d'une proposition (telle quelle ou retouchée).
+    Body JSON: {"date", "periode", "routes": [{"nom", "livreurs", "vehicule_id", "heure_depart", "livraisons"}]}
+    """
+    try:
+        data = json.loads(request.body)
+        date_obj = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        
+        routes = RepartitionAutomatiqueService().valider(
+            date_obj, data['periode'], data.get('routes', []), request.user
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': f"{len(routes)} route(s) créée(s)",
+            'routes': [{'id': str(route.id), 'nom': route.nom} for route in routes]
+        })
+        
+    except (KeyError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@login_required
+@require_http_methods(["POST"])
+def envoyer_positions_gps(request, route_id):
+    """
+    Lot de positions GPS du livreur pour sa route en cours.
+    Body JSON: {"pings": [{"t": ISO 8601 ou époque, "lat", "lon", "precision"}]}
+    """
+    try:
+        route = Route.objects.get(id=route_id, livreurs=request.user)
+    except Route.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Route introuvable ou vous n\'êtes pas assigné à cette route'
+        }, status=404)
     
+    if route.status != 'en_cours':
+        return JsonResponse({'success': False, 'error': 'La route n\'est pas en cours'}, status=400)
+    
+    try:
+        pings = json.loads(request.body).get('pings', [])
+        if not isinstance(pings, list) or len(pings) > TAILLE_LOT_MAX:
+            return JsonResponse({
+                'success': False,
+                'error': f'Liste "pings" attendue ({TAILLE_LOT_MAX} positions maximum)'
+            }, status=400)
+        
+        resultat = SuiviGPSService().enregistrer(route, request.user, pings)
+        return JsonResponse({'success': True, **resultat})
+        
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+def positions_routes(request):
+    """Dernière position connue de chaque route en cours (carte du responsable)"""
+    return JsonResponse({'positions': SuiviGPSService().positions_actives()})
+
+@login_required
+def trajet_gps_route(request, route_id):
+    """Relecture du trajet GPS d'une route. Paramètres: depuis (ISO 8601), livreur (id)."""
+    try:
+        route = Route.objects.get(id=route_id)
+        depuis = request.GET.get('depuis')
+        livreur = request.GET.get('livreur')
+        points = SuiviGPSService().trajet(
+            route,
+            depuis=SuiviGPSService.lire_horodatage(depuis) if depuis else None,
+            livreur_id=int(livreur) if livreur else None,
+        )
+        return JsonResponse({
+            'route_id': str(route.id),
+            'nb_points': len(points),
+            'points': points,  # [horodatage, lat, lon, précision (m)]
+        })
+    except Route.DoesNotExist:
+        return JsonResponse({'error': 'Route introuvable'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': f"Paramètres invalides: {str(e)}"}, status=400)
+
+@login_required
+@require_http_methods(["GET"])
+def flux_evenements(request):
+    """
+    Flux Server-Sent Events des changements de livraisons et de routes.
+    Paramètres: date (YYYY-MM-DD), route (id). Reprise: en-tête Last-Event-ID
+    (envoyé par EventSource à la reconnexion) ou paramètre last_event_id.
+    """
+    try:
+        date_str = request.GET.get('date')
+        route_id = request.GET.get('route')
+        depuis = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        filtre = evenements.FiltreEvenements(
+            date=datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None,
+            route_id=uuid.UUID(route_id) if route_id else None,
+        )
+        depuis = int(depuis) if depuis else None
+    except ValueError as e:
+        return JsonResponse({'error': f"Paramètres invalides: {str(e)}"}, status=400)
+
+    # Sous ASGI, le flux est servi par la boucle d'événements; sous WSGI, il occupe un thread
+    if isinstance(request, ASGIRequest):
+        contenu = evenements.flux_asgi(filtre, depuis)
+    else:
+        contenu = evenements.flux_wsgi(filtre, depuis)
+
+    response = StreamingHttpResponse(contenu, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Pas de mise en tampon par nginx
+    return response
+
 from django.db.models import Prefetch
 @login_required
 def get_routes(request):
@@ -883,42 +1139,7 @@ def get_routes(request):
     else:
         date_obj = timezone.now().date()
     
-    routes = Route.objects.filter(
-        date=date_obj,
-        periode=periode
-    ).prefetch_related(
-        Prefetch(
-            'livraisonroute_set',
-            queryset=LivraisonRoute.objects.select_related('livraison').order_by('ordre')
-        )
-    )
-    
-    routes_data = []
-    for route in routes:
-        livraisons_route = []
-        for lr in route.livraisonroute_set.all():  # Déjà trié par ordre
-            liv = lr.livraison
-            livraisons_route.append({
-                'id': str(liv.id),
-                'numero': liv.numero_livraison,
-                'nom_evenement': liv.nom_evenement,
-                'client': liv.client_nom,
-                'adresse': liv.adresse_complete,
-                'heure': liv.heure_souhaitee.strftime('%H:%M') if liv.heure_souhaitee else '',
-                'cafe': liv.besoin_cafe,
-                'the': liv.besoin_the,
-                'glace': liv.besoin_sac_glace,
-                'chaud': liv.besoin_part_chaud,
-            })
-        
-        routes_data.append({
-            'id': str(route.id),
-            'nom': route.nom,
-            'heure_depart': route.heure_depart.strftime('%H:%M') if route.heure_depart else '',
-            'livreurs': [l.get_full_name() for l in route.livreurs.all()],
-            'commentaire': route.commentaire,
-            'livraisons': livraisons_route  # Déjà dans le bon ordre
-        })
+    routes_data = TableauRoutesService().serialiser(date_obj, periode)
     
     return JsonResponse({'routes': routes_data})
 
@@ -934,11 +1155,16 @@ def modifier_route(request, route_id):
         route.nom = data.get('nom', route.nom)
         route.commentaire = data.get('commentaire', route.commentaire)
         
+        heure_depart = route.heure_depart
         if data.get('heure_depart'):
             from datetime import datetime
             route.heure_depart = datetime.strptime(data['heure_depart'], '%H:%M').time()
         
-        route.save()
+        route.save(update_fields=['nom', 'commentaire', 'heure_depart'])
+        
+        # ⏱️ Nouvelle heure de départ: toute la route est reprojetée
+        if route.heure_depart != heure_depart:
+            ProjectionETAService().projeter(route)
         
         # Mettre à jour les livreurs
         if data.get('livreurs'):
@@ -1273,62 +1499,10 @@ def gestion_livreurs(request):
     aujourd_hui = timezone.now().date()
     debut_semaine = aujourd_hui - timedelta(days=aujourd_hui.weekday())
     
-    # Générer les 14 prochains jours
-    jours_planning = []
-    for i in range(14):
-        jour = debut_semaine + timedelta(days=i)
-        jours_planning.append(jour)
-    
-    # Récupérer les routes des 14 prochains jours organisées par date et période
-    routes_par_date = {}
-    for jour in jours_planning:
-        routes_jour = Route.objects.filter(
-            date=jour
-        ).select_related(
-            'vehicule'
-        ).prefetch_related(
-            'livreurs',
-            Prefetch(
-                'livraisonroute_set',
-                queryset=LivraisonRoute.objects.select_related('livraison').order_by('ordre')
-            )
-        ).order_by('periode', 'heure_depart')
-        
-        # Organiser par période
-        routes_par_periode = {
-            'matin': [],
-            'midi': [],
-            'apres_midi': []
-        }
-        
-        for route in routes_jour:
-            # Compter les récupérations
-            nb_recuperations = route.livraisonroute_set.filter(
-                livraison__est_recuperation=True
-            ).count()
-            
-            route_data = {
-                'id': str(route.id),
-                'nom': route.nom,
-                'heure_depart': route.heure_depart.strftime('%H:%M') if route.heure_depart else '',
-                'status': route.status,
-                'status_display': route.get_status_display(),
-                'livreurs': [
-                    {
-                        'id': l.id,
-                        'nom': l.get_full_name() or l.username,
-                        'initiales': f"{l.first_name[0] if l.first_name else ''}{l.last_name[0] if l.last_name else ''}".upper()
-                    }
-                    for l in route.livreurs.all()
-                ],
-                'nb_livraisons': route.livraisonroute_set.count(),
-                'nb_recuperations': nb_recuperations,
-                'vehicule': f"{route.vehicule.marque} {route.vehicule.modele}" if route.vehicule else None
-            }
-            
-            routes_par_periode[route.periode].append(route_data)
-        
-        routes_par_date[jour.strftime('%Y-%m-%d')] = routes_par_periode
+    # Grille des 14 prochains jours (PLANNING_NB_JOURS), organisée par date et période
+    planning = PlanningLivreursService()
+    jours_planning = planning.jours(debut_semaine)
+    routes_par_date = planning.grille(debut_semaine)
     
     context = {
         'livreurs': livreurs,
@@ -1410,6 +1584,26 @@ def disponibilites_json(request):
     date_debut = request.GET.get('date_debut')
     date_fin = request.GET.get('date_fin')
     
+    # Intervalle borné: réponse tirée de l'index des disponibilités
+    if date_debut and date_fin:
+        debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
+        fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
+        intervalles = index_disponibilites(debut, fin).entre(debut, fin, int(livreur_id) if livreur_id else None)
+        noms = {u.id: u.get_full_name() for u in CustomUser.objects.filter(id__in={i.livreur_id for i in intervalles})}
+        types = dict(DisponibiliteLivreur.TYPE_CHOICES)
+        return JsonResponse({'disponibilites': [{
+            'id': str(i.id),
+            'livreur_id': i.livreur_id,
+            'livreur_nom': noms.get(i.livreur_id, ''),
+            'date_debut': date.fromordinal(i.debut).strftime('%Y-%m-%d'),
+            'date_fin': date.fromordinal(i.fin).strftime('%Y-%m-%d'),
+            'type_dispo': i.type_dispo,
+            'type_display': types.get(i.type_dispo, i.type_dispo),
+            'heure_debut_shift': i.heure_debut_shift.strftime('%H:%M') if i.heure_debut_shift else None,
+            'heure_fin_shift': i.heure_fin_shift.strftime('%H:%M') if i.heure_fin_shift else None,
+            'notes': i.notes
+        } for i in intervalles]})
+    
     dispos = DisponibiliteLivreur.objects.select_related('livreur')
     
     if livreur_id:
@@ -1448,22 +1642,28 @@ def resume_journalier(request):
     date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
     
     # Récupérer toutes les livraisons du jour
-    livraisons = Livraison.objects.filter(
+    livraisons = list(Livraison.objects.filter(
         date_livraison=date_obj
     ).select_related(
         'mode_envoi'
-    ).prefetch_related(
-        'livraisonroute_set__route__livreurs'
-    ).order_by('heure_souhaitee')
+    ).order_by('heure_souhaitee'))
+    
+    # Routes du jour (arrêts et livreurs préchargés): route de chaque livraison sans requête
+    tableau = TableauRoutesService()
+    routes = tableau.routes(date_obj, ordre=('periode', 'heure_depart'))
+    route_par_livraison = tableau.routes_par_livraison(routes)
+    for livraison in livraisons:
+        livraison.route_tableau = route_par_livraison.get(livraison.id)
     
     # Stats globales
+    par_status = Counter(livraison.status for livraison in livraisons)
     stats = {
-        'total': livraisons.count(),
-        'non_assignee': livraisons.filter(status='non_assignee').count(),
-        'assignee': livraisons.filter(status='assignee').count(),
-        'en_cours': livraisons.filter(status='en_cours').count(),
-        'livree': livraisons.filter(status='livree').count(),
-        'annulee': livraisons.filter(status='annulee').count(),
+        'total': len(livraisons),
+        'non_assignee': par_status['non_assignee'],
+        'assignee': par_status['assignee'],
+        'en_cours': par_status['en_cours'],
+        'livree': par_status['livree'],
+        'annulee': par_status['annulee'],
     }
     
     # Pourcentage de progression
@@ -1472,17 +1672,6 @@ def resume_journalier(request):
     else:
         stats['progression'] = 0
     
-    # Grouper par route
-    routes = Route.objects.filter(
-        date=date_obj
-    ).prefetch_related(
-        Prefetch(
-            'livraisonroute_set',
-            queryset=LivraisonRoute.objects.select_related('livraison').order_by('ordre')
-        ),
-        'livreurs'
-    ).order_by('periode', 'heure_depart')
-    
     context = {
         'date_selectionnee': date_str,
         'date_obj': date_obj,
@@ -2139,7 +2328,7 @@ def demarrer_route(request, route_id):
     if route.status == 'planifiee':
         route.status = 'en_cours'
         route.heure_depart_reelle = timezone.now()
-        route.save()
+        route.save(update_fields=['status', 'heure_depart_reelle'])
         
         # Mettre à jour le statut des livraisons
         for livraison_route in route.livraisonroute_set.all():
@@ -2186,7 +2375,7 @@ def assigner_vehicule(request, route_id):
         
         # Assigner le véhicule
         route.vehicule = vehicule
-        route.save()
+        route.save(update_fields=['vehicule'])
         
         # Marquer le véhicule comme non disponible
         vehicule.disponible = False
@@ -2426,7 +2615,7 @@ def terminer_route(request, route_id):
         
         route.status = 'terminee'
         route.heure_retour_reelle = timezone.now().time()
-        route.save()
+        route.save(update_fields=['status', 'heure_retour_reelle'])
         
         # Libérer le véhicule
         if hasattr(route, 'vehicule') and route.vehicule:
@@ -2608,6 +2797,7 @@ def update_geocode(request):
         livraison.geocode_attempts = 0
         
         livraison.save()
+        actualiser_livraison(livraison)
         
         print(f"✅ Livraison {numero} géocodée avec succès")
         
@@ -2808,14 +2998,14 @@ def disponibilites_par_date(request):
         # Récupérer tous les livreurs actifs
         livreurs = Livreur.objects.filter(is_active=True).select_related('user')
         
+        # Disponibilités couvrant cette date: index en mémoire, pas de requête par livreur
+        dispos_par_livreur = {}
+        for d in sorted(index_disponibilites(date_recherche).au(date_recherche), key=lambda i: i.debut):
+            dispos_par_livreur.setdefault(d.livreur_id, []).append(d)
+        
         result = []
         for livreur in livreurs:
-            # Chercher les disponibilités qui couvrent cette date
-            dispos = DisponibiliteLivreur.objects.filter(
-                livreur=livreur.user,
-                date_debut__lte=date_recherche,
-                date_fin__gte=date_recherche
-            ).order_by('date_debut')
+            dispos = dispos_par_livreur.get(livreur.user_id, [])
             
             # Nom complet du livreur
             nom_complet = livreur.user.get_full_name() or livreur.user.username
@@ -2932,8 +3122,8 @@ def routes_par_date(request):
                 besoins_route.add('Checklist')
         
         # Compter les livraisons par statut
-        total_livraisons = livraisons_route.count()
-        livraisons_livrees = sum(1 for lr in livraisons_route if lr.livraison.status == 'livree')
+        total_livraisons = route.nb_livraisons
+        livraisons_livrees = route.nb_livrees
         livraisons_restantes = total_livraisons - livraisons_livrees
         
         routes_data.append({
@@ -3123,7 +3313,9 @@ def supprimer_livraison(request, livraison_id):
         LivraisonRoute.objects.filter(livraison=livraison).delete()
         
         # Supprimer la livraison
+        id_livraison, date_livraison = livraison.id, livraison.date_livraison
         livraison.delete()
+        retirer_livraison(id_livraison, date_livraison)
         
         return JsonResponse({
             'success': True,
@@ -3166,15 +3358,10 @@ def routes_jour(request):
         )
     ).order_by('nom')  # 🔥 TRI PAR NOM: Route 1, Route 2, etc.
     
-    # Calculer les statistiques
-    total_routes = routes.count()
-    total_livraisons = 0
-    livraisons_livrees = 0
-    
-    for route in routes:
-        livraisons_route = route.livraisonroute_set.all()
-        total_livraisons += livraisons_route.count()
-        livraisons_livrees += sum(1 for lr in livraisons_route if lr.livraison.status == 'livree')
+    # Calculer les statistiques (compteurs d'avancement stockés sur chaque route)
+    total_routes = len(routes)
+    total_livraisons = sum(route.nb_livraisons for route in routes)
+    livraisons_livrees = sum(route.nb_livrees for route in routes)
     
     taux_completion = round((livraisons_livrees / total_livraisons * 100) if total_livraisons > 0 else 0)
     
@@ -3,6 +3,12 @@ ASGI config for restaurant_manager project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servi par un serveur ASGI (uvicorn, daphne), le flux Server-Sent Events
+/livraison/api/evenements/ reste ouvert sans occuper de thread: une seule
+lecture du journal d'événements par processus alimente tous les tableaux de
+bord (voir livraison/evenements.py). Sous WSGI, le flux fonctionne en mode
+dégradé (connexions courtes, reconnexion automatique).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """